@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 from django.contrib import messages
 from django.core.exceptions import ImproperlyConfigured
@@ -22,6 +23,8 @@ def project_root(path):
 
 DEFAULT_TAX_RATE = 5.3
 REQUIRE_LOGIN = False
+# Threads used to batch import bank statements, None uses 1/CPU
+BANK_IMPORT_WORKERS = 1
 
 
 SECRET_KEY = get_env_variable("DJANGO_SECRET_KEY")
@@ -74,16 +77,30 @@ DATABASES = {
         'PASSWORD': '',
         'HOST': '',
         'PORT': '',
+        # Only writing views are run in a transaction, see
+        # core.middleware.WriteTransactionMiddleware
+        'OPTIONS': {'autocommit': True},
     }
 }
 
 
-# Cache Machine Settings
+# Cache Settings
+# The default cache keeps recently used values in each process, in front of
+# the shared memcached server. See core.cache_backends.TwoTierCache.
 CACHES = {
     'default': {
-        'BACKEND': 'caching.backends.memcached.MemcachedCache',
+        'BACKEND': 'core.cache_backends.TwoTierCache',
+        'LOCATION': 'memcached',
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+            'LOCAL_TIMEOUT': 30,
+            'VERSION_CHECK_INTERVAL': 1,
+        },
+    },
+    'memcached': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
         'LOCATION': ['127.0.0.1:11211'],
-    }
+    },
 }
 
 CACHE_MIDDLEWARE_SECONDS = 60 * 5
@@ -102,7 +119,7 @@ CONSTANCE_CONFIG = {
 }
 
 CONSTANCE_BACKEND = 'constance.backends.database.DatabaseBackend'
-CONSTANCE_DATABASE_CACHE_BACKEND = 'default'
+CONSTANCE_DATABASE_CACHE_BACKEND = 'memcached'
 CONSTANCE_DATABASE_PREFIX = 'constance:accounting:'
 
 
@@ -122,7 +139,7 @@ TEMPLATE_CONTEXT_PROCESSORS = (
     "django.contrib.messages.context_processors.messages",
     "constance.context_processors.config",
     "core.context_processors.template_accessible_settings",
-    "accounts.context_processors.all_accounts",
+    "accounts.context_processors.accounts_json_url",
 )
 TEMPLATE_DIRS = (project_root('templates'),)
 
@@ -133,15 +150,53 @@ STATICFILES_FINDERS = (
 
 
 MIDDLEWARE_CLASSES = (
+    'core.middleware.RequestTimingMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.transaction.TransactionMiddleware',
+    'core.middleware.WriteTransactionMiddleware',
+    'core.middleware.ReplicaPinningMiddleware',
     'core.middleware.LoginRequiredMiddleware',
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.ProfileMiddleware',
 )
 
+# The fraction of requests whose SQL, cache & view times are measured.
+# See core.middleware.RequestTimingMiddleware.
+REQUEST_TIMING_SAMPLE_RATE = 0.05
+REQUEST_TIMING_SLOWEST_COUNT = 20
+REQUEST_TIMING_TOP_QUERIES = 3
+
+# Each process writes it's metrics to the directory every interval, the
+# /metrics view sums them & is only served to the allowed addresses.
+# See core.metrics.
+METRICS_DIRECTORY = os.path.join(
+    tempfile.gettempdir(), 'acornaccounting-metrics')
+METRICS_FLUSH_INTERVAL = 5
+METRICS_ALLOWED_IPS = ('127.0.0.1',)
+
+# Superusers can profile a request by adding a __profile parameter or an
+# X-Profile header. See core.middleware.ProfileMiddleware.
+PROFILE_DIRECTORY = os.path.join(
+    tempfile.gettempdir(), 'acornaccounting-profiles')
+
+# Queries slower than this many seconds are logged with their plans when a
+# core.db.backends ENGINE is used. See core.db.slow_queries.
+SLOW_QUERY_THRESHOLD = 0.5
+# Run slow queries again with EXPLAIN ANALYZE, logging their actual timings
+# instead of the estimated plan.
+SLOW_QUERY_ANALYZE = False
+SLOW_QUERY_LOG = project_root('slow_queries.log')
+
+# Reports & registers read from this database alias when it is set, writes
+# always use the default database. A client is pinned to the default
+# database for this many seconds after it writes. See core.db.replicas.
+DATABASE_ROUTERS = ['core.db.replicas.ReplicaRouter']
+REPLICA_DATABASE = None
+REPLICA_PIN_SECONDS = 10
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -150,12 +205,30 @@ LOGGING = {
             '()': 'django.utils.log.RequireDebugFalse'
         }
     },
+    'formatters': {
+        'message': {
+            'format': '%(message)s',
+        },
+    },
     'handlers': {
         'mail_admins': {
             'level': 'ERROR',
             'filters': ['require_debug_false'],
             'class': 'django.utils.log.AdminEmailHandler'
-        }
+        },
+        'console': {
+            'level': 'WARNING',
+            'class': 'logging.StreamHandler',
+        },
+        'slow_queries': {
+            'level': 'WARNING',
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': SLOW_QUERY_LOG,
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'delay': True,
+            'formatter': 'message',
+        },
     },
     'loggers': {
         'django.request': {
@@ -163,6 +236,15 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': True,
         },
+        'core.middleware': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+        },
+        'core.db.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
     }
 }
 
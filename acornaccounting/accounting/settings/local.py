@@ -18,7 +18,6 @@ INSTALLED_APPS += (
 
 MIDDLEWARE_CLASSES += (
     'debug_toolbar.middleware.DebugToolbarMiddleware',
-    'snippetscream.ProfileMiddleware',
 )
 
 DATABASES = {
@@ -29,5 +28,15 @@ DATABASES = {
         'PASSWORD': '',
         'HOST': '',
         'PORT': '',
+        # Only writing views are run in a transaction, see
+        # core.middleware.WriteTransactionMiddleware
+        'OPTIONS': {'autocommit': True},
     }
 }
+
+# Set DB_REPLICA_NAME to read reports from a second local database
+if get_env_variable("DB_REPLICA_NAME"):
+    DATABASES['replica'] = dict(DATABASES['default'],
+                                NAME=get_env_variable("DB_REPLICA_NAME"),
+                                TEST_MIRROR='default')
+    REPLICA_DATABASE = 'replica'
@@ -3,6 +3,8 @@ from .base import *
 DEBUG = False
 TEMPLATE_DEBUG = DEBUG
 
+# Use core.db.backends.postgresql_psycopg2 to capture slow queries & add a
+# POOL dictionary to reuse connections between requests, see core.db.pool
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql_psycopg2',
@@ -11,12 +13,18 @@ DATABASES = {
         'PASSWORD': get_env_variable("DB_PASSWORD"),
         'HOST': get_env_variable("DB_HOST"),
         'PORT': get_env_variable("DB_PORT"),
+        # Only writing views are run in a transaction, see
+        # core.middleware.WriteTransactionMiddleware
+        'OPTIONS': {'autocommit': True},
     }
 }
 
-CACHES = {
-    'default': {
-        'BACKEND': 'caching.backends.memcached.MemcachedCache',
-        'LOCATION': [get_env_variable("CACHE_LOCATION")],
-    }
-}
+# Set DB_REPLICA_HOST to read reports from a streaming replica
+if get_env_variable("DB_REPLICA_HOST"):
+    DATABASES['replica'] = dict(DATABASES['default'],
+                                HOST=get_env_variable("DB_REPLICA_HOST"),
+                                PORT=get_env_variable("DB_REPLICA_PORT"),
+                                TEST_MIRROR='default')
+    REPLICA_DATABASE = 'replica'
+
+CACHES['memcached']['LOCATION'] = [get_env_variable("CACHE_LOCATION")]
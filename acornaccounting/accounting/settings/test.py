@@ -10,8 +10,23 @@ DATABASES = {
     }
 }
 
+# The in-memory test database is not shared between threads
+BANK_IMPORT_WORKERS = 1
+
+# Only the timing tests sample requests
+REQUEST_TIMING_SAMPLE_RATE = 0
+
+# Only keep metrics in memory
+METRICS_DIRECTORY = None
+
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
-    }
+    },
+    'memcached': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    },
 }
+
+# Don't write the slow queries captured by the tests to the log file
+LOGGING['loggers']['core.db.slow_queries']['handlers'] = []
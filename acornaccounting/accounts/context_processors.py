@@ -1,17 +1,15 @@
 """Context processors related to Accounts."""
+from django.core.urlresolvers import reverse
 
-import json
-from accounts.models import (Account)
+from core.cache import get_accounts_version
 
 
-def all_accounts(request):
-    """Inject the `accounts_json` variable into every context.
+def accounts_json_url(request):
+    """Inject the `accounts_json_url` variable into every context.
 
-    This is used to pre-populate every AJAX Account Select widget.
+    This URL points to the current version of the Account list, which is
+    lazily loaded to populate the AJAX Account Select widgets.
 
     """
-    accounts = Account.objects.order_by('name')
-    values = [{'text': account.name,
-               'description': account.description,
-               'value': account.id} for account in accounts]
-    return {'accounts_json': json.dumps(values)}
+    return {'accounts_json_url': reverse(
+        'accounts_json', args=[get_accounts_version()])}
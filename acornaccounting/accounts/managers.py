@@ -1,12 +1,15 @@
-from caching.base import CachingQuerySet
+from django.db import connections, router, transaction
+from django.db.models import F, Max
 from mptt.models import TreeManager
 
+from core.cache import bump_account_versions, bump_ledger_version
+
 
 class AccountManager(TreeManager):
     """
     A Custom Manager for the :class:`Account` Model.
 
-    This class inherits from the :class:`CachingTreeManager`.
+    This class inherits from the :class:`~mptt.models.TreeManager`.
 
     """
     def get_banks(self):
@@ -16,3 +19,88 @@ class AccountManager(TreeManager):
     def active(self):
         """This method will return a Querset containing all Active Accounts."""
         return self.filter(active=True)
+
+    def apply_balance_deltas(self, deltas):
+        """Add the balance deltas to each Account, using one query per Account.
+
+        The ledger version & the balance versions of the Accounts are bumped,
+        since no signals are sent.
+
+        :param deltas: The change in balance for each Account.
+        :type deltas: A :obj:`dict` mapping Account ids to
+                      :class:`~decimal.Decimal` balance deltas.
+
+        """
+        for (account_id, delta) in deltas.items():
+            if delta:
+                self.filter(id=account_id).update(balance=F('balance') + delta)
+        bump_account_versions(
+            (account_id, None) for account_id in deltas)
+        bump_ledger_version()
+
+    def rebuild_balances(self):
+        """Set every Account's balance from it's Transactions in one query.
+
+        After a Fiscal Year has been closed, only Transactions dated after the
+        year's end are totalled & Asset, Liability & Equity Accounts add their
+        :class:`~accounts.models.HistoricalAccount` amount at the year's end,
+        like :func:`fiscalyears.views._correct_account_balance`. The totals
+        are summed by correlated subqueries of a single ``UPDATE``. The
+        ledger version & the balance version of every Account are bumped,
+        since no signals are sent.
+
+        :returns: The number of Accounts updated.
+        :rtype: int
+
+        """
+        from entries.models import Transaction
+        from .models import HistoricalAccount
+
+        connection = connections[router.db_for_write(self.model)]
+        quote = connection.ops.quote_name
+        account = self.model._meta
+        entry_transaction = Transaction._meta
+        historical = HistoricalAccount._meta
+        year_end = HistoricalAccount.objects.aggregate(
+            Max('date'))['date__max']
+        names = {
+            'account': quote(account.db_table),
+            'id': quote(account.pk.column),
+            'balance': quote(account.get_field('balance').column),
+            'type': quote(account.get_field('type').column),
+            'places': account.get_field('balance').decimal_places,
+            'transaction': quote(entry_transaction.db_table),
+            'delta': quote(
+                entry_transaction.get_field('balance_delta').column),
+            'transaction_account': quote(
+                entry_transaction.get_field('account').column),
+            'transaction_date': quote(
+                entry_transaction.get_field('date').column),
+            'historical': quote(historical.db_table),
+            'amount': quote(historical.get_field('amount').column),
+            'historical_account': quote(
+                historical.get_field('account').column),
+            'historical_date': quote(historical.get_field('date').column),
+        }
+        total = ("COALESCE((SELECT SUM(t.{delta}) FROM {transaction} t "
+                 "WHERE t.{transaction_account} = {account}.{id}")
+        parameters = []
+        if year_end is None:
+            total += "), 0)"
+        else:
+            total += (" AND t.{transaction_date} > %s), 0) + "
+                      "CASE WHEN {account}.{type} IN (1, 2, 3) THEN "
+                      "COALESCE((SELECT h.{amount} FROM {historical} h "
+                      "WHERE h.{historical_account} = {account}.{id} "
+                      "AND h.{historical_date} = %s), 0) ELSE 0 END")
+            parameters = [connection.ops.value_to_db_date(year_end)] * 2
+        cursor = connection.cursor()
+        cursor.execute(
+            ("UPDATE {account} SET {balance} = ROUND(" + total +
+             ", {places})").format(**names), parameters)
+        transaction.commit_unless_managed(using=connection.alias)
+        bump_account_versions(
+            (account_id, None)
+            for account_id in self.values_list('id', flat=True))
+        bump_ledger_version()
+        return cursor.rowcount
@@ -2,17 +2,19 @@ import calendar
 import datetime
 from decimal import Decimal
 
-from caching.base import CachingManager, CachingMixin, cached_method
 from django.core.urlresolvers import reverse
 from django.db import models
 from mptt.models import MPTTModel, TreeForeignKey, TreeManager
 
+from core.cache import (BALANCE_BUCKET, get_cached_account_ids,
+                        get_cached_account_value, get_cached_accounts_value,
+                        month_bucket, month_buckets_since)
 from entries.models import Transaction
 
 from .managers import AccountManager
 
 
-class BaseAccountModel(MPTTModel, CachingMixin):
+class BaseAccountModel(MPTTModel):
     """Abstract class storing common attributes of Headers and Accounts.
 
     Subclasses must implement the ``_calculate_full_number`` and
@@ -267,7 +269,6 @@ class Account(BaseAccountModel):
             balance *= -1
         return balance
 
-    @cached_method
     def get_balance_by_date(self, date):
         """
         Calculate the :class:`Account's<Account>` balance at the end of a
@@ -277,32 +278,43 @@ class Account(BaseAccountModel):
         :class:`Transactions<Transaction>` from all :class:`Accounts<Account>`
         with :attr:`~BaseAccountModel.type` of 4 to 8 will be used.
 
+        The balance is the :attr:`balance` stored in the database minus the
+        total of any later :class:`Transactions<Transaction>`. That total is
+        cached until a :class:`~entries.models.Transaction` of this
+        :class:`Account`, dated in or after the ``date's`` month, is changed.
+        The stored :attr:`balance` is cached until the balance of this
+        :class:`Account` is changed, & the ``Current Year Earnings`` balance
+        until the balance of an :class:`Account` it sums is changed.
+
         :param date: The day whose balance should be returned.
         :type date: datetime.date
         :returns: The Account's balance at the end of the specified date.
         :rtype: :class:`decimal.Decimal`
         """
         if self.name == "Current Year Earnings":
-            transaction_set = Transaction.objects.filter(
-                account__type__in=range(4, 9))
-        else:
-            transaction_set = self.transaction_set
-        past_transactions = transaction_set.filter(date__lte=date).reverse()
-
-        if self.name == "Current Year Earnings":
-            return (past_transactions.aggregate(
-                models.Sum('balance_delta'))['balance_delta__sum'] or
+            earnings_ids = get_cached_account_ids(
+                'earnings', lambda: list(Account.objects.filter(
+                    type__in=range(4, 9)).values_list('id', flat=True)))
+            return get_cached_accounts_value(
+                'balance_by_date', earnings_ids, (date.isoformat(),),
+                lambda: Transaction.objects.filter(
+                    account__type__in=range(4, 9), date__lte=date).aggregate(
+                    models.Sum('balance_delta'))['balance_delta__sum'] or
                 Decimal(0))
-        elif past_transactions:
-            return past_transactions[0].get_final_account_balance()
-        else:
-            transaction_sum = (transaction_set.all().aggregate(
+        later_total = get_cached_account_value(
+            'balance_by_date', self.id, month_buckets_since(date),
+            (date.isoformat(),),
+            lambda: self.transaction_set.filter(date__gt=date).aggregate(
                 models.Sum('balance_delta'))['balance_delta__sum'] or
-                Decimal(0))
-            balance = self.balance - transaction_sum
-            if self.flip_balance():
-                balance *= -1
-            return balance
+            Decimal(0))
+        current_balance = get_cached_account_value(
+            'balance', self.id, [BALANCE_BUCKET], (),
+            lambda: Account.objects.filter(id=self.id).values_list(
+                'balance', flat=True)[0])
+        balance = current_balance - later_total
+        if self.flip_balance():
+            balance *= -1
+        return balance
 
     def get_balance_change_by_month(self, date):
         """
@@ -313,6 +325,10 @@ class Account(BaseAccountModel):
         :class:`Transactions<Transaction>` from all :class:`Accounts<Account>`
         with :attr:`~BaseAccountModel.type` of 4 to 8 will be used.
 
+        The net change of other :class:`Accounts<Account>` is cached until a
+        :class:`~entries.models.Transaction` of the :class:`Account` dated in
+        the ``date's`` month is changed.
+
         :param date: The month to calculate the net change for.
         :type date: datetime.date
         :returns: The Account's net balance change for the specified month.
@@ -324,10 +340,14 @@ class Account(BaseAccountModel):
         query = models.Q(date__gte=first_day, date__lte=last_day)
         if self.name == "Current Year Earnings":
             query.add(models.Q(account__type__in=range(4, 9)), models.Q.AND)
+            (_, _, net_change) = Transaction.objects.filter(query).get_totals(
+                net_change=True)
         else:
             query.add(models.Q(account__id=self.id), models.Q.AND)
-        (_, _, net_change) = Transaction.objects.filter(query).get_totals(
-            net_change=True)
+            (_, _, net_change) = get_cached_account_value(
+                'balance_change_by_month', self.id, [month_bucket(date)], (),
+                lambda: Transaction.objects.filter(query).get_totals(
+                    net_change=True))
         if self.flip_balance():
             net_change *= -1
         return net_change
@@ -343,7 +363,7 @@ class Account(BaseAccountModel):
         return list(Account.objects.filter(parent=self.parent))
 
 
-class HistoricalAccount(CachingMixin, models.Model):
+class HistoricalAccount(models.Model):
     """
     A model for Archiving Historical Account Data.
     It stores an :class:`Account's<Account>` balance (for Assets, Liabilities
@@ -406,8 +426,6 @@ class HistoricalAccount(CachingMixin, models.Model):
     amount = models.DecimalField(max_digits=19, decimal_places=4)
     date = models.DateField()
 
-    objects = CachingManager()
-
     class Meta:
         ordering = ['date', 'number']
         get_latest_by = ('date', )
@@ -417,7 +435,6 @@ class HistoricalAccount(CachingMixin, models.Model):
         return '{0}/{1} - {2}'.format(self.date.year, self.date.month,
                                       self.name)
 
-    @cached_method
     def get_absolute_url(self):
         """
         The default URL for a HistoricalAccount points to the listing for the
@@ -427,7 +444,6 @@ class HistoricalAccount(CachingMixin, models.Model):
                        kwargs={'month': self.date.month,
                                'year': self.date.year})
 
-    @cached_method
     def get_amount(self):
         """
         Calculates the flipped/value ``balance`` or ``net_change`` for Asset,
@@ -455,7 +471,6 @@ class HistoricalAccount(CachingMixin, models.Model):
         else:
             return self.amount
 
-    @cached_method
     def flip_balance(self):
         """
         Determines whether the :attr:`HistoricalAccount.amount` should be
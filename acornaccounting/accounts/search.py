@@ -0,0 +1,175 @@
+"""An In-Memory Search Index for the Account Autocomplete Widgets.
+
+Every :class:`~accounts.models.Account` number, name & description is split
+into lowercase words. The words are kept in a sorted list for prefix
+lookups, and words without digits are broken into trigrams for matching
+misspelled or partial words when nothing matches by prefix. Numbers only
+match by prefix.
+Results are ranked, so exact & prefix matches come before fuzzy ones.
+
+Each process keeps one index, rebuilt whenever the Account list version in
+:mod:`core.cache` changes, so a search never touches the database.
+
+"""
+from bisect import bisect_left
+from collections import defaultdict
+import re
+import threading
+
+from core.cache import get_accounts_version
+
+
+WORD_REGEX = re.compile(r'[\w-]+', re.UNICODE)
+#: The fraction of a query's trigrams an Account must contain to match.
+TRIGRAM_THRESHOLD = 0.5
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def search_accounts(query, limit=None, active_only=False):
+    """Return the ranked Accounts matching the query, as widget options.
+
+    :param query: The text to search for. Every Account matches an empty
+                  query, ordered by name.
+    :type query: str
+    :param limit: The maximum number of results to return.
+    :type limit: int
+    :param active_only: Only return active Accounts.
+    :type active_only: bool
+    :returns: The ``text``, ``value`` & ``description`` of each match.
+    :rtype: list
+
+    """
+    return get_account_index().search(query, limit, active_only)
+
+
+def get_account_index():
+    """Return this process's index, rebuilding it if an Account changed."""
+    global _index
+    version = get_accounts_version()
+    index = _index
+    if index is None or index.version != version:
+        with _index_lock:
+            if _index is None or _index.version != version:
+                _index = AccountIndex.build(version)
+            index = _index
+    return index
+
+
+def _get_words(text):
+    """Return the lowercase words in the text."""
+    return WORD_REGEX.findall(text.lower())
+
+
+def _has_digits(word):
+    """Return whether the word contains any numbers."""
+    return any(character.isdigit() for character in word)
+
+
+def _get_trigrams(word):
+    """Return the trigrams of the word, padded to mark it's start & end."""
+    padded = u'  {0} '.format(word)
+    return set(padded[position:position + 3]
+               for position in range(len(padded) - 2))
+
+
+class AccountIndex(object):
+    """The prefix & trigram index of a version of the Account list."""
+
+    def __init__(self, version, accounts):
+        """Index the Accounts of the version.
+
+        :param accounts: The ``(id, full_number, name, description, active)``
+                         of every Account.
+        :type accounts: list
+
+        """
+        self.version = version
+        self.options = []
+        self.names = []
+        self.active = []
+        self.words = []
+        self.trigrams = defaultdict(set)
+        for (position, account) in enumerate(
+                sorted(accounts, key=lambda account: account[2].lower())):
+            (account_id, number, name, description, active) = account
+            self.options.append({'text': name, 'description': description,
+                                 'value': account_id})
+            self.names.append(name.lower())
+            self.active.append(active)
+            words = set(_get_words(u'{0} {1} {2}'.format(
+                number or '', name, description)))
+            for word in words:
+                self.words.append((word, position))
+                if not _has_digits(word):
+                    for trigram in _get_trigrams(word):
+                        self.trigrams[trigram].add(position)
+        self.words.sort()
+
+    @classmethod
+    def build(cls, version):
+        """Build an index of every Account, using a single query."""
+        from .models import Account
+        return cls(version, Account.objects.values_list(
+            'id', 'full_number', 'name', 'description', 'active'))
+
+    def search(self, query, limit=None, active_only=False):
+        """See :func:`search_accounts`."""
+        query_words = _get_words(query)
+        if query_words:
+            scores = self._score(query.strip().lower(), query_words)
+            positions = sorted(scores, key=lambda position: (
+                -scores[position], self.names[position]))
+        else:
+            positions = range(len(self.options))
+        if active_only:
+            positions = [position for position in positions
+                         if self.active[position]]
+        return [self.options[position] for position in positions[:limit]]
+
+    def _score(self, query, query_words):
+        """Return the rank of each Account matching every query word."""
+        scores = None
+        for word in query_words:
+            word_scores = self._score_word(word)
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = dict((position, scores[position] + score)
+                              for (position, score) in word_scores.items()
+                              if position in scores)
+        for position in scores:
+            if self.names[position] == query:
+                scores[position] += 100
+            elif self.names[position].startswith(query):
+                scores[position] += 50
+        return scores
+
+    def _score_word(self, word):
+        """Rank the Accounts with words starting with the word.
+
+        Misspelled or partial words have no prefix matches, so the Accounts
+        with enough of the word's trigrams are ranked instead.
+
+        """
+        scores = {}
+        index = bisect_left(self.words, (word,))
+        while (index < len(self.words) and
+               self.words[index][0].startswith(word)):
+            (indexed_word, position) = self.words[index]
+            score = 20 if indexed_word == word else 10
+            scores[position] = max(scores.get(position, 0), score)
+            index += 1
+        if scores or _has_digits(word):
+            return scores
+        trigrams = _get_trigrams(word)
+        counts = defaultdict(int)
+        for trigram in trigrams:
+            for position in self.trigrams.get(trigram, ()):
+                counts[position] += 1
+        for (position, count) in counts.items():
+            similarity = float(count) / len(trigrams)
+            if similarity >= TRIGRAM_THRESHOLD:
+                scores[position] = similarity * 5
+        return scores
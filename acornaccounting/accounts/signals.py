@@ -1,10 +1,17 @@
 from django.db.models import F
-from django.db.models.signals import pre_delete, pre_save, post_save
+from django.db.models.signals import (pre_delete, pre_save, post_delete,
+                                      post_save)
 from django.dispatch.dispatcher import receiver
 
-from entries.models import Transaction
+from core import metrics
+from core.cache import (bump_account_versions, bump_accounts_version,
+                        bump_ledger_version)
+from entries.models import (Transaction, JournalEntry, BankSpendingEntry,
+                            BankReceivingEntry)
+from events.models import Event, HistoricalEvent
+from fiscalyears.models import FiscalYear
 
-from .models import Account
+from .models import Account, Header
 
 
 @receiver(pre_save, sender=Transaction)
@@ -14,6 +21,7 @@ def transaction_presave(sender, instance, **kwargs):
         old_instance = Transaction.objects.get(id=instance.id)
         Account.objects.filter(id=old_instance.account.id).update(
             balance=F('balance') - old_instance.balance_delta)
+        bump_account_versions([(old_instance.account_id, old_instance.date)])
 
 
 @receiver(post_save, sender=Transaction)
@@ -21,6 +29,7 @@ def transaction_postsave(sender, instance, **kwargs):
     """Change Account Balance on Save."""
     Account.objects.filter(id=instance.account.id).update(
         balance=F('balance') + instance.balance_delta)
+    bump_account_versions([(instance.account_id, instance.date)])
 
 
 @receiver(pre_delete, sender=Transaction)
@@ -28,3 +37,49 @@ def transaction_delete(sender, instance, **kwargs):
     """Refund Transaction before deleting from database."""
     Account.objects.filter(id=instance.account.id).update(
         balance=F('balance') - instance.balance_delta)
+    bump_account_versions([(instance.account_id, instance.date)])
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+@receiver(post_save, sender=Account)
+@receiver(post_delete, sender=Account)
+@receiver(post_save, sender=Header)
+@receiver(post_delete, sender=Header)
+@receiver(post_save, sender=FiscalYear)
+@receiver(post_delete, sender=FiscalYear)
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+@receiver(post_save, sender=HistoricalEvent)
+@receiver(post_delete, sender=HistoricalEvent)
+def ledger_changed(sender, instance, **kwargs):
+    """Bump the ledger version, invalidating the cached reports."""
+    bump_ledger_version()
+
+
+@receiver(post_save, sender=Account)
+@receiver(post_delete, sender=Account)
+def account_changed(sender, instance, **kwargs):
+    """Bump the versions of the Account list & the Account's balance.
+
+    The Account list is used by the select widgets.
+
+    """
+    bump_accounts_version()
+    bump_account_versions([(instance.id, None)])
+
+
+@receiver(post_save, sender=JournalEntry)
+@receiver(post_save, sender=BankSpendingEntry)
+@receiver(post_save, sender=BankReceivingEntry)
+def entry_created(sender, instance, created, **kwargs):
+    """Count the new Entry in the metrics."""
+    if created:
+        metrics.increment(metrics.ENTRIES_CREATED, type=sender.__name__)
+
+
+@receiver(post_save, sender=Transaction)
+def transaction_created(sender, instance, created, **kwargs):
+    """Count the new Transaction in the metrics."""
+    if created:
+        metrics.increment(metrics.TRANSACTIONS_POSTED)
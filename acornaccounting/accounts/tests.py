@@ -1,19 +1,25 @@
 import datetime
 from decimal import Decimal
+import json
 
+from django.core.cache import get_cache
 from django.core.urlresolvers import reverse
 from django.db.models import ProtectedError
 from django.db.utils import IntegrityError
 from django.test import TestCase
 
+from core import cache
 from core.forms import DateRangeForm
+from core.cache import get_accounts_version
 from core.tests import (create_header, create_entry, create_account,
-                        create_transaction, create_and_login_user)
+                        create_transaction, create_and_login_user,
+                        use_local_memory_cache)
 from entries.models import Transaction, BankReceivingEntry, BankSpendingEntry
 from fiscalyears.models import FiscalYear
 
 from .models import Account, Header, HistoricalAccount
 from .forms import AccountReconcileForm, ReconcileTransactionFormSet
+from .search import search_accounts
 
 
 class BaseAccountModelTests(TestCase):
@@ -1013,6 +1019,52 @@ class AccountManagerTests(TestCase):
 
         self.assertSequenceEqual([], active)
 
+    def test_rebuild_balances(self):
+        """Every balance is set to the total of it's Transactions."""
+        header = create_header('Initial')
+        account = create_account('Account', header, 0)
+        other = create_account('Other', header, 0)
+        unused = create_account('Unused', header, 0)
+        entry = create_entry(datetime.date.today(), 'Entry')
+        create_transaction(entry, account, Decimal('12.34'))
+        create_transaction(entry, other, Decimal('-12.34'))
+        Account.objects.filter(id=account.id).update(balance=5)
+        Account.objects.filter(id=unused.id).update(balance=7)
+
+        count = Account.objects.rebuild_balances()
+
+        self.assertEqual(count, 3)
+        self.assertEqual(Account.objects.get(id=account.id).balance,
+                         Decimal('12.34'))
+        self.assertEqual(Account.objects.get(id=other.id).balance,
+                         Decimal('-12.34'))
+        self.assertEqual(Account.objects.get(id=unused.id).balance, 0)
+
+    def test_rebuild_balances_after_fiscal_year(self):
+        """
+        After a Fiscal Year is closed, only later Transactions are totalled &
+        Asset, Liability & Equity Accounts add their year end amount.
+        """
+        year_end = datetime.date(2012, 12, 31)
+        asset = create_account('Asset', create_header('Assets', cat_type=1),
+                               0, 1)
+        expense = create_account(
+            'Expense', create_header('Expenses', cat_type=6), 0, 6)
+        for account in (asset, expense):
+            HistoricalAccount.objects.create(
+                account=account, number=account.get_full_number(),
+                name=account.name, type=account.type, amount=100,
+                date=year_end)
+        for (date, amount) in ((year_end, 50), (datetime.date(2013, 1, 1), 3)):
+            entry = create_entry(date, 'Entry')
+            create_transaction(entry, asset, amount)
+            create_transaction(entry, expense, -1 * amount)
+
+        Account.objects.rebuild_balances()
+
+        self.assertEqual(Account.objects.get(id=asset.id).balance, 103)
+        self.assertEqual(Account.objects.get(id=expense.id).balance, -3)
+
 
 class QuickSearchViewTests(TestCase):
     """
@@ -1113,7 +1165,8 @@ class AccountChartViewTests(TestCase):
         """
         A `GET` to the `show_accounts_chart` view should return the Header tree.
         """
-        response = self.client.get(reverse('accounts.views.show_accounts_chart'))
+        response = self.client.get(
+            reverse('accounts.views.show_accounts_chart'))
 
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'accounts/account_charts.html')
@@ -2850,3 +2903,150 @@ class BankJournalViewTests(TestCase):
                          datetime.date(2011, 1, 1))
         self.assertEqual(response.context['stop_date'],
                          datetime.date(2012, 3, 7))
+
+
+class AccountsJSONViewTests(TestCase):
+    """Test the versioned ``accounts_json`` view."""
+
+    def setUp(self):
+        """Use a real cache & create an Account."""
+        use_local_memory_cache(self)
+        self.account = create_account('Account', create_header('Header'), 0)
+        self.account.get_full_number()
+        self.version = get_accounts_version()
+        self.url = reverse('accounts_json', args=[self.version])
+
+    def test_returns_cacheable_json(self):
+        """The Account list is returned with long lived cache headers."""
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response['ETag'], '"{0}"'.format(self.version))
+        self.assertIn('Last-Modified', response)
+        self.assertEqual(response['Cache-Control'],
+                         'private, max-age=31536000')
+        self.assertEqual(
+            json.loads(response.content),
+            [{'text': 'Account', 'description': '',
+              'value': self.account.id}])
+
+    def test_matching_etag_not_modified(self):
+        """A request with the current ETag returns no content."""
+        response = self.client.get(
+            self.url, HTTP_IF_NONE_MATCH='"{0}"'.format(self.version))
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_account_change_redirects_old_version(self):
+        """Changing an Account creates a new version of the list."""
+        self.account.name = 'Renamed'
+        self.account.save()
+        new_version = get_accounts_version()
+
+        response = self.client.get(self.url)
+
+        self.assertGreater(new_version, self.version)
+        self.assertRedirects(
+            response, reverse('accounts_json', args=[new_version]))
+
+    def test_missing_version_served_without_redirect(self):
+        """The requested version is served when the cache kept no version."""
+        cache.cache = get_cache(
+            'django.core.cache.backends.dummy.DummyCache')
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)[0]['value'],
+                         self.account.id)
+
+    def test_context_contains_current_url(self):
+        """Pages link to the current version instead of embedding it."""
+        response = self.client.get(
+            reverse('accounts.views.show_accounts_chart'))
+
+        self.assertEqual(response.context['accounts_json_url'], self.url)
+        self.assertNotIn('accounts_json', response.context)
+
+
+class AccountSearchTests(TestCase):
+    """Test the in-memory Account search index."""
+
+    def setUp(self):
+        """Use a real cache & create some Accounts."""
+        use_local_memory_cache(self)
+        header = create_header('Assets', cat_type=1)
+        self.checking = create_account('Checking', header, 0, 1, True)
+        self.checking.description = 'Main bank account'
+        self.checking.save()
+        self.savings = create_account('Savings Checking', header, 0, 1, True)
+        self.petty_cash = create_account('Petty Cash', header, 0, 1)
+        self.petty_cash.active = False
+        self.petty_cash.save()
+
+    def _search(self, query, **kwargs):
+        """Return the ids of the Accounts matching the query."""
+        return [option['value'] for option in
+                search_accounts(query, **kwargs)]
+
+    def test_empty_query_returns_all_by_name(self):
+        """All Accounts are returned, ordered by name, without a query."""
+        self.assertEqual(
+            self._search(''),
+            [self.checking.id, self.petty_cash.id, self.savings.id])
+
+    def test_ranks_name_prefix_first(self):
+        """Accounts whose name starts with the query are ranked first."""
+        self.assertEqual(self._search('check'),
+                         [self.checking.id, self.savings.id])
+
+    def test_matches_description_and_number(self):
+        """Descriptions & full numbers are searched as well."""
+        self.assertEqual(self._search('bank'), [self.checking.id])
+        self.assertEqual(
+            self._search(self.petty_cash.get_full_number()),
+            [self.petty_cash.id])
+
+    def test_matches_misspelled_words(self):
+        """Trigrams match words that are close to the query."""
+        self.assertEqual(self._search('savngs'), [self.savings.id])
+
+    def test_all_words_must_match(self):
+        """Each word of the query narrows the results."""
+        self.assertEqual(self._search('check sav'), [self.savings.id])
+
+    def test_limit_and_active_only(self):
+        """The results may be limited & exclude inactive Accounts."""
+        self.assertEqual(self._search('', limit=1), [self.checking.id])
+        self.assertEqual(self._search('', active_only=True),
+                         [self.checking.id, self.savings.id])
+
+    def test_matches_non_ascii_names(self):
+        """Accounts with accented names are indexed & matched."""
+        cafe = create_account(u'Caf\xe9 Supplies', self.checking.parent, 0,
+                              1)
+
+        self.assertEqual(self._search(u'caf\xe9'), [cafe.id])
+        self.assertEqual(self._search(u'cafe suplies'), [cafe.id])
+
+    def test_index_reused_until_account_changes(self):
+        """Searches use no queries until an Account is changed."""
+        self._search('cash')
+
+        with self.assertNumQueries(0):
+            self._search('cash')
+        create_account('Cash Drawer', self.checking.parent, 0, 1)
+
+        self.assertEqual(len(self._search('cash')), 2)
+
+    def test_accounts_query_view(self):
+        """The AJAX view returns the ranked, limited & filtered matches."""
+        response = self.client.get(
+            reverse('accounts_query'), {'q': 'c', 'limit': 2, 'active': 1},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+        self.assertEqual(
+            [option['value'] for option in
+             json.loads(response.content)['content']],
+            [self.checking.id, self.savings.id])
@@ -22,4 +22,6 @@ urlpatterns = patterns(
         name='bank_journal'),
 
     url(r'^ajax/accounts/$', 'accounts_query', name='accounts_query'),
+    url(r'^ajax/accounts/(?P<version>\d+)\.json$', 'accounts_json',
+        name='accounts_json'),
 )
@@ -1,4 +1,5 @@
 import datetime
+import json
 
 from dateutil import relativedelta
 from django_ajax.decorators import ajax
@@ -6,18 +7,24 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.core.urlresolvers import reverse
 from django.db.models import Q, Max
-from django.http import HttpResponseRedirect, Http404
+from django.http import HttpResponse, HttpResponseRedirect, Http404
 from django.shortcuts import render, get_object_or_404
+from django.views.decorators.http import condition
 
 
+from core.cache import get_cached_accounts_json, get_stored_accounts_version
 from core.core import (today_in_american_format,
                        remove_trailing_zeroes,
                        process_month_start_date_range_form,
                        process_year_start_date_range_form)
+from core.db.replicas import use_replica
+from entries.models import (BankSpendingEntry, BankReceivingEntry,
+                            Transaction)
 from fiscalyears.fiscalyears import get_start_of_current_fiscal_year
 
 from .forms import AccountReconcileForm, ReconcileTransactionFormSet
 from .models import Account, Header, HistoricalAccount
+from .search import search_accounts
 
 
 def quick_account_search(request):
@@ -56,6 +63,7 @@ def show_accounts_chart(request, header_slug=None,
     return render(request, template_name, locals())
 
 
+@use_replica
 def show_account_detail(request, account_slug,
                         template_name="accounts/account_detail.html"):
     """
@@ -104,7 +112,7 @@ def show_account_detail(request, account_slug,
         date_range_query).select_related('journal_entry', 'bankspendingentry',
                                          'bankspend_entry',
                                          'bankreceivingentry',
-                                         'bankreceive_entry')
+                                         'bankreceive_entry', 'event')
     current_fiscal_start_date = get_start_of_current_fiscal_year()
     show_balance = (current_fiscal_start_date is None or
                     current_fiscal_start_date <= start_date)
@@ -128,6 +136,7 @@ def show_account_detail(request, account_slug,
     return render(request, template_name, locals())
 
 
+@use_replica
 def show_account_history(request, month=None, year=None,
                          template_name="accounts/account_history.html"):
     """
@@ -230,15 +239,44 @@ def bank_journal(request, account_slug,
     in_range_bank_query = ((Q(bankspendingentry__isnull=False) |
                             Q(bankreceivingentry__isnull=False)) &
                            (Q(date__lte=stop_date) & Q(date__gte=start_date)))
-    transactions = account.transaction_set.filter(
+    transactions = list(account.transaction_set.filter(
         in_range_bank_query).select_related('journal_entry',
                                             'bankspendingentry',
                                             'bankspend_entry',
                                             'bankreceivingentry',
-                                            'bankreceive_entry')
+                                            'bankreceive_entry', 'event'))
+    _add_entry_transactions(transactions)
     return render(request, template_name, locals())
 
 
+def _add_entry_transactions(transactions):
+    """Set the ``entry_transactions`` of each bank Entry's main Transaction.
+
+    The Transactions of every Entry are retrieved in a single query.
+
+    """
+    entries = [transaction.get_journal_entry() for transaction in
+               transactions]
+    spending_ids = [entry.id for entry in entries
+                    if isinstance(entry, BankSpendingEntry)]
+    receiving_ids = [entry.id for entry in entries
+                     if isinstance(entry, BankReceivingEntry)]
+    entry_transactions = {}
+    for entry_transaction in Transaction.objects.filter(
+            Q(bankspend_entry__in=spending_ids) |
+            Q(bankreceive_entry__in=receiving_ids)).select_related('account'):
+        key = (('spending', entry_transaction.bankspend_entry_id)
+               if entry_transaction.bankspend_entry_id else
+               ('receiving', entry_transaction.bankreceive_entry_id))
+        entry_transactions.setdefault(key, []).append(entry_transaction)
+    for (transaction, entry) in zip(transactions, entries):
+        if isinstance(entry, BankSpendingEntry):
+            key = ('spending', entry.id)
+        else:
+            key = ('receiving', entry.id)
+        transaction.entry_transactions = entry_transactions.get(key, [])
+
+
 @login_required
 def reconcile_account(request, account_slug,
                       template_name="accounts/account_reconcile.html"):
@@ -335,21 +373,68 @@ def reconcile_account(request, account_slug,
 
 @ajax
 def accounts_query(request):
-    """AJAX endpoint for querying Account Names & Descriptions.
+    """AJAX endpoint for querying Account Numbers, Names & Descriptions.
+
+    Returns an array of JSON objects for the Accounts matching the GET
+    parameter ``q``, best matches first. Each object has a ``text``,
+    ``value`` & ``description`` property. Defaults to all
+    :class:`~accounts.models.Account` if ``q`` is not present in the ``GET``
+    parameters.
 
-    Returns an array of JSON objects that contain the GET parameter ``q`` in
-    their ``name`` or ``description``. Each object has a ``text``, ``value`` &
-    ``description`` property. Defaults to all :class:`~accounts.models.Account`
-    if ``q`` is not present in the ``GET`` parameters.
+    The optional ``limit`` parameter caps the number of results & passing
+    ``active=1`` excludes inactive Accounts. The search uses the in-memory
+    index of :mod:`accounts.search` instead of querying the database.
 
     """
-    if 'q' in request.GET:
-        q = request.GET['q']
-        accounts = Account.objects.filter(
-            Q(name__icontains=q) | Q(description__icontains=q))
-    else:
-        accounts = Account.objects.all()
-    return [{'text': account.name,
-             'description': account.description,
-             'value': account.id
-             } for account in accounts]
+    try:
+        limit = int(request.GET['limit'])
+    except (KeyError, ValueError):
+        limit = None
+    return search_accounts(request.GET.get('q', ''), limit,
+                           active_only=request.GET.get('active') == '1')
+
+
+def _get_accounts_json_etag(request, version):
+    """Use the requested version of the Account list as it's ETag."""
+    return version
+
+
+def _get_accounts_json_last_modified(request, version):
+    """Return the time of the requested version of the Account list."""
+    return datetime.datetime.utcfromtimestamp(int(version) / 1000.0)
+
+
+@condition(etag_func=_get_accounts_json_etag,
+           last_modified_func=_get_accounts_json_last_modified)
+def accounts_json(request, version):
+    """Return a JSON array of every :class:`~accounts.models.Account`.
+
+    Each object has a ``text``, ``value`` & ``description`` property. This is
+    used to populate the Account select widgets.
+
+    The ``version`` changes whenever an Account is changed, so responses may
+    be cached by the User's browser for a year. Requests for an old version
+    are redirected to the current one. If the cache has not kept a current
+    version, e.g. when it is unreachable, the requested version is served
+    instead, since redirecting would start a new version for every request.
+    The JSON of each version is built once & kept in the cache.
+
+    """
+    current_version = get_stored_accounts_version()
+    if current_version is not None and int(version) != current_version:
+        return HttpResponseRedirect(
+            reverse('accounts_json', args=[current_version]))
+    response = HttpResponse(
+        get_cached_accounts_json(int(version), _build_accounts_json),
+        content_type='application/json')
+    response['Cache-Control'] = 'private, max-age={0}'.format(
+        60 * 60 * 24 * 365)
+    return response
+
+
+def _build_accounts_json():
+    """Return the JSON array of all Accounts, ordered by name."""
+    return json.dumps([{'text': account.name,
+                        'description': account.description,
+                        'value': account.id}
+                       for account in Account.objects.order_by('name')])
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import BankAccount, CheckRange
+from .models import BankAccount, CheckRange, ImportFingerprint
 
 
 class CheckRangeInline(admin.TabularInline):
@@ -13,3 +13,10 @@ class BankAccountAdmin(admin.ModelAdmin):
     inlines = (CheckRangeInline,)
 
 admin.site.register(BankAccount, BankAccountAdmin)
+
+
+class ImportFingerprintAdmin(admin.ModelAdmin):
+    list_display = ('fingerprint', 'bank_account', 'created_at')
+    list_filter = ('bank_account',)
+
+admin.site.register(ImportFingerprint, ImportFingerprintAdmin)
@@ -4,10 +4,9 @@ from django.forms.formsets import formset_factory
 
 from accounts.models import Account
 from entries.forms import BankSpendingForm, TransferForm, BankReceivingForm
-from entries.models import (JournalEntry, BankSpendingEntry,
-                            BankReceivingEntry, Transaction)
+from entries.models import BankSpendingEntry, BankReceivingEntry
 
-from .models import BankAccount
+from .models import BankAccount, StatementLine
 
 
 class BankAccountForm(forms.Form):
@@ -20,6 +19,9 @@ class BankAccountForm(forms.Form):
     )
 
 
+BankStatementFormSet = formset_factory(BankAccountForm, extra=12)
+
+
 class ImportFormMixin(object):
     """A mixin to help customize Import specific Forms."""
 
@@ -38,6 +40,19 @@ class ImportFormMixin(object):
         if hasattr(self, 'initial') and 'date' in self.initial:
             self.initial['date'] = self.initial['date'].strftime('%m/%d/%Y')
 
+    def update_line(self, line):
+        """Copy the cleaned data to the :class:`~.models.StatementLine`."""
+        cleaned_data = self.cleaned_data
+        line.date = cleaned_data.get('date')
+        line.amount = abs(cleaned_data.get('amount'))
+        line.memo = cleaned_data.get('memo') or ''
+        self._update_line_fields(line)
+        line.save()
+
+    def _update_line_fields(self, line):
+        """Copy the form-specific fields to the StatementLine."""
+        raise NotImplementedError
+
 
 class TransferImportForm(ImportFormMixin, TransferForm):
     """A form for importing unmatched Transfers."""
@@ -51,27 +66,22 @@ class TransferImportForm(ImportFormMixin, TransferForm):
         max_length=50, required=False,
         widget=forms.TextInput(attrs={'class': 'form-control enter-mod'}))
 
+    line = forms.IntegerField(widget=forms.HiddenInput())
+
     def __init__(self, *args, **kwargs):
         """Set the initial Source/Destination Querysets & fix field order."""
         super(TransferImportForm, self).__init__(*args, **kwargs)
         self._set_account_queryset_from_initial('source')
         self._set_account_queryset_from_initial('destination')
         self.fields.keyOrder = (
-            'date', 'source', 'destination', 'memo', 'amount')
+            'date', 'source', 'destination', 'memo', 'amount', 'line')
 
-    def save(self):
-        """Save the Transfer by Creating a General Journal Entry."""
-        cleaned_data = self.cleaned_data
-        entry = JournalEntry.objects.create(
-            date=cleaned_data.get('date'), memo='Bank Transfer')
-        Transaction.objects.create(
-            journal_entry=entry, account=cleaned_data.get('source'),
-            balance_delta=cleaned_data.get('amount'), date=entry.date,
-        )
-        Transaction.objects.create(
-            journal_entry=entry, account=cleaned_data.get('destination'),
-            balance_delta=-1 * cleaned_data.get('amount'), date=entry.date,
-        )
+    def _update_line_fields(self, line):
+        """Use the non-bank side of the Transfer as the line's Account."""
+        if line.line_type == StatementLine.TRANSFER_DEPOSIT:
+            line.account = self.cleaned_data.get('source')
+        else:
+            line.account = self.cleaned_data.get('destination')
 
 
 TransferImportFormSet = formset_factory(
@@ -85,6 +95,7 @@ class SpendingImportForm(ImportFormMixin, BankSpendingForm):
         queryset=Account.objects.active().order_by('name'),
         widget=forms.Select(attrs={
             'class': 'account-autocomplete form-control enter-mod account'}))
+    line = forms.IntegerField(widget=forms.HiddenInput())
 
     class Meta(object):
         """Remove the ``comments`` field from the base BankSpendingForm."""
@@ -119,23 +130,16 @@ class SpendingImportForm(ImportFormMixin, BankSpendingForm):
                    'class': 'form-control enter-mod'})
         self._set_account_queryset_from_initial('expense_account')
 
-    def save(self, *args, **kwargs):
-        """Create the BankSpendingEntry and it's Transactions."""
+    def _update_line_fields(self, line):
+        """Set the line's Expense Account, Payee, & Check Number."""
         cleaned_data = self.cleaned_data
-        main_transaction = Transaction.objects.create(
-            date=cleaned_data.get('date'), account=cleaned_data.get('account'),
-            balance_delta=cleaned_data.get('amount'),)
-        if cleaned_data.get('ach_payment'):
-            entry_kwargs = {'ach_payment': True}
+        line.account = cleaned_data.get('expense_account')
+        line.payee = cleaned_data.get('payee') or ''
+        line.ach_payment = cleaned_data.get('ach_payment')
+        if line.ach_payment:
+            line.check_number = ''
         else:
-            entry_kwargs = {'check_number': cleaned_data.get('check_number')}
-        entry = BankSpendingEntry.objects.create(
-            main_transaction=main_transaction, date=cleaned_data.get('date'),
-            memo=cleaned_data.get('memo'), payee=cleaned_data.get('payee'),
-            **entry_kwargs)
-        Transaction.objects.create(
-            bankspend_entry=entry, account=cleaned_data.get('expense_account'),
-            balance_delta=-1 * cleaned_data.get('amount'))
+            line.check_number = cleaned_data.get('check_number') or ''
 
 
 SpendingImportFormSet = formset_factory(
@@ -149,6 +153,7 @@ class ReceivingImportForm(ImportFormMixin, BankReceivingForm):
         queryset=Account.objects.active().order_by('name'),
         widget=forms.Select(attrs={
             'class': 'account-autocomplete form-control enter-mod account'}))
+    line = forms.IntegerField(widget=forms.HiddenInput())
 
     class Meta(object):
         """Customize the field order & widgets."""
@@ -174,19 +179,10 @@ class ReceivingImportForm(ImportFormMixin, BankReceivingForm):
                    'class': 'form-control enter-mod'})
         self._set_account_queryset_from_initial('receiving_account')
 
-    def save(self, *args, **kwargs):
-        """Create the BankReceivingEntry and it's Transactions."""
-        cleaned_data = self.cleaned_data
-        main_transaction = Transaction.objects.create(
-            date=cleaned_data.get('date'), account=cleaned_data.get('account'),
-            balance_delta=cleaned_data.get('amount'))
-        entry = BankReceivingEntry.objects.create(
-            main_transaction=main_transaction, date=cleaned_data.get('date'),
-            memo=cleaned_data.get('memo'), payor=cleaned_data.get('payor'))
-        Transaction.objects.create(
-            bankreceive_entry=entry,
-            account=cleaned_data.get('receiving_account'),
-            balance_delta=-1 * cleaned_data.get('amount'))
+    def _update_line_fields(self, line):
+        """Set the line's Receiving Account & Payor."""
+        line.account = self.cleaned_data.get('receiving_account')
+        line.payor = self.cleaned_data.get('payor')
 
 ReceivingImportFormSet = formset_factory(
     ReceivingImportForm, extra=0, can_delete=False)
@@ -7,6 +7,11 @@ import re
 
 from ofxparse import OfxParser
 
+from .qfx_stream import iter_transactions
+
+
+SPACE_REDUCING_REGEX = re.compile(r'\s\s+')
+
 
 class BaseImporter(object):
     """An abstract class for the ``import_bank_statement`` view.
@@ -72,14 +77,13 @@ class CSVImporter(BaseImporter):
 
         reader = csv.DictReader(file_object, fieldnames=self.CSV_FIELD_ORDER)
         data = []
-        space_reducing_regex = re.compile(r'\s\s+')
         for row in reader:
             item = {}
             for (csv_field, data_field) in self.CSV_TO_DATA_FIELDS.items():
                 item[data_field] = row.get(csv_field)
             item['type'] = self.CSV_TYPE_TO_DATA_TYPE[item['type']]
             item['amount'] = Decimal(item['amount'])
-            item['memo'] = space_reducing_regex.sub(' ', item['memo'])
+            item['memo'] = SPACE_REDUCING_REGEX.sub(' ', item['memo'])
             item['date'] = datetime.datetime.strptime(
                 item['date'], self.CSV_DATE_FORMAT).date()
             data.append(item)
@@ -96,26 +100,48 @@ class QFXImporter(BaseImporter):
     def process_file(self, file_object):
         """Read the QFX file & Return the standardized data."""
         ofx_data = OfxParser.parse(file_object)
-
-        data = []
-        space_reducing_regex = re.compile(r'\s\s+')
-        for transaction in ofx_data.account.statement.transactions:
-            item = {
-                'date': transaction.date,
-                'check_number': transaction.checknum,
-                'memo': space_reducing_regex.sub(
-                    ' ', self.clean_memo(transaction.memo)),
-                'amount': transaction.amount,
-            }
-            if transaction.type in ('debit', 'check'):
-                item['type'] = 'withdrawal'
-                if item['check_number'] == '':
-                    item['check_number'] = '0'
-            else:
-                item['type'] = 'deposit'
-            data.append(item)
-        return data
+        return [
+            self.build_item(transaction.date, transaction.checknum,
+                            transaction.memo, transaction.amount,
+                            transaction.type)
+            for transaction in ofx_data.account.statement.transactions
+        ]
+
+    def build_item(self, date, check_number, memo, amount, transaction_type):
+        """Build the standardized data for a single QFX Transaction."""
+        item = {
+            'date': date,
+            'check_number': check_number,
+            'memo': SPACE_REDUCING_REGEX.sub(' ', self.clean_memo(memo)),
+            'amount': amount,
+        }
+        if transaction_type in ('debit', 'check'):
+            item['type'] = 'withdrawal'
+            if item['check_number'] == '':
+                item['check_number'] = '0'
+        else:
+            item['type'] = 'deposit'
+        return item
 
     def clean_memo(self, memo):
         """Clean the memo field."""
         return memo
+
+
+class StreamingQFXImporter(QFXImporter):
+    """A QFX importer that tokenizes the ``<STMTTRN>`` blocks as a stream.
+
+    This produces the same data as the :class:`QFXImporter` but skips building
+    a BeautifulSoup tree of the entire file, making it much faster & lighter on
+    large statements. See :mod:`bank_import.importers.qfx_stream`.
+
+    """
+
+    def process_file(self, file_object):
+        """Tokenize the QFX file & Return the standardized data."""
+        return [
+            self.build_item(transaction['date'], transaction['checknum'],
+                            transaction['memo'], transaction['amount'],
+                            transaction['type'])
+            for transaction in iter_transactions(file_object)
+        ]
@@ -21,3 +21,7 @@ class QFXImporter(base.QFXImporter):
         for removal in removals:
             memo = memo.replace(removal, '').strip()
         return memo
+
+
+class StreamingQFXImporter(QFXImporter, base.StreamingQFXImporter):
+    """Clean up the memo field while using the streaming QFX tokenizer."""
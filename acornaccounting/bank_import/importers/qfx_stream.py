@@ -0,0 +1,131 @@
+"""A Streaming Tokenizer for the ``<STMTTRN>`` Blocks of QFX/OFX Files.
+
+Unlike ``ofxparse``, this module never builds a document tree. The file is
+read in fixed-size chunks and each ``<TAG>value`` token is inspected exactly
+once, so memory use stays flat no matter how large the statement is.
+
+Both the SGML (OFX 1.x, unclosed leaf elements) and XML (OFX 2.x) dialects
+are supported.
+
+"""
+import datetime
+from decimal import Decimal, InvalidOperation
+from HTMLParser import HTMLParser
+import re
+
+
+TOKEN_REGEX = re.compile(r'<([^<>]*)>([^<]*)')
+TIMEZONE_REGEX = re.compile(r'\[(?P<tz>[-+]?\d+\.?\d*)\:\w*\]$')
+FRACTIONAL_SECONDS_REGEX = re.compile(r'^[0-9]*\.([0-9]{0,5})')
+
+TRANSACTION_FIELDS = {
+    'DTPOSTED': 'date',
+    'CHECKNUM': 'checknum',
+    'MEMO': 'memo',
+    'TRNAMT': 'amount',
+    'TRNTYPE': 'type',
+}
+STATEMENT_END_TAGS = ('/STMTRS', '/CCSTMTRS')
+
+_html_parser = HTMLParser()
+
+
+def iter_transactions(file_object, chunk_size=64 * 1024):
+    """Yield a dictionary for each ``<STMTTRN>`` of the first statement.
+
+    Each dictionary contains the ``date``, ``checknum``, ``memo``, ``amount``
+    & ``type`` keys, converted the same way ``ofxparse`` converts them.
+
+    Only the first statement in the file is read, mirroring the
+    ``OfxParser.parse(...).account.statement`` attribute used by the
+    :class:`~bank_import.importers.base.QFXImporter`.
+
+    """
+    transaction = None
+    for (tag, text) in iter_tokens(file_object, chunk_size):
+        if tag == 'STMTTRN':
+            transaction = {}
+        elif tag == '/STMTTRN':
+            if transaction is not None:
+                yield _convert_transaction(transaction)
+            transaction = None
+        elif tag in STATEMENT_END_TAGS:
+            return
+        elif transaction is not None and tag in TRANSACTION_FIELDS:
+            transaction.setdefault(TRANSACTION_FIELDS[tag], text)
+
+
+def iter_tokens(file_object, chunk_size=64 * 1024):
+    """Yield ``(TAG, text)`` tuples from the file, one chunk at a time.
+
+    A token's text runs until the next ``<``, so the last token of a chunk is
+    held back until the following chunk arrives. Closing tags keep their
+    leading ``/``, processing instructions & declarations are skipped.
+
+    """
+    buffer_ = file_object.read(0)
+    while True:
+        chunk = file_object.read(chunk_size)
+        buffer_ += chunk
+        end = len(buffer_) if not chunk else buffer_.rfind('<')
+        if end > 0:
+            for match in TOKEN_REGEX.finditer(buffer_, 0, end):
+                tag = match.group(1).strip()
+                if tag[:1] in ('?', '!'):
+                    continue
+                yield tag.upper(), match.group(2).strip()
+            buffer_ = buffer_[end:]
+        if not chunk:
+            return
+
+
+def parse_datetime(value):
+    """Parse an OFX date like ``20101106160000.00[-5:EST]`` into UTC."""
+    timezone_match = TIMEZONE_REGEX.search(value)
+    offset = float(timezone_match.group('tz')) if timezone_match else 0
+    seconds_match = FRACTIONAL_SECONDS_REGEX.search(value)
+    fraction = float('0.' + seconds_match.group(1)) if seconds_match else 0
+    adjustment = (datetime.timedelta(seconds=fraction) -
+                  datetime.timedelta(hours=offset))
+    try:
+        local_date = datetime.datetime.strptime(value[:14], '%Y%m%d%H%M%S')
+    except ValueError:
+        if value[:8] == '00000000':
+            return None
+        local_date = datetime.datetime.strptime(value[:8], '%Y%m%d')
+    return local_date + adjustment
+
+
+def parse_amount(value):
+    """Parse an OFX amount, allowing for the various decimal separators."""
+    if re.search(r'.*\..*,', value):
+        value = value.replace('.', '')
+    if re.search(r'.*,.*\.', value):
+        value = value.replace(',', '')
+    if '.' not in value and ',' in value:
+        value = value.replace(',', '.')
+    value = value.replace(' ', '').replace('+', '')
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        if value in ('null', '-null'):
+            return Decimal(0)
+        raise
+
+
+def _convert_transaction(fields):
+    """Convert the raw token text of a ``<STMTTRN>`` into Python values."""
+    return {
+        'date': parse_datetime(fields.get('date', '')),
+        'checknum': _unescape(fields.get('checknum', '')),
+        'memo': _unescape(fields.get('memo', '')),
+        'amount': parse_amount(fields.get('amount', '')),
+        'type': fields.get('type', '').lower(),
+    }
+
+
+def _unescape(text):
+    """Replace any SGML/XML character entities in the text."""
+    if '&' in text:
+        return _html_parser.unescape(text)
+    return text
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'StatementLine'
+        db.create_table('bank_import_statementline', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('statement_import', self.gf('django.db.models.fields.related.ForeignKey')(related_name='lines', to=orm['bank_import.StatementImport'])),
+            ('line_type', self.gf('django.db.models.fields.CharField')(max_length=20)),
+            ('date', self.gf('django.db.models.fields.DateField')()),
+            ('amount', self.gf('django.db.models.fields.DecimalField')(max_digits=19, decimal_places=4)),
+            ('account', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['accounts.Account'], null=True, on_delete=models.SET_NULL, blank=True)),
+            ('check_number', self.gf('django.db.models.fields.CharField')(max_length=10, blank=True)),
+            ('ach_payment', self.gf('django.db.models.fields.BooleanField')(default=False)),
+            ('memo', self.gf('django.db.models.fields.CharField')(max_length=255, blank=True)),
+            ('payee', self.gf('django.db.models.fields.CharField')(max_length=50, blank=True)),
+            ('payor', self.gf('django.db.models.fields.CharField')(max_length=50, blank=True)),
+            ('fingerprint', self.gf('django.db.models.fields.CharField')(max_length=40, blank=True)),
+            ('needs_attention', self.gf('django.db.models.fields.BooleanField')(default=True, db_index=True)),
+        ))
+        db.send_create_signal('bank_import', ['StatementLine'])
+
+        # Adding model 'StatementImport'
+        db.create_table('bank_import_statementimport', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('bank_account', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['bank_import.BankAccount'])),
+            ('created_at', self.gf('django.db.models.fields.DateTimeField')(auto_now_add=True, blank=True)),
+        ))
+        db.send_create_signal('bank_import', ['StatementImport'])
+
+
+    def backwards(self, orm):
+        # Deleting model 'StatementLine'
+        db.delete_table('bank_import_statementline')
+
+        # Deleting model 'StatementImport'
+        db.delete_table('bank_import_statementimport')
+
+
+    models = {
+        'accounts.account': {
+            'Meta': {'ordering': "['name']", 'object_name': 'Account'},
+            'active': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'balance': ('django.db.models.fields.DecimalField', [], {'default': "'0.00'", 'max_digits': '19', 'decimal_places': '4'}),
+            'bank': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'description': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'full_number': ('django.db.models.fields.CharField', [], {'max_length': '7', 'null': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_reconciled': ('django.db.models.fields.DateField', [], {'null': 'True', 'blank': 'True'}),
+            u'level': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'}),
+            u'lft': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '50'}),
+            'parent': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['accounts.Header']"}),
+            'reconciled_balance': ('django.db.models.fields.DecimalField', [], {'default': "'0.00'", 'max_digits': '19', 'decimal_places': '4'}),
+            u'rght': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'}),
+            'slug': ('django.db.models.fields.SlugField', [], {'unique': 'True', 'max_length': '50'}),
+            u'tree_id': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'}),
+            'type': ('django.db.models.fields.PositiveSmallIntegerField', [], {'blank': 'True'})
+        },
+        'accounts.header': {
+            'Meta': {'ordering': "['name']", 'object_name': 'Header'},
+            'active': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'description': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'full_number': ('django.db.models.fields.CharField', [], {'max_length': '7', 'null': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            u'level': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'}),
+            u'lft': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '50'}),
+            'parent': ('mptt.fields.TreeForeignKey', [], {'to': "orm['accounts.Header']", 'null': 'True', 'blank': 'True'}),
+            u'rght': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'}),
+            'slug': ('django.db.models.fields.SlugField', [], {'unique': 'True', 'max_length': '50'}),
+            u'tree_id': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'}),
+            'type': ('django.db.models.fields.PositiveSmallIntegerField', [], {'blank': 'True'})
+        },
+        'bank_import.bankaccount': {
+            'Meta': {'ordering': "('name',)", 'object_name': 'BankAccount'},
+            'account': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['accounts.Account']"}),
+            'bank': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50', 'blank': 'True'})
+        },
+        'bank_import.checkrange': {
+            'Meta': {'object_name': 'CheckRange'},
+            'bank_account': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['bank_import.BankAccount']"}),
+            'default_account': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['accounts.Account']"}),
+            'default_memo': ('django.db.models.fields.CharField', [], {'max_length': '60', 'blank': 'True'}),
+            'default_payee': ('django.db.models.fields.CharField', [], {'max_length': '50', 'blank': 'True'}),
+            'end_number': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'start_number': ('django.db.models.fields.PositiveIntegerField', [], {})
+        },
+        'bank_import.importfingerprint': {
+            'Meta': {'object_name': 'ImportFingerprint'},
+            'bank_account': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['bank_import.BankAccount']"}),
+            'created_at': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'fingerprint': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '40'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'})
+        },
+        'bank_import.statementimport': {
+            'Meta': {'ordering': "('-created_at',)", 'object_name': 'StatementImport'},
+            'bank_account': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['bank_import.BankAccount']"}),
+            'created_at': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'})
+        },
+        'bank_import.statementline': {
+            'Meta': {'ordering': "('line_type', 'date', 'id')", 'object_name': 'StatementLine'},
+            'account': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['accounts.Account']", 'null': 'True', 'on_delete': 'models.SET_NULL', 'blank': 'True'}),
+            'ach_payment': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'amount': ('django.db.models.fields.DecimalField', [], {'max_digits': '19', 'decimal_places': '4'}),
+            'check_number': ('django.db.models.fields.CharField', [], {'max_length': '10', 'blank': 'True'}),
+            'date': ('django.db.models.fields.DateField', [], {}),
+            'fingerprint': ('django.db.models.fields.CharField', [], {'max_length': '40', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'line_type': ('django.db.models.fields.CharField', [], {'max_length': '20'}),
+            'memo': ('django.db.models.fields.CharField', [], {'max_length': '255', 'blank': 'True'}),
+            'needs_attention': ('django.db.models.fields.BooleanField', [], {'default': 'True', 'db_index': 'True'}),
+            'payee': ('django.db.models.fields.CharField', [], {'max_length': '50', 'blank': 'True'}),
+            'payor': ('django.db.models.fields.CharField', [], {'max_length': '50', 'blank': 'True'}),
+            'statement_import': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'lines'", 'to': "orm['bank_import.StatementImport']"})
+        }
+    }
+
+    complete_apps = ['bank_import']
\ No newline at end of file
@@ -1,9 +1,25 @@
 """Models related to Bank Accounts & Imports."""
+from collections import defaultdict
+from decimal import Decimal
+import hashlib
 import importlib
+import re
 
+from django.core.urlresolvers import reverse
 from django.db import models
 
+from core import metrics
+from core.db.transactions import commit_on_success_unless_managed
 from core.models import AccountWrapper
+from entries.batch import EntryBatch
+
+
+WHITESPACE_REGEX = re.compile(r'\s+')
+
+#: The longest memo the Transfer Import Form accepts.
+TRANSFER_MEMO_LENGTH = 50
+#: The longest memo the Bank Spending & Receiving Entries accept.
+ENTRY_MEMO_LENGTH = 60
 
 
 class BankAccount(AccountWrapper):
@@ -23,15 +39,19 @@ class BankAccount(AccountWrapper):
     .. attribute:: bank
 
         The module/function path to the statement importer to use for this
-        account.
+        account. Banks that export QFX files may choose between the
+        ``ofxparse`` based importer and the faster streaming importer.
 
     """
 
     VCB_CSV_IMPORTER = 'bank_import.importers.vcb.CSVImporter'
     CF_DC_QFX_IMPORTER = 'bank_import.importers.city_first_dc.QFXImporter'
+    CF_DC_STREAMING_QFX_IMPORTER = (
+        'bank_import.importers.city_first_dc.StreamingQFXImporter')
     BANK_NAMES_TO_IMPORTERS = (
         (VCB_CSV_IMPORTER, 'Virginia Community Bank'),
         (CF_DC_QFX_IMPORTER, 'City First - Bank of DC'),
+        (CF_DC_STREAMING_QFX_IMPORTER, 'City First - Bank of DC (Fast QFX)'),
     )
     bank = models.CharField(
         blank=False, choices=BANK_NAMES_TO_IMPORTERS, max_length=100,
@@ -102,3 +122,318 @@ class CheckRange(models.Model):
     def __unicode__(self, *args, **kwargs):
         return "CheckRange {} - {} to {}".format(
             self.bank_account, self.start_number, self.end_number)
+
+
+class ImportFingerprint(models.Model):
+    """A Hash of a Statement Line that was Previously Imported or Matched.
+
+    Bank statements frequently overlap, so the fingerprints let us drop lines
+    that have already been processed before running the slower
+    ``_match_transactions`` queries.
+
+    .. attribute:: bank_account
+
+        The :class:`~BankAccount` the statement line belonged to.
+
+    .. attribute:: fingerprint
+
+        The SHA-1 hex digest of the line's Bank Account, date, signed amount,
+        check number, normalized memo & occurrence count. The occurrence count
+        distinguishes identical lines appearing in the same statement, e.g.
+        two purchases of the same amount at the same store on the same day.
+
+    .. attribute:: created_at
+
+        The date & time the line was first imported or matched.
+
+    """
+
+    bank_account = models.ForeignKey(BankAccount)
+    fingerprint = models.CharField(max_length=40, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __unicode__(self):
+        return "ImportFingerprint {} - {}".format(
+            self.bank_account, self.fingerprint)
+
+    @staticmethod
+    def build_fingerprint(bank_account, item, occurrence=0):
+        """Return the fingerprint of a single parsed statement line."""
+        amount = abs(Decimal(item['amount'])).quantize(Decimal('0.01'))
+        if 'deposit' not in item['type']:
+            amount *= -1
+        check_number = item['check_number'] or ''
+        if check_number == '0':
+            check_number = ''
+        memo = WHITESPACE_REGEX.sub(' ', item['memo'] or '').strip().lower()
+        key = u'|'.join([
+            unicode(bank_account.id), item['date'].strftime('%Y-%m-%d'),
+            unicode(amount), check_number, memo, unicode(occurrence)])
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def fingerprint_items(cls, bank_account, items):
+        """Set the ``fingerprint`` key of each parsed statement line."""
+        occurrences = defaultdict(int)
+        for item in items:
+            base_fingerprint = cls.build_fingerprint(bank_account, item)
+            item['fingerprint'] = cls.build_fingerprint(
+                bank_account, item, occurrences[base_fingerprint])
+            occurrences[base_fingerprint] += 1
+        return items
+
+    @classmethod
+    def get_seen(cls, fingerprints):
+        """Return the set of the fingerprints that have been recorded.
+
+        The existing fingerprints are fetched with a single ``IN`` query.
+
+        """
+        fingerprints = set(fingerprint for fingerprint in fingerprints
+                           if fingerprint)
+        if not fingerprints:
+            return set()
+        return set(cls.objects.filter(fingerprint__in=fingerprints)
+                   .values_list('fingerprint', flat=True))
+
+    @classmethod
+    def drop_seen_items(cls, bank_account, items):
+        """Fingerprint the items & return only those not yet seen."""
+        cls.fingerprint_items(bank_account, items)
+        seen = cls.get_seen(item['fingerprint'] for item in items)
+        return [item for item in items if item['fingerprint'] not in seen]
+
+    @classmethod
+    def record(cls, bank_account, fingerprints):
+        """Save any of the fingerprints that have not already been recorded."""
+        fingerprints = set(fingerprint for fingerprint in fingerprints
+                           if fingerprint)
+        fingerprints -= cls.get_seen(fingerprints)
+        cls.objects.bulk_create([
+            cls(bank_account=bank_account, fingerprint=fingerprint)
+            for fingerprint in sorted(fingerprints)])
+
+
+class StatementImport(models.Model):
+    """A Parsed Bank Statement Staged for Review Before Being Committed.
+
+    Uploading a statement stores the unmatched lines server-side, so the
+    review pages only need to render & post back the lines that still need
+    attention.
+
+    .. attribute:: bank_account
+
+        The :class:`~BankAccount` the statement was exported from.
+
+    .. attribute:: created_at
+
+        The date & time the statement was uploaded.
+
+    """
+
+    bank_account = models.ForeignKey(BankAccount)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta(object):
+        ordering = ('-created_at',)
+
+    def __unicode__(self):
+        return "StatementImport {} - {}".format(
+            self.bank_account, self.created_at)
+
+    def get_absolute_url(self):
+        """Return the URL of the Staged Import's review page."""
+        return reverse('bank_import.views.review_statement_import',
+                       args=[str(self.id)])
+
+    def commit(self):
+        """Create an Entry for each unseen line, then delete the Staged Import.
+
+        The Entries & Transactions are inserted in bulk by an
+        :class:`~entries.batch.EntryBatch` & the Account balances are updated
+        once. The Entries, Fingerprints & the deletion of the Staged Import
+        are all committed or rolled back together, in the caller's database
+        transaction if it is managing one. A
+        :class:`~django.core.exceptions.ValidationError` will be raised if any
+        of the Entries are invalid.
+
+        Lines whose fingerprints were recorded since the statement was staged,
+        by committing an overlapping statement, are skipped.
+
+        :returns: The number of lines skipped.
+        :rtype: int
+
+        """
+        with commit_on_success_unless_managed():
+            lines = list(self.lines.select_related('account'))
+            seen = ImportFingerprint.get_seen(
+                line.fingerprint for line in lines)
+            unseen_lines = [line for line in lines
+                            if line.fingerprint not in seen]
+            batch = EntryBatch()
+            for line in unseen_lines:
+                line.add_to_batch(batch, self.bank_account.account)
+            batch.save()
+            ImportFingerprint.record(
+                self.bank_account,
+                [line.fingerprint for line in unseen_lines])
+            self.delete()
+        metrics.increment(metrics.IMPORTS_PROCESSED, stage='committed')
+        return len(lines) - len(unseen_lines)
+
+
+class StatementLine(models.Model):
+    """A Single Unmatched Line of a :class:`StatementImport`.
+
+    The lines hold the same values as the Import Forms. They are created by
+    :func:`bank_import.staging.stage_statement`, which pre-fills them from
+    the parsed statement, & turned back into form data by
+    :meth:`get_initial_data`.
+
+    .. attribute:: statement_import
+
+        The :class:`StatementImport` the line belongs to.
+
+    .. attribute:: line_type
+
+        Whether the line is a Transfer Deposit, Transfer Withdrawal, Deposit
+        or Withdrawal.
+
+    .. attribute:: date
+
+        The date of the line.
+
+    .. attribute:: amount
+
+        The absolute amount of the line.
+
+    .. attribute:: account
+
+        The :class:`~accounts.models.Account` on the other side of the bank
+        account - the Transfer's source/destination, the Spending Entry's
+        expense account, or the Receiving Entry's receiving account.
+
+    .. attribute:: check_number
+
+        The check number of a Withdrawal, if any.
+
+    .. attribute:: ach_payment
+
+        Whether a Withdrawal is an ACH payment.
+
+    .. attribute:: memo
+
+        The memo of the Entry.
+
+    .. attribute:: payee
+
+        The Payee of a Withdrawal.
+
+    .. attribute:: payor
+
+        The Payor of a Deposit.
+
+    .. attribute:: fingerprint
+
+        The line's :attr:`ImportFingerprint.fingerprint`, recorded when the
+        line is committed.
+
+    .. attribute:: needs_attention
+
+        Whether the line is missing information that is required to create
+        it's Entry. Only these lines are shown on the review pages.
+
+    """
+
+    TRANSFER_DEPOSIT = 'transfer_deposit'
+    TRANSFER_WITHDRAWAL = 'transfer_withdrawal'
+    DEPOSIT = 'deposit'
+    WITHDRAWAL = 'withdrawal'
+    LINE_TYPES = (
+        (TRANSFER_DEPOSIT, 'Transfer Deposit'),
+        (TRANSFER_WITHDRAWAL, 'Transfer Withdrawal'),
+        (DEPOSIT, 'Deposit'),
+        (WITHDRAWAL, 'Withdrawal'),
+    )
+
+    statement_import = models.ForeignKey(
+        StatementImport, related_name='lines')
+    line_type = models.CharField(max_length=20, choices=LINE_TYPES)
+    date = models.DateField()
+    amount = models.DecimalField(max_digits=19, decimal_places=4)
+    account = models.ForeignKey(
+        'accounts.Account', blank=True, null=True, on_delete=models.SET_NULL)
+    check_number = models.CharField(max_length=10, blank=True)
+    ach_payment = models.BooleanField(default=False)
+    memo = models.CharField(max_length=255, blank=True)
+    payee = models.CharField(max_length=50, blank=True)
+    payor = models.CharField(max_length=50, blank=True)
+    fingerprint = models.CharField(max_length=40, blank=True)
+    needs_attention = models.BooleanField(default=True, db_index=True)
+
+    class Meta(object):
+        ordering = ('line_type', 'date', 'id')
+
+    def __unicode__(self):
+        return "{} {} {}".format(self.get_line_type_display(), self.date,
+                                 self.amount)
+
+    def save(self, *args, **kwargs):
+        """Refresh the ``needs_attention`` flag before saving."""
+        self.update_needs_attention()
+        super(StatementLine, self).save(*args, **kwargs)
+
+    def is_transfer(self):
+        """Return whether the line is a Transfer Deposit or Withdrawal."""
+        return self.line_type in (self.TRANSFER_DEPOSIT,
+                                  self.TRANSFER_WITHDRAWAL)
+
+    def update_needs_attention(self):
+        """Flag the line if it's Entry could not be created as-is."""
+        if self.is_transfer():
+            invalid_memo = len(self.memo) > TRANSFER_MEMO_LENGTH
+        else:
+            invalid_memo = not self.memo or len(self.memo) > ENTRY_MEMO_LENGTH
+        missing = (
+            self.account_id is None or invalid_memo or
+            (self.line_type == self.DEPOSIT and not self.payor) or
+            (self.line_type == self.WITHDRAWAL and
+             not (self.ach_payment ^ bool(self.check_number)))
+        )
+        self.needs_attention = missing
+        return missing
+
+    def get_initial_data(self, bank_account_id):
+        """Return the initial data for the line's Import Form."""
+        data = {'date': self.date, 'amount': self.amount, 'memo': self.memo,
+                'line': self.id}
+        if self.line_type == self.TRANSFER_DEPOSIT:
+            data.update(source=self.account_id, destination=bank_account_id)
+        elif self.line_type == self.TRANSFER_WITHDRAWAL:
+            data.update(source=bank_account_id, destination=self.account_id)
+        elif self.line_type == self.DEPOSIT:
+            data.update(account=bank_account_id, payor=self.payor,
+                        receiving_account=self.account_id)
+        else:
+            data.update(account=bank_account_id, payee=self.payee,
+                        expense_account=self.account_id,
+                        ach_payment=self.ach_payment,
+                        check_number=self.check_number)
+        return data
+
+    def add_to_batch(self, batch, bank_account):
+        """Add the line's Entry for the bank Account to the EntryBatch."""
+        if self.line_type == self.TRANSFER_DEPOSIT:
+            batch.add_transfer(self.date, self.account, bank_account,
+                               self.amount)
+        elif self.line_type == self.TRANSFER_WITHDRAWAL:
+            batch.add_transfer(self.date, bank_account, self.account,
+                               self.amount)
+        elif self.line_type == self.DEPOSIT:
+            batch.add_receiving(self.date, self.memo, bank_account,
+                                self.account, self.amount, self.payor)
+        else:
+            batch.add_spending(
+                self.date, self.memo, bank_account, self.account, self.amount,
+                payee=self.payee, check_number=self.check_number,
+                ach_payment=self.ach_payment)
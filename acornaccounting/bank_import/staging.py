@@ -0,0 +1,385 @@
+"""Parse, Match & Stage Bank Statements for Review.
+
+Statements are parsed by their Bank Account's importer, lines that were
+previously imported are dropped, the remaining lines are matched against
+existing Transactions & the unmatched lines are saved as a
+:class:`~.models.StatementImport`.
+
+When staging many Statements at once, the files are parsed & the
+:class:`MatchIndex` of each Bank Account is built in a thread pool. Passing
+``workers=1`` does all the work serially, in the current thread. Management
+commands may parse the files in a process pool instead, by passing
+``processes=True``, which views must not do, since the forked processes
+inherit the web worker's database connections.
+
+"""
+from collections import defaultdict
+import datetime
+from functools import partial
+import io
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+from django.db import connection
+
+from core import metrics
+from entries.models import Transaction, BankSpendingEntry, BankReceivingEntry
+
+from .models import (BankAccount, CheckRange, ImportFingerprint,
+                     StatementImport, StatementLine)
+
+
+#: The number of days a line's date may be off from a matching Transaction.
+DATE_FUZZ = datetime.timedelta(days=7)
+
+
+def stage_statements(statements, workers=None, processes=False):
+    """Parse, Match & Stage the uploaded Statements.
+
+    :param statements: The Bank Account & file contents of each Statement.
+    :type statements: A :obj:`list` of
+                      (:class:`~.models.BankAccount`, :obj:`str`) tuples
+    :param workers: The number of processes & threads to use, defaults to
+                    the number of CPUs.
+    :type workers: int
+    :param processes: Whether to parse the files in a process pool.
+    :type processes: bool
+    :returns: A Staged Import for each Statement.
+    :rtype: :obj:`list` of :class:`~.models.StatementImport`
+
+    """
+    parsed = parse_statements(
+        [(account.bank, content) for (account, content) in statements],
+        workers, processes)
+    seen_in_batch = set()
+    unseen = []
+    for ((account, _), data) in zip(statements, parsed):
+        data = [item for item in
+                ImportFingerprint.drop_seen_items(account, data)
+                if item['fingerprint'] not in seen_in_batch]
+        seen_in_batch.update(item['fingerprint'] for item in data)
+        unseen.append((account, data))
+    indexes = build_match_indexes(unseen, workers)
+    return [stage_statement(account, data, index)
+            for ((account, data), index) in zip(unseen, indexes)]
+
+
+def stage_statement(account, data, index=None):
+    """Match & Save the unseen lines of a parsed Statement for review.
+
+    :param account: The Bank Account the Statement is for.
+    :type account: :class:`~.models.BankAccount`
+    :param data: The parsed lines, fingerprinted by
+                 :meth:`~.models.ImportFingerprint.drop_seen_items`.
+    :type data: A :obj:`list` of :obj:`dicts<dict>`
+    :param index: The Transactions the lines may match.
+    :type index: :class:`MatchIndex`
+    :returns: The new Staged Import.
+    :rtype: :class:`~.models.StatementImport`
+
+    """
+    transfers, deposits, withdrawals = _group_data(data)
+    _, unmatched_transfers = _match_transactions(account, transfers, index)
+    _, unmatched_deposits = _match_transactions(account, deposits, index)
+    _, unmatched_withdrawals = _match_transactions(
+        account, withdrawals, index)
+    unmatched_fingerprints = set(
+        item['fingerprint'] for item in
+        unmatched_transfers + unmatched_deposits + unmatched_withdrawals)
+    ImportFingerprint.record(account, [
+        item['fingerprint'] for item in data
+        if item['fingerprint'] not in unmatched_fingerprints])
+
+    statement_import = StatementImport.objects.create(bank_account=account)
+    lines = []
+    for (build_function, items) in (
+            (_build_transfer, unmatched_transfers),
+            (partial(_build_spending, account), unmatched_withdrawals),
+            (_build_receiving, unmatched_deposits)):
+        initial_data = _build_initial_data(build_function, account, items)
+        lines.extend(
+            _build_line(statement_import, item, data)
+            for (item, data) in zip(items, initial_data))
+    StatementLine.objects.bulk_create(lines)
+    metrics.increment(metrics.IMPORTS_PROCESSED, stage='staged')
+    return statement_import
+
+
+def parse_statement(statement):
+    """Parse the contents of a Statement file with an Importer.
+
+    :param statement: The module path of the Importer class & the contents of
+                      the file.
+    :type statement: (:obj:`str`, :obj:`str`) tuple
+    :returns: The parsed lines.
+    :rtype: A :obj:`list` of :obj:`dicts<dict>`
+
+    """
+    (importer_path, content) = statement
+    importer_class = BankAccount(bank=importer_path).get_importer_class()
+    return importer_class(io.BytesIO(content)).get_data()
+
+
+def parse_statements(statements, workers=None, processes=False):
+    """Parse the Statements, in a pool unless ``workers`` is 1.
+
+    A thread pool is used unless ``processes`` is ``True``.
+
+    """
+    if workers == 1 or len(statements) < 2:
+        return [parse_statement(statement) for statement in statements]
+    if processes:
+        pool = multiprocessing.Pool(workers)
+    else:
+        pool = ThreadPool(workers or multiprocessing.cpu_count())
+    try:
+        return pool.map(parse_statement, statements)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def build_match_indexes(statements, workers=None):
+    """Build a :class:`MatchIndex` for each (Bank Account, lines) tuple.
+
+    The indexes are built concurrently in a thread pool unless ``workers`` is
+    1. Each thread uses it's own database connection.
+
+    """
+    if workers == 1 or len(statements) < 2:
+        return [MatchIndex(account, data) for (account, data) in statements]
+    pool = ThreadPool(workers or multiprocessing.cpu_count())
+    try:
+        return pool.map(_build_match_index_in_thread, statements)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _build_match_index_in_thread(statement):
+    """Build a MatchIndex, closing the thread's database connection after."""
+    try:
+        return MatchIndex(*statement)
+    finally:
+        connection.close()
+
+
+class MatchIndex(object):
+    """The existing Transactions a Bank Account's statement lines may match.
+
+    All the candidates are fetched up front with two queries - one for the
+    check numbers of the lines & one for the dates around the lines. Lines are
+    then matched in memory, the same way ``_match_transactions`` used to query
+    for each line.
+
+    """
+
+    def __init__(self, bank_account, items):
+        """Fetch the candidate Transactions for the items."""
+        self.by_check_number = defaultdict(list)
+        self.by_amount = defaultdict(list)
+        if not items:
+            return
+        account_id = bank_account.account_id
+        check_numbers = set(item['check_number'] for item in items
+                            if item['check_number'] not in ('', '0'))
+        if check_numbers:
+            check_transactions = Transaction.objects.filter(
+                account=account_id,
+                bankspendingentry__check_number__in=check_numbers,
+            ).select_related('bankspendingentry')
+            for transaction in check_transactions:
+                key = (transaction.bankspendingentry.check_number,
+                       transaction.balance_delta)
+                self.by_check_number[key].append(transaction)
+        dates = [_get_date(item['date']) for item in items]
+        date_transactions = Transaction.objects.filter(
+            account=account_id, date__gte=min(dates) - DATE_FUZZ,
+            date__lte=max(dates) + DATE_FUZZ)
+        for transaction in date_transactions:
+            self.by_amount[transaction.balance_delta].append(transaction)
+
+    def find_match(self, item, already_matched):
+        """Return the first unmatched Transaction the item matches, or False.
+
+        Lines with a check number match on the check number & amount, other
+        lines on the exact date & amount. If there is no match, any
+        Transaction with the same amount within a week is used.
+
+        """
+        amount = item['amount']
+        if 'deposit' in item['type']:
+            amount = -1 * amount
+        date = _get_date(item['date'])
+        if item['check_number'] not in ('', '0'):
+            matches = self.by_check_number[(item['check_number'], amount)]
+        else:
+            matches = [transaction for transaction in self.by_amount[amount]
+                       if transaction.date == date]
+        match = _find_match(matches, already_matched)
+        if not match:
+            matches = [transaction for transaction in self.by_amount[amount]
+                       if abs(transaction.date - date) <= DATE_FUZZ]
+            match = _find_match(matches, already_matched)
+        return match
+
+
+def _get_date(value):
+    """Return the date of a date or datetime."""
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    return value
+
+
+def _build_line(statement_import, item, data):
+    """Build an unsaved StatementLine from the item & it's initial data."""
+    line = StatementLine(
+        statement_import=statement_import, line_type=item['type'],
+        date=_get_date(data['date']),
+        amount=data['amount'], memo=data['memo'] or '',
+        account_id=(data.get('expense_account') or
+                    data.get('receiving_account')),
+        check_number=data.get('check_number') or '',
+        ach_payment=data.get('ach_payment', False),
+        payee=data.get('payee') or '', payor=data.get('payor') or '',
+        fingerprint=data['fingerprint'])
+    line.update_needs_attention()
+    return line
+
+
+def _group_data(data):
+    """Group the input data into Transfers, Deposits, and withdrawals."""
+    transfers = []
+    deposits = []
+    withdrawals = []
+    for item in data:
+        if 'transfer' in item['type']:
+            transfers.append(item)
+        elif item['type'] == 'deposit':
+            deposits.append(item)
+        else:
+            withdrawals.append(item)
+    return (transfers, deposits, withdrawals)
+
+
+def _match_transactions(bank_account, items, index=None):
+    """Try to match the data to existing Transactions/Entries.
+
+    The candidate Transactions are looked up in a :class:`MatchIndex`, which
+    is built for the items if one is not passed.
+
+    """
+    if index is None:
+        index = MatchIndex(bank_account, items)
+    matched = []
+    unmatched = []
+    for item in items:
+        match = index.find_match(item, matched)
+        if not match:
+            unmatched.append(item)
+        else:
+            matched.append(match)
+    return matched, unmatched
+
+
+def _find_match(matches, already_matched):
+    """Return the first match that has not already been matched, or False."""
+    for match in matches:
+        if match not in already_matched:
+            return match
+    return False
+
+
+def _build_initial_data(build_function, bank_account, items):
+    """Build the Initialized Form Data from the Statement's Transactions."""
+    initial_data = []
+    for item in items:
+        data = build_function(bank_account.account.id, item)
+        data['fingerprint'] = item.get('fingerprint', '')
+        initial_data.append(data)
+    return initial_data
+
+
+def _build_transfer(account_id, transfer):
+    """Build the Initial Data for a TransferImportForm."""
+    data = {
+        'amount': abs(transfer['amount']),
+        'date': transfer['date'],
+        'memo': transfer['memo']
+    }
+    if 'deposit' in transfer['type']:
+        data['destination'] = account_id
+    else:
+        data['source'] = account_id
+    return data
+
+
+def _build_spending(bank_account, account_id, withdrawal):
+    """Build the Initial Data for a SpendingImportForm."""
+    data = {
+        'amount': abs(withdrawal['amount']),
+        'date': withdrawal['date'],
+        'memo': withdrawal['memo'],
+        'ach_payment': withdrawal['check_number'] == '0',
+        'account': account_id,
+    }
+    if not data['ach_payment']:
+        data['check_number'] = withdrawal['check_number']
+        check_range = CheckRange.objects.filter(
+            bank_account=bank_account,
+            start_number__lte=data['check_number'],
+            end_number__gte=data['check_number'])
+        if check_range.exists():
+            check_range = check_range[0]
+            data['expense_account'] = check_range.default_account.id
+            data['memo'] = check_range.default_memo
+            data['payee'] = check_range.default_payee
+            return data
+    if data['memo'] != '':
+        matching_entries = BankSpendingEntry.objects.filter(
+            memo__icontains=data['memo'], date__day=data['date'].day)
+        for entry in matching_entries:
+            if entry.transaction_set.count() == 1:
+                transaction = entry.transaction_set.all()[0]
+                data['expense_account'] = transaction.account.id
+                data['payee'] = entry.payee
+                break
+        if 'expense_account' not in data:
+            matching_entries = BankSpendingEntry.objects.filter(
+                memo__icontains=data['memo'])
+            for entry in matching_entries:
+                if entry.transaction_set.count() == 1:
+                    transaction = entry.transaction_set.all()[0]
+                    data['expense_account'] = transaction.account.id
+                    data['payee'] = entry.payee
+                    break
+    return data
+
+
+def _build_receiving(account_id, deposit):
+    """Build the Initial Data for a ReceivingImportForm."""
+    data = {
+        'amount': abs(deposit['amount']),
+        'date': deposit['date'],
+        'memo': deposit['memo'],
+        'account': account_id,
+    }
+    if data['memo'] != '':
+        matching_entries = BankReceivingEntry.objects.filter(
+            memo__icontains=data['memo'], date__day=data['date'].day)
+        for entry in matching_entries:
+            if entry.transaction_set.count() == 1:
+                transaction = entry.transaction_set.all()[0]
+                data['receiving_account'] = transaction.account.id
+                data['payor'] = entry.payor
+                break
+        if 'receiving_account' not in data:
+            matching_entries = BankReceivingEntry.objects.filter(
+                memo__icontains=data['memo'])
+            for entry in matching_entries:
+                if entry.transaction_set.count() == 1:
+                    transaction = entry.transaction_set.all()[0]
+                    data['receiving_account'] = transaction.account.id
+                    data['payor'] = entry.payor
+                    break
+    return data
@@ -2,40 +2,33 @@
 import datetime
 from decimal import Decimal
 import io
+import os
+import shutil
+import tempfile
 
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 
 from accounts.models import Account
 from core.tests import create_header, create_account, create_and_login_user
+from entries.batch import EntryBatch
 from entries.models import Transaction, BankReceivingEntry, BankSpendingEntry
 
-from bank_import import views
-from .forms import (BankAccountForm, TransferImportFormSet,
-                    ReceivingImportFormSet, SpendingImportFormSet)
+from bank_import import staging, views
+from .forms import BankAccountForm
 from .importers.vcb import CSVImporter
-from .importers.city_first_dc import QFXImporter as CFDCImporter
-from .models import BankAccount, CheckRange
+from .importers.base import StreamingQFXImporter
+from .importers.city_first_dc import (
+    QFXImporter as CFDCImporter,
+    StreamingQFXImporter as CFDCStreamingImporter)
+from .importers.qfx_stream import iter_transactions
+from .models import (BankAccount, CheckRange, ImportFingerprint,
+                     StatementImport, StatementLine)
 
 
-class BankAccountModelTests(TestCase):
-    """Test the ``BankAccount`` model."""
-
-    def test_get_importer_returns_imported_class(self):
-        """Test that `get_importer_class` returns the correct class."""
-        header = create_header('Assets')
-        account = create_account('Account', header, 0, 0, True)
-        bank_account = BankAccount.objects.create(
-            account=account, bank=BankAccount.VCB_CSV_IMPORTER)
-        self.assertEqual(bank_account.get_importer_class(), CSVImporter)
-
-
-class QFXImporterTests(TestCase):
-    """Test the QFX Importer Classes."""
-
-    def test_city_bank_of_dc_importer(self):
-        qfx_text = u"""
+CITY_FIRST_QFX_TEXT = u"""
 OFXHEADER: 100
 DATA: OFXSGML
 VERSION: 102
@@ -85,8 +78,161 @@ NEWFILEUID: NONE
     </STMTTRNRS>
   </BANKMSGSRSV1>
 </OFX>
-        """
-        qfx_file = io.StringIO(qfx_text)
+"""
+
+
+class BankAccountModelTests(TestCase):
+    """Test the ``BankAccount`` model."""
+
+    def test_get_importer_returns_imported_class(self):
+        """Test that `get_importer_class` returns the correct class."""
+        header = create_header('Assets')
+        account = create_account('Account', header, 0, 0, True)
+        bank_account = BankAccount.objects.create(
+            account=account, bank=BankAccount.VCB_CSV_IMPORTER)
+        self.assertEqual(bank_account.get_importer_class(), CSVImporter)
+
+
+class ImportFingerprintModelTests(TestCase):
+    """Test the ``ImportFingerprint`` model."""
+
+    def setUp(self):
+        """Create a BankAccount & a Statement Line."""
+        header = create_header('Assets')
+        account = create_account('Account', header, 0, 0, True)
+        self.bank_account = BankAccount.objects.create(
+            account=account, bank=BankAccount.VCB_CSV_IMPORTER)
+        self.item = {
+            'date': datetime.date(2016, 6, 30), 'amount': Decimal('20.00'),
+            'check_number': '0', 'memo': 'Some  Store', 'type': 'withdrawal'}
+
+    def test_fingerprint_normalizes_line(self):
+        """Memo case/whitespace, date types & check numbers are normalized."""
+        other_item = {
+            'date': datetime.datetime(2016, 6, 30, 5),
+            'amount': Decimal('-20'), 'check_number': '',
+            'memo': ' some store', 'type': 'withdrawal'}
+
+        self.assertEqual(
+            ImportFingerprint.build_fingerprint(self.bank_account, self.item),
+            ImportFingerprint.build_fingerprint(self.bank_account, other_item))
+
+    def test_fingerprint_differs_by_direction(self):
+        """A deposit & withdrawal of the same amount should not collide."""
+        deposit = dict(self.item, type='deposit')
+
+        self.assertNotEqual(
+            ImportFingerprint.build_fingerprint(self.bank_account, self.item),
+            ImportFingerprint.build_fingerprint(self.bank_account, deposit))
+
+    def test_identical_lines_get_distinct_fingerprints(self):
+        """Repeated lines in a statement are counted, not collapsed."""
+        items = ImportFingerprint.fingerprint_items(
+            self.bank_account, [dict(self.item), dict(self.item)])
+
+        self.assertNotEqual(items[0]['fingerprint'], items[1]['fingerprint'])
+
+    def test_drop_seen_items(self):
+        """Recorded lines should be removed from later statements."""
+        items = ImportFingerprint.fingerprint_items(
+            self.bank_account, [dict(self.item)])
+        ImportFingerprint.record(self.bank_account, [items[0]['fingerprint']])
+        new_item = dict(self.item, amount=Decimal('15.00'))
+
+        with self.assertNumQueries(1):
+            unseen = ImportFingerprint.drop_seen_items(
+                self.bank_account, [dict(self.item), new_item])
+
+        self.assertEqual(len(unseen), 1)
+        self.assertEqual(unseen[0]['amount'], Decimal('15.00'))
+
+    def test_record_skips_existing_fingerprints(self):
+        """Recording the same fingerprint twice should not raise an error."""
+        ImportFingerprint.record(self.bank_account, ['a' * 40, ''])
+        ImportFingerprint.record(self.bank_account, ['a' * 40, 'b' * 40])
+
+        self.assertEqual(ImportFingerprint.objects.count(), 2)
+
+
+class StatementLineModelTests(TestCase):
+    """Test the ``StatementLine`` model."""
+
+    def setUp(self):
+        """Create a StatementImport."""
+        header = create_header('Assets')
+        self.account = create_account('Account', header, 0, 0, True)
+        self.other_account = create_account('Other', header, 0, 0)
+        bank_account = BankAccount.objects.create(
+            account=self.account, bank=BankAccount.VCB_CSV_IMPORTER)
+        self.statement_import = StatementImport.objects.create(
+            bank_account=bank_account)
+
+    def _build_line(self, **kwargs):
+        """Build a complete, unsaved, ACH Withdrawal."""
+        line_kwargs = {
+            'statement_import': self.statement_import,
+            'line_type': StatementLine.WITHDRAWAL, 'amount': 20,
+            'date': datetime.date(2016, 4, 20), 'memo': 'Memo',
+            'account': self.other_account, 'ach_payment': True}
+        line_kwargs.update(kwargs)
+        return StatementLine(**line_kwargs)
+
+    def test_complete_line_does_not_need_attention(self):
+        """A line with all the Entry's required fields is complete."""
+        self.assertFalse(self._build_line().update_needs_attention())
+
+    def test_line_needs_attention(self):
+        """Missing or invalid fields should flag the line."""
+        incomplete_lines = [
+            self._build_line(account=None),
+            self._build_line(memo=''),
+            self._build_line(memo='m' * 61),
+            self._build_line(ach_payment=False),
+            self._build_line(check_number='42'),
+            self._build_line(line_type=StatementLine.DEPOSIT),
+            self._build_line(line_type=StatementLine.TRANSFER_DEPOSIT,
+                             memo='m' * 51),
+        ]
+        for line in incomplete_lines:
+            self.assertTrue(line.update_needs_attention())
+
+    def test_transfers_do_not_require_a_memo(self):
+        """The Transfer Import Form does not require a memo."""
+        line = self._build_line(
+            line_type=StatementLine.TRANSFER_DEPOSIT, memo='')
+
+        self.assertFalse(line.update_needs_attention())
+
+    def test_save_updates_needs_attention(self):
+        """Saving a line should refresh the ``needs_attention`` flag."""
+        line = self._build_line(account=None)
+        line.save()
+        self.assertTrue(line.needs_attention)
+
+        line.account = self.other_account
+        line.save()
+        self.assertFalse(StatementLine.objects.get(
+            id=line.id).needs_attention)
+
+    def test_add_to_batch_transfer_deposit(self):
+        """A Transfer Deposit moves the amount into the bank Account."""
+        line = self._build_line(line_type=StatementLine.TRANSFER_DEPOSIT)
+        batch = EntryBatch()
+
+        line.add_to_batch(batch, self.account)
+        batch.save()
+
+        self.assertEqual(Account.objects.get(
+            id=self.account.id).get_balance(), Decimal('-20'))
+        self.assertEqual(Account.objects.get(
+            id=self.other_account.id).get_balance(), Decimal('20'))
+
+
+class QFXImporterTests(TestCase):
+    """Test the QFX Importer Classes."""
+
+    def test_city_bank_of_dc_importer(self):
+        qfx_file = io.StringIO(CITY_FIRST_QFX_TEXT)
         importer = CFDCImporter(qfx_file)
         data = importer.get_data()
 
@@ -120,9 +266,53 @@ NEWFILEUID: NONE
             ]
         )
 
+    def test_streaming_importer_matches_ofxparse_importer(self):
+        """The streaming tokenizer should return the same data as ofxparse."""
+        expected = CFDCImporter(io.StringIO(CITY_FIRST_QFX_TEXT)).get_data()
+        data = CFDCStreamingImporter(
+            io.StringIO(CITY_FIRST_QFX_TEXT)).get_data()
+
+        self.assertSequenceEqual(data, expected)
+
+    def test_streaming_importer_handles_small_chunks(self):
+        """Tokens split across chunk boundaries should be reassembled."""
+        expected = list(iter_transactions(io.StringIO(CITY_FIRST_QFX_TEXT)))
+        data = list(iter_transactions(io.StringIO(CITY_FIRST_QFX_TEXT),
+                                      chunk_size=7))
+
+        self.assertEqual(len(data), 3)
+        self.assertSequenceEqual(data, expected)
+
+    def test_streaming_importer_xml_dialect(self):
+        """Closing leaf tags, entities & timezone offsets should be parsed."""
+        qfx_text = (
+            u'<?xml version="1.0" encoding="UTF-8"?>'
+            u'<?OFX OFXHEADER="200" VERSION="211"?>'
+            u'<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>'
+            u'<STMTTRN><TRNTYPE>DEBIT</TRNTYPE>'
+            u'<DTPOSTED>20161205130000.000[-5:EST]</DTPOSTED>'
+            u'<TRNAMT>-10.50</TRNAMT><MEMO>Tom &amp; Jerry</MEMO></STMTTRN>'
+            u'</BANKTRANLIST></STMTRS>'
+            u'<STMTRS><BANKTRANLIST><STMTTRN><TRNTYPE>CREDIT</TRNTYPE>'
+            u'<DTPOSTED>20161206</DTPOSTED><TRNAMT>1.00</TRNAMT></STMTTRN>'
+            u'</BANKTRANLIST></STMTRS>'
+            u'</STMTTRNRS></BANKMSGSRSV1></OFX>')
+        data = StreamingQFXImporter(io.StringIO(qfx_text)).get_data()
+
+        self.assertSequenceEqual(
+            data,
+            [{
+                'date': datetime.datetime(2016, 12, 5, 18),
+                'check_number': '0',
+                'amount': Decimal("-10.50"),
+                'memo': u'Tom & Jerry',
+                'type': 'withdrawal'
+            }]
+        )
+
 
 class MatchTransactionsTests(TestCase):
-    """Test the ``views._match_transactions`` function."""
+    """Test the ``staging._match_transactions`` function."""
 
     def setUp(self):
         """Create an Account and an Entry of each type."""
@@ -150,7 +340,7 @@ class MatchTransactionsTests(TestCase):
         """Test that check_number of 0 matches against ACH Payments."""
         data = {'check_number': '0', 'date': self.day, 'type': 'withdrawal',
                 'amount': 20}
-        (matched, unmatched) = views._match_transactions(
+        (matched, unmatched) = staging._match_transactions(
             self.bank_account, [data])
         self.assertSequenceEqual(unmatched, [])
         self.assertSequenceEqual(matched, [self.withdrawal_transaction])
@@ -163,7 +353,7 @@ class MatchTransactionsTests(TestCase):
 
         data = {'check_number': '42', 'date': self.day, 'type': 'withdrawal',
                 'amount': 20}
-        (matched, unmatched) = views._match_transactions(
+        (matched, unmatched) = staging._match_transactions(
             self.bank_account, [data])
         self.assertSequenceEqual(unmatched, [])
         self.assertSequenceEqual(matched, [self.withdrawal_transaction])
@@ -172,7 +362,7 @@ class MatchTransactionsTests(TestCase):
         """Test that a Deposit's amount is correctly matched."""
         data = {'check_number': '', 'date': self.day, 'type': 'deposit',
                 'amount': 20}
-        (matched, unmatched) = views._match_transactions(
+        (matched, unmatched) = staging._match_transactions(
             self.bank_account, [data])
         self.assertSequenceEqual(unmatched, [])
         self.assertSequenceEqual(matched, [self.deposit_transaction])
@@ -181,7 +371,7 @@ class MatchTransactionsTests(TestCase):
         """Test that a Transfer Deposit's amount is correctly matched."""
         data = {'check_number': '', 'date': self.day, 'type':
                 'transfer_deposit', 'amount': 30}
-        (matched, unmatched) = views._match_transactions(
+        (matched, unmatched) = staging._match_transactions(
             self.bank_account, [data])
         self.assertSequenceEqual(unmatched, [])
         self.assertSequenceEqual(matched, [self.deposit_transfer])
@@ -190,7 +380,7 @@ class MatchTransactionsTests(TestCase):
         """Test that a Transfer Withdrawal's amount is correctly matched."""
         data = {'check_number': '', 'date': self.day, 'type':
                 'transfer_withdrawal', 'amount': 30}
-        (matched, unmatched) = views._match_transactions(
+        (matched, unmatched) = staging._match_transactions(
             self.bank_account, [data])
         self.assertSequenceEqual(unmatched, [])
         self.assertSequenceEqual(matched, [self.withdrawal_transfer])
@@ -200,7 +390,7 @@ class MatchTransactionsTests(TestCase):
         time_diff = datetime.timedelta(days=7)
         data = {'check_number': '', 'date': self.day - time_diff,
                 'type': 'deposit', 'amount': 20}
-        (matched, unmatched) = views._match_transactions(
+        (matched, unmatched) = staging._match_transactions(
             self.bank_account, [data])
         self.assertSequenceEqual(unmatched, [])
         self.assertSequenceEqual(matched, [self.deposit_transaction])
@@ -209,7 +399,7 @@ class MatchTransactionsTests(TestCase):
         """Test that unmatched lines are returned correctly."""
         data = {'check_number': '', 'date': self.day, 'type': 'deposit',
                 'amount': 50}
-        (matched, unmatched) = views._match_transactions(
+        (matched, unmatched) = staging._match_transactions(
             self.bank_account, [data])
         self.assertSequenceEqual(unmatched, [data])
         self.assertSequenceEqual(matched, [])
@@ -218,14 +408,97 @@ class MatchTransactionsTests(TestCase):
         """Test that an existing Transaction is only matched Once."""
         data = {'check_number': '', 'date': self.day, 'type': 'deposit',
                 'amount': 20}
-        (matched, unmatched) = views._match_transactions(
+        (matched, unmatched) = staging._match_transactions(
             self.bank_account, [data, data])
         self.assertSequenceEqual(unmatched, [data])
         self.assertSequenceEqual(matched, [self.deposit_transaction])
 
+    def test_match_index_query_count(self):
+        """Matching should use two queries, no matter how many lines."""
+        items = [{'check_number': '0', 'type': 'withdrawal', 'amount': number,
+                  'date': self.day + datetime.timedelta(days=number)}
+                 for number in range(1, 30)]
+        items.append({'check_number': '42', 'date': self.day,
+                      'type': 'withdrawal', 'amount': 20})
+
+        with self.assertNumQueries(2):
+            staging._match_transactions(self.bank_account, items)
+
+    def test_match_index_shared_between_groups(self):
+        """An index built for all the lines can be used for each group."""
+        items = [{'check_number': '', 'date': self.day, 'type': 'deposit',
+                  'amount': 20},
+                 {'check_number': '0', 'date': self.day,
+                  'type': 'withdrawal', 'amount': 20}]
+        index = staging.MatchIndex(self.bank_account, items)
+
+        with self.assertNumQueries(0):
+            (deposits, _) = staging._match_transactions(
+                self.bank_account, items[:1], index)
+            (withdrawals, _) = staging._match_transactions(
+                self.bank_account, items[1:], index)
+
+        self.assertSequenceEqual(deposits, [self.deposit_transaction])
+        self.assertSequenceEqual(withdrawals, [self.withdrawal_transaction])
+
+
+class StageStatementsTests(TestCase):
+    """Test the ``staging.stage_statements`` function."""
+
+    def setUp(self):
+        """Create two Bank Accounts."""
+        header = create_header('Assets', cat_type=1)
+        self.vcb_account = BankAccount.objects.create(
+            account=create_account('VCB', header, 0, 1, True),
+            bank=BankAccount.VCB_CSV_IMPORTER)
+        self.city_first_account = BankAccount.objects.create(
+            account=create_account('City First', header, 0, 1, True),
+            bank=BankAccount.CF_DC_STREAMING_QFX_IMPORTER)
+        self.csv_content = (
+            ",06/29/2016,20.00,0,Store,ACH Payment\n"
+            ",06/24/2016,15.00,0,Other Store,ACH Payment")
+        self.qfx_content = CITY_FIRST_QFX_TEXT.encode('utf-8')
+
+    def test_stage_multiple_accounts(self):
+        """A StatementImport is created for each Statement."""
+        statement_imports = staging.stage_statements(
+            [(self.vcb_account, self.csv_content),
+             (self.city_first_account, self.qfx_content)], workers=1)
+
+        self.assertEqual(len(statement_imports), 2)
+        self.assertEqual(statement_imports[0].bank_account, self.vcb_account)
+        self.assertEqual(statement_imports[0].lines.count(), 2)
+        self.assertEqual(
+            statement_imports[1].bank_account, self.city_first_account)
+        self.assertEqual(statement_imports[1].lines.count(), 3)
+
+    def test_overlapping_statements_in_batch(self):
+        """Lines repeated in a later Statement of the batch are dropped."""
+        overlapping_content = (
+            ",06/30/2016,10.00,0,New Store,ACH Payment\n"
+            ",06/29/2016,20.00,0,Store,ACH Payment")
+
+        statement_imports = staging.stage_statements(
+            [(self.vcb_account, self.csv_content),
+             (self.vcb_account, overlapping_content)], workers=1)
+
+        self.assertEqual(statement_imports[0].lines.count(), 2)
+        self.assertEqual(statement_imports[1].lines.get().memo, 'New Store')
+
+    def test_parse_statements_in_pools(self):
+        """Parsing in a thread or process pool returns the serial data."""
+        statements = [(self.vcb_account.bank, self.csv_content),
+                      (self.city_first_account.bank, self.qfx_content)]
+        serial_data = staging.parse_statements(statements, workers=1)
+
+        self.assertEqual(staging.parse_statements(statements, workers=2),
+                         serial_data)
+        self.assertEqual(staging.parse_statements(
+            statements, workers=2, processes=True), serial_data)
+
 
 class BuildTransferTests(TestCase):
-    """Test the ``views._build_transfer`` function."""
+    """Test the ``staging._build_transfer`` function."""
 
     def setUp(self):
         """Create a bank account."""
@@ -237,7 +510,7 @@ class BuildTransferTests(TestCase):
         """Test that a transfer deposit has the correct initial data."""
         data = {'amount': 20, 'date': self.day, 'memo': 'something',
                 'type': 'transfer_deposit'}
-        transfer_data = views._build_transfer(self.account.id, data)
+        transfer_data = staging._build_transfer(self.account.id, data)
 
         self.assertIn("amount", transfer_data)
         self.assertIn("date", transfer_data)
@@ -249,7 +522,7 @@ class BuildTransferTests(TestCase):
         """Test that a transfer withdrawal has the correct initial data."""
         data = {'amount': 20, 'date': self.day, 'memo': 'something',
                 'type': 'transfer_withdrawal'}
-        transfer_data = views._build_transfer(self.account.id, data)
+        transfer_data = staging._build_transfer(self.account.id, data)
 
         self.assertIn("amount", transfer_data)
         self.assertIn("date", transfer_data)
@@ -259,7 +532,7 @@ class BuildTransferTests(TestCase):
 
 
 class BuildSpendingTests(TestCase):
-    """Test the ``views._build_spending`` function."""
+    """Test the ``staging._build_spending`` function."""
 
     def setUp(self):
         """Add some accounts and an exisiting BankSpendingEntry."""
@@ -285,7 +558,7 @@ class BuildSpendingTests(TestCase):
         """Test that the returned data has the minimal set of required keys."""
         data = {'amount': 20, 'date': self.day, 'memo': 'hello',
                 'check_number': '0'}
-        spending_data = views._build_spending(
+        spending_data = staging._build_spending(
             self.wrapper_account, self.bank_account.id, data)
         self.assertIn("amount", spending_data)
         self.assertIn("date", spending_data)
@@ -298,7 +571,7 @@ class BuildSpendingTests(TestCase):
         """Test that a valid check numbe ris added to the data."""
         data = {'amount': 20, 'date': self.day, 'memo': 'hello',
                 'check_number': '42'}
-        spending_data = views._build_spending(
+        spending_data = staging._build_spending(
             self.wrapper_account, self.bank_account.id, data)
         self.assertFalse(spending_data['ach_payment'])
         self.assertIn("check_number", spending_data)
@@ -308,7 +581,7 @@ class BuildSpendingTests(TestCase):
         """Test that a deposit with no memo doesn't attempt to prefill."""
         data = {'amount': 20, 'date': self.day, 'memo': '',
                 'check_number': '0'}
-        spending_data = views._build_spending(
+        spending_data = staging._build_spending(
             self.wrapper_account, self.bank_account.id, data)
 
         self.assertNotIn("payee", spending_data)
@@ -319,7 +592,7 @@ class BuildSpendingTests(TestCase):
         other_date = self.day - datetime.timedelta(days=5)
         data = {'amount': 20, 'date': other_date, 'memo': 'test',
                 'check_number': '0'}
-        spending_data = views._build_spending(
+        spending_data = staging._build_spending(
             self.wrapper_account, self.bank_account.id, data)
 
         self.assertIn("payee", spending_data)
@@ -341,7 +614,7 @@ class BuildSpendingTests(TestCase):
             balance_delta=50)
         data = {'amount': 20, 'date': other_date, 'memo': 'unique',
                 'check_number': '0'}
-        spending_data = views._build_spending(
+        spending_data = staging._build_spending(
             self.wrapper_account, self.bank_account.id, data)
 
         self.assertIn("payee", spending_data)
@@ -358,7 +631,7 @@ class BuildSpendingTests(TestCase):
             default_payee="CR PAYEE")
         data = {'amount': 9001, 'date': datetime.date.today(), 'memo': '',
                 'check_number': '33'}
-        spending_data = views._build_spending(
+        spending_data = staging._build_spending(
             self.wrapper_account, self.bank_account.id, data)
         self.assertIn("expense_account", spending_data)
         self.assertEqual(
@@ -370,7 +643,7 @@ class BuildSpendingTests(TestCase):
 
 
 class BuildReceivingTests(TestCase):
-    """Test the ``views._build_receiving`` function."""
+    """Test the ``staging._build_receiving`` function."""
 
     def setUp(self):
         """Add some accounts and an exisiting BankReceivingEntry."""
@@ -392,7 +665,7 @@ class BuildReceivingTests(TestCase):
     def test_data_well_formed(self):
         """Test that the returned data has the minimal set of required keys."""
         data = {'amount': 20, 'date': self.day, 'memo': 'hello'}
-        receiving_data = views._build_receiving(self.bank_account.id, data)
+        receiving_data = staging._build_receiving(self.bank_account.id, data)
         self.assertIn("amount", receiving_data)
         self.assertIn("memo", receiving_data)
         self.assertIn("account", receiving_data)
@@ -401,7 +674,7 @@ class BuildReceivingTests(TestCase):
     def test_no_memo_doesnt_prefill(self):
         """Test that a deposit with no memo doesn't attempt to prefill."""
         data = {'amount': 20, 'date': self.day, 'memo': ''}
-        receiving_data = views._build_receiving(self.bank_account.id, data)
+        receiving_data = staging._build_receiving(self.bank_account.id, data)
 
         self.assertNotIn("payor", receiving_data)
         self.assertNotIn("receiving_account", receiving_data)
@@ -410,7 +683,7 @@ class BuildReceivingTests(TestCase):
         """Test matching by only a memo works fine."""
         other_date = self.day - datetime.timedelta(days=5)
         data = {'amount': 20, 'date': other_date, 'memo': 'test'}
-        receiving_data = views._build_receiving(self.bank_account.id, data)
+        receiving_data = staging._build_receiving(self.bank_account.id, data)
         self.assertIn("payor", receiving_data)
         self.assertEqual(receiving_data['payor'], 'payor')
         self.assertIn("receiving_account", receiving_data)
@@ -430,7 +703,7 @@ class BuildReceivingTests(TestCase):
             balance_delta=-50, detail="")
 
         data = {'amount': 20, 'date': other_date, 'memo': 'test'}
-        receiving_data = views._build_receiving(self.bank_account.id, data)
+        receiving_data = staging._build_receiving(self.bank_account.id, data)
         self.assertIn("payor", receiving_data)
         self.assertEqual(receiving_data['payor'], 'other payor')
         self.assertIn("receiving_account", receiving_data)
@@ -447,15 +720,10 @@ class ImportBankStatementTests(TestCase):
 
         self.asset_header = create_header('asset', cat_type=1)
         self.expense_header = create_header('expense', cat_type=6)
-        self.income_header = create_header('income', cat_type=4)
         self.asset_account = create_account(
             'asset', self.asset_header, 0, 1, True)
-        self.other_asset = create_account(
-            'other asset', self.asset_header, 0, 1, True)
         self.expense_account = create_account(
             'expense', self.expense_header, 0, 6)
-        self.income_account = create_account(
-            'income', self.income_header, 0, 4)
         self.bank_account = BankAccount.objects.create(
             account=self.asset_account, bank=BankAccount.VCB_CSV_IMPORTER)
 
@@ -471,8 +739,19 @@ class ImportBankStatementTests(TestCase):
             response.context['import_form'], BankAccountForm))
         self.assertFalse(response.context['import_form'].is_bound)
 
-    def test_post_upload_returns_formsets(self):
-        """Test a POST with a valid import file returns a set of FormSets."""
+    def test_get_lists_pending_imports(self):
+        """Test that a GET request shows the Staged Imports."""
+        statement_import = StatementImport.objects.create(
+            bank_account=self.bank_account)
+
+        response = self.client.get(
+            reverse('bank_import.views.import_bank_statement'))
+
+        self.assertSequenceEqual(
+            response.context['pending_imports'], [statement_import])
+
+    def test_post_upload_stages_import(self):
+        """Test a POST with a valid import file creates a StatementImport."""
         file_content = """
 ,06/30/2016,837.23,14151,,Check
 ,06/29/2016,1364.96,0,Rewards MC,ACH Payment
@@ -488,130 +767,426 @@ class ImportBankStatementTests(TestCase):
                 'bank_account': self.bank_account.id,
                 'submit': 'Import'
             })
+
+        statement_import = StatementImport.objects.get()
+        self.assertRedirects(response, statement_import.get_absolute_url())
+        self.assertEqual(statement_import.bank_account, self.bank_account)
+        lines = statement_import.lines.all()
+        self.assertEqual(
+            [line.line_type for line in lines],
+            ['deposit', 'deposit', 'transfer_deposit', 'withdrawal',
+             'withdrawal'])
+        self.assertEqual(lines[0].date, datetime.date(2016, 6, 22))
+        self.assertEqual(lines[0].amount, Decimal('428.00'))
+        self.assertTrue(all(line.needs_attention for line in lines))
+
+    def test_post_upload_invalid_returns_form(self):
+        """Test a POST without a file returns the form with errors."""
+        response = self.client.post(
+            reverse('bank_import.views.import_bank_statement'),
+            data={'bank_account': self.bank_account.id, 'submit': 'Import'})
+
         self.assertEqual(response.status_code, 200)
-        self.assertTemplateUsed(response, 'bank_import/import_form.html')
-        self.assertIn('transfer_formset', response.context)
-        self.assertTrue(isinstance(
-            response.context['transfer_formset'], TransferImportFormSet))
-        self.assertIn('withdrawal_formset', response.context)
-        self.assertTrue(isinstance(
-            response.context['withdrawal_formset'], SpendingImportFormSet))
-        self.assertIn('deposit_formset', response.context)
-        self.assertTrue(isinstance(
-            response.context['deposit_formset'], ReceivingImportFormSet))
+        self.assertTrue(response.context['import_form'].errors)
+        self.assertFalse(StatementImport.objects.exists())
+
+    def test_matched_and_committed_lines_are_skipped_on_reimport(self):
+        """Committed or matched lines are skipped by overlapping imports."""
+        file_content = (
+            ",06/29/2016,20.00,0,Store,ACH Payment\n"
+            ",06/24/2016,15.00,0,Other Store,ACH Payment")
+        Transaction.objects.create(
+            account=self.asset_account, balance_delta=15,
+            date=datetime.date(2016, 6, 24))
+        import_data = {'bank_account': self.bank_account.id,
+                       'submit': 'Import'}
+        self.client.post(
+            reverse('bank_import.views.import_bank_statement'),
+            data=dict(import_data, import_file=SimpleUploadedFile(
+                "import.csv", file_content)))
+
+        statement_import = StatementImport.objects.get()
+        self.assertEqual(statement_import.lines.count(), 1)
+        self.assertEqual(ImportFingerprint.objects.count(), 1)
+        statement_import.lines.update(
+            account=self.expense_account, payee='Store',
+            needs_attention=False)
+        self.client.post(statement_import.get_absolute_url(),
+                         data={'submit': 'Commit'})
+        self.assertEqual(ImportFingerprint.objects.count(), 2)
+
+        self.client.post(
+            reverse('bank_import.views.import_bank_statement'),
+            data=dict(import_data, import_file=SimpleUploadedFile(
+                "import.csv", file_content)))
+        self.assertEqual(
+            StatementImport.objects.get().lines.count(), 0)
+
+
+class ReviewStatementImportTests(TestCase):
+    """Test the ``review_statement_import`` view."""
+
+    def setUp(self):
+        """Create Accounts & a StatementImport with a line of each type."""
+        create_and_login_user(self)
+
+        self.asset_header = create_header('asset', cat_type=1)
+        self.expense_header = create_header('expense', cat_type=6)
+        self.income_header = create_header('income', cat_type=4)
+        self.asset_account = create_account(
+            'asset', self.asset_header, 0, 1, True)
+        self.other_asset = create_account(
+            'other asset', self.asset_header, 0, 1, True)
+        self.expense_account = create_account(
+            'expense', self.expense_header, 0, 6)
+        self.income_account = create_account(
+            'income', self.income_header, 0, 4)
+        self.bank_account = BankAccount.objects.create(
+            account=self.asset_account, bank=BankAccount.VCB_CSV_IMPORTER)
+        self.statement_import = StatementImport.objects.create(
+            bank_account=self.bank_account)
+        day = datetime.date(2016, 4, 20)
+        self.transfer = StatementLine.objects.create(
+            statement_import=self.statement_import, date=day,
+            line_type=StatementLine.TRANSFER_WITHDRAWAL, amount=20)
+        self.withdrawal = StatementLine.objects.create(
+            statement_import=self.statement_import, date=day,
+            line_type=StatementLine.WITHDRAWAL, amount=25, check_number='42',
+            memo='Check 42', fingerprint='a' * 40)
+        self.deposit = StatementLine.objects.create(
+            statement_import=self.statement_import, date=day,
+            line_type=StatementLine.DEPOSIT, amount=20, memo='Deposit',
+            account=self.income_account)
+        self.url = self.statement_import.get_absolute_url()
+
+    def _build_save_data(self, **kwargs):
+        """Return valid POST data for saving every line."""
+        data = {
+            'transfer-TOTAL_FORMS': 1,
+            'transfer-INITIAL_FORMS': 1,
+            'transfer-MAX_NUM_FORMS': 1,
+            'transfer-0-date': '04/20/2016',
+            'transfer-0-source': self.asset_account.id,
+            'transfer-0-destination': self.other_asset.id,
+            'transfer-0-memo': 'Memo Memo',
+            'transfer-0-amount': 20,
+            'transfer-0-line': self.transfer.id,
+            'withdrawal-TOTAL_FORMS': 1,
+            'withdrawal-INITIAL_FORMS': 1,
+            'withdrawal-MAX_NUM_FORMS': 1,
+            'withdrawal-0-date': '04/20/2016',
+            'withdrawal-0-account': self.asset_account.id,
+            'withdrawal-0-expense_account': self.expense_account.id,
+            'withdrawal-0-memo': 'Valid Withdrawal',
+            'withdrawal-0-amount': 25,
+            'withdrawal-0-check_number': '42',
+            'withdrawal-0-payee': 'Payee',
+            'withdrawal-0-line': self.withdrawal.id,
+            'deposit-TOTAL_FORMS': 1,
+            'deposit-INITIAL_FORMS': 1,
+            'deposit-MAX_NUM_FORMS': 1,
+            'deposit-0-date': '04/20/2016',
+            'deposit-0-account': self.asset_account.id,
+            'deposit-0-receiving_account': self.income_account.id,
+            'deposit-0-memo': 'Valid Deposit',
+            'deposit-0-amount': 20,
+            'deposit-0-payor': 'Required',
+            'deposit-0-line': self.deposit.id,
+            'submit': 'Save',
+        }
+        data.update(kwargs)
+        return data
+
+    def test_get_returns_lines_needing_attention(self):
+        """Only lines needing attention should have forms."""
+        self.withdrawal.account = self.expense_account
+        self.withdrawal.save()
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'bank_import/review_import.html')
+        self.assertEqual(len(response.context['transfer_formset'].forms), 1)
+        self.assertEqual(len(response.context['withdrawal_formset'].forms), 0)
+        self.assertEqual(len(response.context['deposit_formset'].forms), 1)
+        self.assertEqual(
+            response.context['deposit_formset'].forms[0].initial['line'],
+            self.deposit.id)
+
+    def test_get_is_paginated(self):
+        """The lines needing attention should be split into pages."""
+        StatementLine.objects.bulk_create([
+            StatementLine(statement_import=self.statement_import,
+                          date=datetime.date(2016, 4, 21), amount=1,
+                          line_type=StatementLine.DEPOSIT)
+            for _ in range(views.REVIEW_PAGE_SIZE)])
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['page'].paginator.num_pages, 2)
+        self.assertEqual(len(response.context['deposit_formset'].forms),
+                         views.REVIEW_PAGE_SIZE)
+        self.assertEqual(len(response.context['transfer_formset'].forms), 0)
+
+        response = self.client.get(self.url + '?page=2')
+        self.assertEqual(len(response.context['deposit_formset'].forms), 1)
+        self.assertEqual(len(response.context['transfer_formset'].forms), 1)
+        self.assertEqual(len(response.context['withdrawal_formset'].forms), 1)
 
     def test_post_invalid_formsets_returns_errors(self):
         """Test a POST with invalid FormSets returns FormSets with errors."""
-        response = self.client.post(
-            reverse('bank_import.views.import_bank_statement'),
-            data={
-                'transfer-TOTAL_FORMS': 2,
-                'transfer-INITIAL_FORMS': 2,
-                'transfer-MAX_NUM_FORMS': 2,
-                'transfer-0-date': '/20/2016',
-                'transfer-0-source': self.asset_account.id,
-                'transfer-0-destination': self.other_asset.id,
-                'transfer-0-memo': '',
-                'transfer-0-amount': 20,
-                'transfer-1-date': '04/20/2016',
-                'transfer-1-source': self.other_asset.id,
-                'transfer-1-destination': self.asset_account.id,
-                'transfer-1-memo': 'Valid Entry',
-                'transfer-1-amount': 25,
-                'withdrawal-TOTAL_FORMS': 2,
-                'withdrawal-INITIAL_FORMS': 2,
-                'withdrawal-MAX_NUM_FORMS': 2,
-                'withdrawal-0-date': '04/20/2016',
-                'withdrawal-0-account': self.asset_account.id,
-                'withdrawal-0-expense_account': self.expense_account.id,
-                'withdrawal-0-memo': '',
-                'withdrawal-0-amount': 20,
-                'withdrawal-0-ach_payment': True,
-                'withdrawal-0-check_number': '',
-                'withdrawal-0-payee': '',
-                'withdrawal-1-date': '04/20/2016',
-                'withdrawal-1-account': self.other_asset.id,
-                'withdrawal-1-expense_account': self.expense_account.id,
-                'withdrawal-1-memo': 'Valid Entry',
-                'withdrawal-1-amount': 25,
-                'withdrawal-1-ach_payment': False,
-                'withdrawal-1-check_number': '42',
-                'withdrawal-1-payee': 'Valid Entry',
-                'deposit-TOTAL_FORMS': 1,
-                'deposit-INITIAL_FORMS': 1,
-                'deposit-MAX_NUM_FORMS': 1,
-                'deposit-0-date': '04/20/2016',
-                'deposit-0-account': self.asset_account.id,
-                'deposit-0-receiving_account': self.income_account.id,
-                'deposit-0-memo': 'Invalid - No Payor',
-                'deposit-0-amount': 20,
-                'deposit-0-payor': '',
-                'submit': 'Save',
-            })
+        response = self.client.post(self.url, data=self._build_save_data(**{
+            'transfer-0-date': '/20/2016',
+            'deposit-0-payor': '',
+        }))
 
         self.assertEqual(response.status_code, 200)
-        self.assertTemplateUsed(response, 'bank_import/import_form.html')
+        self.assertTemplateUsed(response, 'bank_import/review_import.html')
         self.assertFalse(response.context['transfer_formset'].is_valid())
-        self.assertFalse(response.context['withdrawal_formset'].is_valid())
         self.assertFalse(response.context['deposit_formset'].is_valid())
-
-    def test_post_formsets_success(self):
-        """Test a POST with valid FormSets redirects to the Import page."""
-        response = self.client.post(
-            reverse('bank_import.views.import_bank_statement'),
-            data={
-                'transfer-TOTAL_FORMS': 2,
-                'transfer-INITIAL_FORMS': 2,
-                'transfer-MAX_NUM_FORMS': 2,
-                'transfer-0-date': '04/20/2016',
-                'transfer-0-source': self.asset_account.id,
-                'transfer-0-destination': self.other_asset.id,
-                'transfer-0-memo': 'Memo Memo',
-                'transfer-0-amount': 20,
-                'transfer-1-date': '04/20/2016',
-                'transfer-1-source': self.other_asset.id,
-                'transfer-1-destination': self.asset_account.id,
-                'transfer-1-memo': 'Valid Entry',
-                'transfer-1-amount': 25,
-                'withdrawal-TOTAL_FORMS': 2,
-                'withdrawal-INITIAL_FORMS': 2,
-                'withdrawal-MAX_NUM_FORMS': 2,
-                'withdrawal-0-date': '04/20/2016',
-                'withdrawal-0-account': self.asset_account.id,
-                'withdrawal-0-expense_account': self.expense_account.id,
-                'withdrawal-0-memo': 'Valid Withdrawal 1',
-                'withdrawal-0-amount': 20,
-                'withdrawal-0-ach_payment': True,
-                'withdrawal-0-check_number': '',
-                'withdrawal-0-payee': 'Payee 24',
-                'withdrawal-1-date': '04/20/2016',
-                'withdrawal-1-account': self.asset_account.id,
-                'withdrawal-1-expense_account': self.expense_account.id,
-                'withdrawal-1-memo': 'Valid Withdrawl 2',
-                'withdrawal-1-amount': 25,
-                'withdrawal-1-ach_payment': False,
-                'withdrawal-1-check_number': '42',
-                'withdrawal-1-payee': 'Payee',
-                'deposit-TOTAL_FORMS': 1,
-                'deposit-INITIAL_FORMS': 1,
-                'deposit-MAX_NUM_FORMS': 1,
-                'deposit-0-date': '04/20/2016',
-                'deposit-0-account': self.asset_account.id,
-                'deposit-0-receiving_account': self.income_account.id,
-                'deposit-0-memo': 'Valid Deposit',
-                'deposit-0-amount': 20,
-                'deposit-0-payor': 'Required',
-                'submit': 'Save',
-            })
+        self.assertTrue(StatementLine.objects.get(
+            id=self.deposit.id).needs_attention)
+
+    def test_post_save_updates_lines(self):
+        """Test a POST with valid FormSets updates the StatementLines."""
+        response = self.client.post(self.url, data=self._build_save_data())
+
+        self.assertRedirects(response, self.url + '?page=1')
+        transfer = StatementLine.objects.get(id=self.transfer.id)
+        self.assertEqual(transfer.account, self.other_asset)
+        self.assertEqual(transfer.memo, 'Memo Memo')
+        withdrawal = StatementLine.objects.get(id=self.withdrawal.id)
+        self.assertEqual(withdrawal.account, self.expense_account)
+        self.assertEqual(withdrawal.payee, 'Payee')
+        deposit = StatementLine.objects.get(id=self.deposit.id)
+        self.assertEqual(deposit.amount, Decimal('20'))
+        self.assertEqual(deposit.payor, 'Required')
+        self.assertFalse(StatementLine.objects.filter(
+            needs_attention=True).exists())
+        self.assertEqual(Transaction.objects.count(), 0)
+
+    def test_post_save_ignores_lines_of_other_imports(self):
+        """Lines from a different StatementImport should not be updated."""
+        other_import = StatementImport.objects.create(
+            bank_account=self.bank_account)
+        other_line = StatementLine.objects.create(
+            statement_import=other_import, date=datetime.date(2016, 4, 20),
+            line_type=StatementLine.DEPOSIT, amount=20)
+
+        self.client.post(self.url, data=self._build_save_data(**{
+            'deposit-0-line': other_line.id}))
+
+        self.assertEqual(StatementLine.objects.get(id=other_line.id).payor, '')
+
+    def test_post_commit_creates_entries(self):
+        """Committing the Import creates the Entries & deletes the lines."""
+        self.client.post(self.url, data=self._build_save_data())
+
+        response = self.client.post(self.url, data={'submit': 'Commit'})
 
         self.assertRedirects(
             response, reverse('bank_import.views.import_bank_statement'))
-
+        self.assertFalse(StatementImport.objects.exists())
+        self.assertFalse(StatementLine.objects.exists())
+        self.assertEqual(ImportFingerprint.objects.get().fingerprint, 'a' * 40)
         self.asset_account = Account.objects.get(id=self.asset_account.id)
-        self.assertEqual(self.asset_account.get_balance(), Decimal("-20"))
+        self.assertEqual(self.asset_account.get_balance(), Decimal("-25"))
         self.other_asset = Account.objects.get(id=self.other_asset.id)
-        self.assertEqual(self.other_asset.get_balance(), Decimal("-5"))
+        self.assertEqual(self.other_asset.get_balance(), Decimal("20"))
         self.expense_account = Account.objects.get(id=self.expense_account.id)
-        self.assertEqual(self.expense_account.get_balance(), Decimal("45"))
+        self.assertEqual(self.expense_account.get_balance(), Decimal("25"))
         self.income_account = Account.objects.get(id=self.income_account.id)
         self.assertEqual(self.income_account.get_balance(), Decimal("20"))
+        entry = BankSpendingEntry.objects.get()
+        self.assertEqual(entry.check_number, '42')
+        self.assertEqual(entry.payee, 'Payee')
+        self.assertEqual(BankReceivingEntry.objects.get().payor, 'Required')
+
+    def test_post_commit_requires_complete_lines(self):
+        """The Import can not be committed while lines need attention."""
+        response = self.client.post(self.url, data={'submit': 'Commit'})
+
+        self.assertRedirects(response, self.url)
+        self.assertTrue(StatementImport.objects.exists())
+        self.assertEqual(Transaction.objects.count(), 0)
+
+    def test_post_discard_deletes_import(self):
+        """Discarding the Import deletes it without creating any Entries."""
+        response = self.client.post(self.url, data={'submit': 'Discard'})
+
+        self.assertRedirects(
+            response, reverse('bank_import.views.import_bank_statement'))
+        self.assertFalse(StatementImport.objects.exists())
+        self.assertEqual(Transaction.objects.count(), 0)
+        self.assertFalse(ImportFingerprint.objects.exists())
+
+
+class RecordFailed(Exception):
+    """Raised when recording the fingerprints of a committed Import."""
+
+
+class StatementImportCommitTests(TransactionTestCase):
+    """Test committing a Staged Import in a single database transaction."""
+
+    def setUp(self):
+        """Create a Bank Account & a StatementImport with a complete line."""
+        self.bank_account = BankAccount.objects.create(
+            account=create_account(
+                'bank', create_header('asset', cat_type=1), 0, 1, True),
+            bank=BankAccount.VCB_CSV_IMPORTER)
+        self.expense_account = create_account(
+            'expense', create_header('expense', cat_type=6), 0, 6)
+        self.statement_import = StatementImport.objects.create(
+            bank_account=self.bank_account)
+        StatementLine.objects.create(
+            statement_import=self.statement_import,
+            date=datetime.date(2016, 4, 20), line_type=StatementLine.DEPOSIT,
+            amount=20, memo='Deposit', payor='Payor',
+            account=self.expense_account, fingerprint='a' * 40)
+
+    def tearDown(self):
+        """Empty the committed tables, since they are only flushed before."""
+        call_command('flush', verbosity=0, interactive=False)
+
+    def test_failed_fingerprints_roll_back_entries(self):
+        """No Entries are kept if recording the fingerprints fails."""
+        def fail(cls, bank_account, fingerprints):
+            raise RecordFailed
+        original_record = ImportFingerprint.__dict__['record']
+        ImportFingerprint.record = classmethod(fail)
+        self.addCleanup(setattr, ImportFingerprint, 'record', original_record)
+
+        with self.assertRaises(RecordFailed):
+            self.statement_import.commit()
+
+        self.assertFalse(BankReceivingEntry.objects.exists())
+        self.assertFalse(Transaction.objects.exists())
+        self.assertTrue(StatementImport.objects.exists())
+        self.assertEqual(
+            Account.objects.get(id=self.expense_account.id).balance, 0)
+
+    def test_overlapping_imports_only_commit_lines_once(self):
+        """Lines committed by an overlapping Import are skipped."""
+        overlapping_import = StatementImport.objects.create(
+            bank_account=self.bank_account)
+        for (fingerprint, amount) in (('a' * 40, 20), ('b' * 40, 15)):
+            StatementLine.objects.create(
+                statement_import=overlapping_import,
+                date=datetime.date(2016, 4, 20),
+                line_type=StatementLine.DEPOSIT, amount=amount,
+                memo='Deposit', payor='Payor', account=self.expense_account,
+                fingerprint=fingerprint)
+
+        self.assertEqual(self.statement_import.commit(), 0)
+        self.assertEqual(overlapping_import.commit(), 1)
+
+        self.assertEqual(BankReceivingEntry.objects.count(), 2)
+        self.assertEqual(
+            sorted(ImportFingerprint.objects.values_list(
+                'fingerprint', flat=True)), ['a' * 40, 'b' * 40])
+        self.assertEqual(
+            Account.objects.get(id=self.expense_account.id).balance, 35)
+
+
+class BatchImportBankStatementsTests(TestCase):
+    """Test the ``batch_import_bank_statements`` view."""
+
+    def setUp(self):
+        """Create two Bank Accounts."""
+        create_and_login_user(self)
+        header = create_header('Assets', cat_type=1)
+        self.first_account = BankAccount.objects.create(
+            account=create_account('First', header, 0, 1, True),
+            bank=BankAccount.VCB_CSV_IMPORTER)
+        self.second_account = BankAccount.objects.create(
+            account=create_account('Second', header, 0, 1, True),
+            bank=BankAccount.VCB_CSV_IMPORTER)
+        self.url = reverse('bank_import.views.batch_import_bank_statements')
+
+    def test_get_returns_formset(self):
+        """Test that a GET request returns an unbound FormSet."""
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(
+            response, 'bank_import/batch_import_form.html')
+        self.assertFalse(response.context['formset'].is_bound)
+
+    def test_post_stages_each_file(self):
+        """Each uploaded file is staged for it's Bank Account."""
+        response = self.client.post(self.url, data={
+            'statement-TOTAL_FORMS': 3,
+            'statement-INITIAL_FORMS': 0,
+            'statement-MAX_NUM_FORMS': 1000,
+            'statement-0-bank_account': self.first_account.id,
+            'statement-0-import_file': SimpleUploadedFile(
+                "first.csv", ",06/29/2016,20.00,0,Store,ACH Payment"),
+            'statement-1-bank_account': self.second_account.id,
+            'statement-1-import_file': SimpleUploadedFile(
+                "second.csv", ",06/24/2016,15.00,0,Other,ACH Payment"),
+            'statement-2-bank_account': '',
+        })
+
+        self.assertRedirects(
+            response, reverse('bank_import.views.import_bank_statement'))
+        self.assertEqual(
+            StatementImport.objects.get(
+                bank_account=self.first_account).lines.get().memo, 'Store')
+        self.assertEqual(
+            StatementImport.objects.get(
+                bank_account=self.second_account).lines.get().memo, 'Other')
+
+    def test_post_invalid_returns_errors(self):
+        """A row missing it's file returns the FormSet with errors."""
+        response = self.client.post(self.url, data={
+            'statement-TOTAL_FORMS': 1,
+            'statement-INITIAL_FORMS': 0,
+            'statement-MAX_NUM_FORMS': 1000,
+            'statement-0-bank_account': self.first_account.id,
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context['formset'].is_valid())
+        self.assertFalse(StatementImport.objects.exists())
+
+
+class ImportStatementsCommandTests(TestCase):
+    """Test the ``import_statements`` management command."""
+
+    def setUp(self):
+        """Create a Bank Account & a directory of statements."""
+        header = create_header('Assets', cat_type=1)
+        self.bank_account = BankAccount.objects.create(
+            account=create_account('VCB Checking', header, 0, 1, True),
+            bank=BankAccount.VCB_CSV_IMPORTER)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def _write_statement(self, directory_name, file_name, content):
+        """Write a statement file to the account's sub-directory."""
+        account_directory = os.path.join(self.directory, directory_name)
+        if not os.path.isdir(account_directory):
+            os.mkdir(account_directory)
+        with open(os.path.join(account_directory, file_name), 'w') as output:
+            output.write(content)
+
+    def test_stages_files_by_id_or_slug(self):
+        """Sub-directories may use the Bank Account's id or slugified name."""
+        self._write_statement(str(self.bank_account.id), 'june.csv',
+                              ",06/29/2016,20.00,0,Store,ACH Payment")
+        self._write_statement('vcb-checking', 'july.csv',
+                              ",07/29/2016,20.00,0,Store,ACH Payment")
+
+        call_command('import_statements', self.directory, workers=1,
+                     stdout=io.BytesIO())
+
+        self.assertEqual(StatementImport.objects.filter(
+            bank_account=self.bank_account).count(), 2)
+        self.assertEqual(StatementLine.objects.count(), 2)
+
+    def test_unknown_directory_raises_error(self):
+        """A sub-directory that matches no Bank Account is an error."""
+        self._write_statement('unknown', 'june.csv', '')
+
+        self.assertRaises(SystemExit, call_command, 'import_statements',
+                          self.directory, workers=1, stderr=io.BytesIO())
+        self.assertFalse(StatementImport.objects.exists())
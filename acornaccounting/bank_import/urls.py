@@ -4,4 +4,8 @@ from django.conf.urls import patterns, url
 urlpatterns = patterns(
     'bank_import.views',
     url(r'^$', 'import_bank_statement', name='import_bank_statement'),
+    url(r'^batch/$', 'batch_import_bank_statements',
+        name='batch_import_bank_statements'),
+    url(r'^review/(?P<import_id>\d+)/$', 'review_statement_import',
+        name='review_statement_import'),
 )
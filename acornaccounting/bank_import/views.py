@@ -1,229 +1,169 @@
 """Views for Importing Bank Statements."""
-import datetime
-from functools import partial
-
+from django.conf import settings
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.shortcuts import render, redirect
+from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db.models import Count
+from django.shortcuts import get_object_or_404, render, redirect
+
+from .forms import (BankAccountForm, BankStatementFormSet,
+                    TransferImportFormSet, SpendingImportFormSet,
+                    ReceivingImportFormSet)
+from .models import StatementImport
+from .staging import stage_statements
 
-from entries.models import Transaction, BankSpendingEntry, BankReceivingEntry
 
-from .forms import (BankAccountForm, TransferImportFormSet,
-                    SpendingImportFormSet, ReceivingImportFormSet)
-from .models import CheckRange
+#: The number of lines needing attention to show per review page.
+REVIEW_PAGE_SIZE = 25
 
 
 @login_required
 def import_bank_statement(request):
-    """Render the Import Upload Form, & the FormSets."""
-    context = {}
-    is_post = request.method == 'POST'
-    submit_value = request.POST.get('submit', '')
-    if is_post and submit_value == 'Import':
+    """Render the Import Upload Form & stage any uploaded Statement."""
+    if request.method == 'POST':
         account_form = BankAccountForm(request.POST, request.FILES)
         if account_form.is_valid():
-            data = _parse_input_file(account_form)
-            transfers, deposits, withdrawals = _group_data(data)
-            account = account_form.cleaned_data['bank_account']
-            _, unmatched_transfers = _match_transactions(
-                account, transfers)
-            _, unmatched_deposits = _match_transactions(
-                account, deposits)
-            _, unmatched_withdrawals = _match_transactions(
-                account, withdrawals)
-            context['transfer_formset'] = TransferImportFormSet(
-                prefix='transfer',
-                initial=_build_initial_data(
-                    _build_transfer, account, unmatched_transfers))
-            context['withdrawal_formset'] = SpendingImportFormSet(
-                prefix='withdrawal',
-                initial=_build_initial_data(
-                    partial(_build_spending, account), account,
-                    unmatched_withdrawals))
-            context['deposit_formset'] = ReceivingImportFormSet(
-                prefix='deposit',
-                initial=_build_initial_data(
-                    _build_receiving, account, unmatched_deposits))
-        else:
-            context['import_form'] = account_form
-    elif is_post and submit_value == 'Save':
-        transfer_formset = TransferImportFormSet(
-            request.POST, prefix='transfer')
-        withdrawal_formset = SpendingImportFormSet(
-            request.POST, prefix='withdrawal')
-        deposit_formset = ReceivingImportFormSet(
-            request.POST, prefix='deposit')
-        formsets_valid = (
-            transfer_formset.is_valid() and withdrawal_formset.is_valid() and
-            deposit_formset.is_valid())
-        if formsets_valid:
-            for form in transfer_formset.forms:
-                form.save()
-            for form in withdrawal_formset.forms:
-                form.save()
-            for form in deposit_formset.forms:
-                form.save()
-            return redirect('bank_import.views.import_bank_statement')
-        else:
-            context.update({'transfer_formset': transfer_formset,
-                            'withdrawal_formset': withdrawal_formset,
-                            'deposit_formset': deposit_formset})
+            [statement_import] = stage_statements(
+                [_get_statement(account_form)], workers=1)
+            return redirect(statement_import)
     else:
-        context['import_form'] = BankAccountForm()
-    return render(request, "bank_import/import_form.html", context)
-
-
-def _parse_input_file(account_form):
-    """Parse an Uploaded Bank Statement using the BankAccount's Importer."""
-    account = account_form.cleaned_data['bank_account']
-    import_file = account_form.cleaned_data['import_file']
-    importer_class = account.get_importer_class()
-    importer = importer_class(import_file)
-    return importer.get_data()
-
-
-def _group_data(data):
-    """Group the input data into Transfers, Deposits, and withdrawals."""
-    transfers = []
-    deposits = []
-    withdrawals = []
-    for item in data:
-        if 'transfer' in item['type']:
-            transfers.append(item)
-        elif item['type'] == 'deposit':
-            deposits.append(item)
-        else:
-            withdrawals.append(item)
-    return (transfers, deposits, withdrawals)
-
-
-def _match_transactions(bank_account, items):
-    """Try to match the data to existing Transactions/Entries."""
-    matched = []
-    unmatched = []
-    date_fuzz = datetime.timedelta(days=7)
-    for item in items:
-        amount = item['amount']
-        if 'deposit' in item['type']:
-            amount = -1 * amount
-
-        match = False
-        if item['check_number'] not in ('', '0'):
-            matches = Transaction.objects.filter(
-                bankspendingentry__check_number=item['check_number'],
-                account=bank_account.account, balance_delta=amount
-            )
-        else:
-            matches = Transaction.objects.filter(
-                date=item['date'], account=bank_account.account,
-                balance_delta=amount)
-        match = _find_match(matches, matched)
-
-        if not match:
-            matches = Transaction.objects.filter(
-                date__gte=item['date'] - date_fuzz,
-                date__lte=item['date'] + date_fuzz,
-                account=bank_account.account, balance_delta=amount)
-            match = _find_match(matches, matched)
-        if not match:
-            unmatched.append(item)
-        else:
-            matched.append(match)
-    return matched, unmatched
-
-
-def _find_match(matches, already_matched):
-    """Return the first match that has not already been matched, or False."""
-    for match in matches:
-        if match not in already_matched:
-            return match
-    return False
+        account_form = BankAccountForm()
+    pending_imports = StatementImport.objects.select_related(
+        'bank_account').annotate(line_count=Count('lines'))
+    return render(request, "bank_import/import_form.html",
+                  {'import_form': account_form,
+                   'pending_imports': pending_imports})
 
 
-def _build_initial_data(build_function, bank_account, items):
-    """Build the Initialized Form Data from the Statement's Transactions."""
-    return [build_function(bank_account.account.id, item) for item in items]
+@login_required
+def batch_import_bank_statements(request):
+    """Stage many uploaded Statements, for any number of Bank Accounts.
+
+    The files are parsed & matched using ``settings.BANK_IMPORT_WORKERS``
+    threads. The new Staged Imports are added to the pending imports queue.
+
+    """
+    if request.method == 'POST':
+        formset = BankStatementFormSet(
+            request.POST, request.FILES, prefix='statement')
+        if formset.is_valid():
+            statements = [_get_statement(form) for form in formset.forms
+                          if form.has_changed()]
+            statement_imports = stage_statements(
+                statements, settings.BANK_IMPORT_WORKERS)
+            messages.success(request, "{0} statements were imported.".format(
+                len(statement_imports)))
+            return redirect('bank_import.views.import_bank_statement')
+    else:
+        formset = BankStatementFormSet(prefix='statement')
+    return render(request, "bank_import/batch_import_form.html",
+                  {'formset': formset})
 
 
-def _build_transfer(account_id, transfer):
-    """Build the Initial Data for a TransferImportForm."""
-    data = {
-        'amount': abs(transfer['amount']),
-        'date': transfer['date'],
-        'memo': transfer['memo']
-    }
-    if 'deposit' in transfer['type']:
-        data['destination'] = account_id
+@login_required
+def review_statement_import(request, import_id):
+    """Edit the lines of a Staged Import that need attention, or commit it.
+
+    Only the lines needing attention are rendered, one page at a time.
+    ``Save`` updates the posted lines, ``Commit`` creates the Entries for
+    every line in a single database transaction & ``Discard`` deletes the
+    Staged Import.
+
+    """
+    statement_import = get_object_or_404(
+        StatementImport.objects.select_related('bank_account__account'),
+        id=import_id)
+    submit_value = request.POST.get('submit', '')
+    if request.method == 'POST' and submit_value == 'Discard':
+        statement_import.delete()
+        messages.success(request, "The imported statement was discarded.")
+        return redirect('bank_import.views.import_bank_statement')
+    elif request.method == 'POST' and submit_value == 'Commit':
+        if _commit_statement_import(request, statement_import):
+            return redirect('bank_import.views.import_bank_statement')
+        return redirect(statement_import)
+
+    attention_lines = statement_import.lines.filter(needs_attention=True)
+    page = _get_page(attention_lines, request.GET.get('page'))
+    if request.method == 'POST' and submit_value == 'Save':
+        formsets = _build_review_formsets(
+            statement_import, page.object_list, request.POST)
+        if all(formset.is_valid() for formset in formsets.values()):
+            _update_lines(statement_import, formsets.values())
+            return redirect('{0}?page={1}'.format(
+                statement_import.get_absolute_url(), page.number))
     else:
-        data['source'] = account_id
-    return data
-
-
-def _build_spending(bank_account, account_id, withdrawal):
-    """Build the Initial Data for a SpendingImportForm."""
-    data = {
-        'amount': abs(withdrawal['amount']),
-        'date': withdrawal['date'],
-        'memo': withdrawal['memo'],
-        'ach_payment': withdrawal['check_number'] == '0',
-        'account': account_id,
-    }
-    if not data['ach_payment']:
-        data['check_number'] = withdrawal['check_number']
-        check_range = CheckRange.objects.filter(
-            bank_account=bank_account,
-            start_number__lte=data['check_number'],
-            end_number__gte=data['check_number'])
-        if check_range.exists():
-            check_range = check_range[0]
-            data['expense_account'] = check_range.default_account.id
-            data['memo'] = check_range.default_memo
-            data['payee'] = check_range.default_payee
-            return data
-    if data['memo'] != '':
-        matching_entries = BankSpendingEntry.objects.filter(
-            memo__icontains=data['memo'], date__day=data['date'].day)
-        for entry in matching_entries:
-            if entry.transaction_set.count() == 1:
-                transaction = entry.transaction_set.all()[0]
-                data['expense_account'] = transaction.account.id
-                data['payee'] = entry.payee
-                break
-        if 'expense_account' not in data:
-            matching_entries = BankSpendingEntry.objects.filter(
-                memo__icontains=data['memo'])
-            for entry in matching_entries:
-                if entry.transaction_set.count() == 1:
-                    transaction = entry.transaction_set.all()[0]
-                    data['expense_account'] = transaction.account.id
-                    data['payee'] = entry.payee
-                    break
-    return data
-
-
-def _build_receiving(account_id, deposit):
-    """Build the Initial Data for a ReceivingImportForm."""
-    data = {
-        'amount': abs(deposit['amount']),
-        'date': deposit['date'],
-        'memo': deposit['memo'],
-        'account': account_id,
+        formsets = _build_review_formsets(statement_import, page.object_list)
+    context = {'statement_import': statement_import, 'page': page,
+               'line_count': statement_import.lines.count()}
+    context.update(formsets)
+    return render(request, "bank_import/review_import.html", context)
+
+
+def _get_statement(account_form):
+    """Return the BankAccount & uploaded file contents of a valid form."""
+    return (account_form.cleaned_data['bank_account'],
+            account_form.cleaned_data['import_file'].read())
+
+
+def _get_page(lines, page_number):
+    """Return the requested Page of lines, or the last Page if invalid."""
+    paginator = Paginator(lines, REVIEW_PAGE_SIZE)
+    try:
+        return paginator.page(page_number)
+    except PageNotAnInteger:
+        return paginator.page(1)
+    except EmptyPage:
+        return paginator.page(paginator.num_pages)
+
+
+def _build_review_formsets(statement_import, lines, data=None):
+    """Build the Transfer, Withdrawal & Deposit FormSets for the lines."""
+    bank_account_id = statement_import.bank_account.account_id
+    initial = {'transfer': [], 'withdrawal': [], 'deposit': []}
+    for line in lines:
+        if line.is_transfer():
+            prefix = 'transfer'
+        else:
+            prefix = line.line_type
+        initial[prefix].append(line.get_initial_data(bank_account_id))
+    return {
+        'transfer_formset': TransferImportFormSet(
+            data, prefix='transfer', initial=initial['transfer']),
+        'withdrawal_formset': SpendingImportFormSet(
+            data, prefix='withdrawal', initial=initial['withdrawal']),
+        'deposit_formset': ReceivingImportFormSet(
+            data, prefix='deposit', initial=initial['deposit']),
     }
-    if data['memo'] != '':
-        matching_entries = BankReceivingEntry.objects.filter(
-            memo__icontains=data['memo'], date__day=data['date'].day)
-        for entry in matching_entries:
-            if entry.transaction_set.count() == 1:
-                transaction = entry.transaction_set.all()[0]
-                data['receiving_account'] = transaction.account.id
-                data['payor'] = entry.payor
-                break
-        if 'receiving_account' not in data:
-            matching_entries = BankReceivingEntry.objects.filter(
-                memo__icontains=data['memo'])
-            for entry in matching_entries:
-                if entry.transaction_set.count() == 1:
-                    transaction = entry.transaction_set.all()[0]
-                    data['receiving_account'] = transaction.account.id
-                    data['payor'] = entry.payor
-                    break
-    return data
+
+
+def _update_lines(statement_import, formsets):
+    """Save the cleaned data of the formsets to the Staged Import's lines."""
+    forms = [form for formset in formsets for form in formset.forms]
+    lines = statement_import.lines.in_bulk(
+        [form.cleaned_data['line'] for form in forms])
+    for form in forms:
+        line = lines.get(form.cleaned_data['line'])
+        if line is not None:
+            form.update_line(line)
+
+
+def _commit_statement_import(request, statement_import):
+    """Commit the Staged Import, returning whether it was successful."""
+    if statement_import.lines.filter(needs_attention=True).exists():
+        messages.error(request, "Every line must be completed before the "
+                                "statement can be committed.")
+        return False
+    try:
+        skipped = statement_import.commit()
+    except ValidationError as error:
+        messages.error(request, "The statement could not be committed: "
+                                "{0}".format(", ".join(error.messages)))
+        return False
+    messages.success(request, "The imported statement was committed.")
+    if skipped:
+        messages.warning(request, "{0} line(s) were already imported by "
+                                  "another statement & were skipped."
+                                  .format(skipped))
+    return True
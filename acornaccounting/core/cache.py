@@ -0,0 +1,398 @@
+"""Cache Ledger Calculations Until the Data They Depend On Changes.
+
+Nothing is ever deleted from the cache. Instead, cached values are stored
+under keys that include version numbers, and writes bump those versions,
+making the stale values unreachable until they expire.
+
+Three kinds of versions are kept:
+
+* A single **ledger version**, bumped by any write to the ledger. Report
+  results depend on the whole ledger, so they are keyed by this version.
+* An **accounts version**, bumped by any change to an Account. The JSON
+  list of all Accounts, used by the Account select widgets, is served from a
+  URL containing this version.
+* An **account version** for each Account & month, bumped by writes to
+  that Account's Transactions dated in that month. Per-Account values, like
+  balances, are keyed by the versions of only the months they depend on, so
+  a write to one Account only invalidates values for that Account & period.
+  Each Account also has a :data:`BALANCE_BUCKET` version, bumped by every
+  write to it's balance, whatever the date.
+
+The versions are bumped by the receivers in :mod:`accounts.signals` and by
+bulk writes that skip the model signals. The hits & misses of each kind of
+cached value are counted per-process, see :func:`get_cache_stats`.
+
+A version bumped inside a managed transaction is bumped again once the
+transaction is committed, by :func:`flush_pending_bumps`. Otherwise a
+reader on another connection could read the uncommitted rows' old values
+between the bump & the commit, & cache them under the new version.
+
+"""
+from collections import defaultdict
+import datetime
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .db.replicas import get_replica_alias
+
+
+LEDGER_VERSION_KEY = 'ledger:version'
+ACCOUNTS_VERSION_KEY = 'ledger:accounts'
+#: The longest relative timeout memcached allows.
+LEDGER_VERSION_TIMEOUT = 60 * 60 * 24 * 30
+REPORT_CACHE_TIMEOUT = 60 * 60
+ACCOUNT_CACHE_TIMEOUT = 60 * 60
+ACCOUNTS_JSON_TIMEOUT = 60 * 60 * 24
+#: The month bucket of Transactions dated after the current month.
+FUTURE_BUCKET = 'future'
+#: The bucket of every write to an Account's balance.
+BALANCE_BUCKET = 'balance'
+
+_stats = defaultdict(lambda: {'hits': 0, 'misses': 0})
+_pending = threading.local()
+
+
+def get_ledger_version():
+    """Return the current ledger version, starting one if none exists."""
+    return _get_version(LEDGER_VERSION_KEY)
+
+
+def bump_ledger_version():
+    """Increase the ledger version, invalidating every cached report."""
+    if transaction.is_managed():
+        _get_pending_bumps()['ledger'] = True
+    return _bump_ledger_version()
+
+
+def _bump_ledger_version():
+    """Increase the ledger version, starting one if none exists."""
+    try:
+        return cache.incr(LEDGER_VERSION_KEY)
+    except ValueError:
+        version = _new_version()
+        cache.set(LEDGER_VERSION_KEY, version, LEDGER_VERSION_TIMEOUT)
+        return version
+
+
+def get_cached_report(report_name, start_date, stop_date, build_report):
+    """Return the cached result of a report, building it on a cache miss.
+
+    :param report_name: A name unique to the report.
+    :type report_name: str
+    :param start_date: The first day of the report's date range, if any.
+    :type start_date: :class:`datetime.date`
+    :param stop_date: The last day of the report's date range, if any.
+    :type stop_date: :class:`datetime.date`
+    :param build_report: A callable returning the picklable report result.
+    :returns: The result of ``build_report``.
+
+    A replica may not have every write counted in the ledger version yet, so
+    reports built from a replica are cached separately & only for
+    ``REPLICA_PIN_SECONDS``, while reports built from the ``default``
+    database are shared with the replica's readers.
+
+    """
+    key = 'report:{0}:{1}:{2}:{3}'.format(
+        report_name, _normalize_date(start_date), _normalize_date(stop_date),
+        get_ledger_version())
+    return _get_or_build_for_alias(
+        'report', key, build_report, REPORT_CACHE_TIMEOUT)
+
+
+def get_accounts_version():
+    """Return the version of the Account list, starting one if none exists.
+
+    The version is the time of the last change to any Account, in
+    milliseconds since the epoch.
+
+    """
+    return _get_version(ACCOUNTS_VERSION_KEY)
+
+
+def get_stored_accounts_version():
+    """Return the stored version of the Account list, or ``None``.
+
+    Unlike :func:`get_accounts_version`, no version is started, so callers
+    can tell when the cache has not kept one.
+
+    """
+    return cache.get(ACCOUNTS_VERSION_KEY)
+
+
+def bump_accounts_version():
+    """Mark the Account list as changed, returning the new version."""
+    if transaction.is_managed():
+        _get_pending_bumps()['accounts'] = True
+    return _bump_accounts_version()
+
+
+def _bump_accounts_version():
+    """Set the Account list's version to one greater than any before."""
+    version = max(_new_version(), (cache.get(ACCOUNTS_VERSION_KEY) or 0) + 1)
+    cache.set(ACCOUNTS_VERSION_KEY, version, LEDGER_VERSION_TIMEOUT)
+    return version
+
+
+def get_cached_accounts_json(version, build_json):
+    """Return the JSON of an Account list version, building it if missing."""
+    key = 'accounts:json:{0}'.format(version)
+    return _get_or_build(
+        'accounts_json', key, build_json, ACCOUNTS_JSON_TIMEOUT)
+
+
+def month_bucket(date):
+    """Return the name of the month bucket the date falls in."""
+    return date.strftime('%Y-%m')
+
+
+def month_buckets_since(date):
+    """Return the buckets of every month from the date's onwards.
+
+    The :data:`FUTURE_BUCKET` is included, so values depending on the
+    buckets are also invalidated by writes dated after the current month.
+
+    """
+    today = datetime.date.today()
+    buckets = []
+    year, month = date.year, date.month
+    while (year, month) <= (today.year, today.month):
+        buckets.append(month_bucket(datetime.date(year, month, 1)))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return buckets + [FUTURE_BUCKET]
+
+
+def bump_account_versions(account_dates):
+    """Bump the versions of the Account & month buckets that were written.
+
+    Every write bumps the Account's :data:`BALANCE_BUCKET`, writes dated
+    after the current month also bump the Account's :data:`FUTURE_BUCKET`.
+    Undated writes, like changes to only the Account's balance, fall in no
+    month bucket.
+
+    :param account_dates: The Account id & date of each changed Transaction.
+    :type account_dates: An iterable of ``(account_id, date)`` tuples.
+
+    """
+    current_bucket = month_bucket(datetime.date.today())
+    keys = set()
+    for (account_id, date) in account_dates:
+        keys.add(_account_version_key(account_id, BALANCE_BUCKET))
+        if date is None:
+            continue
+        bucket = month_bucket(date)
+        keys.add(_account_version_key(account_id, bucket))
+        if bucket > current_bucket:
+            keys.add(_account_version_key(account_id, FUTURE_BUCKET))
+    if transaction.is_managed():
+        _get_pending_bumps()['keys'].update(keys)
+    _bump_versions(keys)
+
+
+def flush_pending_bumps():
+    """Bump the versions bumped since the last commit again.
+
+    This must be called after committing a managed transaction.
+
+    """
+    pending = discard_pending_bumps()
+    if pending['ledger']:
+        _bump_ledger_version()
+    if pending['accounts']:
+        _bump_accounts_version()
+    _bump_versions(pending['keys'])
+
+
+def discard_pending_bumps():
+    """Forget the versions bumped since the last commit & return them.
+
+    This is called after rolling back a managed transaction, since the
+    rolled back writes changed nothing readers could cache.
+
+    """
+    pending = _get_pending_bumps()
+    _pending.bumps = None
+    return pending
+
+
+def get_cached_account_value(name, account_id, buckets, arguments,
+                             build_value):
+    """Return a cached value for the Account, building it on a cache miss.
+
+    :param name: A name unique to the kind of value.
+    :type name: str
+    :param account_id: The id of the Account the value is for.
+    :type account_id: int
+    :param buckets: The month buckets whose Transactions the value uses.
+    :type buckets: list
+    :param arguments: Any other values the result depends on.
+    :type arguments: tuple
+    :param build_value: A callable returning the picklable value.
+    :returns: The result of ``build_value``.
+
+    Like :func:`get_cached_report`, values built from a replica are cached
+    separately & only for ``REPLICA_PIN_SECONDS``.
+
+    """
+    versions = _get_account_versions(account_id, buckets)
+    versions_hash = hashlib.md5(
+        ','.join(str(version) for version in versions)).hexdigest()
+    key = 'account:{0}:{1}:{2}:{3}'.format(
+        name, account_id, ':'.join(str(argument) for argument in arguments),
+        versions_hash)
+    return _get_or_build_for_alias(
+        name, key, build_value, ACCOUNT_CACHE_TIMEOUT)
+
+
+def get_cached_accounts_value(name, account_ids, arguments, build_value):
+    """Return a cached value totalling many Accounts, building it on a miss.
+
+    The value is keyed by the :data:`BALANCE_BUCKET` versions of the
+    Accounts, so it is only invalidated by writes to one of them.
+
+    :param name: A name unique to the kind of value.
+    :type name: str
+    :param account_ids: The ids of the Accounts the value uses.
+    :type account_ids: list
+    :param arguments: Any other values the result depends on.
+    :type arguments: tuple
+    :param build_value: A callable returning the picklable value.
+    :returns: The result of ``build_value``.
+
+    """
+    account_ids = sorted(account_ids)
+    keys = [_account_version_key(account_id, BALANCE_BUCKET)
+            for account_id in account_ids]
+    versions_hash = hashlib.md5(','.join(
+        '{0}={1}'.format(account_id, version) for (account_id, version)
+        in zip(account_ids, _get_versions(keys)))).hexdigest()
+    key = 'accounts:{0}:{1}:{2}'.format(
+        name, ':'.join(str(argument) for argument in arguments),
+        versions_hash)
+    return _get_or_build_for_alias(
+        name, key, build_value, ACCOUNT_CACHE_TIMEOUT)
+
+
+def get_cached_account_ids(name, build_ids):
+    """Return a cached list of Account ids, rebuilt when any Account changes.
+
+    :param name: A name unique to the list.
+    :type name: str
+    :param build_ids: A callable returning the list of Account ids.
+    :returns: The result of ``build_ids``.
+
+    """
+    key = 'accounts:ids:{0}:{1}'.format(name, get_accounts_version())
+    return _get_or_build_for_alias(
+        'account_ids', key, build_ids, ACCOUNTS_JSON_TIMEOUT)
+
+
+def get_cache_stats():
+    """Return the hits & misses of each kind of value cached by this process.
+
+    :returns: The ``hits`` & ``misses`` counts, keyed by the kind of value,
+              e.g. ``report`` or ``balance_by_date``.
+    :rtype: dict
+
+    """
+    return dict((name, dict(counts)) for (name, counts) in _stats.items())
+
+
+def reset_cache_stats():
+    """Clear the hit & miss counts of this process."""
+    _stats.clear()
+
+
+def _get_version(key):
+    """Return the version stored in the key, starting one if none exists."""
+    version = cache.get(key)
+    if version is None:
+        version = _new_version()
+        if not cache.add(key, version, LEDGER_VERSION_TIMEOUT):
+            version = cache.get(key) or version
+    return version
+
+
+def _get_pending_bumps():
+    """Return the versions this thread must bump again after a commit."""
+    if getattr(_pending, 'bumps', None) is None:
+        _pending.bumps = {'ledger': False, 'accounts': False, 'keys': set()}
+    return _pending.bumps
+
+
+def _bump_versions(keys):
+    """Increase the versions stored in the keys, starting missing ones."""
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_version(), LEDGER_VERSION_TIMEOUT)
+
+
+def _get_account_versions(account_id, buckets):
+    """Return the versions of the Account's buckets, starting missing ones."""
+    return _get_versions(
+        [_account_version_key(account_id, bucket) for bucket in buckets])
+
+
+def _get_versions(keys):
+    """Return the versions stored in the keys, starting missing ones."""
+    versions = cache.get_many(keys)
+    missing = dict((key, _new_version()) for key in keys
+                   if key not in versions)
+    if missing:
+        cache.set_many(missing, LEDGER_VERSION_TIMEOUT)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def _account_version_key(account_id, bucket):
+    """Return the cache key of the Account's version for the bucket."""
+    return 'ledger:account:{0}:{1}'.format(account_id, bucket)
+
+
+def _get_or_build(name, key, build_value, timeout):
+    """Return the cached value, building & caching it if it is missing."""
+    value = cache.get(key)
+    if value is None:
+        _stats[name]['misses'] += 1
+        value = build_value()
+        cache.set(key, value, timeout)
+    else:
+        _stats[name]['hits'] += 1
+    return value
+
+
+def _get_or_build_for_alias(name, key, build_value, timeout):
+    """Return the cached value, keeping values built from a replica apart.
+
+    Values built from the ``default`` database are cached in the key for the
+    ``timeout`` & shared with the replica's readers. A replica may not have
+    every write counted in the versions the key contains, so values built
+    from it are cached under a key scoped to it's alias, & only for
+    ``REPLICA_PIN_SECONDS``.
+
+    """
+    alias = get_replica_alias()
+    if alias is None:
+        return _get_or_build(name, key, build_value, timeout)
+    value = cache.get(key)
+    if value is not None:
+        _stats[name]['hits'] += 1
+        return value
+    return _get_or_build(name, '{0}:{1}'.format(key, alias), build_value,
+                         settings.REPLICA_PIN_SECONDS)
+
+
+def _new_version():
+    """Return a starting version greater than any previously evicted one."""
+    return int(time.time() * 1000)
+
+
+def _normalize_date(date):
+    """Return the date in ISO format, or an empty string if there is none."""
+    return date.isoformat() if date is not None else ''
@@ -0,0 +1,205 @@
+"""Cache Backends Used by the Application.
+
+The :class:`TwoTierCache` keeps a small, per-process copy of recently used
+values in front of a shared, remote cache like memcached. Render heavy pages
+read the same cached balances & reports many times, so most reads are
+answered without a network round trip.
+
+"""
+from collections import OrderedDict
+import cPickle as pickle
+import threading
+import time
+
+from django.core.cache import get_cache
+from django.core.cache.backends.base import BaseCache
+
+
+class TwoTierCache(BaseCache):
+    """A size-bounded, in-process LRU cache in front of a remote cache.
+
+    The ``LOCATION`` is the alias or dotted path of the remote cache. The
+    ``OPTIONS`` may contain:
+
+    ``MAX_ENTRIES``
+        The most values kept in the local tier, the least recently used value
+        is dropped first. Defaults to ``300``.
+    ``LOCAL_TIMEOUT``
+        The most seconds a value is served from the local tier before it is
+        read from the remote cache again. Defaults to ``5``.
+    ``VERSION_KEY``
+        The key of the ledger version, defaults to ``ledger:version``.
+    ``VERSION_CHECK_INTERVAL``
+        The most seconds between reads of the remote ledger version. The
+        local tier is emptied when the version has changed. Defaults to
+        ``1``.
+    ``REMOTE_ONLY_PREFIX``
+        Keys starting with this prefix are never kept in the local tier,
+        defaults to ``ledger:``. The version counters must always be read
+        from the remote cache, since other processes bump them.
+
+    Writes go to both tiers. The number of hits in each tier & the misses
+    are counted in the :attr:`stats` dictionary.
+
+    """
+
+    def __init__(self, location, params):
+        super(TwoTierCache, self).__init__(params)
+        options = params.get('OPTIONS', {})
+        self.remote_location = location
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self.version_key = options.get('VERSION_KEY', 'ledger:version')
+        self.version_check_interval = options.get(
+            'VERSION_CHECK_INTERVAL', 1)
+        self.remote_only_prefix = options.get(
+            'REMOTE_ONLY_PREFIX', 'ledger:')
+        self.stats = {'local_hits': 0, 'remote_hits': 0, 'misses': 0}
+        self._remote = None
+        self._local = OrderedDict()
+        self._lock = threading.RLock()
+        self._ledger_version = None
+        self._version_checked_at = 0
+
+    @property
+    def remote(self):
+        """Return the remote cache, connecting to it on first use."""
+        if self._remote is None:
+            self._remote = get_cache(self.remote_location)
+        return self._remote
+
+    def add(self, key, value, timeout=None, version=None):
+        added = self.remote.add(key, value, timeout, version)
+        if added:
+            self._set_local(key, value, timeout, version)
+        return added
+
+    def get(self, key, default=None, version=None):
+        found, value = self._get_local(key, version)
+        if found:
+            self.stats['local_hits'] += 1
+            return value
+        value = self.remote.get(key, version=version)
+        if value is None:
+            self.stats['misses'] += 1
+            return default
+        self.stats['remote_hits'] += 1
+        self._set_local(key, value, None, version)
+        return value
+
+    def set(self, key, value, timeout=None, version=None):
+        self.remote.set(key, value, timeout, version)
+        self._set_local(key, value, timeout, version)
+        if key == self.version_key:
+            self._clear_local(value)
+
+    def delete(self, key, version=None):
+        self.remote.delete(key, version)
+        self._delete_local(key, version)
+
+    def get_many(self, keys, version=None):
+        values = {}
+        remote_keys = []
+        for key in keys:
+            found, value = self._get_local(key, version)
+            if found:
+                values[key] = value
+            else:
+                remote_keys.append(key)
+        self.stats['local_hits'] += len(values)
+        if remote_keys:
+            remote_values = self.remote.get_many(remote_keys, version=version)
+            self.stats['remote_hits'] += len(remote_values)
+            self.stats['misses'] += len(remote_keys) - len(remote_values)
+            for (key, value) in remote_values.items():
+                self._set_local(key, value, None, version)
+            values.update(remote_values)
+        return values
+
+    def set_many(self, data, timeout=None, version=None):
+        self.remote.set_many(data, timeout, version)
+        for (key, value) in data.items():
+            self._set_local(key, value, timeout, version)
+
+    def delete_many(self, keys, version=None):
+        self.remote.delete_many(keys, version)
+        for key in keys:
+            self._delete_local(key, version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.remote.incr(key, delta, version)
+        self._delete_local(key, version)
+        if key == self.version_key:
+            self._clear_local(value)
+        return value
+
+    def decr(self, key, delta=1, version=None):
+        return self.incr(key, -delta, version)
+
+    def has_key(self, key, version=None):
+        return self.get(key, version=version) is not None
+
+    def clear(self):
+        self.remote.clear()
+        self._clear_local(None)
+
+    def reset_stats(self):
+        """Set the hit & miss counts back to zero."""
+        for name in self.stats:
+            self.stats[name] = 0
+
+    def _get_local(self, key, version):
+        """Return whether the key is in the local tier, & it's value."""
+        if key.startswith(self.remote_only_prefix):
+            return False, None
+        self._check_ledger_version()
+        local_key = self.make_key(key, version)
+        with self._lock:
+            entry = self._local.get(local_key)
+            if entry is None:
+                return False, None
+            (expires_at, pickled) = entry
+            if expires_at < time.time():
+                del self._local[local_key]
+                return False, None
+            # Move the key to the end, marking it as the most recently used
+            del self._local[local_key]
+            self._local[local_key] = entry
+        return True, pickle.loads(pickled)
+
+    def _set_local(self, key, value, timeout, version):
+        """Keep a copy of the value in the local tier."""
+        if key.startswith(self.remote_only_prefix) or self._max_entries < 1:
+            return
+        if timeout is None:
+            timeout = self.default_timeout
+        expires_at = time.time() + min(timeout, self.local_timeout)
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        local_key = self.make_key(key, version)
+        with self._lock:
+            self._local.pop(local_key, None)
+            self._local[local_key] = (expires_at, pickled)
+            while len(self._local) > self._max_entries:
+                self._local.popitem(last=False)
+
+    def _delete_local(self, key, version):
+        """Remove the key from the local tier."""
+        with self._lock:
+            self._local.pop(self.make_key(key, version), None)
+
+    def _clear_local(self, ledger_version):
+        """Empty the local tier, remembering the ledger version it is for."""
+        with self._lock:
+            self._local.clear()
+            self._ledger_version = ledger_version
+            self._version_checked_at = time.time()
+
+    def _check_ledger_version(self):
+        """Empty the local tier if another process changed the ledger."""
+        if time.time() - self._version_checked_at < (
+                self.version_check_interval):
+            return
+        ledger_version = self.remote.get(self.version_key)
+        if ledger_version != self._ledger_version:
+            self._clear_local(ledger_version)
+        else:
+            self._version_checked_at = time.time()
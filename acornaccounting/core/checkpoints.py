@@ -0,0 +1,25 @@
+"""Save the Progress of Long Running Commands to Resume After Interruption.
+
+A checkpoint is a :obj:`dict` saved as JSON. The file is replaced in a single
+rename, so an interrupted write leaves the previous checkpoint in place.
+
+"""
+import json
+import os
+
+
+def read_checkpoint(path):
+    """Return the checkpoint saved at the path, or ``None`` if missing."""
+    try:
+        with open(path) as checkpoint_file:
+            return json.load(checkpoint_file)
+    except IOError:
+        return None
+
+
+def write_checkpoint(path, checkpoint):
+    """Replace the checkpoint file, so it is never left half written."""
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'w') as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+    os.rename(temporary_path, path)
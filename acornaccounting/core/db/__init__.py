@@ -0,0 +1 @@
+"""Database Helpers Shared by the Applications."""
@@ -0,0 +1,8 @@
+"""Database Backends that Capture Slow Queries.
+
+Use one of these as a database's ``ENGINE`` to log the queries slower than
+the ``SLOW_QUERY_THRESHOLD``, see :mod:`core.db.slow_queries`. The
+PostgreSQL backend also keeps connections open between requests when the
+database has a ``POOL`` setting, see :mod:`core.db.pool`.
+
+"""
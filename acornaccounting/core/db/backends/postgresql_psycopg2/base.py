@@ -0,0 +1,22 @@
+"""The PostgreSQL Backend, Capturing Slow Queries & Pooling Connections."""
+from django.db.backends.postgresql_psycopg2 import base
+from django.db.backends.postgresql_psycopg2.base import *
+
+from core.db.pool import PooledConnectionMixin
+from core.db.slow_queries import SlowQueryMixin
+
+
+class DatabaseWrapper(PooledConnectionMixin, SlowQueryMixin,
+                      base.DatabaseWrapper):
+    explain_prefix = 'EXPLAIN '
+    analyze_prefix = 'EXPLAIN ANALYZE '
+
+    def _is_usable(self, connection):
+        """Skip the query if psycopg2 already knows the connection closed."""
+        if connection.closed:
+            return False
+        return super(DatabaseWrapper, self)._is_usable(connection)
+
+    def _prepare_connection(self, connection):
+        """Use this wrapper's isolation level, which may be autocommit."""
+        connection.set_isolation_level(self.isolation_level)
@@ -0,0 +1,9 @@
+"""The SQLite Backend, Capturing Slow Queries."""
+from django.db.backends.sqlite3 import base
+from django.db.backends.sqlite3.base import *
+
+from core.db.slow_queries import SlowQueryMixin
+
+
+class DatabaseWrapper(SlowQueryMixin, base.DatabaseWrapper):
+    explain_prefix = 'EXPLAIN QUERY PLAN '
@@ -0,0 +1,95 @@
+"""Helpers for Inserting & Deleting Related Rows with Bulk Queries.
+
+Django's ``bulk_create`` does not set the primary keys of the objects it
+inserts, so rows that other rows refer to can not normally be bulk inserted.
+These functions reserve the primary keys up front, letting the related
+objects be linked together before any of them are inserted.
+
+Django's ``QuerySet.delete`` loads every row & it's related rows to send the
+delete signals, :func:`bulk_delete` removes the rows with a single query.
+
+"""
+from django.db import connections, router, transaction
+
+
+#: The most parameters SQLite allows in a single query.
+SQLITE_MAX_VARIABLES = 999
+
+
+def reserve_ids(model, count):
+    """Reserve & return a list of ``count`` unused primary keys for the Model.
+
+    PostgreSQL pulls the keys from the table's sequence, so they are never
+    handed out again. Other databases use the keys after the current maximum,
+    which is only safe inside the transaction that inserts the rows.
+
+    """
+    if count < 1:
+        return []
+    using = router.db_for_write(model)
+    connection = connections[using]
+    table = model._meta.db_table
+    pk_column = model._meta.pk.column
+    cursor = connection.cursor()
+    if connection.vendor == 'postgresql':
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, %s)) "
+            "FROM generate_series(1, %s)", [table, pk_column, count])
+        return [row[0] for row in cursor.fetchall()]
+    cursor.execute("SELECT MAX({0}) FROM {1}".format(
+        connection.ops.quote_name(pk_column),
+        connection.ops.quote_name(table)))
+    maximum = cursor.fetchone()[0] or 0
+    return range(maximum + 1, maximum + count + 1)
+
+
+def assign_ids(model, objects):
+    """Set the primary key of every object that does not already have one."""
+    objects = [obj for obj in objects if obj.pk is None]
+    for (obj, pk) in zip(objects, reserve_ids(model, len(objects))):
+        obj.pk = pk
+    return objects
+
+
+def bulk_create(model, objects, batch_size=None):
+    """Insert the objects, in batches the database can handle.
+
+    Each batch is inserted with it's own ``bulk_create`` query. On SQLite the
+    batches are never larger than :data:`SQLITE_MAX_VARIABLES` allows, since
+    it limits the number of parameters in a single query.
+
+    """
+    if not objects:
+        return
+    connection = connections[router.db_for_write(model)]
+    limit = batch_size or len(objects)
+    if connection.vendor == 'sqlite':
+        limit = min(limit, max(
+            SQLITE_MAX_VARIABLES // len(model._meta.local_fields), 1))
+    for start in range(0, len(objects), limit):
+        model.objects.bulk_create(objects[start:start + limit])
+
+
+def bulk_delete(queryset):
+    """Delete the rows of the QuerySet with a single query.
+
+    No signals are sent & related rows are not deleted, so the caller must
+    delete the rows referring to these first & update anything the signals
+    would have. The rows are deleted in the caller's transaction, which must
+    be managed, so a series of deletes is committed or rolled back together.
+
+    :returns: The number of rows deleted.
+    :rtype: int
+
+    """
+    model = queryset.model
+    using = router.db_for_write(model)
+    connection = connections[using]
+    query = queryset.order_by().values('pk').query
+    sql, params = query.get_compiler(using).as_sql()
+    cursor = connection.cursor()
+    cursor.execute("DELETE FROM {0} WHERE {1} IN ({2})".format(
+        connection.ops.quote_name(model._meta.db_table),
+        connection.ops.quote_name(model._meta.pk.column), sql), params)
+    transaction.set_dirty(using=using)
+    return cursor.rowcount
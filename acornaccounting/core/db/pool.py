@@ -0,0 +1,220 @@
+"""Keep Database Connections Open Between Requests.
+
+Django closes each thread's database connections when a request finishes,
+so every request pays for a new connection. A database backend using the
+:class:`PooledConnectionMixin` instead returns the connection to a
+per-process pool, and the next request in any of the process's threads
+takes it from the pool.
+
+The pool is configured by a ``POOL`` dictionary in the database's
+``DATABASES`` entry, pooling is disabled when there is none::
+
+    DATABASES = {
+        'default': {
+            'ENGINE': 'core.db.backends.postgresql_psycopg2',
+            # ...
+            'POOL': {'MAX_SIZE': 4, 'MAX_AGE': 600, 'CHECK_AFTER': 30},
+        }
+    }
+
+``MAX_SIZE``
+    The most idle connections kept by each process, returned connections
+    are closed when the pool is full. Busy threads still open connections
+    when the pool is empty, so this does not limit the open connections.
+``MAX_AGE``
+    Connections opened this many seconds ago are closed instead of being
+    reused, so server side memory & settings changes are picked up.
+``CHECK_AFTER``
+    Connections idle for this many seconds are checked with a query before
+    they are reused, broken connections are closed.
+
+Connections are rolled back when they are returned. The connections
+created, reused, recycled & discarded are counted by the
+``acorn_db_connections_total`` metric & the time taken to open connections
+by the ``acorn_db_connect_duration_seconds`` metric, see
+:mod:`core.metrics`.
+
+"""
+import os
+import threading
+import time
+
+from core import metrics
+
+
+#: The pool settings used when the ``POOL`` dictionary leaves them out.
+DEFAULT_POOL_SETTINGS = {'MAX_SIZE': 4, 'MAX_AGE': 600, 'CHECK_AFTER': 30}
+
+_pools = {}
+_pools_lock = threading.Lock()
+_state = {'pid': None}
+#: The connections inherited from a parent process, see :func:`get_pool`.
+_inherited = []
+
+
+class ConnectionPool(object):
+    """The idle connections to a database, newest last.
+
+    The newest connection is reused first, so connections left idle by a
+    quiet period are recycled instead of being checked again & again.
+
+    """
+
+    def __init__(self, alias, max_size, max_age, check_after):
+        self.alias = alias
+        self.max_size = max_size
+        self.max_age = max_age
+        self.check_after = check_after
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def get(self, is_usable):
+        """Return an idle connection & when it was opened, if there is one.
+
+        :param is_usable: A callable checking if a connection still works.
+        :returns: The connection & the time it was opened, or ``None``.
+        :rtype: tuple
+
+        """
+        while True:
+            with self.lock:
+                if not self.idle:
+                    return None
+                (connection, opened_at, returned_at) = self.idle.pop()
+            now = time.time()
+            if now - opened_at >= self.max_age:
+                self._discard(connection, 'recycled')
+            elif (now - returned_at >= self.check_after and
+                    not is_usable(connection)):
+                self._discard(connection, 'unusable')
+            else:
+                self._count('reused')
+                return (connection, opened_at)
+
+    def put(self, connection, opened_at, reset):
+        """Return a connection to the pool, closing it if it is not needed.
+
+        :param reset: A callable rolling back the connection.
+
+        """
+        if time.time() - opened_at >= self.max_age:
+            return self._discard(connection, 'recycled')
+        try:
+            reset(connection)
+        except Exception:
+            return self._discard(connection, 'unusable')
+        with self.lock:
+            if len(self.idle) < self.max_size:
+                self.idle.append((connection, opened_at, time.time()))
+                return
+        self._discard(connection, 'overflow')
+
+    def record_connect(self, duration):
+        """Count a newly opened connection & the time it took to open."""
+        self._count('created')
+        metrics.observe(metrics.DB_CONNECT_DURATION, duration,
+                        database=self.alias)
+
+    def close_all(self):
+        """Close every idle connection."""
+        with self.lock:
+            (idle, self.idle) = (self.idle, [])
+        for (connection, _, _) in idle:
+            self._discard(connection, 'closed')
+
+    def _discard(self, connection, reason):
+        """Close a connection that will not be reused."""
+        self._count(reason)
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _count(self, event):
+        """Count an event of the pool's connections."""
+        metrics.increment(metrics.DB_CONNECTIONS, database=self.alias,
+                          event=event)
+
+
+def get_pool(alias, pool_settings):
+    """Return this process's pool for the database alias.
+
+    Forked processes start with empty pools. The connections of the parent
+    process are kept open but never used, since closing them would also
+    close the parent's connections.
+
+    """
+    with _pools_lock:
+        pid = os.getpid()
+        if _state['pid'] != pid:
+            _state['pid'] = pid
+            for pool in _pools.values():
+                _inherited.extend(connection for (connection, _, _)
+                                  in pool.idle)
+            _pools.clear()
+        pool = _pools.get(alias)
+        if pool is None:
+            options = dict(DEFAULT_POOL_SETTINGS, **pool_settings)
+            pool = _pools[alias] = ConnectionPool(
+                alias, options['MAX_SIZE'], options['MAX_AGE'],
+                options['CHECK_AFTER'])
+        return pool
+
+
+class PooledConnectionMixin(object):
+    """Take a ``DatabaseWrapper``'s connections from a pool.
+
+    Closing the wrapper returns it's connection to the pool. Pooling is
+    disabled when the database's settings have no ``POOL`` dictionary.
+
+    """
+    connection_opened_at = None
+
+    def _cursor(self):
+        """Reuse a pooled connection, or time opening a new one."""
+        pool = self._get_pool()
+        if pool is None or self.connection is not None:
+            return super(PooledConnectionMixin, self)._cursor()
+        pooled = pool.get(self._is_usable)
+        if pooled is not None:
+            (self.connection, self.connection_opened_at) = pooled
+            self._prepare_connection(self.connection)
+            return super(PooledConnectionMixin, self)._cursor()
+        start = time.time()
+        cursor = super(PooledConnectionMixin, self)._cursor()
+        pool.record_connect(time.time() - start)
+        self.connection_opened_at = start
+        return cursor
+
+    def close(self):
+        """Return the connection to the pool instead of closing it."""
+        pool = self._get_pool()
+        if pool is None or self.connection is None:
+            return super(PooledConnectionMixin, self).close()
+        self.validate_thread_sharing()
+        (connection, self.connection) = (self.connection, None)
+        pool.put(connection, self.connection_opened_at,
+                 self._reset_connection)
+
+    def _get_pool(self):
+        """Return the database's pool, or ``None`` if it is not pooled."""
+        pool_settings = self.settings_dict.get('POOL')
+        if pool_settings is None:
+            return None
+        return get_pool(self.alias, pool_settings)
+
+    def _is_usable(self, connection):
+        """Return whether a query can be run on the connection."""
+        try:
+            connection.cursor().execute('SELECT 1')
+            connection.rollback()
+        except Exception:
+            return False
+        return True
+
+    def _reset_connection(self, connection):
+        """End any transaction left open on the connection."""
+        connection.rollback()
+
+    def _prepare_connection(self, connection):
+        """Set up a pooled connection for this wrapper."""
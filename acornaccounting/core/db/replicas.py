@@ -0,0 +1,104 @@
+"""Send the Reads of Read-Only Views to a Replica Database.
+
+Views wrapped with :func:`use_replica` read from the database alias named by
+the ``REPLICA_DATABASE`` setting, while writes always go to the ``default``
+database. Reads outside of those views, including every read made by views
+that write, use the ``default`` database.
+
+A replica may lag behind the ``default`` database, so a client that has just
+written is pinned to the ``default`` database for ``REPLICA_PIN_SECONDS``.
+The :class:`~core.middleware.ReplicaPinningMiddleware` sets the pinning
+cookie after any request that is not a ``GET`` or ``HEAD``, so the page
+shown after saving an Entry always includes it.
+
+Reports & Account balances built from the replica are only cached for
+``REPLICA_PIN_SECONDS``, since they may miss writes already counted in the
+cache versions, see :func:`core.cache.get_cached_report` &
+:func:`core.cache.get_cached_account_value`.
+
+The :class:`ReplicaRouter` must be in the ``DATABASE_ROUTERS`` setting.
+When ``REPLICA_DATABASE`` is ``None``, every query uses ``default``.
+
+"""
+from functools import wraps
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+#: The cookie holding the time a client is pinned to ``default`` until.
+PIN_COOKIE = 'replica_pin'
+#: The request methods that are not expected to write.
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+_state = threading.local()
+
+
+class ReplicaRouter(object):
+    """Read from the replica inside :func:`use_replica` views.
+
+    Writes always go to the ``default`` database, even for objects read from
+    the replica.
+
+    """
+
+    def db_for_read(self, model, **hints):
+        """Use the replica if the current view was routed to it."""
+        return get_replica_alias()
+
+    def db_for_write(self, model, **hints):
+        """Always write to the ``default`` database."""
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Allow relations between objects read from either database."""
+        return True
+
+    def allow_syncdb(self, db, model):
+        """Only create tables in the ``default`` database."""
+        if db == settings.REPLICA_DATABASE:
+            return False
+        return None
+
+
+def use_replica(view):
+    """Route the reads of a read-only view to the replica.
+
+    The ``default`` database is used if no replica is configured or the
+    client is pinned to it after a recent write.
+
+    """
+    @wraps(view)
+    def routed_view(request, *args, **kwargs):
+        alias = settings.REPLICA_DATABASE
+        if not alias or is_pinned(request):
+            return view(request, *args, **kwargs)
+        previous_alias = get_replica_alias()
+        _state.alias = alias
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _state.alias = previous_alias
+    return routed_view
+
+
+def get_replica_alias():
+    """Return the replica the current reads are routed to, if any."""
+    return getattr(_state, 'alias', None)
+
+
+def is_pinned(request):
+    """Return whether the client recently wrote to the ledger."""
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def pin(response):
+    """Pin the client to the ``default`` database for a while."""
+    seconds = settings.REPLICA_PIN_SECONDS
+    response.set_cookie(PIN_COOKIE, str(time.time() + seconds),
+                        max_age=seconds)
@@ -0,0 +1,198 @@
+"""Capture Slow Queries Along With Their Query Plans.
+
+The database backends in :mod:`core.db.backends` wrap every cursor in a
+:class:`SlowQueryCursorWrapper`. Queries taking at least the
+``SLOW_QUERY_THRESHOLD`` number of seconds are logged to the
+``core.db.slow_queries`` logger as a line of JSON containing the SQL, it's
+parameters, the duration, the query plan & the application functions that
+ran it. The ``slow_queries`` management command summarizes the logged
+queries.
+
+Queries are explained on the connection that ran them, so they see the same
+uncommitted rows. The ``EXPLAIN`` is run in a savepoint when the connection
+is managing a transaction, so a failed ``EXPLAIN`` does not abort the
+caller's transaction. Only ``SELECT`` queries are explained & their plans
+are only estimated, unless the ``SLOW_QUERY_ANALYZE`` setting is ``True`` &
+the backend supports ``EXPLAIN ANALYZE``, which runs the slow query again.
+
+"""
+import datetime
+import json
+import logging
+import os
+import time
+import traceback
+
+from django.conf import settings
+from django.db import DatabaseError
+
+
+logger = logging.getLogger(__name__)
+
+#: The directory containing the application's packages.
+PROJECT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+#: The modules that run queries on behalf of their callers.
+WRAPPER_PATHS = (os.path.splitext(os.path.abspath(__file__))[0],
+                 os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'backends', ''))
+#: The savepoint a query's ``EXPLAIN`` is run in.
+EXPLAIN_SAVEPOINT = 'slow_query_explain'
+
+
+class SlowQueryMixin(object):
+    """Add slow query capturing to a ``DatabaseWrapper``.
+
+    Subclasses set :attr:`explain_prefix` to the statement that returns the
+    plan of a query, & :attr:`analyze_prefix` to the statement that runs the
+    query & returns it's plan with the actual timings, if there is one.
+
+    """
+    explain_prefix = 'EXPLAIN '
+    analyze_prefix = None
+
+    def cursor(self):
+        """Return a cursor that captures slow queries."""
+        return SlowQueryCursorWrapper(
+            super(SlowQueryMixin, self).cursor(), self)
+
+
+class SlowQueryCursorWrapper(object):
+    """Time each query run by the cursor, capturing the slow ones."""
+
+    def __init__(self, cursor, db):
+        self.cursor = cursor
+        self.db = db
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def execute(self, sql, params=()):
+        start = time.time()
+        result = self.cursor.execute(sql, params)
+        duration = time.time() - start
+        if duration >= get_threshold():
+            capture(self.db, sql, params, duration)
+        return result
+
+    def executemany(self, sql, param_list):
+        start = time.time()
+        result = self.cursor.executemany(sql, param_list)
+        duration = time.time() - start
+        if duration >= get_threshold():
+            capture(self.db, sql, None, duration)
+        return result
+
+
+def get_threshold():
+    """Return the number of seconds a query must take to be captured."""
+    return getattr(settings, 'SLOW_QUERY_THRESHOLD', 0.5)
+
+
+def capture(db, sql, params, duration):
+    """Log the query with it's plan & the functions that called it.
+
+    :param db: The connection the query was run on.
+    :type db: ``DatabaseWrapper``
+    :param sql: The SQL of the query.
+    :type sql: str
+    :param params: The parameters of the query, ``None`` if it was run with
+                   many sets of parameters.
+    :type params: list
+    :param duration: The number of seconds the query took.
+    :type duration: float
+
+    """
+    caller, view = find_callers(traceback.extract_stack()[:-2])
+    logger.warning(json.dumps({
+        'time': datetime.datetime.now().isoformat(),
+        'database': db.alias,
+        'duration': duration,
+        'sql': sql,
+        'params': [unicode(param) for param in params or ()],
+        'plan': explain(db, sql, params),
+        'caller': caller,
+        'view': view,
+    }))
+
+
+def explain(db, sql, params):
+    """Return the lines of the query's plan, if it is a ``SELECT`` query.
+
+    The ``EXPLAIN`` is rolled back to a savepoint if it fails & the
+    connection is managing a transaction, leaving the transaction usable.
+    Outside of a managed transaction no savepoint is used, since PostgreSQL
+    only allows them in transaction blocks. Failures are logged in the plan
+    instead of being raised, so they never fail the slow query's caller.
+
+    """
+    if params is None or not sql.lstrip().upper().startswith('SELECT'):
+        return []
+    prefix = db.explain_prefix
+    if getattr(settings, 'SLOW_QUERY_ANALYZE', False) and db.analyze_prefix:
+        prefix = db.analyze_prefix
+    use_savepoint = db.features.uses_savepoints and db.is_managed()
+    try:
+        return _run_explain(db, prefix + sql, params, use_savepoint)
+    except DatabaseError as error:
+        return ['Could not explain the query: {0}'.format(error)]
+
+
+def _run_explain(db, sql, params, use_savepoint):
+    """Run the ``EXPLAIN`` query, in a savepoint if ``use_savepoint``."""
+    cursor = db._cursor()
+    if not use_savepoint:
+        cursor.execute(sql, params)
+        return _format_plan(cursor)
+    cursor.execute(db.ops.savepoint_create_sql(EXPLAIN_SAVEPOINT))
+    try:
+        cursor.execute(sql, params)
+        return _format_plan(cursor)
+    except DatabaseError:
+        cursor.execute(db.ops.savepoint_rollback_sql(EXPLAIN_SAVEPOINT))
+        raise
+    finally:
+        cursor.execute(db.ops.savepoint_commit_sql(EXPLAIN_SAVEPOINT))
+
+
+def _format_plan(cursor):
+    """Return the rows of the plan fetched by the cursor as lines."""
+    return [' '.join(unicode(column) for column in row)
+            for row in cursor.fetchall()]
+
+
+def find_callers(stack):
+    """Return the innermost & outermost application functions in the stack.
+
+    Frames outside of the project directory, & in the cursor wrappers, are
+    skipped. The outermost function is usually the view or management
+    command.
+
+    :param stack: The frames, as returned by
+                  :func:`traceback.extract_stack`.
+    :type stack: list
+    :returns: The ``module.py:line function`` of each, or ``None``.
+    :rtype: tuple
+
+    """
+    application_frames = [
+        '{0}:{1} {2}'.format(
+            os.path.relpath(file_name, PROJECT_DIRECTORY), line_number,
+            function)
+        for (file_name, line_number, function, _) in stack
+        if _is_application_file(file_name)]
+    if not application_frames:
+        return None, None
+    return application_frames[-1], application_frames[0]
+
+
+def _is_application_file(file_name):
+    """Return whether the file belongs to the application's packages."""
+    file_name = os.path.abspath(file_name)
+    return (file_name.startswith(PROJECT_DIRECTORY + os.sep) and
+            'site-packages' not in file_name and
+            not file_name.startswith(WRAPPER_PATHS) and
+            os.path.basename(file_name) != 'manage.py')
@@ -0,0 +1,37 @@
+"""Share a Single Database Transaction Between Nested Writers.
+
+Django 1.4's ``commit_on_success`` commits the connection's transaction when
+the block exits, even if it was entered inside another managed transaction.
+Functions that write several tables use
+:func:`commit_on_success_unless_managed` instead, so when they are called by
+a view running in the :class:`~core.middleware.WriteTransactionMiddleware`'s
+transaction or by another writer, everything is committed or rolled back
+together by the outermost caller. The cache versions bumped by the writes
+are bumped again once the outermost caller commits, see :mod:`core.cache`.
+
+"""
+from contextlib import contextmanager
+
+from django.db import transaction
+
+from ..cache import discard_pending_bumps, flush_pending_bumps
+
+
+@contextmanager
+def commit_on_success_unless_managed(using=None):
+    """Run the block in a new transaction, unless one is already managed.
+
+    :param using: The database alias, the ``default`` database if ``None``.
+    :type using: str
+
+    """
+    if transaction.is_managed(using=using):
+        yield
+        return
+    try:
+        with transaction.commit_on_success(using=using):
+            yield
+    except Exception:
+        discard_pending_bumps()
+        raise
+    flush_pending_bumps()
@@ -0,0 +1,333 @@
+"""
+Django Accounting Command to time a scripted workload of requests.
+
+The workload is driven through the Django test client against the configured
+database, which should contain a ledger created by the ``generatedata``
+command. Each step is requested a number of times as a superuser, recording
+the latency & number of queries of every request. The p50/p95/p99 latencies
+& the query counts of each step are reported as JSON, so the results of runs
+on different commits can be compared.
+
+The entry creation, bank import, credit card approval & fiscal year close
+steps change the ledger, so the ledger should be generated again before each
+run that is compared.
+"""
+import datetime
+import json
+import math
+from optparse import make_option
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.db.models import Count, Max
+from django.test.client import Client
+
+from accounts.models import Account, Header
+from bank_import.models import BankAccount
+from creditcards.models import CreditCardEntry
+from entries.models import Transaction
+from fiscalyears.models import FiscalYear
+
+from .benchmark_qfx import build_synthetic_qfx
+
+
+#: The name of each step, whether it changes the ledger, & whether it may
+#: only be run once. The steps are run in this order.
+STEPS = (
+    ('accounts_chart', False, False),
+    ('header_chart', False, False),
+    ('account_register_month', False, False),
+    ('account_register_quarter', False, False),
+    ('account_register_year', False, False),
+    ('bank_register', False, False),
+    ('journal_ledger', False, False),
+    ('trial_balance', False, False),
+    ('profit_loss', False, False),
+    ('add_journal_entry', True, False),
+    ('bank_import', True, False),
+    ('credit_card_approval', True, False),
+    ('fiscal_year_close', True, True),
+)
+#: The number of lines in each synthetic bank statement.
+STATEMENT_LINES = 50
+#: The percentiles of the latencies to report.
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, percent):
+    """Return the nearest-rank percentile of the values.
+
+    :param values: The values, in ascending order.
+    :type values: list
+    :param percent: The percentile to return, between 0 & 100.
+    :type percent: int
+
+    """
+    rank = int(math.ceil(percent / 100.0 * len(values)))
+    return values[max(rank, 1) - 1]
+
+
+def summarize(durations, query_counts):
+    """Return the latency percentiles & query counts of a step's requests."""
+    durations = sorted(durations)
+    query_counts = sorted(query_counts)
+    summary = {'requests': len(durations),
+               'mean_ms': sum(durations) / len(durations) * 1000,
+               'queries_min': query_counts[0],
+               'queries_max': query_counts[-1],
+               'queries_p50': percentile(query_counts, 50)}
+    for percent in PERCENTILES:
+        summary['p{0}_ms'.format(percent)] = (
+            percentile(durations, percent) * 1000)
+    return summary
+
+
+class Workload(object):
+    """Request the steps of the workload with a logged in test client.
+
+    Each step is a method named ``step_<name>``, called with the iteration
+    number & returning the response. A step returns ``None`` when there is
+    nothing left for it to do.
+
+    """
+
+    def __init__(self, client):
+        """Choose the Accounts & dates the steps request."""
+        self.client = client
+        busiest = Transaction.objects.filter(account__bank=False).values(
+            'account').annotate(count=Count('id')).order_by('-count')[:1]
+        if not busiest:
+            raise CommandError("The ledger has no Transactions, create one "
+                               "with the generatedata command.")
+        self.account = Account.objects.get(id=busiest[0]['account'])
+        self.other_account = Account.objects.filter(bank=False).exclude(
+            id=self.account.id).order_by('id')[0]
+        self.bank_account = BankAccount.objects.select_related(
+            'account').order_by('id')[0]
+        self.header = Header.objects.filter(parent=None).order_by('id')[0]
+        self.stop_date = Transaction.objects.aggregate(
+            Max('date'))['date__max']
+
+    def step_accounts_chart(self, iteration):
+        return self.client.get(
+            reverse('accounts.views.show_accounts_chart'))
+
+    def step_header_chart(self, iteration):
+        return self.client.get(self.header.get_absolute_url())
+
+    def step_account_register_month(self, iteration):
+        return self._get_range(self.account.get_absolute_url(), 31)
+
+    def step_account_register_quarter(self, iteration):
+        return self._get_range(self.account.get_absolute_url(), 92)
+
+    def step_account_register_year(self, iteration):
+        return self._get_range(self.account.get_absolute_url(), 365)
+
+    def step_bank_register(self, iteration):
+        return self._get_range(
+            reverse('accounts.views.bank_journal',
+                    args=[self.bank_account.account.slug]), 31)
+
+    def step_journal_ledger(self, iteration):
+        return self._get_range(reverse('entries.views.journal_ledger'), 31)
+
+    def step_trial_balance(self, iteration):
+        return self._get_range(
+            reverse('reports.views.trial_balance_report'), 365)
+
+    def step_profit_loss(self, iteration):
+        return self._get_range(
+            reverse('reports.views.profit_loss_report'), 365)
+
+    def step_add_journal_entry(self, iteration):
+        return self.client.post(
+            reverse('entries.views.add_journal_entry'),
+            data={'entry-date': _format_date(self.stop_date),
+                  'entry-memo': 'Benchmark Entry {0}'.format(iteration),
+                  'transaction-TOTAL_FORMS': 2,
+                  'transaction-INITIAL_FORMS': 0,
+                  'transaction-MAX_NUM_FORMS': '',
+                  'transaction-0-account': self.account.id,
+                  'transaction-0-debit': 5,
+                  'transaction-1-account': self.other_account.id,
+                  'transaction-1-credit': 5,
+                  'subbtn': 'Submit'})
+
+    def step_bank_import(self, iteration):
+        statement = build_synthetic_qfx(STATEMENT_LINES, seed=iteration)
+        import_file = SimpleUploadedFile('statement.qfx',
+                                         statement.encode('utf-8'))
+        return self.client.post(
+            reverse('bank_import.views.import_bank_statement'),
+            data={'import_file': import_file,
+                  'bank_account': self.bank_account.id,
+                  'submit': 'Import'})
+
+    def step_credit_card_approval(self, iteration):
+        entries = CreditCardEntry.objects.order_by('id')[:1]
+        if not entries:
+            return None
+        entry = entries[0]
+        transactions = list(entry.transaction_set.all())
+        data = {'entry-id': entry.id,
+                'entry-date': _format_date(entry.date),
+                'entry-name': entry.name,
+                'entry-merchant': entry.merchant,
+                'entry-amount': entry.amount,
+                'entry-card': entry.card_id,
+                'transaction-TOTAL_FORMS': len(transactions),
+                'transaction-INITIAL_FORMS': len(transactions),
+                'transaction-MAX_NUM_FORMS': len(transactions),
+                'subbtn': 'Approve'}
+        for (number, card_transaction) in enumerate(transactions):
+            prefix = 'transaction-{0}-'.format(number)
+            data.update({prefix + 'id': card_transaction.id,
+                         prefix + 'creditcard_entry': entry.id,
+                         prefix + 'detail': card_transaction.detail,
+                         prefix + 'amount': card_transaction.amount,
+                         prefix + 'account': card_transaction.account_id})
+        return self.client.post(
+            reverse('creditcards.views.add_creditcard_entry',
+                    args=[str(entry.id)]), data=data)
+
+    def step_fiscal_year_close(self, iteration):
+        fiscal_year = FiscalYear.objects.latest()
+        accounts = Account.objects.order_by('last_reconciled', 'full_number')
+        data = {'year': fiscal_year.year + 1,
+                'end_month': fiscal_year.end_month,
+                'period': fiscal_year.period,
+                'form-TOTAL_FORMS': len(accounts),
+                'form-INITIAL_FORMS': len(accounts),
+                'form-MAX_NUM_FORMS': len(accounts),
+                'submit': 'Start New Year'}
+        for (number, account) in enumerate(accounts):
+            data['form-{0}-id'.format(number)] = account.id
+        return self.client.post(
+            reverse('fiscalyears.views.add_fiscal_year'), data=data)
+
+    def _get_range(self, url, days):
+        """Request the URL for the days ending on the last Transaction."""
+        return self.client.get(url, data={
+            'start_date': _format_date(
+                self.stop_date - datetime.timedelta(days=days - 1)),
+            'stop_date': _format_date(self.stop_date)})
+
+
+def _format_date(date):
+    """Return the date in the format used by the forms."""
+    return date.strftime('%m/%d/%Y')
+
+
+class Command(BaseCommand):
+    args = ''
+    help = """\
+    Time a scripted workload of requests against the generated ledger,
+    reporting the latency percentiles & query counts of each step as JSON.
+    The write steps change the ledger.
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('--iterations', type='int', default=20,
+                    help='Number of requests per step.'),
+        make_option('--steps', default=None,
+                    help='Comma separated names of the steps to run, '
+                         'defaults to every step.'),
+        make_option('--read-only', action='store_true', default=False,
+                    help='Skip the steps that change the ledger.'),
+        make_option('--label', default='',
+                    help='A label for the run, like the commit benchmarked.'),
+        make_option('--output', default=None,
+                    help='The file to write the JSON results to, defaults '
+                         'to standard output.'),
+        make_option('--noinput', action='store_false', dest='interactive',
+                    default=True,
+                    help='Do not ask before running the write steps.'),
+    )
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError("--iterations must be positive.")
+        steps = self._get_steps(options)
+        if (options['interactive'] and
+                any(writes for (_, writes, _) in steps)):
+            confirm = raw_input(
+                "The write steps will change the ledger in the database.\n"
+                "Type 'yes' to continue, or 'no' to cancel: ")
+            if confirm != 'yes':
+                raise CommandError("The benchmark was cancelled.")
+
+        username = 'benchmark-{0}'.format(uuid.uuid4().hex[:8])
+        password = uuid.uuid4().hex
+        user = User.objects.create_superuser(
+            username, 'benchmark@localhost', password)
+        use_debug_cursor = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+        try:
+            client = Client()
+            client.login(username=username, password=password)
+            workload = Workload(client)
+            results = {}
+            for (name, writes, once) in steps:
+                results[name] = self._run_step(
+                    workload, name, writes,
+                    1 if once else options['iterations'])
+        finally:
+            connection.use_debug_cursor = use_debug_cursor
+            user.delete()
+
+        report = json.dumps(
+            {'label': options['label'],
+             'time': datetime.datetime.now().isoformat(),
+             'database': connection.vendor,
+             'iterations': options['iterations'],
+             'steps': results}, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(report + '\n')
+        else:
+            self.stdout.write(report + '\n')
+
+    def _get_steps(self, options):
+        """Return the steps selected by the options, in workload order."""
+        steps = STEPS
+        if options['steps']:
+            names = [name.strip() for name in options['steps'].split(',')]
+            unknown = set(names) - set(name for (name, _, _) in STEPS)
+            if unknown:
+                raise CommandError("Unknown steps: {0}".format(
+                    ', '.join(sorted(unknown))))
+            steps = [step for step in STEPS if step[0] in names]
+        if options['read_only']:
+            steps = [step for step in steps if not step[1]]
+        return steps
+
+    def _run_step(self, workload, name, writes, iterations):
+        """Request the step, returning the summary of it's requests.
+
+        Write steps must redirect, since their forms are shown again with
+        errors when they fail.
+
+        """
+        step = getattr(workload, 'step_' + name)
+        durations = []
+        query_counts = []
+        for iteration in range(iterations):
+            start_time = time.time()
+            response = step(iteration)
+            duration = time.time() - start_time
+            if response is None:
+                break
+            if (response.status_code >= 400 or
+                    writes and response.status_code != 302):
+                raise CommandError("The {0} step responded with a {1}."
+                                   .format(name, response.status_code))
+            durations.append(duration)
+            query_counts.append(len(connection.queries))
+        if not durations:
+            return {'requests': 0}
+        return summarize(durations, query_counts)
@@ -0,0 +1,118 @@
+"""
+Django Accounting Command to compare the speed of the QFX Importers.
+
+Generates a synthetic QFX statement and times how long the ``ofxparse`` based
+QFXImporter and the StreamingQFXImporter take to parse it.
+"""
+from decimal import Decimal
+import datetime
+import io
+from optparse import make_option
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bank_import.importers.base import QFXImporter, StreamingQFXImporter
+
+
+QFX_HEADER = """OFXHEADER:100
+DATA:OFXSGML
+VERSION:102
+SECURITY:NONE
+ENCODING:USASCII
+CHARSET:1252
+COMPRESSION:NONE
+OLDFILEUID:NONE
+NEWFILEUID:NONE
+
+<OFX>
+<BANKMSGSRSV1>
+<STMTTRNRS>
+<TRNUID>0
+<STMTRS>
+<CURDEF>USD
+<BANKTRANLIST>
+<DTSTART>{start}050000.000[0:GMT]
+<DTEND>{end}050000.000[0:GMT]
+"""
+
+QFX_TRANSACTION = """<STMTTRN>
+<TRNTYPE>{type}
+<DTPOSTED>{date}050000.000[0:GMT]
+<TRNAMT>{amount}
+<FITID>{fitid}
+{checknum}<NAME>{memo}
+<MEMO>{memo}
+</STMTTRN>
+"""
+
+QFX_FOOTER = """</BANKTRANLIST>
+</STMTRS>
+</STMTTRNRS>
+</BANKMSGSRSV1>
+</OFX>
+"""
+
+
+def build_synthetic_qfx(transaction_count, seed=0):
+    """Return the text of a QFX statement with the given transaction count."""
+    rng = random.Random(seed)
+    start = datetime.date(2016, 1, 1)
+    parts = [QFX_HEADER.format(
+        start=start.strftime('%Y%m%d'),
+        end=(start + datetime.timedelta(days=transaction_count // 50)
+             ).strftime('%Y%m%d'))]
+    for number in range(transaction_count):
+        transaction_type = rng.choice(('DEBIT', 'CREDIT', 'CHECK'))
+        amount = Decimal(rng.randint(100, 500000)) / 100
+        if transaction_type != 'CREDIT':
+            amount *= -1
+        checknum = ''
+        if transaction_type == 'CHECK':
+            checknum = '<CHECKNUM>{0}\n'.format(1000 + number)
+        parts.append(QFX_TRANSACTION.format(
+            type=transaction_type, amount=amount, fitid=number,
+            checknum=checknum, memo='Synthetic Transaction {0}'.format(number),
+            date=(start + datetime.timedelta(days=number // 50)
+                  ).strftime('%Y%m%d')))
+    parts.append(QFX_FOOTER)
+    return u''.join(parts)
+
+
+class Command(BaseCommand):
+    args = ''
+    help = """\
+    Time the ofxparse & streaming QFX importers on a synthetic statement.
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('--transactions', type='int', default=10000,
+                    help='Number of transactions in the synthetic statement.'),
+        make_option('--repeat', type='int', default=3,
+                    help='Number of runs per importer, the best is reported.'),
+        make_option('--seed', type='int', default=0,
+                    help='The random seed used to build the statement.'),
+    )
+
+    def handle(self, *args, **options):
+        if options['transactions'] < 1 or options['repeat'] < 1:
+            raise CommandError("--transactions & --repeat must be positive.")
+        qfx_text = build_synthetic_qfx(
+            options['transactions'], options['seed'])
+        results = {}
+        for importer_class in (QFXImporter, StreamingQFXImporter):
+            timings = []
+            for _ in range(options['repeat']):
+                start_time = time.time()
+                data = importer_class(io.StringIO(qfx_text)).get_data()
+                timings.append(time.time() - start_time)
+            results[importer_class] = (min(timings), data)
+            self.stdout.write("{0}: {1} transactions in {2:.3f}s\n".format(
+                importer_class.__name__, len(data), min(timings)))
+
+        ofxparse_time, ofxparse_data = results[QFXImporter]
+        streaming_time, streaming_data = results[StreamingQFXImporter]
+        if ofxparse_data != streaming_data:
+            raise CommandError("The importers returned different data.")
+        self.stdout.write("Speedup: {0:.1f}x\n".format(
+            ofxparse_time / max(streaming_time, 1e-9)))
@@ -1,70 +1,428 @@
+"""
+Django Accounting Command to generate a synthetic ledger for benchmarking.
+
+Creates a chart of Headers & Accounts, Events, then years of Journal, Bank
+Spending & Bank Receiving Entries, along with queues of unapproved Credit
+Card & Trip Entries. The first year is started as a Fiscal Year & the Bank
+Accounts import QFX statements, so the ledger can be closed & imported into
+by the ``benchmark`` command. Every table is filled with ``bulk_create`` &
+the primary keys are reserved up front with :mod:`core.db.bulk`, so the
+related rows can be linked before they are inserted. The Account balances
+are summed while the Transactions are generated & written once at the end.
+
+The same ``--seed`` & scale options always generate the same ledger.
+"""
+from collections import defaultdict
 import datetime
+from decimal import Decimal
+from optparse import make_option
 import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import slugify
 
-from django.core.management.base import BaseCommand
 from accounts.models import Header, Account
+from bank_import.models import BankAccount
+from core.db.bulk import assign_ids, bulk_create
+from core.db.transactions import commit_on_success_unless_managed
+from creditcards.models import (CreditCard, CreditCardEntry,
+                                CreditCardTransaction)
 from entries.models import (Transaction, JournalEntry, BankSpendingEntry,
                             BankReceivingEntry)
+from events.models import Event
+from fiscalyears.models import FiscalYear
+from trips.models import (StoreAccount, TripEntry, TripTransaction,
+                          TripStoreTransaction)
+
+
+#: The number of child Headers under each generated Header.
+HEADER_BRANCHING = 2
+#: The deepest Header tree whose numbers fit in an Account's ``full_number``.
+MAXIMUM_HEADER_DEPTH = 5
+#: The most Accounts whose numbers fit under a single Header.
+MAXIMUM_ACCOUNTS_PER_HEADER = 999
+#: The chance of a Journal Entry's Transaction being charged to an Event.
+EVENT_CHANCE = 0.1
+
+
+class LedgerGenerator(object):
+    """Generate & insert a synthetic ledger, using a seeded random generator.
+
+    The scale of the ledger is set by the keyword arguments, which match the
+    command's options.
+
+    """
+
+    def __init__(self, years=1, entries_per_day=9, accounts=50,
+                 header_depth=2, events=20, banks=2, credit_card_entries=50,
+                 trip_entries=50, seed=0, batch_size=5000, stdout=None):
+        self.years = years
+        self.entries_per_day = entries_per_day
+        self.account_count = accounts
+        self.header_depth = header_depth
+        self.event_count = events
+        self.bank_count = banks
+        self.credit_card_entries = credit_card_entries
+        self.trip_entries = trip_entries
+        self.batch_size = batch_size
+        self.stdout = stdout
+        self.random = random.Random(seed)
+        self.balance_deltas = defaultdict(Decimal)
+        self.counts = defaultdict(int)
+
+    def generate(self):
+        """Generate the entire ledger, returning the number of rows inserted.
+
+        :returns: The number of rows inserted into each Model's table.
+        :rtype: :obj:`dict` mapping Model names to counts
+
+        """
+        start_date = datetime.date(
+            datetime.date.today().year - self.years + 1, 1, 1)
+        with commit_on_success_unless_managed():
+            FiscalYear.objects.create(
+                year=start_date.year, end_month=12, period=12)
+            self._generate_chart()
+            self._generate_events()
+        stop_date = datetime.date(datetime.date.today().year, 12, 31)
+        day = start_date
+        while day <= stop_date:
+            with commit_on_success_unless_managed():
+                month = day.month
+                batch = defaultdict(list)
+                while day <= stop_date and day.month == month:
+                    self._generate_day(day, batch)
+                    day += datetime.timedelta(days=1)
+                self._insert_entries(batch)
+            self._write("Generated {0:%B %Y}, {1} Transactions in total.\n"
+                        .format(day - datetime.timedelta(days=1),
+                                self.counts['Transaction']))
+        with commit_on_success_unless_managed():
+            self._generate_approval_queues(stop_date)
+            Account.objects.apply_balance_deltas(dict(self.balance_deltas))
+        return dict(self.counts)
+
+    def _generate_chart(self):
+        """Insert the Header trees & the Accounts under their leaf Headers."""
+        headers = []
+        leaves = {}
+        root_names = sorted(name for (_, name) in Header.TYPE_CHOICES)
+        for (header_type, type_name) in Header.TYPE_CHOICES:
+            root = self._new_header(type_name, None, header_type)
+            tree = [root]
+            level = [root]
+            for _ in range(self.header_depth):
+                level = [self._new_header(
+                    '{0}-{1}'.format(parent.name, number), parent,
+                    header_type)
+                    for parent in level
+                    for number in range(1, HEADER_BRANCHING + 1)]
+                tree.extend(level)
+            for (number, header) in enumerate(
+                    _build_tree(root, tree, root_names.index(type_name) + 1)):
+                header.full_number = '{0}-{1:02d}000'.format(
+                    header_type, number)
+            headers.extend(tree)
+            leaves[header_type] = level
+        assign_ids(Header, headers)
+        for header in headers:
+            header.parent_id = header.parent.id if header.parent else None
+        self._bulk_create(Header, headers)
+
+        accounts = []
+        all_leaves = [leaf for header_type in sorted(leaves)
+                      for leaf in leaves[header_type]]
+        for number in range(1, self.account_count + 1):
+            parent = all_leaves[(number - 1) % len(all_leaves)]
+            accounts.append(self._new_account(
+                '{0} Account {1:05d}'.format(parent.name, number), parent))
+        asset_leaf = leaves[Header.ASSET][0]
+        liability_leaf = leaves[Header.LIABILITY][0]
+        equity_leaf = leaves[Header.EQUITY][0]
+        banks = [self._new_account('Bank Account {0:03d}'.format(number),
+                                   asset_leaf, bank=True)
+                 for number in range(1, self.bank_count + 1)]
+        card_account = self._new_account('Credit Card', liability_leaf)
+        store_account = self._new_account('Local Store', liability_leaf)
+        accounts.extend(banks + [
+            card_account, store_account,
+            self._new_account('Current Year Earnings', equity_leaf),
+            self._new_account('Retained Earnings', equity_leaf)])
+        siblings = defaultdict(list)
+        for account in accounts:
+            siblings[account.parent].append(account)
+        for (parent, children) in siblings.items():
+            if len(children) > MAXIMUM_ACCOUNTS_PER_HEADER:
+                raise CommandError(
+                    "Too many Accounts under the '{0}' Header, increase the "
+                    "Header depth.".format(parent.name))
+            for (number, account) in enumerate(
+                    sorted(children, key=lambda account: account.name), 1):
+                account.full_number = '{0}{1:03d}'.format(
+                    parent.full_number[:-3], number)
+        assign_ids(Account, accounts)
+        self._bulk_create(Account, accounts)
+
+        self.account_ids = [account.id for account in
+                            accounts[:self.account_count]]
+        self.bank_ids = [bank.id for bank in banks]
+        for bank in banks:
+            BankAccount.objects.create(
+                account=bank, bank=BankAccount.CF_DC_STREAMING_QFX_IMPORTER)
+        self.card = CreditCard.objects.create(account=card_account)
+        self.store = StoreAccount.objects.create(account=store_account)
+
+    def _new_header(self, name, parent, header_type):
+        """Return an unsaved Header, it's tree fields are set later."""
+        return Header(name=name, slug=slugify(name), parent=parent,
+                      type=header_type)
+
+    def _new_account(self, name, parent, bank=False):
+        """Return an unsaved Account, placed in it's parent's tree."""
+        return Account(name=name, slug=slugify(name), parent=parent,
+                       type=parent.type, bank=bank,
+                       balance=0, lft=1, rght=2, tree_id=parent.tree_id,
+                       level=parent.level + 1)
+
+    def _generate_events(self):
+        """Insert Events spread across the years of the ledger."""
+        events = []
+        first_year = datetime.date.today().year - self.years + 1
+        for number in range(1, self.event_count + 1):
+            date = datetime.date(first_year + number % self.years,
+                                 self.random.randint(1, 12),
+                                 self.random.randint(1, 28))
+            abbreviation = 'EV{0}'.format(number)
+            events.append(Event(
+                name='Event {0}'.format(number), date=date, city='Louisa',
+                state='VA', abbreviation=abbreviation,
+                number='{0}{1}'.format(abbreviation, str(date.year)[2:])))
+        assign_ids(Event, events)
+        self._bulk_create(Event, events)
+        self.event_ids = [event.id for event in events]
+
+    def _generate_day(self, day, batch):
+        """Add the day's Entries & Transactions to the batch."""
+        for number in range(self.entries_per_day):
+            kind = number % 3
+            if kind == 0 or not self.bank_ids:
+                entry = JournalEntry(date=day, memo='Synthetic Entry')
+                batch[JournalEntry].append(entry)
+                amounts = [self._amount() for _ in
+                           range(self.random.randint(1, 2))]
+                for amount in amounts:
+                    self._add_transaction(batch, day, amount,
+                                          journal_entry=entry, event=True)
+                    self._add_transaction(batch, day, -1 * amount,
+                                          journal_entry=entry, event=True)
+            elif kind == 1:
+                amounts = [self._amount() for _ in
+                           range(self.random.randint(1, 3))]
+                main_transaction = self._add_transaction(
+                    batch, day, sum(amounts), bank=True)
+                entry = BankSpendingEntry(
+                    date=day, memo='Synthetic Payment', payee='Payee',
+                    ach_payment=True, main_transaction=main_transaction)
+                batch[BankSpendingEntry].append(entry)
+                for amount in amounts:
+                    self._add_transaction(batch, day, -1 * amount,
+                                          bankspend_entry=entry)
+            else:
+                amounts = [self._amount() for _ in
+                           range(self.random.randint(1, 3))]
+                main_transaction = self._add_transaction(
+                    batch, day, -1 * sum(amounts), bank=True)
+                entry = BankReceivingEntry(
+                    date=day, memo='Synthetic Deposit', payor='Payor',
+                    main_transaction=main_transaction)
+                batch[BankReceivingEntry].append(entry)
+                for amount in amounts:
+                    self._add_transaction(batch, day, amount,
+                                          bankreceive_entry=entry)
+
+    def _add_transaction(self, batch, day, amount, bank=False, event=False,
+                         **entry):
+        """Add a Transaction to the batch & to it's Account's balance."""
+        account_id = self.random.choice(
+            self.bank_ids if bank else self.account_ids)
+        event_id = None
+        if (event and self.event_ids and
+                self.random.random() < EVENT_CHANCE):
+            event_id = self.random.choice(self.event_ids)
+        new_transaction = Transaction(
+            account_id=account_id, balance_delta=amount, date=day,
+            event_id=event_id, detail='Synthetic Transaction')
+        batch[Transaction].append((new_transaction, entry))
+        self.balance_deltas[account_id] += amount
+        return new_transaction
+
+    def _insert_entries(self, batch):
+        """Reserve the primary keys of the batch, link & insert the rows."""
+        transactions = [new_transaction for (new_transaction, _) in
+                        batch[Transaction]]
+        assign_ids(Transaction, transactions)
+        for model in (BankSpendingEntry, BankReceivingEntry):
+            for entry in batch[model]:
+                entry.main_transaction_id = entry.main_transaction.id
+        for model in (JournalEntry, BankSpendingEntry, BankReceivingEntry):
+            assign_ids(model, batch[model])
+            self._bulk_create(model, batch[model])
+        for (new_transaction, entry) in batch[Transaction]:
+            for (field_name, related_entry) in entry.items():
+                setattr(new_transaction, field_name + '_id', related_entry.id)
+        self._bulk_create(Transaction, transactions)
+
+    def _generate_approval_queues(self, date):
+        """Insert the unapproved Credit Card & Trip Entries."""
+        card_entries = []
+        card_transactions = []
+        for number in range(1, self.credit_card_entries + 1):
+            amounts = [self._amount() for _ in
+                       range(self.random.randint(1, 3))]
+            entry = CreditCardEntry(
+                date=date, card_id=self.card.id, name='Communard',
+                merchant='Merchant {0}'.format(number), amount=sum(amounts))
+            card_entries.append(entry)
+            card_transactions.extend(
+                (CreditCardTransaction(
+                    account_id=self.random.choice(self.account_ids),
+                    amount=amount), entry) for amount in amounts)
+        self._insert_queue(CreditCardEntry, card_entries,
+                           CreditCardTransaction, card_transactions,
+                           'creditcard_entry_id')
+
+        trip_entries = []
+        trip_transactions = []
+        store_transactions = []
+        for number in range(1, self.trip_entries + 1):
+            amounts = [self._amount() for _ in
+                       range(self.random.randint(1, 3))]
+            store_amount = self._amount()
+            entry = TripEntry(
+                date=date, name='Communard', number=str(number),
+                total_trip_advance=sum(amounts), amount=sum(amounts))
+            trip_entries.append(entry)
+            trip_transactions.extend(
+                (TripTransaction(
+                    account_id=self.random.choice(self.account_ids),
+                    amount=amount), entry) for amount in amounts)
+            store_transactions.append((TripStoreTransaction(
+                store_id=self.store.id,
+                account_id=self.random.choice(self.account_ids),
+                amount=store_amount), entry))
+        self._insert_queue(TripEntry, trip_entries, TripTransaction,
+                           trip_transactions, 'trip_entry_id')
+        for (store_transaction, entry) in store_transactions:
+            store_transaction.trip_entry_id = entry.id
+        self._bulk_create(TripStoreTransaction, [
+            store_transaction for (store_transaction, _) in
+            store_transactions])
+
+    def _insert_queue(self, entry_model, entries, transaction_model,
+                      transactions, field_name):
+        """Insert the unapproved Entries & their related Transactions."""
+        assign_ids(entry_model, entries)
+        self._bulk_create(entry_model, entries)
+        for (queue_transaction, entry) in transactions:
+            setattr(queue_transaction, field_name, entry.id)
+        self._bulk_create(transaction_model, [
+            queue_transaction for (queue_transaction, _) in transactions])
+
+    def _bulk_create(self, model, objects):
+        """Insert the objects, in batches the database can handle."""
+        bulk_create(model, objects, self.batch_size)
+        self.counts[model.__name__] += len(objects)
+
+    def _amount(self):
+        """Return a random amount between $1 & $800."""
+        return Decimal(self.random.randint(100, 80000)) / 100
+
+    def _write(self, message):
+        """Write the progress message, if an output stream was given."""
+        if self.stdout is not None:
+            self.stdout.write(message)
+
 
+def _build_tree(root, headers, tree_id):
+    """Set the tree fields of the Headers, like ``TreeManager.rebuild``.
 
-def get_random_account():
-    return Account.objects.all()[random.randint(0, 9)]
+    :returns: The Headers in tree order, with siblings ordered by name.
+    :rtype: list
 
+    """
+    children = defaultdict(list)
+    for header in headers:
+        if header.parent is not None:
+            children[id(header.parent)].append(header)
+    ordered = []
 
-def get_random_bank():
-    return Account.objects.get_banks()[random.randint(0, 1)]
+    def visit(header, left, level):
+        ordered.append(header)
+        header.tree_id = tree_id
+        header.level = level
+        header.lft = left
+        right = left + 1
+        for child in sorted(children[id(header)],
+                            key=lambda child: child.name):
+            right = visit(child, right, level + 1) + 1
+        header.rght = right
+        return right
+    visit(root, 1, 0)
+    return ordered
 
 
 class Command(BaseCommand):
     args = ''
-    help = 'Generate mass random data'
+    help = """\
+    Generate a synthetic ledger in an empty database. The same seed & scale
+    options always generate the same ledger.
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('--years', type='int', default=1,
+                    help='Number of years of Entries, ending this year.'),
+        make_option('--entries-per-day', type='int', default=9,
+                    help='Number of Journal & Bank Entries each day.'),
+        make_option('--accounts', type='int', default=50,
+                    help='Number of Accounts, excluding Bank Accounts.'),
+        make_option('--header-depth', type='int', default=2,
+                    help='Number of Header levels under each root Header.'),
+        make_option('--events', type='int', default=20,
+                    help='Number of Events.'),
+        make_option('--banks', type='int', default=2,
+                    help='Number of Bank Accounts.'),
+        make_option('--credit-card-entries', type='int', default=50,
+                    help='Number of unapproved Credit Card Entries.'),
+        make_option('--trip-entries', type='int', default=50,
+                    help='Number of unapproved Trip Entries.'),
+        make_option('--seed', type='int', default=0,
+                    help='The random seed used to generate the ledger.'),
+        make_option('--batch-size', type='int', default=5000,
+                    help='Number of rows inserted by each query.'),
+    )
 
     def handle(self, *args, **options):
-        if Header.objects.count() == 0:
-            asset_head = Header.objects.create(name='Asset', type=1, slug='asset')
-            fixed_asset = Header.objects.create(name='Fixed-Asset', slug='fixed-asset', parent=asset_head)
-            bank_accounts = Header.objects.create(name='Bank Accounts', slug='bank-accounts', parent=fixed_asset)
-            liabilities = Header.objects.create(name='Liabilities', type=2, slug='liability')
-            stipends = Header.objects.create(name='Member Stipends', slug='member-stipends', parent=liabilities)
-            expense = Header.objects.create(name='Expense', type=6, slug='expense')
-            misc_expense = Header.objects.create(name='Misc Expenses', slug='misc-expense', parent=expense)
-
-            Account.objects.create(name='Heartwood', balance=0, slug='heartwood', parent=fixed_asset)
-            Account.objects.create(name='VCB Checking', bank=True, balance=0, slug='vcb-checking', parent=bank_accounts)
-            Account.objects.create(name='VCB Savings', bank=True, balance=0, slug='vcb-savings', parent=bank_accounts)
-            Account.objects.create(name='Pavans Stipend', balance=0, slug='pavans-stipend', parent=stipends)
-            Account.objects.create(name='Pauls Stipend', balance=0, slug='pauls-stipend', parent=stipends)
-            Account.objects.create(name='Jesus Stipend', balance=0, slug='jesus-stipend', parent=stipends)
-            Account.objects.create(name='Quetzl Stipend', balance=0, slug='quetzl-stipend', parent=stipends)
-            Account.objects.create(name='Heyzeus Stipend', balance=0, slug='heyzeus-stipend', parent=stipends)
-            Account.objects.create(name='Domestic Cleaning', balance=0, slug='domestic-cleaning', parent=misc_expense)
-            Account.objects.create(name='Aliens and shit yo', balance=0, slug='alien-yo', parent=misc_expense)
-        start_time = datetime.datetime.now()
-        for day in range(0, 366):
-            print "Starting day {} of 366".format(day)
-            date = datetime.date.today() + datetime.timedelta(days=day)
-            for GJ in range(0, 3):
-                entry = JournalEntry.objects.create(date=date, memo='test entry')
-                amt1 = random.randint(100, 80000)
-                amt2 = random.randint(100, 80000)
-                Transaction.objects.create(journal_entry=entry, account=get_random_account(), balance_delta=amt1)
-                Transaction.objects.create(journal_entry=entry, account=get_random_account(), balance_delta=amt1 * -1)
-                Transaction.objects.create(journal_entry=entry, account=get_random_account(), balance_delta=amt2)
-                Transaction.objects.create(journal_entry=entry, account=get_random_account(), balance_delta=amt2 * -1)
-            for CD in range(0, 3):
-                amt1 = random.randint(100, 80000)
-                amt2 = random.randint(100, 80000)
-
-                main_transaction = Transaction.objects.create(account=get_random_bank(), balance_delta=amt1 + amt2)
-                entry = BankSpendingEntry.objects.create(date=date, memo='test bank spend', main_transaction=main_transaction, ach_payment=True)
-                Transaction.objects.create(bankspend_entry=entry, account=get_random_account(), balance_delta=amt1 * -1)
-                Transaction.objects.create(bankspend_entry=entry, account=get_random_account(), balance_delta=amt2 * -1)
-            for CR in range(0, 3):
-                amt1 = random.randint(100, 80000)
-                amt2 = random.randint(100, 80000)
-
-                main_transaction = Transaction.objects.create(account=get_random_bank(), balance_delta=-1 * (amt1 + amt2))
-                entry = BankReceivingEntry.objects.create(date=date, memo='test bank receive', main_transaction=main_transaction)
-                Transaction.objects.create(bankreceive_entry=entry, account=get_random_account(), balance_delta=amt1)
-                Transaction.objects.create(bankreceive_entry=entry, account=get_random_account(), balance_delta=amt2)
-        print "Time to Execute: {}".format(datetime.datetime.now() - start_time)
+        if (options['years'] < 1 or options['accounts'] < 1 or
+                options['batch_size'] < 1):
+            raise CommandError(
+                "--years, --accounts & --batch-size must be positive.")
+        if not 0 <= options['header_depth'] <= MAXIMUM_HEADER_DEPTH:
+            raise CommandError("--header-depth must be between 0 & {0}."
+                               .format(MAXIMUM_HEADER_DEPTH))
+        if Header.objects.exists() or Account.objects.exists():
+            raise CommandError("The ledger must be empty.")
+        start_time = time.time()
+        counts = LedgerGenerator(
+            years=options['years'],
+            entries_per_day=options['entries_per_day'],
+            accounts=options['accounts'],
+            header_depth=options['header_depth'],
+            events=options['events'], banks=options['banks'],
+            credit_card_entries=options['credit_card_entries'],
+            trip_entries=options['trip_entries'], seed=options['seed'],
+            batch_size=options['batch_size'], stdout=self.stdout).generate()
+        for model_name in sorted(counts):
+            self.stdout.write("{0}: {1}\n".format(
+                model_name, counts[model_name]))
+        self.stdout.write("Time to Execute: {0:.1f}s\n".format(
+            time.time() - start_time))
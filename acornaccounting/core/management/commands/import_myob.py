@@ -6,23 +6,42 @@ coming before any child headers.
 
 Creates Accounts based on MYOB data, then all Entries/Transactions.
 
-Export Account and Journal entries in MYOB and place in root folder of project.
+Export Account and Journal entries in MYOB and place in the import directory,
+which defaults to the current working directory.
+
+JOURNAL.TXT is streamed in chunks of Entries. Each chunk is inserted with
+``bulk_create`` in it's own database transaction, with the primary keys
+reserved up front by :mod:`core.db.bulk`. The progress through the journal is
+written to a checkpoint file with :mod:`core.checkpoints` after every chunk,
+so an interrupted import continues from the last inserted chunk when the
+command is run again. The Account balances are set once the entire journal
+has been imported.
 """
+from collections import defaultdict
 from datetime import date
 from decimal import Decimal
-import pickle
+from optparse import make_option
+import os
 from time import strptime
 
-from django.core.management.base import BaseCommand
-from django.db.models import Q
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum
 from django.template.defaultfilters import slugify
 
 from accounts.models import Header, Account
+from core.cache import bump_account_versions, bump_ledger_version
+from core.checkpoints import read_checkpoint, write_checkpoint
+from core.db.bulk import assign_ids, bulk_create
+from core.db.transactions import commit_on_success_unless_managed
 from entries.models import (JournalEntry, BankReceivingEntry,
                             BankSpendingEntry, Transaction)
 from events.models import Event
 
 
+#: The Entry models created by the import, used to count imported Entries.
+ENTRY_MODELS = (JournalEntry, BankSpendingEntry, BankReceivingEntry)
+
+
 def _get_date(date_string):
     return date(*strptime(date_string, "%m/%d/%Y")[:3])
 
@@ -32,214 +51,399 @@ def _strip_cur_format(inputstr):
     return inputstr.replace('(', '-').replace(')', '')
 
 
-def _get_or_make_account_dictionary():
-    """
-    If a pickled dictionary and accounts exist, grab the dictionary, otherwise
-    make one.
-    """
-    try:
-        with open('accounts.pickle', 'rb') as pickle_file:
-            account_dictionary = pickle.load(pickle_file)
-    except IOError:
-        account_dictionary = _make_accounts_and_dictionary()
-        with open('accounts.pickle', 'wb') as pickle_file:
-            pickle.dump(account_dictionary, pickle_file)
-    return account_dictionary
+def _get_balance_delta(columns):
+    """Return the balance delta of a journal line, credits are positive."""
+    if columns[2].lower() == 'void':
+        balance_delta = Decimal(0)
+    elif len(columns) >= 5 and columns[4] == '':
+        # Delta is a credit
+        if columns[5] != '':
+            balance_delta = Decimal(_strip_cur_format(columns[5]))
+        else:
+            balance_delta = Decimal(0)
+    elif columns[4] != '':
+        # Delta is debit
+        balance_delta = -1 * Decimal(_strip_cur_format(columns[4]))
+    else:
+        balance_delta = Decimal(0)
+    return balance_delta
+
 
+def read_journal(journal_file, position=0):
+    """Stream the Entries of a MYOB journal, starting at the byte position.
+
+    Blank lines separate the Entries.
+
+    :param journal_file: The journal, opened in binary mode.
+    :type journal_file: file
+    :param position: The byte offset of the first Entry to read.
+    :type position: int
+    :returns: The columns of each line in an Entry & the byte offset of the
+              following Entry.
+    :rtype: A generator of ``(lines, position)`` tuples
 
-def _make_accounts_and_dictionary():
     """
-    Make accounts found in ACCOUNTS.TXT, return a dictionary of MYOB # -> pk.
+    journal_file.seek(position)
+    lines = []
+    for line in journal_file:
+        position += len(line)
+        if line.strip() == '':
+            if lines:
+                yield (lines, position)
+                lines = []
+        else:
+            # 0: number, 1: date, 2: memo, 3: myob acct num, 4: debit,
+            # 5: credit, 6: job
+            lines.append(line.rstrip('\r\n').split('\t'))
+    if lines:
+        yield (lines, position)
+
+
+def count_entries():
+    """Return the total number of Entries in the ledger."""
+    return sum(model.objects.count() for model in ENTRY_MODELS)
+
+
+class MyobImporter(object):
+    """Import the Accounts & Entries exported from MYOB into the ledger.
+
+    The progress of the import is kept in a checkpoint :obj:`dict`, holding
+    the Account created for each MYOB number, the Account opening balances,
+    the byte ``position`` of the next Entry to import & the number of
+    ``entries`` in the ledger at that position. While a chunk is being
+    inserted, the position & number of entries after the chunk are kept as
+    the ``pending`` checkpoint, since the chunk may be committed before the
+    checkpoint file is written.
+
     """
-    acct_dict = {}
-    if Account.objects.count() == 0:
-        with open('./ACCOUNTS.TXT') as accounts_file:
+
+    def __init__(self, directory, checkpoint_path, chunk_size=1000,
+                 stdout=None):
+        self.directory = directory
+        self.checkpoint_path = checkpoint_path
+        self.chunk_size = chunk_size
+        self.stdout = stdout
+        self.counts = defaultdict(int)
+
+    def run(self):
+        """Import the Accounts, the journal & then set the Account balances.
+
+        :returns: The number of rows inserted into each Model's table.
+        :rtype: :obj:`dict` mapping Model names to counts
+
+        """
+        checkpoint = read_checkpoint(self.checkpoint_path)
+        if checkpoint is None:
+            if Account.objects.exists():
+                raise CommandError(
+                    "Accounts already exist, but there is no checkpoint at "
+                    "'{0}' to resume from.".format(self.checkpoint_path))
+            with commit_on_success_unless_managed():
+                (accounts, opening_balances) = self._make_accounts()
+            checkpoint = {'accounts': accounts,
+                          'opening_balances': opening_balances,
+                          'position': 0, 'entries': count_entries(),
+                          'pending': None}
+            write_checkpoint(self.checkpoint_path, checkpoint)
+        else:
+            self._resume(checkpoint)
+        self.account_ids = dict(
+            (number, int(account_id)) for (number, account_id) in
+            checkpoint['accounts'].items())
+        self.event_ids = self._make_event_dictionary()
+
+        self._import_journal(checkpoint)
+        with commit_on_success_unless_managed():
+            self._set_balances(checkpoint['opening_balances'])
+        return dict(self.counts)
+
+    def _make_accounts(self):
+        """
+        Make accounts found in ACCOUNTS.TXT, return dictionaries of MYOB # ->
+        pk & pk -> opening balance.
+
+        Every Account is inserted at once, the full numbers are calculated
+        from each Header's Accounts, instead of rebuilding & saving each one.
+
+        """
+        Header.objects.rebuild()
+        headers = dict((header.slug, header) for header in
+                       Header.objects.all())
+        taken_names = set()
+        taken_slugs = set()
+        accounts = []
+        numbers = []
+        accounts_path = os.path.join(self.directory, 'ACCOUNTS.TXT')
+        with open(accounts_path) as accounts_file:
             for (counter, line) in enumerate(accounts_file):
                 # 0: number, 1: name, 2: header, 3:balance
                 columns = line.split('\t')
                 if 'H' in columns[2]:   # is header
-                    current_header = Header.objects.get(
-                        slug=slugify(columns[1]))
-                else:   # create an account under the current header
-                    number = columns[0].replace('-', '')    # strip the `-`
-                                                # between number and type
-                    # check if slug or name is taken
-                    name = columns[1]
+                    try:
+                        current_header = headers[slugify(columns[1])]
+                    except KeyError:
+                        raise CommandError("The '{0}' Header does not "
+                                           "exist.".format(columns[1]))
+                    continue
+                # create an account under the current header
+                # strip the `-` between number and type
+                number = columns[0].replace('-', '')
+                # check if slug or name is taken
+                name = columns[1]
+                slug = slugify(name)
+                if name in taken_names or slug in taken_slugs:
+                    name = name + str(counter)
                     slug = slugify(name)
-                    quer = Account.objects.filter(Q(name=name) | Q(slug=slug))
-                    if quer.exists():
-                        name = name + str(counter)
-                        slug = slugify(name)
-
-                    acc_type = columns[0][0]
-                    if (int(acc_type) in (1, 2, 3) and
-                            name != "Current Year Earnings"):
-                        balance = Decimal(_strip_cur_format(columns[3]))
-                    else:
-                        balance = 0
-                    if int(acc_type) in (1, 5, 6, 8):
-                        balance *= -1
-
-                    acct = Account.objects.create(parent=current_header,
-                                                  name=name,
-                                                  slug=slug,
-                                                  balance=balance)
-                    acct_dict[number] = acct.pk
-        # Generate Full Numbers
-        Header.objects.rebuild()
-        Account.objects.rebuild()
-        for account in Account.objects.all():
-            account.full_number = account._calculate_full_number()
-            account.save()
-    return acct_dict
+                taken_names.add(name)
+                taken_slugs.add(slug)
 
+                acc_type = columns[0][0]
+                if (int(acc_type) in (1, 2, 3) and
+                        name != "Current Year Earnings"):
+                    balance = Decimal(_strip_cur_format(columns[3]))
+                else:
+                    balance = Decimal(0)
+                if int(acc_type) in (1, 5, 6, 8):
+                    balance *= -1
 
-def _make_event_dictionary():
-    """
-    Make the event dictionary from EVENTS.txt, return a dicitonary of MYOB
-    job # -> pk.
-    """
-    d = {}
-    with open('./EVENTS.TXT') as events_file:
-        for line in events_file:
-            (key, val) = line.strip().split()
-            d[key] = val
-    return d
+                accounts.append(Account(
+                    parent=current_header, name=name, slug=slug,
+                    type=current_header.type, balance=balance, lft=1, rght=2,
+                    tree_id=current_header.tree_id,
+                    level=current_header.level + 1))
+                numbers.append(number)
+
+        siblings = defaultdict(list)
+        for account in accounts:
+            siblings[account.parent_id].append(account)
+        for children in siblings.values():
+            parent_number = children[0].parent.get_full_number()
+            for (position, account) in enumerate(
+                    sorted(children, key=lambda account: account.name), 1):
+                account.full_number = '{0}{1:03d}'.format(
+                    parent_number[:-3], position)
+        assign_ids(Account, accounts)
+        bulk_create(Account, accounts)
+        self.counts['Account'] += len(accounts)
+        bump_ledger_version()
+        return (dict((number, account.id) for (number, account) in
+                     zip(numbers, accounts)),
+                dict((str(account.id), str(account.balance)) for account in
+                     accounts))
+
+    def _make_event_dictionary(self):
+        """
+        Make the event dictionary from EVENTS.TXT, return a dictionary of MYOB
+        job # -> pk.
+        """
+        event_ids = set(Event.objects.values_list('id', flat=True))
+        d = {}
+        with open(os.path.join(self.directory, 'EVENTS.TXT')) as events_file:
+            for line in events_file:
+                (key, val) = line.strip().split()
+                if int(val) not in event_ids:
+                    raise CommandError(
+                        "The Event for job #{0} does not exist.".format(key))
+                d[key] = int(val)
+        return d
+
+    def _resume(self, checkpoint):
+        """Continue from the checkpoint, if the ledger has not changed since.
+
+        If the ledger contains the pending chunk, it was committed before the
+        checkpoint file could be written, so the import continues after it.
+
+        """
+        entries = count_entries()
+        pending = checkpoint['pending']
+        if entries != checkpoint['entries']:
+            if pending is None or entries != pending['entries']:
+                raise CommandError(
+                    "The ledger has {0} Entries, but the checkpoint expected "
+                    "{1}.".format(entries, checkpoint['entries']))
+            checkpoint.update(pending)
+        checkpoint['pending'] = None
+        write_checkpoint(self.checkpoint_path, checkpoint)
+
+    def _import_journal(self, checkpoint):
+        """Insert the Entries in JOURNAL.TXT after the checkpoint's position.
+
+        Each chunk is validated before anything is inserted, so a bad line
+        leaves the ledger at the end of the previous chunk.
+
+        """
+        journal_path = os.path.join(self.directory, 'JOURNAL.TXT')
+        with open(journal_path, 'rb') as journal_file:
+            batch = defaultdict(list)
+            entry_count = 0
+            position = checkpoint['position']
+            for (lines, position) in read_journal(
+                    journal_file, checkpoint['position']):
+                entry_count += self._add_entry(batch, lines)
+                if entry_count >= self.chunk_size:
+                    self._insert_chunk(checkpoint, batch, entry_count,
+                                       position)
+                    batch = defaultdict(list)
+                    entry_count = 0
+            if batch:
+                self._insert_chunk(checkpoint, batch, entry_count, position)
+
+    def _add_entry(self, batch, lines):
+        """Add an Entry & it's Transactions to the batch.
+
+        :returns: The number of Entries added, which is ``0`` for skipped void
+                  checks.
+        :rtype: int
+
+        """
+        entry_num = lines[0][0]
+        date = _get_date(lines[0][1])
+        memo = lines[0][2][:60] or str(date)
+        transactions = [self._make_transaction(columns, date)
+                        for columns in lines]
+        # first 2 chars will be GJ for gen
+        # CR for bank rec, ## or 2 ints for bank spend
+        if entry_num[:2] == 'GJ':
+            entry = JournalEntry(date=date, memo=memo)
+            field_name = 'journal_entry'
+        elif entry_num[:2] == 'CR':
+            entry = BankReceivingEntry(date=date, memo=memo,
+                                       payor=memo[:50])
+            field_name = 'bankreceive_entry'
+        elif entry_num[:2] == '##':
+            # if ach payment, first two chars is `##`
+            entry = BankSpendingEntry(date=date, memo=memo,
+                                      ach_payment=True)
+            field_name = 'bankspend_entry'
+        elif transactions[0].balance_delta == 0:
+            self._write("Skip void check #{0} for account #{1} with memo "
+                        "{2} on {3}\n".format(
+                            entry_num, transactions[0].account_id, memo,
+                            date))
+            return 0
+        else:
+            entry = BankSpendingEntry(date=date, memo=memo,
+                                      check_number=entry_num)
+            field_name = 'bankspend_entry'
+
+        if field_name != 'journal_entry':
+            # the first line is the bank's main transaction
+            entry.main_transaction = transactions[0]
+            transactions[0].event_id = None
+            transactions = transactions[1:]
+        batch[type(entry)].append(entry)
+        batch[Transaction].extend(
+            (entry_transaction, entry, field_name)
+            for entry_transaction in transactions)
+        if field_name != 'journal_entry':
+            batch[Transaction].append(
+                (entry.main_transaction, None, None))
+        return 1
+
+    def _make_transaction(self, columns, date):
+        """Return an unsaved Transaction for the journal line."""
+        try:
+            account_id = self.account_ids[columns[3]]
+        except KeyError:
+            raise CommandError(
+                "No Account was imported for MYOB Account #{0}.".format(
+                    columns[3]))
+        event_id = None
+        if len(columns) >= 7 and columns[6].strip() != '':
+            # Event present
+            try:
+                event_id = self.event_ids[columns[6].strip()]
+            except KeyError:
+                raise CommandError("MYOB job #{0} is not in EVENTS.TXT."
+                                   .format(columns[6].strip()))
+        return Transaction(account_id=account_id, event_id=event_id,
+                           balance_delta=_get_balance_delta(columns),
+                           date=date)
+
+    def _insert_chunk(self, checkpoint, batch, entry_count, position):
+        """Insert the batch, then move the checkpoint past it's Entries."""
+        checkpoint['pending'] = {
+            'position': position,
+            'entries': checkpoint['entries'] + entry_count}
+        write_checkpoint(self.checkpoint_path, checkpoint)
+        transactions = [new_transaction for (new_transaction, _, _) in
+                        batch[Transaction]]
+        with commit_on_success_unless_managed():
+            assign_ids(Transaction, transactions)
+            for model in (BankSpendingEntry, BankReceivingEntry):
+                for entry in batch[model]:
+                    entry.main_transaction_id = entry.main_transaction.id
+            for model in ENTRY_MODELS:
+                assign_ids(model, batch[model])
+                bulk_create(model, batch[model])
+                self.counts[model.__name__] += len(batch[model])
+            for (new_transaction, entry, field_name) in batch[Transaction]:
+                if entry is not None:
+                    setattr(new_transaction, field_name + '_id', entry.id)
+            bulk_create(Transaction, transactions)
+            self.counts['Transaction'] += len(transactions)
+        bump_account_versions(
+            (new_transaction.account_id, new_transaction.date)
+            for new_transaction in transactions)
+        checkpoint.update(checkpoint['pending'])
+        checkpoint['pending'] = None
+        write_checkpoint(self.checkpoint_path, checkpoint)
+        self._write("Imported {0} Entries, up to {1:%m/%d/%Y}.\n".format(
+            checkpoint['entries'], transactions[-1].date))
+
+    def _set_balances(self, opening_balances):
+        """Set each imported Account's balance from it's Transactions.
+
+        The balances are calculated from the ledger, so setting them again
+        after an interrupted run gives the same result.
+
+        """
+        totals = dict(
+            (total['account'], total['balance_delta__sum']) for total in
+            Transaction.objects.filter(
+                account__in=[int(account_id) for account_id in
+                             opening_balances]
+            ).order_by().values('account').annotate(Sum('balance_delta')))
+        for (account_id, opening_balance) in opening_balances.items():
+            Account.objects.filter(id=int(account_id)).update(
+                balance=Decimal(opening_balance) +
+                (totals.get(int(account_id)) or 0))
+        bump_ledger_version()
+
+    def _write(self, message):
+        """Write the progress message, if an output stream was given."""
+        if self.stdout is not None:
+            self.stdout.write(message)
 
 
 class Command(BaseCommand):
-    args = ''
+    args = '[<directory>]'
     help = """\
     Will created Accounts, Entries and Transactions based on MYOB data.
-    ACCOUNTS.TXT and JOURNAL.TXT must in your current working directory.
-    All Headers should already be created.
+    ACCOUNTS.TXT, EVENTS.TXT and JOURNAL.TXT must be in the directory, which
+    defaults to your current working directory. All Headers should already
+    be created. Interrupted imports continue from their checkpoint.
     """
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size', type='int', default=1000,
+                    help='Number of Entries inserted in each database '
+                         'transaction.'),
+        make_option('--checkpoint', default=None,
+                    help='The file recording the progress of the import, '
+                         'defaults to myob_import.json in the directory.'),
+    )
 
     def handle(self, *args, **options):
-        # MYOB acct number => django pk
-        acct_dict = _get_or_make_account_dictionary()
-        # MYOB job number => django pk
-        event_dict = _make_event_dictionary()
-
-        # Now create Entries and Transactions
-        with open('./JOURNAL.TXT') as f:
-            last_entry = None
-            last_type = None
-            for (counter, line) in enumerate(f):
-                if line == '\r\n':
-                    # blank lines mean new entries
-                    last_entry = None
-                    last_type = None
-                else:
-                    columns = line.split('\t')  # 0: number, 1: date
-                                                # 2: memo, 3: myob acct num
-                                                # 4: debit, 5: credit
-                                                # 6: job
-                    # Derive Event and Balance Delta
-                    if len(columns) >= 7 and columns[6] != '\r\n':
-                        # Event present
-                        myob_event = columns[6].strip()
-                        event_id = event_dict[myob_event]
-                        event = Event.objects.get(id=event_id)
-                    else:
-                        event = None
-                    if columns[2].lower() == 'void':
-                        balance_delta = Decimal(0)
-                    elif len(columns) >= 5 and columns[4] == '':
-                        # Delta is a credit
-                        if columns[5] != '':
-                            balance_delta = Decimal(
-                                _strip_cur_format(columns[5]))
-                        else:
-                            balance_delta = 0
-                    elif columns[4] != '':
-                        # Delta is debit
-                        balance_delta = -1 * Decimal(
-                            _strip_cur_format(columns[4]))
-                    else:
-                        balance_delta = 0
-                    date = _get_date(columns[1])
-                    if columns[2] == '':
-                        columns[2] = date
-                    else:
-                        columns[2] = columns[2][:60]
-
-                    if not last_entry:
-                        # create new entry
-                        entry_num = columns[0]
-                        # first 2 chars will be GJ for gen
-                        # CR for bank rec, ## or 2 ints for bank spend
-                        if entry_num[:2] == 'GJ':
-                            # gen entry
-                            last_type = 'GJ'
-                            last_entry = JournalEntry.objects.create(
-                                date=date,
-                                memo=columns[2])
-                            Transaction.objects.create(
-                                journal_entry=last_entry,
-                                balance_delta=balance_delta,
-                                event=event,
-                                account_id=acct_dict[columns[3]])
-                        elif entry_num[:2] == 'CR':
-                            # bank receive
-                            last_type = 'CR'
-                            main_transaction = Transaction.objects.create(
-                                account_id=acct_dict[columns[3]],
-                                balance_delta=balance_delta)
-                            last_entry = BankReceivingEntry.objects.create(
-                                main_transaction=main_transaction,
-                                memo=columns[2],
-                                date=date,
-                                payor=str(columns[2])[:50])
-                        else:                           # bank spend
-                            last_type = 'CD'
-                            ach = entry_num[:2] == '##'  # if ach payment
-                                                # first two chars is `##`
-                            if ach:
-                                main_transaction = (
-                                    Transaction.objects.create(
-                                        account_id=acct_dict[columns[3]],
-                                        balance_delta=balance_delta))
-                                last_entry = (
-                                    BankSpendingEntry.objects.create(
-                                        main_transaction=main_transaction,
-                                        memo=columns[2], date=date,
-                                        ach_payment=True))
-                            else:
-                                account_id = acct_dict[columns[3]]
-                                if balance_delta == 0:
-                                    print("Skip void check #{0} for account "
-                                          "#{1} with memo {2} on {3}".format(
-                                              entry_num, acct_dict[columns[3]],
-                                              columns[2], date))
-                                    continue
-                                else:
-                                    main_transaction = (
-                                        Transaction.objects.create(
-                                            account_id=acct_dict[columns[3]],
-                                            balance_delta=balance_delta))
-                                    last_entry = (
-                                        BankSpendingEntry.objects.create(
-                                            main_transaction=main_transaction,
-                                            memo=columns[2], date=date,
-                                            check_number=entry_num))
-                    else:
-                        # entry already created, just add a Transaction
-                        if last_type == 'GJ':
-                            Transaction.objects.create(
-                                journal_entry=last_entry,
-                                balance_delta=balance_delta,
-                                event=event,
-                                account_id=acct_dict[columns[3]])
-                        elif last_type == 'CR':
-                            Transaction.objects.create(
-                                bankreceive_entry=last_entry,
-                                balance_delta=balance_delta,
-                                event=event,
-                                account_id=acct_dict[columns[3]])
-                        else:
-                            Transaction.objects.create(
-                                bankspend_entry=last_entry,
-                                balance_delta=balance_delta,
-                                event=event,
-                                account_id=acct_dict[columns[3]])
+        if len(args) > 1:
+            raise CommandError("Only one directory may be imported.")
+        directory = args[0] if args else '.'
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be positive.")
+        checkpoint_path = options['checkpoint'] or os.path.join(
+            directory, 'myob_import.json')
+        counts = MyobImporter(
+            directory, checkpoint_path, chunk_size=options['chunk_size'],
+            stdout=self.stdout).run()
+        for model_name in sorted(counts):
+            self.stdout.write("{0}: {1}\n".format(
+                model_name, counts[model_name]))
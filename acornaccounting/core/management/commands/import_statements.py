@@ -0,0 +1,74 @@
+"""
+Django Accounting Command to stage a directory of Bank Statement exports.
+
+The directory should contain a sub-directory for each Bank Account, named
+with either the BankAccount's id or it's slugified name. Every file in a
+sub-directory is parsed with that Bank Account's importer. The files are
+parsed in a process pool & matched concurrently, then added to the pending
+imports queue for review.
+
+For example::
+
+    statements/
+        1/june.csv
+        city-first-checking/june.qfx
+        city-first-checking/july.qfx
+"""
+from optparse import make_option
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import slugify
+
+from bank_import.models import BankAccount
+from bank_import.staging import stage_statements
+
+
+def _find_bank_account(directory_name, bank_accounts):
+    """Return the BankAccount whose id or slugified name is the directory."""
+    for bank_account in bank_accounts:
+        if directory_name in (str(bank_account.id),
+                              slugify(bank_account.name)):
+            return bank_account
+    raise CommandError(
+        "No Bank Account matches the directory '{0}'.".format(directory_name))
+
+
+class Command(BaseCommand):
+    args = '<directory>'
+    help = """\
+    Stage every statement export in the directory's Bank Account
+    sub-directories for review.
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('--workers', type='int', default=None,
+                    help='Number of processes & threads to use, defaults to '
+                         'the number of CPUs.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1 or not os.path.isdir(args[0]):
+            raise CommandError("A directory of statements is required.")
+        directory = args[0]
+        bank_accounts = list(BankAccount.objects.all())
+        statements = []
+        paths = []
+        for directory_name in sorted(os.listdir(directory)):
+            account_directory = os.path.join(directory, directory_name)
+            if not os.path.isdir(account_directory):
+                continue
+            bank_account = _find_bank_account(directory_name, bank_accounts)
+            for file_name in sorted(os.listdir(account_directory)):
+                path = os.path.join(account_directory, file_name)
+                if os.path.isfile(path):
+                    with open(path, 'rb') as statement_file:
+                        statements.append(
+                            (bank_account, statement_file.read()))
+                    paths.append(path)
+
+        statement_imports = stage_statements(
+            statements, options['workers'], processes=True)
+        for (path, statement_import) in zip(paths, statement_imports):
+            self.stdout.write("{0}: {1} lines staged, {2}\n".format(
+                path, statement_import.lines.count(),
+                statement_import.get_absolute_url()))
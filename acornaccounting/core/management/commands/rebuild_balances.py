@@ -0,0 +1,40 @@
+"""
+Django Accounting Command to rebuild every Account balance from the ledger.
+
+The balances are recalculated from the Transactions by
+:meth:`~accounts.managers.AccountManager.rebuild_balances`, in a single
+``UPDATE``. Bumping the ledger version invalidates the cached reports &
+bumping every Account's balance version invalidates the cached balances,
+the cached per-Account totals only depend on the Transactions, so they stay
+valid.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.models import Account
+from core.db.transactions import commit_on_success_unless_managed
+
+
+class Command(BaseCommand):
+    args = ''
+    help = """\
+    Recalculate the balance of every Account from it's Transactions &
+    the last closed Fiscal Year, listing the balances that changed.
+    """
+
+    def handle(self, *args, **options):
+        start_time = time.time()
+        old_balances = dict(Account.objects.values_list('id', 'balance'))
+        with commit_on_success_unless_managed():
+            count = Account.objects.rebuild_balances()
+        changed = 0
+        for (account_id, name, balance) in Account.objects.order_by(
+                'full_number').values_list('id', 'name', 'balance'):
+            if old_balances.get(account_id) != balance:
+                changed += 1
+                self.stdout.write("{0}: {1} -> {2}\n".format(
+                    name, old_balances.get(account_id), balance))
+        self.stdout.write(
+            "Rebuilt {0} Account balances, {1} changed, in {2:.2f}s.\n".format(
+                count, changed, time.time() - start_time))
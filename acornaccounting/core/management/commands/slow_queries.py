@@ -0,0 +1,98 @@
+"""
+Django Accounting Command to summarize the captured slow queries.
+
+Reads the log written by :mod:`core.db.slow_queries` & it's rotated backups,
+groups the captures by their SQL, then prints the queries with the most total
+time along with the functions that ran them & the plan of the slowest run.
+"""
+from collections import Counter, defaultdict
+import glob
+import json
+from optparse import make_option
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def read_captures(path):
+    """Return the captures in the log file & it's rotated backups."""
+    captures = []
+    for log_path in sorted(glob.glob(path + '.*')) + [path]:
+        if not os.path.isfile(log_path):
+            continue
+        with open(log_path) as log_file:
+            for line in log_file:
+                try:
+                    captures.append(json.loads(line))
+                except ValueError:
+                    continue
+    return captures
+
+
+def summarize(captures):
+    """Group the captures by SQL, ordered by their total time.
+
+    :returns: The ``sql``, ``count``, ``total``, ``slowest`` capture, &
+              ``callers`` & ``views`` counts of each query.
+    :rtype: :obj:`list` of :obj:`dicts<dict>`
+
+    """
+    queries = defaultdict(lambda: {'count': 0, 'total': 0,
+                                   'slowest': None, 'callers': Counter(),
+                                   'views': Counter()})
+    for capture in captures:
+        query = queries[capture['sql']]
+        query['count'] += 1
+        query['total'] += capture['duration']
+        if (query['slowest'] is None or
+                capture['duration'] > query['slowest']['duration']):
+            query['slowest'] = capture
+        query['callers'][capture.get('caller')] += 1
+        query['views'][capture.get('view')] += 1
+    summaries = []
+    for (sql, query) in queries.items():
+        query['sql'] = sql
+        summaries.append(query)
+    return sorted(summaries, key=lambda query: query['total'], reverse=True)
+
+
+class Command(BaseCommand):
+    args = '[<log file>]'
+    help = """\
+    Summarize the slowest queries captured in the slow query log, defaulting
+    to the SLOW_QUERY_LOG setting.
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('--limit', type='int', default=10,
+                    help='Number of queries to show, defaults to 10.'),
+        make_option('--plans', action='store_true', default=False,
+                    help='Show the plan of each query\'s slowest run.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) > 1:
+            raise CommandError("Only one log file may be summarized.")
+        path = args[0] if args else settings.SLOW_QUERY_LOG
+        captures = read_captures(path)
+        if not captures:
+            raise CommandError(
+                "No slow queries were captured in '{0}'.".format(path))
+
+        summaries = summarize(captures)[:options['limit']]
+        for (rank, query) in enumerate(summaries, 1):
+            self.stdout.write(
+                "{0}. {1} runs, {2:.3f}s total, {3:.3f}s mean, {4:.3f}s "
+                "max\n    {5}\n".format(
+                    rank, query['count'], query['total'],
+                    float(query['total']) / query['count'],
+                    query['slowest']['duration'], query['sql']))
+            for (label, counts) in (('Called by', query['callers']),
+                                    ('In', query['views'])):
+                self.stdout.write("    {0}: {1}\n".format(label, ', '.join(
+                    '{0} ({1})'.format(name, count)
+                    for (name, count) in counts.most_common(3))))
+            if options['plans']:
+                for line in query['slowest']['plan']:
+                    self.stdout.write("        {0}\n".format(line))
+            self.stdout.write("\n")
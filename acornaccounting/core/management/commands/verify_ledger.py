@@ -0,0 +1,304 @@
+"""
+Django Accounting Command to verify the ledger's stored totals.
+
+Account balances are only kept up to date by the ``accounts.signals``
+receivers, so anything bypassing them, like bulk updates, admin edits or a
+crash between a signal & the commit, lets a balance drift from it's
+Transactions. The ledger is checked for:
+
+* Account balances that are not the total of their Transactions. After a
+  Fiscal Year is closed, Asset, Liability & Equity balances also include
+  their HistoricalAccount amount at the year's end, like
+  ``fiscalyears.views._correct_account_balance`` sets.
+* Entries whose Transactions do not balance.
+* Void Bank Spending Entries that still have a main Transaction amount or
+  other Transactions.
+* Reconciled balances that are not the balance minus the unreconciled
+  Transactions, & reconciled Transactions dated after the Account was last
+  reconciled.
+
+The Entries & Accounts are split into ranges of ids, which are checked in a
+process pool. Each checked range is written to an optional checkpoint file,
+so an interrupted run skips the ranges it has already checked. With
+``--repair``, void Entries are emptied & Account balances are set from their
+Transactions, the other problems are only reported.
+"""
+import datetime
+from decimal import Decimal
+import multiprocessing
+from optparse import make_option
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, Max, Sum
+from django.utils.dateparse import parse_date
+
+from accounts.models import Account, HistoricalAccount
+from core.cache import bump_account_versions, bump_ledger_version
+from core.checkpoints import read_checkpoint, write_checkpoint
+from core.db.transactions import commit_on_success_unless_managed
+from entries.models import (JournalEntry, BankSpendingEntry,
+                            BankReceivingEntry, Transaction)
+
+
+#: The Models whose rows are checked, in the order they are checked. Entries
+#: come first, since repairing void Entries changes the Account balances.
+CHECKED_MODELS = (JournalEntry, BankSpendingEntry, BankReceivingEntry,
+                  Account)
+#: The Transaction field relating each kind of Entry to it's Transactions.
+ENTRY_FIELDS = {JournalEntry: 'journal_entry',
+                BankSpendingEntry: 'bankspend_entry',
+                BankReceivingEntry: 'bankreceive_entry'}
+
+
+def get_ranges(model, size):
+    """Return the first & last id of each range of the Model's rows."""
+    last_id = model.objects.aggregate(Max('id'))['id__max'] or 0
+    return [(first_id, first_id + size - 1)
+            for first_id in range(1, last_id + 1, size)]
+
+
+def check_range(task):
+    """Check the rows of a Model in a range of ids.
+
+    :param task: The name of the Model, the first & last ids of the range &
+                 the end of the last closed Fiscal Year, in ISO format.
+    :type task: tuple
+    :returns: The task & a :obj:`dict` describing each problem found.
+    :rtype: tuple
+
+    """
+    (model_name, first_id, last_id, year_end) = task
+    year_end = parse_date(year_end) if year_end else None
+    if model_name == Account.__name__:
+        problems = check_accounts(first_id, last_id, year_end)
+    else:
+        model = dict((model.__name__, model) for model in ENTRY_FIELDS)[
+            model_name]
+        problems = check_entries(model, first_id, last_id)
+    return (task, problems)
+
+
+def check_accounts(first_id, last_id, year_end=None):
+    """Check the balances & reconciliations of the Accounts in the range."""
+    accounts = list(
+        Account.objects.filter(id__range=(first_id, last_id)).order_by('id'))
+    if not accounts:
+        return []
+    transactions = Transaction.objects.filter(
+        account__id__range=(first_id, last_id))
+    balance_transactions = transactions
+    historical_amounts = {}
+    if year_end is not None:
+        balance_transactions = transactions.filter(date__gt=year_end)
+        historical_amounts = dict(HistoricalAccount.objects.filter(
+            account__id__range=(first_id, last_id), date=year_end
+        ).values_list('account', 'amount'))
+    totals = _get_totals(balance_transactions, 'account')
+    unreconciled_totals = _get_totals(
+        transactions.filter(reconciled=False), 'account')
+    last_reconciled_dates = dict(
+        transactions.filter(reconciled=True).order_by().values_list(
+            'account').annotate(Max('date')))
+
+    problems = []
+    for account in accounts:
+        expected = totals.get(account.id, (0, 0))[0]
+        if account.type in (1, 2, 3):
+            expected += historical_amounts.get(account.id, 0)
+        if account.balance != expected:
+            problems.append(_problem(
+                'balance', Account, account.id,
+                "the balance is {0}, but the Transactions total {1}".format(
+                    account.balance, expected), expected=str(expected)))
+        if account.last_reconciled is None:
+            if account.reconciled_balance or (
+                    account.id in last_reconciled_dates):
+                problems.append(_problem(
+                    'reconciled_balance', Account, account.id,
+                    "it was never reconciled, but has a reconciled balance "
+                    "or reconciled Transactions"))
+            continue
+        last_reconciled_date = last_reconciled_dates.get(account.id)
+        if (last_reconciled_date is not None and
+                last_reconciled_date > account.last_reconciled):
+            problems.append(_problem(
+                'reconciled_date', Account, account.id,
+                "a Transaction dated {0} is reconciled, but it was last "
+                "reconciled on {1}".format(
+                    last_reconciled_date, account.last_reconciled)))
+        unreconciled = unreconciled_totals.get(account.id, (0, 0))[0]
+        if account.reconciled_balance + unreconciled != expected:
+            problems.append(_problem(
+                'reconciled_balance', Account, account.id,
+                "the reconciled balance is {0}, but the unreconciled "
+                "Transactions total {1} of the {2} balance".format(
+                    account.reconciled_balance, unreconciled, expected)))
+    return problems
+
+
+def check_entries(model, first_id, last_id):
+    """Check that the Entries in the range balance & void Entries are empty.
+
+    A Bank Entry's main Transaction is included in it's total.
+
+    """
+    field_name = ENTRY_FIELDS[model]
+    totals = _get_totals(Transaction.objects.filter(
+        **{field_name + '__id__range': (first_id, last_id)}), field_name)
+    if model is JournalEntry:
+        entries = [(entry_id, 0, False) for entry_id in totals]
+    else:
+        fields = ['id', 'main_transaction__balance_delta']
+        if model is BankSpendingEntry:
+            fields.append('void')
+        entries = [values + (False,) * (3 - len(values)) for values in
+                   model.objects.filter(id__range=(first_id, last_id))
+                   .values_list(*fields)]
+
+    problems = []
+    for (entry_id, main_amount, void) in sorted(entries):
+        (total, count) = totals.get(entry_id, (0, 0))
+        if void:
+            if main_amount or count:
+                problems.append(_problem(
+                    'void_entry', model, entry_id, "it is void, but has {0} "
+                    "Transactions & a main Transaction of {1}".format(
+                        count, main_amount)))
+        elif main_amount + total != 0:
+            problems.append(_problem(
+                'entry_balance', model, entry_id,
+                "the Transactions are out of balance by {0}".format(
+                    main_amount + total)))
+    return problems
+
+
+def repair(problem):
+    """Fix the problem, if it can be fixed.
+
+    Void Entries have their Transactions deleted & their main Transaction
+    zeroed, like saving them does. The main Transaction's Account balance is
+    left for the balance check to repair. Balances are set to the total of
+    their Transactions.
+
+    :returns: Whether the problem was repaired.
+    :rtype: bool
+
+    """
+    if problem['check'] == 'void_entry':
+        entry = BankSpendingEntry.objects.select_related(
+            'main_transaction').get(id=problem['id'])
+        entry.transaction_set.all().delete()
+        Transaction.objects.filter(id=entry.main_transaction_id).update(
+            balance_delta=0)
+        bump_account_versions([(entry.main_transaction.account_id,
+                                entry.main_transaction.date)])
+    elif problem['check'] == 'balance':
+        Account.objects.filter(id=problem['id']).update(
+            balance=Decimal(problem['expected']))
+        bump_account_versions([(problem['id'], datetime.date.today())])
+    else:
+        return False
+    bump_ledger_version()
+    return True
+
+
+def _get_totals(transactions, field_name):
+    """Return the sum & count of the Transactions, keyed by the field."""
+    return dict(
+        (values[0], values[1:]) for values in
+        transactions.order_by().values_list(field_name).annotate(
+            Sum('balance_delta'), Count('id')))
+
+
+def _problem(check, model, item_id, message, **extra):
+    """Return a problem found by a check of an Account or Entry."""
+    problem = {'check': check, 'model': model.__name__, 'id': item_id,
+               'message': message}
+    problem.update(extra)
+    return problem
+
+
+def _run_in_worker(task):
+    """Check the task, closing the process's database connection after."""
+    try:
+        return check_range(task)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    args = ''
+    help = """\
+    Check that the Account balances, Entries, void Entries & reconciled
+    balances agree with the Transactions, optionally repairing the balances
+    & void Entries.
+    """
+    option_list = BaseCommand.option_list + (
+        make_option('--repair', action='store_true', default=False,
+                    help='Fix the Account balances & void Entries.'),
+        make_option('--workers', type='int', default=None,
+                    help='Number of processes to use, defaults to the number '
+                         'of CPUs.'),
+        make_option('--chunk-size', type='int', default=500,
+                    help='Number of ids in each range that is checked.'),
+        make_option('--checkpoint', default=None,
+                    help='A file recording the ranges already checked, so an '
+                         'interrupted run can be resumed.'),
+    )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be positive.")
+        checkpoint_path = options['checkpoint']
+        checkpoint = {'checked': [], 'problems': []}
+        if checkpoint_path:
+            checkpoint = read_checkpoint(checkpoint_path) or checkpoint
+        checked = set(tuple(task) for task in checkpoint['checked'])
+        year_end = HistoricalAccount.objects.aggregate(
+            Max('date'))['date__max']
+        year_end = year_end.isoformat() if year_end else None
+
+        for model in CHECKED_MODELS:
+            tasks = [(model.__name__, first_id, last_id, year_end)
+                     for (first_id, last_id) in
+                     get_ranges(model, options['chunk_size'])]
+            tasks = [task for task in tasks if task not in checked]
+            for (task, problems) in self._check(tasks, options['workers']):
+                if options['repair']:
+                    with commit_on_success_unless_managed():
+                        for problem in problems:
+                            problem['repaired'] = repair(problem)
+                checkpoint['checked'].append(task)
+                checkpoint['problems'].extend(problems)
+                if checkpoint_path:
+                    write_checkpoint(checkpoint_path, checkpoint)
+        unrepaired = 0
+        for problem in checkpoint['problems']:
+            self.stdout.write("{0} #{1} ({2}): {3}{4}\n".format(
+                problem['model'], problem['id'], problem['check'],
+                problem['message'],
+                " - repaired" if problem.get('repaired') else ""))
+            unrepaired += not problem.get('repaired')
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        if unrepaired:
+            raise CommandError(
+                "{0} problems were found in the ledger.".format(unrepaired))
+        self.stdout.write("The ledger is consistent.\n")
+
+    def _check(self, tasks, workers):
+        """Check the tasks, using a process pool unless ``workers`` is 1."""
+        if workers == 1 or len(tasks) < 2:
+            for task in tasks:
+                yield check_range(task)
+            return
+        connection.close()
+        pool = multiprocessing.Pool(workers)
+        try:
+            for result in pool.imap_unordered(_run_in_worker, tasks):
+                yield result
+        finally:
+            pool.close()
+            pool.join()
@@ -0,0 +1,269 @@
+"""Count & Time the Ledger's Hot Paths for Prometheus.
+
+Each process keeps it's counters & latency histograms in memory. Every
+``METRICS_FLUSH_INTERVAL`` seconds, and when the process exits, they are
+written to a file named by the process id in the ``METRICS_DIRECTORY``.
+The ``/metrics`` view sums the files of every process that has served the
+application, so the values are aggregated across worker processes without
+an outside service. When ``METRICS_DIRECTORY`` is ``None``, only the current
+process's values are reported.
+
+The files of exited processes are kept, so counters never decrease. A new
+process that re-uses a process id carries on from the old process's file.
+
+"""
+from collections import defaultdict
+import atexit
+import cPickle as pickle
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+
+VIEW_DURATION = 'acorn_view_duration_seconds'
+ENTRIES_CREATED = 'acorn_entries_created_total'
+ENTRIES_APPROVED = 'acorn_entries_approved_total'
+TRANSACTIONS_POSTED = 'acorn_transactions_posted_total'
+IMPORTS_PROCESSED = 'acorn_imports_processed_total'
+PENDING_APPROVALS = 'acorn_pending_approvals'
+DB_CONNECTIONS = 'acorn_db_connections_total'
+DB_CONNECT_DURATION = 'acorn_db_connect_duration_seconds'
+
+#: The type & help text of every exposed metric.
+METRICS = {
+    VIEW_DURATION: ('histogram', 'The time taken to respond, by view.'),
+    ENTRIES_CREATED: ('counter', 'The Entries created, by type.'),
+    ENTRIES_APPROVED: ('counter', 'The Approvable Entries approved, by '
+                                  'type.'),
+    TRANSACTIONS_POSTED: ('counter', 'The Transactions posted.'),
+    IMPORTS_PROCESSED: ('counter', 'The Bank Statements processed, by '
+                                   'stage.'),
+    PENDING_APPROVALS: ('gauge', 'The Entries awaiting approval, by type.'),
+    DB_CONNECTIONS: ('counter', 'The pooled database connections created, '
+                                'reused & closed, by database & event.'),
+    DB_CONNECT_DURATION: ('histogram', 'The time taken to open a database '
+                                       'connection, by database.'),
+}
+#: The upper bounds, in seconds, of the latency histogram buckets.
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_counters = defaultdict(float)
+_histograms = {}
+_lock = threading.Lock()
+_state = {'pid': None, 'flushed_at': 0}
+
+
+def increment(name, amount=1, **labels):
+    """Increase the counter with the labels by the amount."""
+    key = (name, _label_items(labels))
+    with _lock:
+        _check_process()
+        _counters[key] += amount
+
+
+def observe(name, value, **labels):
+    """Record the value in the histogram with the labels."""
+    key = (name, _label_items(labels))
+    with _lock:
+        _check_process()
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = _new_histogram()
+        _add_to_histogram(histogram, value)
+
+
+def flush(force=False):
+    """Write this process's values to it's file in the metrics directory.
+
+    Unless ``force`` is set, nothing is written if the values were written
+    less than ``METRICS_FLUSH_INTERVAL`` seconds ago.
+
+    """
+    directory = _get_directory()
+    if directory is None:
+        return
+    now = time.time()
+    interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+    with _lock:
+        _check_process()
+        if not force and now - _state['flushed_at'] < interval:
+            return
+        _state['flushed_at'] = now
+        if not (_counters or _histograms):
+            return
+        values = {'counters': dict(_counters),
+                  'histograms': dict((key, list(histogram)) for
+                                     (key, histogram) in _histograms.items())}
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=directory)
+    with os.fdopen(file_descriptor, 'wb') as metrics_file:
+        pickle.dump(values, metrics_file, pickle.HIGHEST_PROTOCOL)
+    os.rename(temporary_path, _get_path(directory, os.getpid()))
+
+
+def collect():
+    """Return the counters & histograms summed across every process.
+
+    :returns: The counter values & the histograms, keyed by the metric name &
+              the sorted ``(label, value)`` pairs.
+    :rtype: :obj:`tuple` of :obj:`dicts<dict>`
+
+    """
+    directory = _get_directory()
+    if directory is None:
+        with _lock:
+            return (dict(_counters),
+                    dict((key, list(histogram)) for
+                         (key, histogram) in _histograms.items()))
+    flush(force=True)
+    counters = defaultdict(float)
+    histograms = {}
+    for file_name in sorted(os.listdir(directory)):
+        if file_name.endswith('.pickle'):
+            values = _load(os.path.join(directory, file_name))
+            _merge(values, counters, histograms)
+    return dict(counters), histograms
+
+
+def render(gauges=None):
+    """Return every metric in the Prometheus text exposition format.
+
+    :param gauges: The current value of each gauge, keyed like the counters
+                   returned by :func:`collect`.
+    :type gauges: dict
+    :returns: The exposition text.
+    :rtype: str
+
+    """
+    counters, histograms = collect()
+    samples = defaultdict(list)
+    for ((name, labels), value) in counters.items():
+        samples[name].append((name, labels, value))
+    for ((name, labels), value) in (gauges or {}).items():
+        samples[name].append((name, labels, value))
+    for ((name, labels), histogram) in histograms.items():
+        cumulative = 0
+        for (bound, count) in zip(LATENCY_BUCKETS, histogram):
+            cumulative += count
+            samples[name].append((name + '_bucket',
+                                  labels + (('le', repr(float(bound))),),
+                                  cumulative))
+        count = cumulative + histogram[len(LATENCY_BUCKETS)]
+        samples[name].extend([
+            (name + '_bucket', labels + (('le', '+Inf'),), count),
+            (name + '_sum', labels, histogram[-1]),
+            (name + '_count', labels, count)])
+    lines = []
+    for name in sorted(METRICS):
+        (metric_type, help_text) = METRICS[name]
+        lines.append('# HELP {0} {1}'.format(name, help_text))
+        lines.append('# TYPE {0} {1}'.format(name, metric_type))
+        for (sample_name, labels, value) in sorted(
+                samples[name], key=lambda sample: sample[1]):
+            lines.append('{0}{1} {2}'.format(
+                sample_name, _format_labels(labels), _format_value(value)))
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    """Clear the values of this process."""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def _check_process():
+    """Start over with the previous file's values in a new process.
+
+    Forked workers inherit the values of their parent, which are already
+    reported by the parent's file. Must be called while holding the lock.
+
+    """
+    pid = os.getpid()
+    if _state['pid'] == pid:
+        return
+    _state['pid'] = pid
+    _state['flushed_at'] = 0
+    _counters.clear()
+    _histograms.clear()
+    directory = _get_directory()
+    if directory is not None:
+        _merge(_load(_get_path(directory, pid)), _counters, _histograms)
+
+
+def _new_histogram():
+    """Return empty bucket counts, an overflow count & a sum of values."""
+    return [0] * (len(LATENCY_BUCKETS) + 2)
+
+
+def _add_to_histogram(histogram, value):
+    """Add the value to the first bucket it fits in & to the sum."""
+    for (position, bound) in enumerate(LATENCY_BUCKETS):
+        if value <= bound:
+            histogram[position] += 1
+            break
+    else:
+        histogram[len(LATENCY_BUCKETS)] += 1
+    histogram[-1] += value
+
+
+def _merge(values, counters, histograms):
+    """Add the counters & histograms in the values to the totals."""
+    for (key, value) in values.get('counters', {}).items():
+        counters[key] += value
+    for (key, histogram) in values.get('histograms', {}).items():
+        total = histograms.get(key)
+        if total is None:
+            total = histograms[key] = _new_histogram()
+        for (position, count) in enumerate(histogram):
+            total[position] += count
+
+
+def _load(path):
+    """Return the values in the metrics file, if it can be read."""
+    try:
+        with open(path, 'rb') as metrics_file:
+            return pickle.load(metrics_file)
+    except (IOError, EOFError, pickle.UnpicklingError):
+        return {}
+
+
+def _get_directory():
+    """Return the directory the processes write their values to."""
+    return getattr(settings, 'METRICS_DIRECTORY', None)
+
+
+def _get_path(directory, pid):
+    """Return the path of the metrics file of the process."""
+    return os.path.join(directory, '{0}.pickle'.format(pid))
+
+
+def _label_items(labels):
+    """Return the labels as sorted ``(label, value)`` pairs."""
+    return tuple(sorted((label, unicode(value))
+                        for (label, value) in labels.items()))
+
+
+def _format_labels(labels):
+    """Return the labels in the exposition format."""
+    if not labels:
+        return ''
+    return '{{{0}}}'.format(','.join(
+        u'{0}="{1}"'.format(label, value.replace('\\', '\\\\')
+                            .replace('"', '\\"').replace('\n', '\\n'))
+        for (label, value) in labels))
+
+
+def _format_value(value):
+    """Return the value in the exposition format."""
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+atexit.register(flush, force=True)
@@ -1,10 +1,25 @@
+from functools import wraps
+import heapq
+import logging
+import os
+import random
 import re
+import threading
+import time
 
 from django.http import HttpResponseRedirect
 from django.conf import settings
+from django.db import connections, transaction
 
+from . import cache, metrics
+from .db import replicas
+from .profiling import profile_call
 
-EXEMPT_URLS = [re.compile(settings.LOGIN_URL.lstrip('/'))]
+
+logger = logging.getLogger(__name__)
+
+EXEMPT_URLS = [re.compile(settings.LOGIN_URL.lstrip('/')),
+               re.compile(r'^metrics/$')]
 if hasattr(settings, 'REQUIRE_LOGIN_EXEMPT_URLS'):
     EXEMPT_URLS += [compile(expr) for expr in settings.LOGIN_EXEMPT_URLS]
 
@@ -25,3 +40,258 @@ class LoginRequiredMiddleware(object):
             if not any(m.match(path) for m in EXEMPT_URLS):
                 return HttpResponseRedirect(
                     "{}?next={}".format(settings.LOGIN_URL, request.path))
+
+
+class RequestTimingMiddleware(object):
+    """Measure the SQL, cache & view time of a sample of requests.
+
+    A fraction of requests, set by the ``REQUEST_TIMING_SAMPLE_RATE``
+    setting, is instrumented. Their query count, total SQL time, cache hits
+    & misses, view time & total time are added to the response as a
+    ``Server-Timing`` header.
+
+    Each process remembers it's ``REQUEST_TIMING_SLOWEST_COUNT`` slowest
+    sampled requests. The first requests only fill this list, afterwards a
+    request slower than all but one of them replaces the fastest & is logged
+    to the ``core.middleware`` logger with it's
+    ``REQUEST_TIMING_TOP_QUERIES`` slowest queries. So a restart does not log
+    every request until the list is full, & each logged request is slower
+    than most of the process's earlier ones.
+
+    This should be the first Middleware, so the total time includes the
+    other Middleware.
+
+    """
+    slowest = []
+    slowest_lock = threading.Lock()
+
+    def process_request(self, request):
+        """Start timing the request, if it is part of the sample."""
+        sample_rate = getattr(settings, 'REQUEST_TIMING_SAMPLE_RATE', 0)
+        if sample_rate <= 0 or random.random() >= sample_rate:
+            return
+        debug_cursors = {}
+        query_counts = {}
+        for connection in connections.all():
+            debug_cursors[connection.alias] = connection.use_debug_cursor
+            query_counts[connection.alias] = len(connection.queries)
+            connection.use_debug_cursor = True
+        request.timing = {
+            'start': time.time(),
+            'debug_cursors': debug_cursors,
+            'query_counts': query_counts,
+            'cache': _get_cache_counts(),
+        }
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """Mark the start of the view."""
+        if hasattr(request, 'timing'):
+            request.timing['view_start'] = time.time()
+
+    def process_response(self, request, response):
+        """Add the measurements to the response & log slow requests."""
+        timing = getattr(request, 'timing', None)
+        if timing is None:
+            return response
+        del request.timing
+        now = time.time()
+        queries = []
+        for connection in connections.all():
+            queries += connection.queries[
+                timing['query_counts'].get(connection.alias, 0):]
+            connection.use_debug_cursor = timing['debug_cursors'].get(
+                connection.alias)
+        sql_time = sum(float(query['time']) for query in queries)
+        hits, misses = [after - before for (after, before) in
+                        zip(_get_cache_counts(), timing['cache'])]
+        total_time = now - timing['start']
+        view_time = now - timing.get('view_start', now)
+        response['Server-Timing'] = ', '.join([
+            'db;dur={0:.1f};desc="{1} queries"'.format(
+                sql_time * 1000, len(queries)),
+            'cache;desc="{0} hits, {1} misses"'.format(hits, misses),
+            'view;dur={0:.1f}'.format(view_time * 1000),
+            'total;dur={0:.1f}'.format(total_time * 1000),
+        ])
+        if self._is_slowest(total_time):
+            top_queries = sorted(
+                queries, key=lambda query: float(query['time']),
+                reverse=True)[:getattr(settings, 'REQUEST_TIMING_TOP_QUERIES',
+                                       3)]
+            logger.warning(
+                "Slow request: %s %s took %.1fms, %d queries in %.1fms, "
+                "%d cache hits, %d misses.\n%s", request.method,
+                request.get_full_path(), total_time * 1000, len(queries),
+                sql_time * 1000, hits, misses,
+                '\n'.join('({0}s) {1}'.format(query['time'], query['sql'])
+                          for query in top_queries))
+        return response
+
+    @classmethod
+    def _is_slowest(cls, total_time):
+        """Return whether the time replaces one of the process's slowest.
+
+        Times filling the list are remembered without being reported.
+
+        """
+        count = getattr(settings, 'REQUEST_TIMING_SLOWEST_COUNT', 20)
+        with cls.slowest_lock:
+            if len(cls.slowest) < count:
+                heapq.heappush(cls.slowest, total_time)
+                return False
+            elif cls.slowest and total_time > cls.slowest[0]:
+                heapq.heapreplace(cls.slowest, total_time)
+                return True
+        return False
+
+
+def writes_database(view):
+    """Mark a view that writes for ``GET`` or ``HEAD`` requests.
+
+    The :class:`WriteTransactionMiddleware` runs these views in a
+    transaction for every request method. The view is wrapped, so views from
+    other applications can be marked in the URLconf.
+
+    """
+    @wraps(view)
+    def writing_view(*args, **kwargs):
+        return view(*args, **kwargs)
+    writing_view.writes_database = True
+    return writing_view
+
+
+class WriteTransactionMiddleware(object):
+    """Run the views of requests that may write in a transaction.
+
+    This replaces Django's ``TransactionMiddleware``, which opens a
+    transaction for every request. Views are run in a transaction that is
+    committed with a successful response & rolled back on an exception if the
+    request is not a ``GET``, ``HEAD``, ``OPTIONS`` or ``TRACE`` request, or
+    the view is marked with :func:`writes_database`. Other views read in the
+    database's normal mode, which is autocommit when the ``autocommit``
+    database option is set.
+
+    """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """Enter transaction management if the view may write."""
+        if (request.method not in replicas.SAFE_METHODS or
+                getattr(view_func, 'writes_database', False)):
+            transaction.enter_transaction_management()
+            transaction.managed(True)
+            request.write_transaction = True
+
+    def process_exception(self, request, exception):
+        """Roll back the view's writes & leave transaction management."""
+        if getattr(request, 'write_transaction', False):
+            del request.write_transaction
+            if transaction.is_dirty():
+                transaction.rollback()
+            transaction.leave_transaction_management()
+            cache.discard_pending_bumps()
+
+    def process_response(self, request, response):
+        """Commit the view's writes & leave transaction management.
+
+        The cache versions bumped by the view are bumped again after the
+        commit, see :mod:`core.cache`.
+
+        """
+        if not getattr(request, 'write_transaction', False):
+            return response
+        del request.write_transaction
+        if transaction.is_dirty():
+            try:
+                transaction.commit()
+            except Exception:
+                transaction.rollback()
+                transaction.leave_transaction_management()
+                cache.discard_pending_bumps()
+                raise
+        transaction.leave_transaction_management()
+        cache.flush_pending_bumps()
+        return response
+
+
+class ReplicaPinningMiddleware(object):
+    """Read from the ``default`` database for a while after a write.
+
+    Responses to requests that may write, like ``POST`` requests, pin the
+    client to the ``default`` database for ``REPLICA_PIN_SECONDS``, so the
+    :func:`~core.db.replicas.use_replica` views it is redirected to include
+    the write even if the replica lags behind. Nothing is done when no
+    ``REPLICA_DATABASE`` is configured.
+
+    """
+
+    def process_response(self, request, response):
+        """Set the pinning cookie if the request may have written."""
+        if (settings.REPLICA_DATABASE and
+                request.method not in replicas.SAFE_METHODS):
+            replicas.pin(response)
+        return response
+
+
+class MetricsMiddleware(object):
+    """Record the response time of every view in :mod:`core.metrics`.
+
+    The time is measured from the start of the view, so this should come
+    after any Middleware that may respond without calling a view.
+
+    """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """Remember the view's name & start time."""
+        request.metrics_view = (
+            getattr(view_func, '__name__', 'unknown'), time.time())
+
+    def process_response(self, request, response):
+        """Record the time since the view started."""
+        view = getattr(request, 'metrics_view', None)
+        if view is not None:
+            (view_name, start) = view
+            metrics.observe(
+                metrics.VIEW_DURATION, time.time() - start, view=view_name)
+            metrics.flush()
+        return response
+
+
+class ProfileMiddleware(object):
+    """Let superusers profile a single request's view.
+
+    A request with a ``__profile`` parameter or an ``X-Profile`` header, made
+    by a superuser, runs the view under :mod:`cProfile`. The stats & an HTML
+    flame summary are written to the ``PROFILE_DIRECTORY`` & the stats file's
+    name is returned in the ``X-Profile`` response header. See
+    :func:`core.profiling.profile_call`.
+
+    This should be the last Middleware, since it calls the view itself.
+    Exceptions raised in ``process_view`` skip the exception Middleware, so
+    the :class:`WriteTransactionMiddleware` is told about a profiled view's
+    exception here, rolling back it's writes.
+
+    """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """Profile the view if requested by a superuser."""
+        requested = ('__profile' in request.GET or
+                     'HTTP_X_PROFILE' in request.META)
+        if not requested or not request.user.is_superuser:
+            return
+        try:
+            response, stats_path = profile_call(
+                settings.PROFILE_DIRECTORY,
+                getattr(view_func, '__name__', 'view'),
+                view_func, request, *view_args, **view_kwargs)
+        except Exception as error:
+            WriteTransactionMiddleware().process_exception(request, error)
+            raise
+        response['X-Profile'] = os.path.basename(stats_path)
+        return response
+
+
+def _get_cache_counts():
+    """Return the total cache hits & misses of this process."""
+    stats = cache.get_cache_stats().values()
+    return (sum(counts['hits'] for counts in stats),
+            sum(counts['misses'] for counts in stats))
@@ -0,0 +1,110 @@
+"""Profile Single Calls & Summarize Where Their Time Was Spent.
+
+:func:`profile_call` runs a function under :mod:`cProfile`, then writes the
+raw stats, readable with :mod:`pstats` or tools like ``snakeviz``, & an HTML
+flame summary of the call tree to a directory.
+
+"""
+import cProfile
+import datetime
+import os
+import pstats
+import re
+
+from django.utils.html import escape
+
+
+#: Calls taking less than this fraction of the total time are not shown.
+FLAME_MINIMUM_FRACTION = 0.005
+FLAME_MAXIMUM_DEPTH = 40
+
+FLAME_STYLE = """
+body { font-family: monospace; font-size: 12px; }
+.call { box-sizing: border-box; display: inline-block; vertical-align: top; }
+.frame { background: #f4a460; border: 1px solid #fff; overflow: hidden;
+         padding: 2px; white-space: nowrap; }
+.children { width: 100%; }
+"""
+
+
+def profile_call(directory, name, function, *args, **kwargs):
+    """Profile the function call, writing the stats & flame summary.
+
+    :param directory: The directory to write the files to.
+    :type directory: str
+    :param name: The name to start the file names with.
+    :type name: str
+    :returns: The function's result & the path of the stats file. The flame
+              summary has the same path, with a ``.html`` extension.
+    :rtype: tuple
+
+    """
+    profiler = cProfile.Profile()
+    result = profiler.runcall(function, *args, **kwargs)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    base_path = os.path.join(directory, '{0}-{1}'.format(
+        datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f'),
+        re.sub(r'[^\w-]+', '_', name)))
+    profiler.dump_stats(base_path + '.prof')
+    stats = pstats.Stats(profiler)
+    with open(base_path + '.html', 'w') as html_file:
+        html_file.write(build_flame_summary(stats, name).encode('utf-8'))
+    return result, base_path + '.prof'
+
+
+def build_flame_summary(stats, title):
+    """Return an HTML page showing the call tree as nested boxes.
+
+    Each function is as wide as it's share of the total time & it's callees
+    are drawn beneath it.
+
+    :param stats: The profiled calls.
+    :type stats: :class:`pstats.Stats`
+    :param title: The title of the page.
+    :type title: str
+
+    """
+    callees = {}
+    called = set()
+    for (function, (_, _, _, _, callers)) in stats.stats.items():
+        for (caller, caller_stats) in callers.items():
+            callees.setdefault(caller, {})[function] = caller_stats[3]
+            called.add(function)
+    roots = dict((function, stats.stats[function][3])
+                 for function in stats.stats if function not in called)
+    total = sum(roots.values()) or 1
+    body = _render_calls(roots, callees, total, total, set(), 0)
+    return (u'<!DOCTYPE html><html><head><meta charset="utf-8">'
+            u'<title>{0}</title><style>{1}</style></head><body>'
+            u'<h1>{0}</h1><p>{2:.1f}ms total</p>{3}</body></html>').format(
+        escape(title), FLAME_STYLE, total * 1000, body)
+
+
+def _render_calls(calls, callees, parent_time, total, path, depth):
+    """Return the nested boxes of the calls, widest first."""
+    if depth > FLAME_MAXIMUM_DEPTH:
+        return u''
+    html = []
+    for (function, time) in sorted(calls.items(), key=lambda call: -call[1]):
+        if time < total * FLAME_MINIMUM_FRACTION or function in path:
+            continue
+        label = u'{0} ({1:.1f}ms, {2:.1f}%)'.format(
+            _format_function(function), time * 1000, time / total * 100)
+        html.append(
+            u'<div class="call" style="width: {0:.2f}%">'
+            u'<div class="frame" title="{1}">{1}</div>'
+            u'<div class="children">{2}</div></div>'.format(
+                min(time / parent_time, 1) * 100, escape(label),
+                _render_calls(callees.get(function, {}), callees, time,
+                              total, path | set([function]), depth + 1)))
+    return u''.join(html)
+
+
+def _format_function(function):
+    """Return the ``file:line(name)`` of a profiled function."""
+    (file_name, line_number, name) = function
+    if file_name == '~':
+        return name
+    return u'{0}:{1}({2})'.format(
+        os.path.basename(file_name), line_number, name)
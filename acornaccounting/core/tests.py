@@ -1,10 +1,51 @@
+import cPickle as pickle
+import datetime
+import io
+import json
+import logging
+import os
+import pstats
+import shutil
+import tempfile
+
 from django.contrib.auth.models import User
+from django.core.cache import get_cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.template.defaultfilters import slugify
-from django.test import TestCase
+from django.core.urlresolvers import resolve, reverse
+from django.db import DatabaseError, connection, router, transaction
+from django.db.models.signals import post_delete, post_save
+from django.http import HttpResponse
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
 
-from accounts.models import Header, Account
-from entries.models import JournalEntry, Transaction
+from accounts.models import Header, Account, HistoricalAccount
+from bank_import.models import (BankAccount, ImportFingerprint,
+                                StatementImport, StatementLine)
+from creditcards.models import (CreditCard, CreditCardEntry,
+                                CreditCardTransaction)
+from entries.batch import EntryBatch
+from entries.models import (JournalEntry, BankSpendingEntry,
+                            BankReceivingEntry, Transaction)
+from events.models import Event, HistoricalEvent
+from fiscalyears.models import FiscalYear
+from trips.models import (StoreAccount, TripEntry, TripTransaction,
+                          TripStoreTransaction)
 
+from . import cache, metrics
+from .cache_backends import TwoTierCache
+from .db.backends.sqlite3.base import DatabaseWrapper
+from .db import pool, replicas, slow_queries
+from .db.bulk import (assign_ids, bulk_create, reserve_ids,
+                      SQLITE_MAX_VARIABLES)
+from .db.transactions import commit_on_success_unless_managed
+from .management.commands import benchmark
+from .middleware import (RequestTimingMiddleware, ReplicaPinningMiddleware,
+                         WriteTransactionMiddleware, ProfileMiddleware,
+                         writes_database)
 from .models import AccountWrapper
 from .templatetags.core_filters import capitalize_words
 
@@ -41,6 +82,17 @@ def create_and_login_user(test_instance):
     test_instance.client.login(username=test_admin.username, password=password)
 
 
+def use_local_memory_cache(test_instance):
+    """Use an empty local memory cache for the ledger version & reports."""
+    original_cache = cache.cache
+    cache.cache = get_cache(
+        'django.core.cache.backends.locmem.LocMemCache', LOCATION='tests')
+    cache.cache.clear()
+    cache.reset_cache_stats()
+    cache.discard_pending_bumps()
+    test_instance.addCleanup(setattr, cache, 'cache', original_cache)
+
+
 class CoreFilterTests(TestCase):
     """
     These test the core_filters.
@@ -87,3 +139,1635 @@ class AccountWrapperTests(TestCase):
 
         obj.save()
         self.assertEqual(obj.name, self.account.name)
+
+
+class ReserveIdsTests(TestCase):
+    """Test the ``core.db.bulk`` primary key reservation functions."""
+
+    def test_reserve_ids_are_unused(self):
+        """The reserved keys should come after any existing keys."""
+        entry = create_entry(datetime.date.today(), 'Existing')
+
+        ids = reserve_ids(JournalEntry, 3)
+
+        self.assertEqual(len(ids), 3)
+        self.assertTrue(all(pk > entry.id for pk in ids))
+        self.assertEqual(len(set(ids)), 3)
+
+    def test_assign_ids_allows_bulk_create(self):
+        """Objects with assigned keys can be bulk created & referenced."""
+        entries = [JournalEntry(date=datetime.date.today(), memo=str(number))
+                   for number in range(3)]
+        entries.append(create_entry(datetime.date.today(), 'Existing'))
+        existing_id = entries[-1].id
+
+        assigned = assign_ids(JournalEntry, entries)
+        JournalEntry.objects.bulk_create(assigned)
+
+        self.assertEqual(len(assigned), 3)
+        self.assertEqual(entries[-1].id, existing_id)
+        for entry in entries:
+            self.assertEqual(JournalEntry.objects.get(id=entry.id).memo,
+                             entry.memo)
+
+    def test_bulk_create_splits_large_inserts(self):
+        """More objects than one query's parameters allow are all inserted."""
+        count = SQLITE_MAX_VARIABLES + 1
+        entries = [JournalEntry(date=datetime.date.today(), memo=str(number))
+                   for number in range(count)]
+
+        bulk_create(JournalEntry, entries)
+
+        self.assertEqual(JournalEntry.objects.count(), count)
+
+
+class LedgerVersionTests(TestCase):
+    """Test the ledger version & report caching functions."""
+
+    def setUp(self):
+        """Use a real cache & create an Account."""
+        use_local_memory_cache(self)
+        self.account = create_account('Account', create_header('Header'), 0)
+
+    def test_bump_increases_version(self):
+        """Bumping the ledger version should always increase it."""
+        version = cache.get_ledger_version()
+
+        self.assertGreater(cache.bump_ledger_version(), version)
+        self.assertGreater(cache.get_ledger_version(), version)
+
+    def test_evicted_version_restarts_higher(self):
+        """A version started after an eviction should not reuse old keys."""
+        version = cache.bump_ledger_version()
+        cache.cache.delete(cache.LEDGER_VERSION_KEY)
+
+        self.assertGreater(cache.get_ledger_version(), version)
+
+    def test_transaction_save_bumps_version(self):
+        """Saving or deleting a Transaction should bump the ledger version."""
+        version = cache.get_ledger_version()
+        entry_transaction = create_transaction(
+            create_entry(datetime.date.today(), 'Entry'), self.account, 20)
+        saved_version = cache.get_ledger_version()
+        entry_transaction.delete()
+
+        self.assertGreater(saved_version, version)
+        self.assertGreater(cache.get_ledger_version(), saved_version)
+
+    def test_balance_deltas_bump_version(self):
+        """Bulk balance updates skip signals but should bump the version."""
+        version = cache.get_ledger_version()
+        Account.objects.apply_balance_deltas({self.account.id: 20})
+
+        self.assertGreater(cache.get_ledger_version(), version)
+
+    def test_cached_report_rebuilt_after_ledger_change(self):
+        """A cached report is reused until the ledger version changes."""
+        builds = []
+        today = datetime.date.today()
+
+        def build_report():
+            builds.append(True)
+            return len(builds)
+
+        first = cache.get_cached_report('test', today, today, build_report)
+        second = cache.get_cached_report('test', today, today, build_report)
+        other_range = cache.get_cached_report(
+            'test', today - datetime.timedelta(days=1), today, build_report)
+        cache.bump_ledger_version()
+        after_change = cache.get_cached_report(
+            'test', today, today, build_report)
+
+        self.assertEqual((first, second, other_range, after_change),
+                         (1, 1, 2, 3))
+
+
+class AccountVersionTests(TestCase):
+    """Test the targeted invalidation of cached Account values."""
+
+    def setUp(self):
+        """Use a real cache & create two Accounts with Transactions."""
+        use_local_memory_cache(self)
+        header = create_header('Header')
+        self.account = create_account('Account', header, 0)
+        self.other_account = create_account('Other Account', header, 0)
+        self.today = datetime.date.today()
+        self.last_month = self.today.replace(day=1) - datetime.timedelta(1)
+        self.two_months_ago = (self.last_month.replace(day=1) -
+                               datetime.timedelta(1))
+        entry = create_entry(self.today, 'Entry')
+        create_transaction(entry, self.account, 20)
+        create_transaction(entry, self.other_account, -20)
+
+    def _get_balance(self):
+        """Return the Account's balance at the end of last month."""
+        return Account.objects.get(id=self.account.id).get_balance_by_date(
+            self.last_month)
+
+    def test_month_buckets_since(self):
+        """The buckets run from the date's month to the future bucket."""
+        self.assertEqual(
+            cache.month_buckets_since(self.last_month),
+            [cache.month_bucket(self.last_month),
+             cache.month_bucket(self.today), cache.FUTURE_BUCKET])
+
+    def test_balance_cached(self):
+        """A repeated balance calculation should be a cache hit."""
+        first_balance = self._get_balance()
+        second_balance = self._get_balance()
+
+        self.assertEqual(first_balance, second_balance)
+        self.assertEqual(cache.get_cache_stats()['balance_by_date'],
+                         {'hits': 1, 'misses': 1})
+
+    def test_repeated_balance_runs_no_queries(self):
+        """The stored balance is cached along with the later total."""
+        account = Account.objects.get(id=self.account.id)
+        first_balance = account.get_balance_by_date(self.last_month)
+
+        with self.assertNumQueries(0):
+            second_balance = account.get_balance_by_date(self.last_month)
+        self.assertEqual(first_balance, second_balance)
+        self.assertEqual(cache.get_cache_stats()['balance'],
+                         {'hits': 1, 'misses': 1})
+
+    def test_other_account_write_keeps_cache(self):
+        """Writes to another Account should not invalidate the balance."""
+        self._get_balance()
+        entry = create_entry(self.today, 'Other Entry')
+        create_transaction(entry, self.other_account, 15)
+
+        self._get_balance()
+
+        self.assertEqual(cache.get_cache_stats()['balance_by_date']['hits'], 1)
+
+    def test_earlier_month_write_keeps_cache(self):
+        """Writes before the balance's month only change the stored balance.
+
+        The cached total of later Transactions is still valid.
+
+        """
+        self._get_balance()
+        entry = create_entry(self.two_months_ago, 'Old Entry')
+        create_transaction(entry, self.account, 15)
+
+        self.assertEqual(self._get_balance(), 15)
+        self.assertEqual(cache.get_cache_stats()['balance_by_date']['hits'], 1)
+
+    def test_later_write_invalidates_cache(self):
+        """Writes in or after the balance's month invalidate it."""
+        self._get_balance()
+        entry = create_entry(self.today, 'New Entry')
+        create_transaction(entry, self.account, 15)
+
+        self.assertEqual(self._get_balance(), 0)
+        self.assertEqual(cache.get_cache_stats()['balance_by_date'],
+                         {'hits': 0, 'misses': 2})
+
+    def test_future_write_invalidates_cache(self):
+        """Writes dated after the current month invalidate the balance."""
+        self._get_balance()
+        entry = create_entry(self.today + datetime.timedelta(days=40),
+                             'Future Entry')
+        create_transaction(entry, self.account, 15)
+
+        self.assertEqual(self._get_balance(), 0)
+        self.assertEqual(
+            cache.get_cache_stats()['balance_by_date']['misses'], 2)
+
+    def test_entry_batch_invalidates_cache(self):
+        """Bulk inserted Transactions invalidate the changed months."""
+        self.account.get_balance_change_by_month(self.today)
+        batch = EntryBatch()
+        batch.add_transfer(self.today, self.other_account, self.account, 15)
+        batch.save()
+
+        net_change = self.account.get_balance_change_by_month(self.today)
+
+        self.assertEqual(net_change, 5)
+        self.assertEqual(cache.get_cache_stats()['balance_change_by_month'],
+                         {'hits': 0, 'misses': 2})
+
+    def test_other_account_write_keeps_stored_balance(self):
+        """The stored balance is keyed by only the Account's own version."""
+        self._get_balance()
+        entry = create_entry(self.today, 'Other Entry')
+        create_transaction(entry, self.other_account, 15)
+
+        self._get_balance()
+
+        self.assertEqual(cache.get_cache_stats()['balance'],
+                         {'hits': 1, 'misses': 1})
+
+    def test_earnings_keyed_by_summed_accounts(self):
+        """Current Year Earnings is only invalidated by the Accounts summed."""
+        earnings = create_account('Current Year Earnings',
+                                  create_header('Equity', cat_type=3), 0, 3)
+        income = create_account('Income', create_header('Income', cat_type=4),
+                                0, 4)
+        earnings.get_balance_by_date(self.today)
+        entry = create_entry(self.today, 'Other Entry')
+        create_transaction(entry, self.other_account, 15)
+        earnings.get_balance_by_date(self.today)
+        entry = create_entry(self.today, 'Income Entry')
+        create_transaction(entry, income, -15)
+
+        self.assertEqual(earnings.get_balance_by_date(self.today), -15)
+        self.assertEqual(cache.get_cache_stats()['balance_by_date'],
+                         {'hits': 1, 'misses': 2})
+
+
+class TwoTierCacheTests(TestCase):
+    """Test the local & remote tiers of the TwoTierCache backend."""
+
+    def setUp(self):
+        """Create a TwoTierCache in front of an empty local memory cache."""
+        self.cache = TwoTierCache(
+            'django.core.cache.backends.locmem.LocMemCache',
+            {'OPTIONS': {'MAX_ENTRIES': 2, 'VERSION_CHECK_INTERVAL': 0}})
+        self.cache.remote.clear()
+
+    def test_repeated_get_hits_local_tier(self):
+        """Values are only read from the remote cache once."""
+        self.cache.remote.set('key', 'value')
+
+        self.assertEqual(self.cache.get('key'), 'value')
+        self.assertEqual(self.cache.get('key'), 'value')
+        self.assertEqual(self.cache.get('missing'), None)
+        self.assertEqual(self.cache.stats,
+                         {'local_hits': 1, 'remote_hits': 1, 'misses': 1})
+
+    def test_set_writes_both_tiers(self):
+        """Set values are stored remotely & served locally."""
+        self.cache.set('key', 'value')
+
+        self.assertEqual(self.cache.remote.get('key'), 'value')
+        self.assertEqual(self.cache.get('key'), 'value')
+        self.assertEqual(self.cache.stats['local_hits'], 1)
+
+    def test_least_recently_used_dropped(self):
+        """The local tier drops the least recently used value when full."""
+        self.cache.set('first', 1)
+        self.cache.set('second', 2)
+        self.cache.get('first')
+        self.cache.set('third', 3)
+
+        self.assertEqual(
+            self.cache.get_many(['first', 'second', 'third']),
+            {'first': 1, 'second': 2, 'third': 3})
+        self.assertEqual(self.cache.stats,
+                         {'local_hits': 3, 'remote_hits': 1, 'misses': 0})
+
+    def test_local_values_expire(self):
+        """Values older than the local timeout are read remotely again."""
+        self.cache.local_timeout = -1
+        self.cache.set('key', 'value')
+
+        self.assertEqual(self.cache.get('key'), 'value')
+        self.assertEqual(self.cache.stats['remote_hits'], 1)
+
+    def test_ledger_keys_are_remote_only(self):
+        """The version counters are never served from the local tier."""
+        self.cache.set('ledger:account:1:2016-01', 5)
+        self.cache.remote.incr('ledger:account:1:2016-01')
+
+        self.assertEqual(self.cache.get('ledger:account:1:2016-01'), 6)
+
+    def test_ledger_version_change_empties_local_tier(self):
+        """A version bumped by another process invalidates the local tier."""
+        self.cache.set('ledger:version', 1)
+        self.cache.set('key', 'value')
+        self.cache.remote.incr('ledger:version')
+        self.cache.remote.set('key', 'new value')
+
+        self.assertEqual(self.cache.get('key'), 'new value')
+
+    def test_returned_values_are_copies(self):
+        """Changing a returned value does not change the cached value."""
+        self.cache.set('key', [1])
+        self.cache.get('key').append(2)
+
+        self.assertEqual(self.cache.get('key'), [1])
+
+
+class RecordingHandler(logging.Handler):
+    """A logging Handler that keeps every record."""
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@override_settings(REQUEST_TIMING_SAMPLE_RATE=1,
+                   REQUEST_TIMING_SLOWEST_COUNT=1)
+class RequestTimingMiddlewareTests(TestCase):
+    """Test the sampled request timing Middleware."""
+
+    def setUp(self):
+        """Record the timing logs & forget any previous slow requests."""
+        RequestTimingMiddleware.slowest = []
+        self.handler = RecordingHandler()
+        logger = logging.getLogger('core.middleware')
+        logger.addHandler(self.handler)
+        self.addCleanup(logger.removeHandler, self.handler)
+        create_account('Account', create_header('Header'), 0)
+        self.url = reverse('reports.views.trial_balance_report')
+
+    def test_sampled_request_has_server_timing(self):
+        """Sampled responses contain the SQL, cache & view timings."""
+        response = self.client.get(self.url)
+
+        server_timing = response['Server-Timing']
+        self.assertRegexpMatches(server_timing, r'db;dur=[\d.]+;desc="\d+ '
+                                                r'queries"')
+        self.assertRegexpMatches(server_timing,
+                                 r'cache;desc="0 hits, [1-9]\d* misses"')
+        self.assertRegexpMatches(server_timing, r'view;dur=[\d.]+')
+        self.assertRegexpMatches(server_timing, r'total;dur=[\d.]+')
+        self.assertFalse(connection.use_debug_cursor)
+
+    def test_unsampled_request_has_no_header(self):
+        """Requests outside the sample are not measured."""
+        with self.settings(REQUEST_TIMING_SAMPLE_RATE=0):
+            response = self.client.get(self.url)
+
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(self.handler.records, [])
+
+    def test_slowest_requests_logged(self):
+        """Only requests slower than the slowest so far are logged."""
+        RequestTimingMiddleware.slowest = [60 * 60]
+        self.client.get(self.url)
+        RequestTimingMiddleware.slowest = [0]
+        self.client.get(self.url)
+
+        [record] = self.handler.records
+        self.assertIn('Slow request: GET ' + self.url, record.getMessage())
+        self.assertIn('SELECT', record.getMessage())
+
+    def test_first_requests_not_logged(self):
+        """Requests filling the slowest list are remembered but not logged."""
+        self.client.get(self.url)
+
+        self.assertEqual(len(RequestTimingMiddleware.slowest), 1)
+        self.assertEqual(self.handler.records, [])
+
+
+class WriteFailed(Exception):
+    """Raised by the receivers interrupting a view's writes."""
+
+
+class WriteTransactionMiddlewareTests(TransactionTestCase):
+    """Test only running the views of writing requests in a transaction."""
+
+    def setUp(self):
+        """Create Accounts & login."""
+        create_and_login_user(self)
+        self.factory = RequestFactory()
+        self.bank_account = create_account(
+            'Bank', create_header('Assets', cat_type=1), 0, 1, True)
+        self.expense_account = create_account(
+            'Expense', create_header('Expenses', cat_type=6), 0, 6)
+
+    def tearDown(self):
+        """Empty the committed tables, since they are only flushed before."""
+        call_command('flush', verbosity=0, interactive=False)
+
+    def _fail_after_write(self, model, signal=post_save):
+        """Raise an exception after each instance of the model is written."""
+        def fail(sender, **kwargs):
+            raise WriteFailed
+        signal.connect(fail, sender=model, weak=False,
+                       dispatch_uid='write_failed')
+        self.addCleanup(signal.disconnect, sender=model,
+                        dispatch_uid='write_failed')
+
+    def _is_managed_in_view(self, request, view):
+        """Return whether the middleware manages the view's transaction."""
+        middleware = WriteTransactionMiddleware()
+        middleware.process_view(request, view, (), {})
+        managed = transaction.is_managed()
+        middleware.process_response(request, HttpResponse())
+        return managed
+
+    def test_only_writes_are_managed(self):
+        """Unsafe requests & marked views are run in a transaction."""
+        def view(request):
+            return HttpResponse()
+
+        self.assertFalse(self._is_managed_in_view(
+            self.factory.get('/'), view))
+        self.assertTrue(self._is_managed_in_view(
+            self.factory.post('/'), view))
+        self.assertTrue(self._is_managed_in_view(
+            self.factory.get('/'), writes_database(view)))
+        self.assertFalse(transaction.is_managed())
+
+    def test_logout_is_managed(self):
+        """Logging out flushes the session, so it is run in a transaction."""
+        self.assertTrue(self._is_managed_in_view(
+            self.factory.get('/logout/'), resolve('/logout/').func))
+
+    def _cache_stale_balance(self):
+        """Cache the Account's balance from before any uncommitted writes.
+
+        This is what a reader on another connection would cache.
+
+        """
+        cache.get_cached_account_value(
+            'balance', self.bank_account.id, [cache.BALANCE_BUCKET], (),
+            lambda: 0)
+
+    def _get_balance_after_view(self, request, write):
+        """Run the writes in a view, then return the cached balance."""
+        def view(request):
+            write()
+            return HttpResponse()
+        middleware = WriteTransactionMiddleware()
+        middleware.process_view(request, view, (), {})
+        middleware.process_response(request, view(request))
+        return cache.get_cached_account_value(
+            'balance', self.bank_account.id, [cache.BALANCE_BUCKET], (),
+            lambda: Account.objects.get(id=self.bank_account.id).balance)
+
+    def test_versions_bumped_again_after_commit(self):
+        """Values cached before a view's writes are committed are stale."""
+        use_local_memory_cache(self)
+
+        def write():
+            entry = create_entry(datetime.date.today(), 'Entry')
+            create_transaction(entry, self.bank_account, 5)
+            self._cache_stale_balance()
+
+        self.assertEqual(
+            self._get_balance_after_view(self.factory.post('/'), write), 5)
+
+    def test_nested_writer_bumps_again_after_commit(self):
+        """Writers managing their own transaction also bump after commit."""
+        use_local_memory_cache(self)
+
+        def write():
+            with commit_on_success_unless_managed():
+                batch = EntryBatch()
+                batch.add_transfer(datetime.date.today(), self.bank_account,
+                                   self.expense_account, 5)
+                batch.save()
+                self._cache_stale_balance()
+
+        self.assertEqual(
+            self._get_balance_after_view(self.factory.get('/'), write), 5)
+
+    def test_entry_is_atomic(self):
+        """An Entry is rolled back if saving a Transaction fails."""
+        self._fail_after_write(Transaction)
+
+        with self.assertRaises(WriteFailed):
+            self.client.post(
+                reverse('entries.views.add_journal_entry'),
+                data={'entry-date': '01/05/2014',
+                      'entry-memo': 'Rolled Back',
+                      'transaction-TOTAL_FORMS': 2,
+                      'transaction-INITIAL_FORMS': 0,
+                      'transaction-MAX_NUM_FORMS': '',
+                      'transaction-0-account': self.bank_account.id,
+                      'transaction-0-debit': 5,
+                      'transaction-1-account': self.expense_account.id,
+                      'transaction-1-credit': 5,
+                      'subbtn': 'Submit'})
+
+        self.assertFalse(JournalEntry.objects.exists())
+        self.assertFalse(Transaction.objects.exists())
+        self.assertEqual(Account.objects.get(id=self.bank_account.id).balance,
+                         0)
+
+    def test_import_is_atomic(self):
+        """A staged Statement is rolled back if staging it fails."""
+        bank_account = BankAccount.objects.create(
+            account=self.bank_account, bank=BankAccount.VCB_CSV_IMPORTER)
+        self._fail_after_write(StatementImport)
+
+        with self.assertRaises(WriteFailed):
+            self.client.post(
+                reverse('bank_import.views.import_bank_statement'),
+                data={'import_file': SimpleUploadedFile(
+                          'import.csv', ',06/24/2016,5369.05,0,,Deposit'),
+                      'bank_account': bank_account.id,
+                      'submit': 'Import'})
+
+        self.assertFalse(StatementImport.objects.exists())
+
+    def test_import_commit_is_atomic(self):
+        """A committed Statement is rolled back if deleting it fails."""
+        bank_account = BankAccount.objects.create(
+            account=self.bank_account, bank=BankAccount.VCB_CSV_IMPORTER)
+        statement_import = StatementImport.objects.create(
+            bank_account=bank_account)
+        StatementLine.objects.create(
+            statement_import=statement_import,
+            date=datetime.date(2016, 6, 24), amount=20,
+            line_type=StatementLine.WITHDRAWAL, account=self.expense_account,
+            memo='Store', ach_payment=True, fingerprint='a' * 40)
+        self._fail_after_write(StatementImport, signal=post_delete)
+
+        with self.assertRaises(WriteFailed):
+            self.client.post(statement_import.get_absolute_url(),
+                             data={'submit': 'Commit'})
+
+        self.assertTrue(StatementImport.objects.exists())
+        self.assertFalse(ImportFingerprint.objects.exists())
+        self.assertFalse(BankSpendingEntry.objects.exists())
+        self.assertFalse(Transaction.objects.exists())
+        self.assertEqual(Account.objects.get(id=self.bank_account.id).balance,
+                         0)
+
+    def test_fiscal_year_close_is_atomic(self):
+        """Closing a Fiscal Year is rolled back if saving the year fails."""
+        equity_header = create_header('Equity', cat_type=3)
+        create_account('Retained Earnings', equity_header, 0, 3)
+        create_account('Current Year Earnings', equity_header, 0, 3)
+        FiscalYear.objects.create(year=2012, end_month=12, period=12)
+        entry = create_entry(datetime.date(2012, 6, 1), 'Purged')
+        create_transaction(entry, self.bank_account, 20)
+        create_transaction(entry, self.expense_account, -20)
+        self._fail_after_write(FiscalYear)
+
+        with self.assertRaises(WriteFailed):
+            self.client.post(
+                reverse('fiscalyears.views.add_fiscal_year'),
+                {'year': 2013,
+                 'end_month': 12,
+                 'period': 12,
+                 'form-TOTAL_FORMS': 1,
+                 'form-INITIAL_FORMS': 1,
+                 'form-MAX_NUM_FORMS': 1,
+                 'form-0-id': self.bank_account.id,
+                 'submit': 'Start New Year'})
+
+        self.assertEqual(FiscalYear.objects.count(), 1)
+        self.assertFalse(HistoricalAccount.objects.exists())
+        self.assertTrue(JournalEntry.objects.filter(id=entry.id).exists())
+        self.assertEqual(
+            Account.objects.get(id=self.expense_account.id).balance, -20)
+
+    def test_profiled_view_exception_rolled_back(self):
+        """A profiled view raising an exception has it's writes undone."""
+        def view(request):
+            create_header('Rolled Back')
+            raise WriteFailed
+        request = self.factory.post('/?__profile')
+        request.user = User(is_superuser=True)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        middleware = WriteTransactionMiddleware()
+        middleware.process_view(request, view, (), {})
+
+        with self.settings(PROFILE_DIRECTORY=directory):
+            with self.assertRaises(WriteFailed):
+                ProfileMiddleware().process_view(request, view, (), {})
+        middleware.process_response(request, HttpResponse(status=500))
+
+        self.assertFalse(transaction.is_managed())
+        self.assertFalse(Header.objects.filter(name='Rolled Back').exists())
+
+
+@override_settings(REPLICA_DATABASE='replica')
+class ReplicaRoutingTests(TestCase):
+    """Test routing the reads of read-only views to a replica."""
+
+    def setUp(self):
+        """Create a view recording the database Accounts are read from."""
+        self.factory = RequestFactory()
+        self.read_from = []
+
+        @replicas.use_replica
+        def view(request):
+            self.read_from.append(router.db_for_read(Account))
+            return HttpResponse()
+        self.view = view
+
+    def test_view_reads_from_replica(self):
+        """Decorated views read from the replica & always write to default."""
+        self.view(self.factory.get('/'))
+
+        self.assertEqual(self.read_from, ['replica'])
+        self.assertEqual(router.db_for_read(Account), 'default')
+        self.assertEqual(router.db_for_write(Account), 'default')
+
+    def test_no_replica_configured(self):
+        """Every read uses the default database without a replica."""
+        with self.settings(REPLICA_DATABASE=None):
+            self.view(self.factory.get('/'))
+
+        self.assertEqual(self.read_from, ['default'])
+
+    def test_pinned_client_reads_from_default(self):
+        """Clients that recently wrote read from the default database."""
+        response = HttpResponse()
+        ReplicaPinningMiddleware().process_response(
+            self.factory.post('/'), response)
+        request = self.factory.get('/')
+        request.COOKIES[replicas.PIN_COOKIE] = (
+            response.cookies[replicas.PIN_COOKIE].value)
+        self.view(request)
+        request.COOKIES[replicas.PIN_COOKIE] = '0'
+        self.view(request)
+
+        self.assertEqual(self.read_from, ['default', 'replica'])
+
+    def test_only_writes_pin_client(self):
+        """The pinning cookie is only set after requests that may write."""
+        middleware = ReplicaPinningMiddleware()
+        get_response = middleware.process_response(
+            self.factory.get('/'), HttpResponse())
+        post_response = middleware.process_response(
+            self.factory.post('/'), HttpResponse())
+
+        self.assertNotIn(replicas.PIN_COOKIE, get_response.cookies)
+        self.assertEqual(
+            post_response.cookies[replicas.PIN_COOKIE]['max-age'], 10)
+
+    def test_replica_reports_cached_separately(self):
+        """Reports built from the replica do not replace default reports."""
+        use_local_memory_cache(self)
+        builds = []
+        today = datetime.date.today()
+
+        def build_report():
+            builds.append(True)
+            return len(builds)
+
+        @replicas.use_replica
+        def view(request):
+            return cache.get_cached_report('test', today, today, build_report)
+
+        from_replica = view(self.factory.get('/'))
+        from_default = cache.get_cached_report(
+            'test', today, today, build_report)
+        shared = view(self.factory.get('/'))
+
+        self.assertEqual((from_replica, from_default, shared), (1, 2, 2))
+
+    def test_replica_account_values_cached_separately(self):
+        """Account values built from the replica are not shared."""
+        use_local_memory_cache(self)
+        builds = []
+
+        def build_value():
+            builds.append(True)
+            return len(builds)
+
+        @replicas.use_replica
+        def view(request):
+            return cache.get_cached_account_value(
+                'test', 1, ['2016-04'], (), build_value)
+
+        from_replica = view(self.factory.get('/'))
+        from_default = cache.get_cached_account_value(
+            'test', 1, ['2016-04'], (), build_value)
+        shared = view(self.factory.get('/'))
+
+        self.assertEqual((from_replica, from_default, shared), (1, 2, 2))
+
+
+class MetricsTests(TestCase):
+    """Test the metrics counted by the ledger & the metrics view."""
+
+    def setUp(self):
+        """Start with no metrics."""
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        self.account = create_account('Account', create_header('Header'), 0)
+
+    def test_created_entries_counted(self):
+        """Saving new Entries & Transactions increments their counters."""
+        entry = create_entry(datetime.date.today(), 'Entry')
+        create_transaction(entry, self.account, 20)
+        create_transaction(entry, self.account, -20)
+        entry.save()
+
+        counters, _ = metrics.collect()
+        self.assertEqual(counters[(metrics.ENTRIES_CREATED,
+                                   (('type', u'JournalEntry'),))], 1)
+        self.assertEqual(counters[(metrics.TRANSACTIONS_POSTED, ())], 2)
+
+    def test_batch_entries_counted(self):
+        """Entries inserted in bulk are counted."""
+        batch = EntryBatch()
+        batch.add_transfer(
+            datetime.date.today(), self.account, self.account, 5)
+        batch.save()
+
+        counters, _ = metrics.collect()
+        self.assertEqual(counters[(metrics.ENTRIES_CREATED,
+                                   (('type', u'JournalEntry'),))], 1)
+        self.assertEqual(counters[(metrics.TRANSACTIONS_POSTED, ())], 2)
+
+    def test_view_renders_metrics(self):
+        """The view shows view latencies, counters & the approval queues."""
+        card = CreditCard.objects.create(account=self.account)
+        CreditCardEntry.objects.create(
+            date=datetime.date.today(), card=card, name='Member',
+            merchant='Store', amount=10)
+        self.client.get(reverse('reports.views.trial_balance_report'))
+
+        response = self.client.get(reverse('metrics'))
+
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        self.assertIn('# TYPE acorn_view_duration_seconds histogram',
+                      response.content)
+        self.assertIn('acorn_view_duration_seconds_count{view='
+                      '"trial_balance_report"} 1', response.content)
+        self.assertIn('acorn_view_duration_seconds_bucket{view='
+                      '"trial_balance_report",le="+Inf"} 1',
+                      response.content)
+        self.assertIn('acorn_pending_approvals{type="CreditCardEntry"} 1',
+                      response.content)
+        self.assertIn('acorn_pending_approvals{type="TripEntry"} 0',
+                      response.content)
+
+    def test_view_requires_allowed_address(self):
+        """Requests from addresses that are not allowed are not found."""
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1')
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_processes_aggregated(self):
+        """The values written by every process are summed."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with open(os.path.join(directory, '1.pickle'), 'wb') as other:
+            pickle.dump({'counters': {(metrics.TRANSACTIONS_POSTED, ()): 3}},
+                        other)
+
+        with self.settings(METRICS_DIRECTORY=directory):
+            metrics.increment(metrics.TRANSACTIONS_POSTED, 2)
+            metrics.observe(metrics.VIEW_DURATION, 0.02, view='show')
+            metrics.observe(metrics.VIEW_DURATION, 20, view='show')
+            exposition = metrics.render()
+
+        self.assertIn('acorn_transactions_posted_total 5', exposition)
+        self.assertIn('acorn_view_duration_seconds_bucket{view="show",'
+                      'le="0.01"} 0', exposition)
+        self.assertIn('acorn_view_duration_seconds_bucket{view="show",'
+                      'le="0.025"} 1', exposition)
+        self.assertIn('acorn_view_duration_seconds_bucket{view="show",'
+                      'le="+Inf"} 2', exposition)
+        self.assertIn('acorn_view_duration_seconds_sum{view="show"} 20.02',
+                      exposition)
+        self.assertTrue(os.path.exists(
+            os.path.join(directory, '{0}.pickle'.format(os.getpid()))))
+
+
+class PooledDatabaseWrapper(pool.PooledConnectionMixin, DatabaseWrapper):
+    """A SQLite DatabaseWrapper taking it's connections from a pool."""
+
+
+class ConnectionPoolTests(TestCase):
+    """Test reusing database connections from a per-process pool."""
+
+    def setUp(self):
+        """Use a pooled database file & empty the metrics."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.settings_dict = dict(
+            connection.settings_dict, NAME=os.path.join(directory, 'db'),
+            POOL={'MAX_SIZE': 1, 'MAX_AGE': 600, 'CHECK_AFTER': 0})
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        self.addCleanup(self._close_pools)
+
+    def _close_pools(self):
+        """Close & forget the pooled connections."""
+        for connection_pool in pool._pools.values():
+            connection_pool.close_all()
+        pool._pools.clear()
+
+    def _get_pool(self):
+        """Return the pool of the test database."""
+        return pool.get_pool('pooled', self.settings_dict['POOL'])
+
+    def _open(self):
+        """Return a wrapper with an open connection to the test database."""
+        db = PooledDatabaseWrapper(self.settings_dict, alias='pooled')
+        db.cursor()
+        return db
+
+    def _get_events(self):
+        """Return the count of each event of the pooled connections."""
+        return dict((dict(labels)['event'], count) for
+                    ((name, labels), count) in metrics.collect()[0].items()
+                    if name == metrics.DB_CONNECTIONS)
+
+    def test_closed_connection_reused(self):
+        """Closing a wrapper lets the next wrapper reuse it's connection."""
+        db = self._open()
+        first_connection = db.connection
+        db.close()
+        other_db = self._open()
+
+        self.assertIsNone(db.connection)
+        self.assertIs(other_db.connection, first_connection)
+        self.assertEqual(self._get_events(), {'created': 1, 'reused': 1})
+        [(_, histogram)] = metrics.collect()[1].items()
+        self.assertEqual(sum(histogram[:-1]), 1)
+
+    def test_pool_size_bounded(self):
+        """Connections returned to a full pool are closed."""
+        (db, other_db) = (self._open(), self._open())
+        db.close()
+        other_db.close()
+
+        self.assertEqual(len(self._get_pool().idle), 1)
+        self.assertEqual(self._get_events(), {'created': 2, 'overflow': 1})
+
+    def test_old_connections_recycled(self):
+        """Connections older than the maximum age are not reused."""
+        self.settings_dict['POOL']['MAX_AGE'] = 0
+        db = self._open()
+        first_connection = db.connection
+        db.close()
+
+        self.assertIsNot(self._open().connection, first_connection)
+        self.assertEqual(self._get_events(), {'created': 2, 'recycled': 1})
+
+    def test_broken_connections_discarded(self):
+        """Idle connections that can not run a query are not reused."""
+        db = self._open()
+        first_connection = db.connection
+        db.close()
+        first_connection.close()
+
+        self.assertIsNot(self._open().connection, first_connection)
+        self.assertEqual(self._get_events(), {'created': 2, 'unusable': 1})
+
+    def test_unpooled_without_setting(self):
+        """Databases without a POOL setting close their connections."""
+        del self.settings_dict['POOL']
+        db = self._open()
+        db.close()
+
+        self.assertIsNone(db.connection)
+        self.assertEqual(self._get_events(), {})
+
+
+@override_settings(SLOW_QUERY_THRESHOLD=0)
+class SlowQueryTests(TestCase):
+    """Test the slow query capturing database backends."""
+
+    def setUp(self):
+        """Record the captured queries on a separate connection."""
+        self.handler = RecordingHandler()
+        logger = logging.getLogger('core.db.slow_queries')
+        logger.addHandler(self.handler)
+        self.addCleanup(logger.removeHandler, self.handler)
+        settings_dict = dict(connection.settings_dict, NAME=':memory:')
+        self.db = DatabaseWrapper(settings_dict, alias='slow')
+        self.addCleanup(self.db.close)
+
+    def _get_captures(self):
+        """Return the captured queries."""
+        return [json.loads(record.getMessage())
+                for record in self.handler.records]
+
+    def _manage_transactions(self):
+        """Manage the connection's transactions until the test ends."""
+        self.db.enter_transaction_management()
+        self.db.managed(True)
+        self.addCleanup(self.db.leave_transaction_management)
+        self.addCleanup(self.db.rollback)
+
+    def test_slow_select_captured_with_plan(self):
+        """Slow queries are logged with their plan & calling function."""
+        cursor = self.db.cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = %s",
+                       ['table'])
+
+        [capture] = self._get_captures()
+        self.assertEqual(capture['sql'],
+                         "SELECT name FROM sqlite_master WHERE type = %s")
+        self.assertEqual(capture['params'], ['table'])
+        self.assertEqual(capture['database'], 'slow')
+        self.assertTrue(capture['plan'])
+        self.assertIn('test_slow_select_captured_with_plan',
+                      capture['caller'])
+        self.assertTrue(capture['caller'].startswith('core/tests.py:'))
+
+    def test_fast_queries_ignored(self):
+        """Queries faster than the threshold are not logged."""
+        with self.settings(SLOW_QUERY_THRESHOLD=60):
+            self.db.cursor().execute("SELECT 1")
+
+        self.assertEqual(self.handler.records, [])
+
+    def test_writes_not_explained(self):
+        """Only SELECT queries are explained, since EXPLAIN runs them."""
+        cursor = self.db.cursor()
+        cursor.execute("CREATE TABLE slow (id integer)")
+        cursor.execute("INSERT INTO slow VALUES (%s)", [1])
+
+        self.assertEqual(
+            [capture['plan'] for capture in self._get_captures()], [[], []])
+
+    def test_failed_explain_rolled_back_to_savepoint(self):
+        """A failed EXPLAIN leaves the connection's transaction usable."""
+        self.db.features.uses_savepoints = True
+        self.db.ops.savepoint_create_sql = 'SAVEPOINT {0}'.format
+        self.db.ops.savepoint_rollback_sql = 'ROLLBACK TO SAVEPOINT {0}'.format
+        self.db.ops.savepoint_commit_sql = 'RELEASE SAVEPOINT {0}'.format
+        self._manage_transactions()
+        cursor = self.db.cursor()
+        self.db.connection.isolation_level = None
+        cursor.execute("BEGIN")
+        cursor.execute("CREATE TABLE slow (id integer)")
+        cursor.execute("INSERT INTO slow VALUES (%s)", [1])
+
+        [line] = slow_queries.explain(
+            self.db, "SELECT id FROM missing WHERE id = %s", [1])
+        cursor.execute("SELECT id FROM slow")
+
+        self.assertTrue(line.startswith('Could not explain the query: '))
+        self.assertEqual(cursor.fetchall(), [(1,)])
+        with self.assertRaises(DatabaseError):
+            cursor.execute(self.db.ops.savepoint_commit_sql(
+                slow_queries.EXPLAIN_SAVEPOINT))
+
+    def test_no_savepoint_outside_managed_transactions(self):
+        """Autocommit connections explain queries without a savepoint."""
+        self.db.features.uses_savepoints = True
+        self.db.ops.savepoint_create_sql = 'NOT A SAVEPOINT {0}'.format
+
+        plan = slow_queries.explain(
+            self.db, "SELECT name FROM sqlite_master WHERE type = %s",
+            ['table'])
+
+        self.assertFalse(plan[0].startswith('Could not explain the query'))
+
+    def test_failed_savepoint_logged(self):
+        """A savepoint that can not be created does not fail the caller."""
+        self.db.features.uses_savepoints = True
+        self.db.ops.savepoint_create_sql = 'NOT A SAVEPOINT {0}'.format
+        self._manage_transactions()
+
+        [line] = slow_queries.explain(
+            self.db, "SELECT name FROM sqlite_master WHERE type = %s",
+            ['table'])
+
+        self.assertTrue(line.startswith('Could not explain the query: '))
+
+    def test_analyze_only_when_enabled(self):
+        """Queries are only run again by EXPLAIN ANALYZE if enabled."""
+        self.db.analyze_prefix = 'EXPLAIN '
+        sql = "SELECT name FROM sqlite_master WHERE type = %s"
+
+        plan = slow_queries.explain(self.db, sql, ['table'])
+        with self.settings(SLOW_QUERY_ANALYZE=True):
+            analyzed_plan = slow_queries.explain(self.db, sql, ['table'])
+
+        self.assertNotIn('Init', ' '.join(plan))
+        self.assertIn('Init', ' '.join(analyzed_plan))
+
+
+class SlowQueriesCommandTests(TestCase):
+    """Test the command summarizing the slow query log."""
+
+    def setUp(self):
+        """Write a log & a rotated backup of captured queries."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'slow_queries.log')
+        self._write_captures(self.path + '.1', [
+            ('SELECT history', 2, 'accounts/views.py:10 history'),
+            ('SELECT balance', 1, 'accounts/models.py:20 balance')])
+        self._write_captures(self.path, [
+            ('SELECT history', 3, 'accounts/views.py:10 history'),
+            ('SELECT memo', 0.5, 'bank_import/staging.py:30 match')])
+
+    def _write_captures(self, path, captures):
+        """Write a line of JSON for each ``(sql, duration, caller)``."""
+        with open(path, 'w') as log_file:
+            for (sql, duration, caller) in captures:
+                log_file.write(json.dumps({
+                    'sql': sql, 'duration': duration, 'caller': caller,
+                    'view': caller, 'plan': ['SCAN ' + sql]}) + '\n')
+
+    def test_worst_queries_summarized(self):
+        """Queries are grouped & ordered by their total time."""
+        output = io.BytesIO()
+        call_command('slow_queries', self.path, limit=2, plans=True,
+                     stdout=output)
+
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines[0], "1. 2 runs, 5.000s total, 2.500s mean, "
+                                   "3.000s max")
+        self.assertEqual(lines[1], "    SELECT history")
+        self.assertEqual(lines[2], "    Called by: accounts/views.py:10 "
+                                   "history (2)")
+        self.assertEqual(lines[4], "        SCAN SELECT history")
+        self.assertIn("2. 1 runs, 1.000s total", output.getvalue())
+        self.assertNotIn("SELECT memo", output.getvalue())
+
+    def test_empty_log_raises_error(self):
+        """Summarizing a missing log is an error."""
+        self.assertRaises(SystemExit, call_command, 'slow_queries',
+                          self.path + '.missing', stderr=io.BytesIO())
+
+
+class GenerateDataCommandTests(TestCase):
+    """Test the command generating a synthetic ledger."""
+
+    def _generate(self):
+        """Generate a small ledger."""
+        call_command('generatedata', years=1, entries_per_day=3, accounts=10,
+                     header_depth=1, events=2, banks=1, credit_card_entries=2,
+                     trip_entries=3, stdout=io.BytesIO())
+
+    def test_ledger_is_balanced(self):
+        """Every Account's balance is the total of it's Transactions."""
+        self._generate()
+
+        self.assertEqual(JournalEntry.objects.count(),
+                         BankSpendingEntry.objects.count())
+        self.assertEqual(CreditCardEntry.objects.count(), 2)
+        self.assertEqual(TripEntry.objects.count(), 3)
+        self.assertEqual(Transaction.objects.aggregate(
+            Sum('balance_delta'))['balance_delta__sum'], 0)
+        for account in Account.objects.all():
+            self.assertEqual(
+                account.balance, account.transaction_set.aggregate(
+                    Sum('balance_delta'))['balance_delta__sum'] or 0)
+        for entry in BankSpendingEntry.objects.all()[:5]:
+            self.assertEqual(entry.main_transaction.balance_delta,
+                             -1 * entry.transaction_set.aggregate(
+                                 Sum('balance_delta'))['balance_delta__sum'])
+
+    def test_chart_matches_saved_chart(self):
+        """The numbers & trees are the same as saving each row would set."""
+        self._generate()
+        tree_fields = ('tree_id', 'lft', 'rght', 'level')
+        headers = list(Header.objects.values_list('id', *tree_fields))
+
+        Header.objects.rebuild()
+
+        self.assertItemsEqual(
+            Header.objects.values_list('id', *tree_fields), headers)
+        for item in list(Header.objects.all()) + list(Account.objects.all()):
+            self.assertEqual(item.full_number, item._calculate_full_number())
+
+    def test_ledger_must_be_empty(self):
+        """Generating data into an existing ledger is an error."""
+        create_header('Existing Header')
+
+        self.assertRaises(SystemExit, self._generate)
+        self.assertEqual(Transaction.objects.count(), 0)
+
+
+class ImportMyobCommandTests(TestCase):
+    """Test the command importing Accounts & Entries exported from MYOB."""
+
+    def setUp(self):
+        """Create the Headers & Event, then write the MYOB exports."""
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        create_header('Assets', cat_type=1)
+        create_header('Expenses', cat_type=6)
+        self.event = Event.objects.create(
+            name='Event', abbreviation='EV', date=datetime.date.today(),
+            city='City', state='VA')
+        self._write_export('ACCOUNTS.TXT', [
+            '1-0000\tAssets\tH\t$1,000.00',
+            '1-1100\tChecking\tD\t$1,000.00',
+            '6-0000\tExpenses\tH\t$0.00',
+            '6-1000\tRent\tD\t$85.00'])
+        self._write_export('EVENTS.TXT', ['JOB1 {0}'.format(self.event.id)])
+        self.journal = [
+            'GJ000001\t01/05/2013\tRent\t61000\t$100.00\t\tJOB1',
+            'GJ000001\t01/05/2013\tRent\t11100\t\t$100.00\t',
+            '',
+            'CR000001\t01/06/2013\tRefund\t11100\t$50.00\t\t',
+            'CR000001\t01/06/2013\tRefund\t61000\t\t$50.00\t',
+            '',
+            '001234\t01/07/2013\tVoid Check\t11100\t\t\t',
+            '001234\t01/07/2013\tVoid Check\t61000\t\t\t',
+            '',
+            '##0001\t01/08/2013\tBill\t11100\t\t$25.00\t',
+            '##0001\t01/08/2013\tBill\t61000\t$25.00\t\t',
+            '',
+            '001235\t01/09/2013\t\t11100\t\t$10.00\t',
+            '001235\t01/09/2013\t\t61000\t$10.00\t\t']
+        self._write_export('JOURNAL.TXT', self.journal)
+        self.checkpoint_path = os.path.join(
+            self.directory, 'myob_import.json')
+
+    def _write_export(self, name, lines):
+        """Write the lines of an export with MYOB's line endings."""
+        with open(os.path.join(self.directory, name), 'wb') as export_file:
+            export_file.write(''.join(line + '\r\n' for line in lines))
+
+    def _import(self, **options):
+        """Import the exports in the directory."""
+        call_command('import_myob', self.directory, stdout=io.BytesIO(),
+                     stderr=io.BytesIO(), **options)
+
+    def _assert_imported(self):
+        """The Entries are imported once & the balances are correct."""
+        self.assertEqual(JournalEntry.objects.count(), 1)
+        self.assertEqual(BankReceivingEntry.objects.count(), 1)
+        self.assertEqual(BankSpendingEntry.objects.count(), 2)
+        self.assertEqual(Transaction.objects.count(), 8)
+        self.assertEqual(Account.objects.get(name='Checking').balance, -915)
+        self.assertEqual(Account.objects.get(name='Rent').balance, -85)
+
+    def test_exports_imported(self):
+        """Accounts, Entries & balances are created from the exports."""
+        self._import(chunk_size=2)
+
+        self._assert_imported()
+        for account in Account.objects.all():
+            self.assertEqual(account.full_number,
+                             account._calculate_full_number())
+        rent = Transaction.objects.get(journal_entry__isnull=False,
+                                       account__name='Rent')
+        self.assertEqual(rent.event, self.event)
+        self.assertEqual(rent.date, datetime.date(2013, 1, 5))
+        check = BankSpendingEntry.objects.get(check_number='001235')
+        self.assertEqual(check.memo, '2013-01-09')
+        self.assertEqual(check.main_transaction.balance_delta, 10)
+        self.assertEqual(check.transaction_set.get().balance_delta, -10)
+
+    def test_interrupted_import_resumes(self):
+        """Running the import again continues after the last chunk."""
+        self._write_export('JOURNAL.TXT', self.journal[:-5] + [
+            '##0001\t01/08/2013\tBill\t99999\t\t$25.00\t'])
+
+        self.assertRaises(SystemExit, self._import, chunk_size=1)
+        self.assertEqual(Transaction.objects.count(), 4)
+
+        self._write_export('JOURNAL.TXT', self.journal)
+        self._import(chunk_size=1)
+
+        self._assert_imported()
+
+    def test_committed_pending_chunk_is_skipped(self):
+        """A chunk committed before the checkpoint was written is skipped."""
+        self._import()
+        with open(self.checkpoint_path) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        checkpoint['pending'] = {'position': checkpoint['position'],
+                                 'entries': checkpoint['entries']}
+        checkpoint.update(position=0, entries=0)
+        with open(self.checkpoint_path, 'w') as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file)
+
+        self._import()
+
+        self._assert_imported()
+
+    def test_changed_ledger_is_not_resumed(self):
+        """Resuming is an error if the ledger does not match the checkpoint."""
+        self._import()
+        JournalEntry.objects.all().delete()
+
+        self.assertRaises(SystemExit, self._import)
+
+
+class VerifyLedgerCommandTests(TestCase):
+    """Test the command checking the ledger against it's Transactions."""
+
+    def setUp(self):
+        """Create a Journal Entry & a Bank Spending Entry."""
+        asset_header = create_header('Assets', cat_type=1)
+        expense_header = create_header('Expenses', cat_type=6)
+        self.bank = create_account('Bank', asset_header, 0, 1, bank=True)
+        self.expense = create_account('Expense', expense_header, 0, 6)
+        self.entry = create_entry(datetime.date.today(), 'Entry')
+        create_transaction(self.entry, self.bank, 20)
+        create_transaction(self.entry, self.expense, -20)
+        batch = EntryBatch()
+        self.spending = batch.add_spending(
+            datetime.date.today(), 'Spending', self.bank, self.expense, 5,
+            ach_payment=True)
+        batch.save()
+
+    def _verify(self, **options):
+        """Verify the ledger, returning the output."""
+        output = io.BytesIO()
+        try:
+            call_command('verify_ledger', workers=1, stdout=output,
+                         stderr=io.BytesIO(), **options)
+        except SystemExit:
+            return output.getvalue(), False
+        return output.getvalue(), True
+
+    def test_consistent_ledger(self):
+        """A ledger maintained by the signals has no problems."""
+        (output, consistent) = self._verify()
+
+        self.assertTrue(consistent)
+        self.assertEqual(output, "The ledger is consistent.\n")
+
+    def test_problems_are_reported(self):
+        """Drifted balances, unbalanced & void Entries are reported."""
+        Account.objects.filter(id=self.expense.id).update(balance=3)
+        create_transaction(self.entry, self.bank, 1)
+        BankSpendingEntry.objects.filter(id=self.spending.id).update(
+            void=True)
+        Transaction.objects.filter(account=self.bank).update(reconciled=True)
+
+        (output, consistent) = self._verify()
+
+        self.assertFalse(consistent)
+        self.assertIn("Account #{0} (balance): the balance is 3".format(
+            self.expense.id), output)
+        self.assertIn("JournalEntry #{0} (entry_balance)".format(
+            self.entry.id), output)
+        self.assertIn("BankSpendingEntry #{0} (void_entry)".format(
+            self.spending.id), output)
+        self.assertIn("Account #{0} (reconciled_balance)".format(
+            self.bank.id), output)
+
+    def test_repair(self):
+        """Void Entries are emptied & balances are set from Transactions."""
+        Account.objects.filter(id=self.bank.id).update(balance=100)
+        BankSpendingEntry.objects.filter(id=self.spending.id).update(
+            void=True)
+
+        (output, consistent) = self._verify(repair=True)
+
+        self.assertTrue(consistent)
+        self.assertIn("(void_entry): it is void, but has 1 Transactions & a "
+                      "main Transaction of 5", output)
+        self.assertIn("(balance): the balance is 100", output)
+        self.assertEqual(Account.objects.get(id=self.bank.id).balance, 20)
+        self.assertEqual(Account.objects.get(id=self.expense.id).balance, -20)
+        self.assertTrue(self._verify()[1])
+
+    def test_checkpoint_skips_checked_ranges(self):
+        """Ranges in the checkpoint are not checked again."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'verify.json')
+        with open(path, 'w') as checkpoint_file:
+            json.dump({'checked': [['Account', 1, 500, None]],
+                       'problems': []}, checkpoint_file)
+        Account.objects.filter(id=self.bank.id).update(balance=100)
+
+        (output, consistent) = self._verify(checkpoint=path)
+
+        self.assertTrue(consistent)
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(self._verify()[1])
+
+
+class RebuildBalancesCommandTests(TestCase):
+    """Test the command rebuilding the Account balances."""
+
+    def test_changed_balances_are_listed(self):
+        """Drifted balances are rebuilt & listed."""
+        header = create_header('Header')
+        account = create_account('Drifted', header, 0)
+        other = create_account('Other', header, 0)
+        entry = create_entry(datetime.date.today(), 'Entry')
+        create_transaction(entry, account, 20)
+        create_transaction(entry, other, -20)
+        Account.objects.filter(id=account.id).update(balance=3)
+        output = io.BytesIO()
+
+        call_command('rebuild_balances', stdout=output)
+
+        lines = output.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith("Drifted: 3"))
+        self.assertTrue(lines[1].startswith(
+            "Rebuilt 2 Account balances, 1 changed"))
+        self.assertEqual(Account.objects.get(id=account.id).balance, 20)
+
+
+class BenchmarkCommandTests(TestCase):
+    """Test the command timing a workload against a generated ledger."""
+
+    def setUp(self):
+        """Generate a small ledger."""
+        call_command('generatedata', years=1, entries_per_day=3, accounts=10,
+                     header_depth=1, events=2, banks=1, credit_card_entries=3,
+                     trip_entries=0, stdout=io.BytesIO())
+
+    def _benchmark(self, **options):
+        """Run the benchmark & return it's parsed report."""
+        output = io.BytesIO()
+        call_command('benchmark', interactive=False, stdout=output,
+                     **options)
+        return json.loads(output.getvalue())
+
+    def test_every_step_is_reported(self):
+        """Each step reports it's latency percentiles & query counts."""
+        fiscal_year = FiscalYear.objects.get()
+
+        report = self._benchmark(iterations=2, label='test')
+
+        self.assertEqual(report['label'], 'test')
+        self.assertEqual(set(report['steps']), set(
+            name for (name, _, _) in benchmark.STEPS))
+        for (name, summary) in report['steps'].items():
+            expected_requests = 1 if name == 'fiscal_year_close' else 2
+            self.assertEqual(summary['requests'], expected_requests)
+            self.assertLessEqual(summary['p50_ms'], summary['p99_ms'])
+            self.assertGreater(summary['queries_max'], 0)
+        self.assertEqual(CreditCardEntry.objects.count(), 1)
+        self.assertEqual(FiscalYear.objects.latest().year,
+                         fiscal_year.year + 1)
+        self.assertFalse(User.objects.exists())
+
+    def test_read_only_steps(self):
+        """The write steps can be skipped & steps can be chosen by name."""
+        entry_count = JournalEntry.objects.count()
+
+        report = self._benchmark(
+            iterations=1, read_only=True,
+            steps='trial_balance,add_journal_entry')
+
+        self.assertEqual(report['steps'].keys(), ['trial_balance'])
+        self.assertEqual(JournalEntry.objects.count(), entry_count)
+
+    def test_percentile_uses_nearest_rank(self):
+        """The percentile is the smallest value covering the percentage."""
+        values = range(1, 101)
+
+        self.assertEqual(benchmark.percentile(values, 50), 50)
+        self.assertEqual(benchmark.percentile(values, 99), 99)
+        self.assertEqual(benchmark.percentile([7], 95), 7)
+
+
+class ProfileMiddlewareTests(TestCase):
+    """Test profiling single requests with the ProfileMiddleware."""
+
+    def setUp(self):
+        """Write profiles to a temporary directory."""
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        create_account('Account', create_header('Header'), 0)
+        self.url = reverse('reports.views.trial_balance_report')
+
+    def _login(self, is_superuser):
+        """Create & login a User."""
+        user = User.objects.create_user(
+            'profiler', 'profiler@test.com', 'password')
+        user.is_superuser = is_superuser
+        user.save()
+        self.client.login(username='profiler', password='password')
+
+    def test_superuser_profile_written(self):
+        """Superusers get the stats & flame summary of the view."""
+        self._login(is_superuser=True)
+        with self.settings(PROFILE_DIRECTORY=self.directory):
+            response = self.client.get(self.url, {'__profile': ''})
+
+        self.assertEqual(response.status_code, 200)
+        stats_name = response['X-Profile']
+        self.assertTrue(stats_name.endswith('-trial_balance_report.prof'))
+        stats = pstats.Stats(os.path.join(self.directory, stats_name))
+        self.assertTrue(any(function[2] == 'trial_balance_report'
+                            for function in stats.stats))
+        with open(os.path.join(self.directory, stats_name[:-5] +
+                               '.html')) as html_file:
+            self.assertIn('trial_balance_report', html_file.read())
+
+    def test_profile_header(self):
+        """The X-Profile request header also profiles the view."""
+        self._login(is_superuser=True)
+        with self.settings(PROFILE_DIRECTORY=self.directory):
+            response = self.client.get(self.url, HTTP_X_PROFILE='1')
+
+        self.assertTrue(response.has_header('X-Profile'))
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+    def test_other_users_not_profiled(self):
+        """Requests by other Users are not profiled."""
+        self._login(is_superuser=False)
+        with self.settings(PROFILE_DIRECTORY=self.directory):
+            response = self.client.get(self.url, {'__profile': ''})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('X-Profile'))
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+class LedgerSeeder(object):
+    """Seed a ledger whose size is set by the number of rows per batch.
+
+    Every call to :meth:`add_batch` adds the same number of Headers,
+    Accounts, Events & Entries, so the ledger can be grown by a known factor.
+    Each batch's Entries also use the same Expense :attr:`account`, Bank
+    Account, :attr:`event` & Credit Card, so their pages grow with the
+    ledger.
+
+    """
+
+    def __init__(self, headers=1, accounts=2, events=1, entries=2):
+        """Create the rows every page needs & set the rows per batch."""
+        self.headers = headers
+        self.accounts = accounts
+        self.events = events
+        self.entries = entries
+        self.batches = 0
+        self.today = datetime.date.today()
+        FiscalYear.objects.create(
+            year=self.today.year, end_month=12, period=12)
+        self.roots = dict(
+            (cat_type, create_header('Root {0}'.format(cat_type),
+                                     cat_type=cat_type))
+            for cat_type in range(1, 9))
+        self.bank_account = create_account(
+            'Bank Account', self.roots[1], 0, cat_type=1, bank=True)
+        self.trip_advances = create_account(
+            'Trip Advances', self.roots[1], 0, cat_type=1)
+        self.account = create_account(
+            'Expense Account', self.roots[6], 0, cat_type=6)
+        self.event = self._create_event('Event', 'EVT')
+        self.card = CreditCard.objects.create(account=self.bank_account)
+        self.store = StoreAccount.objects.create(account=self.trip_advances)
+
+    def add_batch(self):
+        """Add another batch of rows to the ledger."""
+        self.batches += 1
+        accounts = []
+        for (cat_type, root) in self.roots.items():
+            for header_number in range(self.headers):
+                header = create_header('Header {0}-{1}-{2}'.format(
+                    self.batches, cat_type, header_number), root, cat_type)
+                for account_number in range(self.accounts):
+                    accounts.append(create_account(
+                        'Account {0}-{1}-{2}-{3}'.format(
+                            self.batches, cat_type, header_number,
+                            account_number), header, 0, cat_type))
+        last_year = datetime.date(self.today.year - 1, self.today.month, 1)
+        for account in accounts:
+            HistoricalAccount.objects.create(
+                account=account, number=account.get_full_number(),
+                name=account.name, type=account.type, amount=5,
+                date=last_year)
+        events = [self.event] + [
+            self._create_event('Event {0}-{1}'.format(self.batches, number),
+                               'E{0}X{1}'.format(self.batches, number))
+            for number in range(self.events)]
+        HistoricalEvent.objects.create(
+            name='Old Event {0}'.format(self.batches), date=last_year,
+            city='City', state='VA', credit_total=5, debit_total=-5,
+            net_change=0)
+        for number in range(self.entries):
+            account = accounts[number % len(accounts)]
+            entry = create_entry(self.today, 'Entry {0}'.format(number))
+            for (entry_account, delta) in ((account, 10), (self.account, -10)):
+                Transaction.objects.create(
+                    journal_entry=entry, account=entry_account,
+                    detail='Detail', balance_delta=delta,
+                    event=events[number % len(events)])
+            batch = EntryBatch()
+            batch.add_spending(self.today, 'Spent', self.bank_account,
+                               account, 10, payee='Payee',
+                               check_number=str(self.batches * 1000 + number))
+            batch.add_receiving(self.today, 'Received', self.bank_account,
+                                self.account, 10, payor='Payor')
+            batch.add_transfer(self.today, self.bank_account, account, 5)
+            batch.save()
+            card_entry = CreditCardEntry.objects.create(
+                date=self.today, card=self.card, name='Member',
+                merchant='Store', amount=10)
+            CreditCardTransaction.objects.create(
+                creditcard_entry=card_entry, account=account,
+                detail='Detail', amount=10)
+            trip_entry = TripEntry.objects.create(
+                date=self.today, name='Member', number=str(number),
+                total_trip_advance=20, amount=10)
+            TripTransaction.objects.create(
+                trip_entry=trip_entry, account=account, detail='Detail',
+                amount=10)
+            TripStoreTransaction.objects.create(
+                trip_entry=trip_entry, store=self.store, account=account,
+                detail='Detail', amount=5)
+
+    def _create_event(self, name, abbreviation):
+        """Return a new Event happening today."""
+        return Event.objects.create(
+            name=name, abbreviation=abbreviation, date=self.today,
+            city='City', state='VA')
+
+
+class QueryBudgetTests(TestCase):
+    """Ensure every page runs a fixed number of queries.
+
+    The queries of each page are counted with a small ledger, then again
+    after the ledger is grown ``QUERY_BUDGET_SCALE`` times. The counts must
+    not change & must not exceed the page's budget.
+
+    """
+    SCALE = int(os.environ.get('QUERY_BUDGET_SCALE', 10))
+
+    def setUp(self):
+        """Seed a small ledger & login as a superuser."""
+        user = User.objects.create_user(
+            'budget', 'budget@test.com', 'password')
+        user.is_superuser = True
+        user.save()
+        self.client.login(username='budget', password='password')
+        self.seeder = LedgerSeeder()
+        self.seeder.add_batch()
+
+    def _get_pages(self):
+        """Return the budget & URL of every page, keyed by a label."""
+        account = self.seeder.account
+        bank_account = self.seeder.bank_account
+        header = self.seeder.roots[6]
+        event = self.seeder.event
+        entry = JournalEntry.objects.order_by('id')[0]
+        spending = BankSpendingEntry.objects.order_by('id')[0]
+        receiving = BankReceivingEntry.objects.order_by('id')[0]
+        card_entry = CreditCardEntry.objects.order_by('id')[0]
+        trip_entry = TripEntry.objects.order_by('id')[0]
+        history_date = HistoricalAccount.objects.order_by('date')[0].date
+        return {
+            'homepage': (42, reverse('homepage')),
+            'accounts chart': (42, '/accounts/'),
+            'header chart': (14, '/accounts/header/{0}/'.format(header.slug)),
+            'account detail': (23, reverse(
+                'show_account_detail', args=[account.slug])),
+            'reconcile': (10, '/accounts/{0}/reconcile/'.format(
+                bank_account.slug)),
+            'account history': (15, '/accounts/history/'),
+            'account history month': (13, '/accounts/history/{0}/{1}/'.format(
+                history_date.year, history_date.month)),
+            'bank journal': (12, reverse(
+                'bank_journal', args=[bank_account.slug])),
+            'accounts query': (1, reverse('accounts_query') + '?q=account'),
+            'journal ledger': (13, '/entries/journal/'),
+            'add journal entry': (32, '/entries/add/'),
+            'add transfer': (9, '/entries/add/transfer/'),
+            'add spending': (18, '/entries/add/CD/'),
+            'edit journal entry': (39, '/entries/edit/GJ/{0}/'.format(
+                entry.id)),
+            'edit spending': (25, '/entries/edit/CD/{0}/'.format(
+                spending.id)),
+            'journal entry': (20, entry.get_absolute_url()),
+            'spending entry': (17, spending.get_absolute_url()),
+            'receiving entry': (17, receiving.get_absolute_url()),
+            'event': (12, event.get_absolute_url()),
+            'fiscal year': (11, '/fiscal-years/'),
+            'events report': (12, '/reports/events/'),
+            'profit loss report': (29, '/reports/profit-loss/'),
+            'trial balance report': (19, '/reports/trial-balance/'),
+            'credit card list': (10, reverse(
+                'creditcards.views.list_creditcard_entries')),
+            'credit card entry': (14, reverse(
+                'creditcards.views.show_creditcard_entry',
+                args=[card_entry.id])),
+            'edit credit card entry': (15, reverse(
+                'creditcards.views.add_creditcard_entry',
+                args=[card_entry.id])),
+            'trip list': (10, reverse('trips.views.list_trip_entries')),
+            'trip entry': (18, reverse(
+                'trips.views.show_trip_entry', args=[trip_entry.id])),
+            'edit trip entry': (20, reverse(
+                'trips.views.add_trip_entry', args=[trip_entry.id])),
+            'bank import': (11, reverse(
+                'bank_import.views.import_bank_statement')),
+            'metrics': (2, reverse('metrics')),
+        }
+
+    def _count_queries(self):
+        """Return the number of queries run by each page."""
+        counts = {}
+        for (label, (_, url)) in self._get_pages().items():
+            # The first request may save lazily calculated values
+            self._get(url)
+            connection.use_debug_cursor = True
+            try:
+                response = self._get(url)
+            finally:
+                connection.use_debug_cursor = None
+            self.assertEqual(response.status_code, 200, label)
+            # The queries are reset when each request starts
+            counts[label] = len(connection.queries)
+        return counts
+
+    def _get(self, url):
+        """Request the page as an AJAX request, so the AJAX views respond."""
+        return self.client.get(url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def test_query_counts_within_budget(self):
+        """Each page runs a constant number of queries, within it's budget."""
+        small_counts = self._count_queries()
+        for _ in range(self.SCALE - 1):
+            self.seeder.add_batch()
+        large_counts = self._count_queries()
+
+        failures = []
+        for (label, (budget, _)) in sorted(self._get_pages().items()):
+            if small_counts[label] != large_counts[label]:
+                failures.append('{0}: {1} queries grew to {2}'.format(
+                    label, small_counts[label], large_counts[label]))
+            elif large_counts[label] > budget:
+                failures.append('{0}: {1} queries, budget is {2}'.format(
+                    label, large_counts[label], budget))
+        self.assertEqual(failures, [])
@@ -1,6 +1,8 @@
 from django.conf.urls import patterns, url
+from django.contrib.auth.views import logout
 
 from .forms import BootstrapAuthenticationForm
+from .middleware import writes_database
 
 
 urlpatterns = patterns(
@@ -11,6 +13,8 @@ urlpatterns = patterns(
         {'template_name': 'login.html',
          'authentication_form': BootstrapAuthenticationForm},
         name='login'),
-    url(r'^logout/$', 'django.contrib.auth.views.logout', {'next_page': '/'},
+    # Logging out flushes the session from the database for GET requests
+    url(r'^logout/$', writes_database(logout), {'next_page': '/'},
         name='logout'),
+    url(r'^metrics/$', 'core.views.show_metrics', name='metrics'),
 )
@@ -1,13 +1,25 @@
 """Abstract views used throughout the application."""
+from django.conf import settings
 from django.contrib import messages
 from django.core.urlresolvers import reverse
-from django.http import HttpResponseRedirect, Http404
+from django.http import HttpResponse, HttpResponseRedirect, Http404
 from django.shortcuts import render, get_object_or_404
 
+from creditcards.models import CreditCardEntry
+from trips.models import TripEntry
 
-def list_entries(request, template_name, entry_class):
-    """Return a response for listing all specified Entries."""
+from . import metrics
+
+
+def list_entries(request, template_name, entry_class, related_fields=()):
+    """Return a response for listing all specified Entries.
+
+    The ``related_fields`` shown for each Entry are selected along with them.
+
+    """
     entries = entry_class.objects.all()
+    if related_fields:
+        entries = entries.select_related(*related_fields)
     return render(request, template_name, {'entries': entries})
 
 
@@ -19,6 +31,22 @@ def show_single_entry(request, entry_id, template_name, entry_class):
                    'transactions': entry.transaction_set.all()})
 
 
+def show_metrics(request):
+    """Return the metrics of every process in the Prometheus text format.
+
+    Only requests from the ``METRICS_ALLOWED_IPS`` are served.
+
+    """
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise Http404
+    gauges = dict(
+        ((metrics.PENDING_APPROVALS, (('type', entry_class.__name__),)),
+         entry_class.objects.count())
+        for entry_class in (CreditCardEntry, TripEntry))
+    return HttpResponse(
+        metrics.render(gauges), content_type=metrics.CONTENT_TYPE)
+
+
 class AddApprovableEntryView(object):
     """A View for adding, editing, approving and deleting Approvable Entries
 
@@ -155,6 +183,8 @@ class AddApprovableEntryView(object):
     def _approve_and_redirect(self, request, redirect_to_next):
         """Approve the Entry and redirect to the proper page."""
         journal_entry = self.entry.approve_entry()
+        metrics.increment(
+            metrics.ENTRIES_APPROVED, type=self.entry_class.__name__)
         messages.success(request, (
             "Approved the {} Entry & Created <a href='{}' "
             "target='_blank'>{}</a>.".format(
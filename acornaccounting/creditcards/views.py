@@ -10,7 +10,8 @@ from .models import CreditCardEntry, CreditCardReceipt
 @login_required
 def list_creditcard_entries(request, template_name='creditcards/list.html'):
     """Retrieve every :class:`CreditCardEntry`."""
-    return list_entries(request, template_name, CreditCardEntry)
+    return list_entries(request, template_name, CreditCardEntry,
+                        related_fields=('card',))
 
 
 def show_creditcard_entry(request, entry_id,
@@ -0,0 +1,131 @@
+"""Create Many Entries with Bulk Queries.
+
+Saving Entries one at a time runs several queries per Entry, and the
+``accounts.signals`` receivers update an Account balance for every
+:class:`~.models.Transaction`. The :class:`EntryBatch` instead validates the
+Entries as they are added, then inserts each table with batched
+``bulk_create`` & updates each Account's balance once. The cached values of
+the changed Accounts & months are invalidated in one pass & the new rows are
+counted in :mod:`core.metrics`.
+
+"""
+from collections import defaultdict
+
+from accounts.models import Account
+from core import metrics
+from core.cache import bump_account_versions
+from core.db.bulk import assign_ids, bulk_create
+from core.db.transactions import commit_on_success_unless_managed
+
+from .models import (JournalEntry, BankSpendingEntry, BankReceivingEntry,
+                     Transaction)
+
+
+#: The relations that are only linked once the primary keys are reserved.
+TRANSACTION_RELATIONS = ['account', 'journal_entry', 'bankspend_entry',
+                         'bankreceive_entry', 'event']
+
+
+class EntryBatch(object):
+    """Collect new Entries & their Transactions to insert all at once.
+
+    No signals are sent for the inserted rows, the Account balances are
+    adjusted directly by :meth:`save`.
+
+    """
+
+    def __init__(self):
+        """Start with no Entries or Transactions."""
+        self.entries = defaultdict(list)
+        self.transactions = []
+        self.main_transactions = []
+        self.entry_relations = []
+
+    def __len__(self):
+        """Return the number of Entries in the batch."""
+        return sum(len(entries) for entries in self.entries.values())
+
+    def add_transfer(self, date, source, destination, amount,
+                     memo='Bank Transfer'):
+        """Add a JournalEntry moving the amount from source to destination."""
+        entry = self._add_entry(JournalEntry(date=date, memo=memo))
+        self._add_transaction(entry, 'journal_entry', source, amount, date)
+        self._add_transaction(
+            entry, 'journal_entry', destination, -1 * amount, date)
+        return entry
+
+    def add_spending(self, date, memo, bank_account, account, amount,
+                     payee='', check_number=None, ach_payment=False):
+        """Add a BankSpendingEntry crediting the bank Account."""
+        entry = BankSpendingEntry(
+            date=date, memo=memo, payee=payee, ach_payment=ach_payment,
+            check_number=None if ach_payment else check_number)
+        self._add_bank_entry(entry, bank_account, amount)
+        self._add_transaction(
+            entry, 'bankspend_entry', account, -1 * amount, date)
+        return entry
+
+    def add_receiving(self, date, memo, bank_account, account, amount, payor):
+        """Add a BankReceivingEntry debiting the bank Account."""
+        entry = BankReceivingEntry(date=date, memo=memo, payor=payor)
+        self._add_bank_entry(entry, bank_account, -1 * amount)
+        self._add_transaction(
+            entry, 'bankreceive_entry', account, amount, date)
+        return entry
+
+    def save(self):
+        """Insert the Entries & Transactions, then update Account balances.
+
+        Everything is done inside a single database transaction, the
+        caller's if it is managing one.
+
+        """
+        with commit_on_success_unless_managed():
+            assign_ids(Transaction, self.transactions)
+            for (entry, main_transaction) in self.main_transactions:
+                entry.main_transaction = main_transaction
+            for (model, entries) in self.entries.items():
+                assign_ids(model, entries)
+                bulk_create(model, entries)
+            for (entry, field_name, entry_transaction) in self.entry_relations:
+                setattr(entry_transaction, field_name, entry)
+            bulk_create(Transaction, self.transactions)
+            Account.objects.apply_balance_deltas(self.get_balance_deltas())
+        bump_account_versions(
+            (batch_transaction.account_id, batch_transaction.date)
+            for batch_transaction in self.transactions)
+        for (model, entries) in self.entries.items():
+            metrics.increment(
+                metrics.ENTRIES_CREATED, len(entries), type=model.__name__)
+        metrics.increment(metrics.TRANSACTIONS_POSTED, len(self.transactions))
+
+    def get_balance_deltas(self):
+        """Return the total balance change of each Account in the batch."""
+        deltas = defaultdict(int)
+        for batch_transaction in self.transactions:
+            deltas[batch_transaction.account_id] += (
+                batch_transaction.balance_delta)
+        return dict(deltas)
+
+    def _add_entry(self, entry, exclude=None):
+        """Validate & add the Entry to the batch."""
+        entry.full_clean(exclude=exclude)
+        self.entries[type(entry)].append(entry)
+        return entry
+
+    def _add_bank_entry(self, entry, bank_account, amount):
+        """Add a Bank Entry & it's main Transaction to the batch."""
+        self._add_entry(entry, exclude=['main_transaction'])
+        main_transaction = self._add_transaction(
+            None, None, bank_account, amount, entry.date)
+        self.main_transactions.append((entry, main_transaction))
+
+    def _add_transaction(self, entry, field_name, account, amount, date):
+        """Validate & add a Transaction, relating it to the Entry if given."""
+        new_transaction = Transaction(
+            account=account, balance_delta=amount, date=date)
+        new_transaction.full_clean(exclude=TRANSACTION_RELATIONS)
+        self.transactions.append(new_transaction)
+        if entry is not None:
+            self.entry_relations.append((entry, field_name, new_transaction))
+        return new_transaction
@@ -1,11 +1,10 @@
 from decimal import Decimal
 
-from caching.base import CachingQuerySet
 from django.db import models
 
 
-class TransactionQuerySet(CachingQuerySet):
-    """A wrapper for the :class:`caching.base.CachingQuerySet`.
+class TransactionQuerySet(models.query.QuerySet):
+    """A wrapper for the :class:`~django.db.models.query.QuerySet`.
 
     The methods of this class mimic the :class:`TransactionManager` class. This
     allows the chaining of our custom methods. For example:
@@ -17,6 +16,10 @@ class TransactionQuerySet(CachingQuerySet):
         """See :meth:`TransactionManager.get_totals`."""
         return _get_totals_from_query_set(self, net_change)
 
+    def get_totals_by_account(self, net_change=False):
+        """See :meth:`TransactionManager.get_totals_by_account`."""
+        return _get_totals_by_account_from_query_set(self, net_change)
+
 
 class TransactionManager(models.Manager):
     """A Custom Manager for the :class:`~.models.Transaction` Model.
@@ -30,7 +33,7 @@ class TransactionManager(models.Manager):
     use_for_related_fields = True
 
     def get_query_set(self):
-        """Return a :class:`caching.base.CachingQuerySet`."""
+        """Return a :class:`TransactionQuerySet`."""
         return TransactionQuerySet(self.model, using=self._db)
 
     def get_totals(self, net_change=False):
@@ -57,6 +60,24 @@ class TransactionManager(models.Manager):
         query_set = self.get_query_set()
         return _get_totals_from_query_set(query_set, net_change)
 
+    def get_totals_by_account(self, net_change=False):
+        """
+        Calculate the debit and credit totals of each Account in the Queryset.
+
+        The totals of every :class:`~accounts.models.Account` are summed by the
+        database in two grouped queries, instead of a query per Account.
+        Accounts without any :class:`~.models.Transaction` are not included.
+
+        :param net_change: Calculate the difference between debits and credits.
+        :type net_change: bool
+        :returns: The totals of each Account, in the same form as
+                  :meth:`get_totals`, keyed by the Account's ``id``.
+        :rtype: :obj:`dict`
+
+        """
+        query_set = self.get_query_set()
+        return _get_totals_by_account_from_query_set(query_set, net_change)
+
 
 def _get_totals_from_query_set(query_set, net_change):
     """Return the query_sets total debits/credits and optionally net_change."""
@@ -68,3 +89,22 @@ def _get_totals_from_query_set(query_set, net_change):
     if net_change:
         return debit_total, credit_total, credit_total + debit_total
     return debit_total, credit_total
+
+
+def _get_totals_by_account_from_query_set(query_set, net_change):
+    """Return the total debits/credits & net_change of each Account."""
+    query_set = query_set.order_by().values('account')
+    debit_totals = dict(query_set.filter(balance_delta__lt=0).annotate(
+        total=models.Sum('balance_delta')).values_list('account', 'total'))
+    credit_totals = dict(query_set.filter(balance_delta__gt=0).annotate(
+        total=models.Sum('balance_delta')).values_list('account', 'total'))
+    totals = {}
+    for account_id in set(debit_totals) | set(credit_totals):
+        debit_total = Decimal(debit_totals.get(account_id, 0))
+        credit_total = Decimal(credit_totals.get(account_id, 0))
+        if net_change:
+            totals[account_id] = (debit_total, credit_total,
+                                  credit_total + debit_total)
+        else:
+            totals[account_id] = (debit_total, credit_total)
+    return totals
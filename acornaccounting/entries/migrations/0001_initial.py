@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+    """Create the Entry tables.
+
+    Databases whose Entry tables were created by ``syncdb`` should skip this
+    with ``./manage.py migrate entries 0001 --fake``.
+
+    """
+    depends_on = (('accounts', '0001_initial'),)
+    needed_by = (('receipts', '0001_initial'),)
+
+    def forwards(self, orm):
+        # Adding model 'JournalEntry'
+        db.create_table('entries_journalentry', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('date', self.gf('django.db.models.fields.DateField')(db_index=True)),
+            ('created_at', self.gf('django.db.models.fields.DateTimeField')(default=datetime.datetime.now, auto_now_add=True, blank=True)),
+            ('updated_at', self.gf('django.db.models.fields.DateTimeField')(default=datetime.datetime.now, auto_now=True, blank=True)),
+            ('memo', self.gf('django.db.models.fields.CharField')(max_length=60)),
+            ('comments', self.gf('django.db.models.fields.TextField')(null=True, blank=True)),
+        ))
+        db.send_create_signal('entries', ['JournalEntry'])
+
+        # Adding model 'BankSpendingEntry'
+        db.create_table('entries_bankspendingentry', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('date', self.gf('django.db.models.fields.DateField')(db_index=True)),
+            ('created_at', self.gf('django.db.models.fields.DateTimeField')(default=datetime.datetime.now, auto_now_add=True, blank=True)),
+            ('updated_at', self.gf('django.db.models.fields.DateTimeField')(default=datetime.datetime.now, auto_now=True, blank=True)),
+            ('memo', self.gf('django.db.models.fields.CharField')(max_length=60)),
+            ('comments', self.gf('django.db.models.fields.TextField')(null=True, blank=True)),
+            ('check_number', self.gf('django.db.models.fields.CharField')(max_length=10, null=True, blank=True)),
+            ('ach_payment', self.gf('django.db.models.fields.BooleanField')(default=False)),
+            ('payee', self.gf('django.db.models.fields.CharField')(max_length=50, null=True, blank=True)),
+            ('void', self.gf('django.db.models.fields.BooleanField')(default=False)),
+            ('main_transaction', self.gf('django.db.models.fields.related.OneToOneField')(to=orm['entries.Transaction'], unique=True)),
+        ))
+        db.send_create_signal('entries', ['BankSpendingEntry'])
+
+        # Adding model 'BankReceivingEntry'
+        db.create_table('entries_bankreceivingentry', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('date', self.gf('django.db.models.fields.DateField')(db_index=True)),
+            ('created_at', self.gf('django.db.models.fields.DateTimeField')(default=datetime.datetime.now, auto_now_add=True, blank=True)),
+            ('updated_at', self.gf('django.db.models.fields.DateTimeField')(default=datetime.datetime.now, auto_now=True, blank=True)),
+            ('memo', self.gf('django.db.models.fields.CharField')(max_length=60)),
+            ('comments', self.gf('django.db.models.fields.TextField')(null=True, blank=True)),
+            ('payor', self.gf('django.db.models.fields.CharField')(max_length=50)),
+            ('main_transaction', self.gf('django.db.models.fields.related.OneToOneField')(to=orm['entries.Transaction'], unique=True)),
+        ))
+        db.send_create_signal('entries', ['BankReceivingEntry'])
+
+        # Adding model 'Transaction'
+        db.create_table('entries_transaction', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('journal_entry', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['entries.JournalEntry'], null=True, blank=True)),
+            ('bankspend_entry', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['entries.BankSpendingEntry'], null=True, blank=True)),
+            ('bankreceive_entry', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['entries.BankReceivingEntry'], null=True, blank=True)),
+            ('account', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['accounts.Account'], on_delete=models.PROTECT)),
+            ('detail', self.gf('django.db.models.fields.CharField')(max_length=50, blank=True)),
+            ('balance_delta', self.gf('django.db.models.fields.DecimalField')(max_digits=19, decimal_places=4, db_index=True)),
+            ('event', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['events.Event'], null=True, on_delete=models.SET_NULL, blank=True)),
+            ('reconciled', self.gf('django.db.models.fields.BooleanField')(default=False)),
+            ('date', self.gf('django.db.models.fields.DateField')(db_index=True, null=True, blank=True)),
+        ))
+        db.send_create_signal('entries', ['Transaction'])
+
+
+    def backwards(self, orm):
+        # Deleting model 'JournalEntry'
+        db.delete_table('entries_journalentry')
+
+        # Deleting model 'BankSpendingEntry'
+        db.delete_table('entries_bankspendingentry')
+
+        # Deleting model 'BankReceivingEntry'
+        db.delete_table('entries_bankreceivingentry')
+
+        # Deleting model 'Transaction'
+        db.delete_table('entries_transaction')
+
+
+    models = {
+        'accounts.account': {
+            'Meta': {'ordering': "['name']", 'object_name': 'Account'},
+            'active': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'balance': ('django.db.models.fields.DecimalField', [], {'default': "'0.00'", 'max_digits': '19', 'decimal_places': '4'}),
+            'bank': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'description': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'full_number': ('django.db.models.fields.CharField', [], {'max_length': '7', 'null': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_reconciled': ('django.db.models.fields.DateField', [], {'null': 'True', 'blank': 'True'}),
+            u'level': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'}),
+            u'lft': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '50'}),
+            'parent': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['accounts.Header']"}),
+            'reconciled_balance': ('django.db.models.fields.DecimalField', [], {'default': "'0.00'", 'max_digits': '19', 'decimal_places': '4'}),
+            u'rght': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'}),
+            'slug': ('django.db.models.fields.SlugField', [], {'unique': 'True', 'max_length': '50'}),
+            u'tree_id': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'}),
+            'type': ('django.db.models.fields.PositiveSmallIntegerField', [], {'blank': 'True'})
+        },
+        'accounts.header': {
+            'Meta': {'ordering': "['name']", 'object_name': 'Header'},
+            'active': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'description': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'full_number': ('django.db.models.fields.CharField', [], {'max_length': '7', 'null': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            u'level': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'}),
+            u'lft': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '50'}),
+            'parent': ('mptt.fields.TreeForeignKey', [], {'to': "orm['accounts.Header']", 'null': 'True', 'blank': 'True'}),
+            u'rght': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'}),
+            'slug': ('django.db.models.fields.SlugField', [], {'unique': 'True', 'max_length': '50'}),
+            u'tree_id': ('django.db.models.fields.PositiveIntegerField', [], {'db_index': 'True'}),
+            'type': ('django.db.models.fields.PositiveSmallIntegerField', [], {'blank': 'True'})
+        },
+        'entries.bankreceivingentry': {
+            'Meta': {'object_name': 'BankReceivingEntry'},
+            'comments': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'}),
+            'created_at': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now', 'auto_now_add': 'True', 'blank': 'True'}),
+            'date': ('django.db.models.fields.DateField', [], {'db_index': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'main_transaction': ('django.db.models.fields.related.OneToOneField', [], {'to': "orm['entries.Transaction']", 'unique': 'True'}),
+            'memo': ('django.db.models.fields.CharField', [], {'max_length': '60'}),
+            'payor': ('django.db.models.fields.CharField', [], {'max_length': '50'}),
+            'updated_at': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now', 'auto_now': 'True', 'blank': 'True'})
+        },
+        'entries.bankspendingentry': {
+            'Meta': {'object_name': 'BankSpendingEntry'},
+            'ach_payment': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'check_number': ('django.db.models.fields.CharField', [], {'max_length': '10', 'null': 'True', 'blank': 'True'}),
+            'comments': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'}),
+            'created_at': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now', 'auto_now_add': 'True', 'blank': 'True'}),
+            'date': ('django.db.models.fields.DateField', [], {'db_index': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'main_transaction': ('django.db.models.fields.related.OneToOneField', [], {'to': "orm['entries.Transaction']", 'unique': 'True'}),
+            'memo': ('django.db.models.fields.CharField', [], {'max_length': '60'}),
+            'payee': ('django.db.models.fields.CharField', [], {'max_length': '50', 'null': 'True', 'blank': 'True'}),
+            'updated_at': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now', 'auto_now': 'True', 'blank': 'True'}),
+            'void': ('django.db.models.fields.BooleanField', [], {'default': 'False'})
+        },
+        'entries.journalentry': {
+            'Meta': {'ordering': "['date', 'id']", 'object_name': 'JournalEntry'},
+            'comments': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'}),
+            'created_at': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now', 'auto_now_add': 'True', 'blank': 'True'}),
+            'date': ('django.db.models.fields.DateField', [], {'db_index': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'memo': ('django.db.models.fields.CharField', [], {'max_length': '60'}),
+            'updated_at': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now', 'auto_now': 'True', 'blank': 'True'})
+        },
+        'entries.transaction': {
+            'Meta': {'ordering': "['date', 'id']", 'object_name': 'Transaction'},
+            'account': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['accounts.Account']", 'on_delete': 'models.PROTECT'}),
+            'balance_delta': ('django.db.models.fields.DecimalField', [], {'max_digits': '19', 'decimal_places': '4', 'db_index': 'True'}),
+            'bankreceive_entry': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['entries.BankReceivingEntry']", 'null': 'True', 'blank': 'True'}),
+            'bankspend_entry': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['entries.BankSpendingEntry']", 'null': 'True', 'blank': 'True'}),
+            'date': ('django.db.models.fields.DateField', [], {'db_index': 'True', 'null': 'True', 'blank': 'True'}),
+            'detail': ('django.db.models.fields.CharField', [], {'max_length': '50', 'blank': 'True'}),
+            'event': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['events.Event']", 'null': 'True', 'on_delete': 'models.SET_NULL', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'journal_entry': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['entries.JournalEntry']", 'null': 'True', 'blank': 'True'}),
+            'reconciled': ('django.db.models.fields.BooleanField', [], {'default': 'False'})
+        },
+        'events.event': {
+            'Meta': {'ordering': "['-date']", 'object_name': 'Event'},
+            'abbreviation': ('django.db.models.fields.CharField', [], {'max_length': '10'}),
+            'city': ('django.db.models.fields.CharField', [], {'max_length': '50'}),
+            'date': ('django.db.models.fields.DateField', [], {}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '150'}),
+            'number': ('django.db.models.fields.CharField', [], {'max_length': '12', 'blank': 'True'}),
+            'state': ('localflavor.us.models.USStateField', [], {'max_length': '2'})
+        }
+    }
+
+    complete_apps = ['entries']
\ No newline at end of file
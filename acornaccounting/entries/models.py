@@ -1,4 +1,3 @@
-from caching.base import CachingMixin, CachingManager, cached_method
 from django.core.exceptions import ValidationError
 from django.core.urlresolvers import reverse
 from django.db import models
@@ -9,7 +8,7 @@ from fiscalyears.fiscalyears import get_start_of_current_fiscal_year
 from .managers import TransactionManager
 
 
-class BaseJournalEntry(CachingMixin, models.Model):
+class BaseJournalEntry(models.Model):
     """
     Journal Entries group :class:`Transactions<entries.models.Transaction>` by
     discrete points in time.
@@ -57,8 +56,6 @@ class BaseJournalEntry(CachingMixin, models.Model):
     memo = models.CharField(max_length=60)
     comments = models.TextField(blank=True, null=True)
 
-    objects = CachingManager()
-
     class Meta:
         abstract = True
         ordering = ['date', 'id']
@@ -101,7 +98,6 @@ class BaseJournalEntry(CachingMixin, models.Model):
 
 class JournalEntry(BaseJournalEntry):
     """A concrete class of the :class:`BaseJournalEntry` model."""
-    objects = CachingManager()
 
     def save(self, *args, **kwargs):
         """Save all related :class:`Transactions<Transaction>` after saving."""
@@ -166,8 +162,6 @@ class BankSpendingEntry(BaseJournalEntry):
                                help_text="Refunds Associated Transactions.")
     main_transaction = models.OneToOneField('Transaction')
 
-    objects = CachingManager()
-
     class Meta:
         verbose_name_plural = "bank spending entries"
 
@@ -216,7 +210,6 @@ class BankSpendingEntry(BaseJournalEntry):
                                   'required.')
         super(BankSpendingEntry, self).clean()
 
-    @cached_method
     def get_number(self):
         """Return the formatted :attr:`check_number` or ``##ACH##``."""
         if self.ach_payment:
@@ -247,8 +240,6 @@ class BankReceivingEntry(BaseJournalEntry):
     payor = models.CharField(max_length=50)
     main_transaction = models.OneToOneField('Transaction')
 
-    objects = CachingManager()
-
     class Meta:
         verbose_name_plural = "bank receiving entries"
 
@@ -276,13 +267,12 @@ class BankReceivingEntry(BaseJournalEntry):
             transaction.date = self.date
             transaction.save()
 
-    @cached_method
     def get_number(self):
         """Return the Entry's formatted number."""
         return "CR#{0:06d}".format(self.id)
 
 
-class Transaction(CachingMixin, models.Model):
+class Transaction(models.Model):
     """
     Transactions itemize :class:`~accounts.models.Account` balance changes.
 
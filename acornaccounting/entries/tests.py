@@ -1,8 +1,14 @@
 import datetime
+import importlib
+import io
+import re
 
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
-from django.test import TestCase
+from django.db import connection
+from django.db.models import Count, Q
+from django.test import TestCase, TransactionTestCase
 from django.utils.timezone import utc
 
 from core.tests import (create_header, create_entry, create_account,
@@ -14,6 +20,7 @@ from events.models import Event
 from fiscalyears.fiscalyears import get_start_of_current_fiscal_year
 from fiscalyears.models import FiscalYear
 
+from .batch import EntryBatch
 from .forms import (JournalEntryForm, TransactionForm, TransactionFormSet,
                     TransferFormSet, BankReceivingForm, BankSpendingForm,
                     BankTransactionForm, BankReceivingTransactionFormSet,
@@ -441,6 +448,96 @@ class TransactionModelTests(TestCase):
         self.assertRaises(ValidationError, trans.save)
 
 
+class EntryBatchTests(TestCase):
+    """Test the EntryBatch class."""
+
+    def setUp(self):
+        """Create a Bank, Expense & Income Account."""
+        self.bank_account = create_account(
+            'Bank', create_header('Assets', cat_type=1), 0, 1, True)
+        self.expense_account = create_account(
+            'Expense', create_header('Expenses', cat_type=6), 0, 6)
+        self.income_account = create_account(
+            'Income', create_header('Income', cat_type=4), 0, 4)
+        self.date = datetime.date(2016, 4, 20)
+
+    def _fill_batch(self, batch, count):
+        """Add ``count`` Entries of each type to the EntryBatch."""
+        for number in range(count):
+            batch.add_transfer(
+                self.date, self.bank_account, self.expense_account, 5)
+            batch.add_spending(
+                self.date, 'Check', self.bank_account, self.expense_account,
+                20, payee='Payee', check_number=str(number + 1))
+            batch.add_receiving(
+                self.date, 'Deposit', self.bank_account, self.income_account,
+                15, payor='Payor')
+
+    def test_save_creates_entries(self):
+        """The Entries & their Transactions are created & linked."""
+        batch = EntryBatch()
+        self._fill_batch(batch, 1)
+        self.assertEqual(len(batch), 3)
+
+        batch.save()
+
+        journal_entry = JournalEntry.objects.get()
+        self.assertEqual(journal_entry.transaction_set.count(), 2)
+        spending_entry = BankSpendingEntry.objects.get()
+        self.assertEqual(spending_entry.main_transaction.account,
+                         self.bank_account)
+        self.assertEqual(spending_entry.main_transaction.balance_delta, 20)
+        self.assertEqual(
+            spending_entry.transaction_set.get().balance_delta, -20)
+        receiving_entry = BankReceivingEntry.objects.get()
+        self.assertEqual(receiving_entry.main_transaction.balance_delta, -15)
+        self.assertEqual(
+            receiving_entry.transaction_set.get().account, self.income_account)
+        self.assertEqual(Transaction.objects.count(), 6)
+        self.assertTrue(all(t.date == self.date
+                            for t in Transaction.objects.all()))
+
+    def test_save_updates_balances(self):
+        """The Account balances should match saving the Entries one by one."""
+        batch = EntryBatch()
+        self._fill_batch(batch, 3)
+
+        batch.save()
+
+        self.assertEqual(
+            Account.objects.get(id=self.bank_account.id).balance, 30)
+        self.assertEqual(
+            Account.objects.get(id=self.expense_account.id).balance, -75)
+        self.assertEqual(
+            Account.objects.get(id=self.income_account.id).balance, 45)
+
+    def test_save_query_count_is_constant(self):
+        """The number of queries should not depend on the number of Entries.
+
+        The large batch is small enough to avoid SQLite splitting the inserts
+        into multiple queries.
+
+        """
+        small_batch = EntryBatch()
+        self._fill_batch(small_batch, 1)
+        large_batch = EntryBatch()
+        self._fill_batch(large_batch, 10)
+
+        with self.assertNumQueries(11):
+            small_batch.save()
+        with self.assertNumQueries(11):
+            large_batch.save()
+
+    def test_add_validates_entries(self):
+        """Invalid Entries raise an error when they are added."""
+        batch = EntryBatch()
+
+        self.assertRaises(
+            ValidationError, batch.add_spending, self.date, 'Memo',
+            self.bank_account, self.expense_account, 20)
+        self.assertEqual(len(batch), 0)
+
+
 class TransactionFormTests(TestCase):
     """Test the ModelForm for the Transaction class."""
     def setUp(self):
@@ -2784,3 +2881,87 @@ class JournalLedgerViewTests(TestCase):
                              'Enter a valid date.')
         self.assertFormError(response, 'form', 'stop_date',
                              'Enter a valid date.')
+
+
+class LedgerIndexTests(TransactionTestCase):
+    """Test the hot ledger queries use the composite indexes.
+
+    Creating the indexes commits on SQLite, so the indexes are dropped & the
+    tables flushed after each test.
+
+    """
+
+    def setUp(self):
+        """Generate a ledger, create the indexes & gather statistics."""
+        call_command('generatedata', years=1, entries_per_day=9, accounts=20,
+                     header_depth=1, events=2, banks=1, credit_card_entries=0,
+                     trip_entries=0, stdout=io.BytesIO())
+        for entry in BankSpendingEntry.objects.all()[:50]:
+            BankSpendingEntry.objects.filter(id=entry.id).update(
+                ach_payment=False, check_number=str(entry.id))
+        self.migration = importlib.import_module(
+            'entries.migrations.0002_add_ledger_indexes').Migration()
+        self.migration.forwards(None)
+        connection.cursor().execute('ANALYZE')
+        busiest = Transaction.objects.order_by().values('account').annotate(
+            count=Count('id')).order_by('-count')[0]
+        self.account = Account.objects.get(id=busiest['account'])
+        self.last_transaction = self.account.transaction_set.reverse()[0]
+
+    def tearDown(self):
+        """Drop the indexes & empty the committed tables."""
+        self.migration.backwards(None)
+        call_command('flush', verbosity=0, interactive=False)
+
+    def _explain(self, queryset):
+        """Return the database's plan for the queryset."""
+        sql, params = queryset.query.sql_with_params()
+        prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' \
+            else 'EXPLAIN '
+        cursor = connection.cursor()
+        cursor.execute(prefix + sql, params)
+        return '\n'.join(unicode(row[-1]) for row in cursor.fetchall())
+
+    def assertIndexScan(self, queryset, index_name=None):
+        """Assert no Entry table is read without an index."""
+        plan = self._explain(queryset)
+        for table in ('entries_transaction', 'entries_bankspendingentry'):
+            self.assertIsNone(re.search(
+                r'(Seq Scan on|SCAN( TABLE)?) "?{0}"?(?! USING)\b'.format(
+                    table), plan), plan)
+        if index_name is not None:
+            self.assertIn(index_name, plan)
+
+    def test_register(self):
+        """Account registers search by Account & date, ordered by date."""
+        stop_date = self.last_transaction.date
+        self.assertIndexScan(
+            Transaction.objects.filter(
+                account=self.account,
+                date__range=(stop_date - datetime.timedelta(days=31),
+                             stop_date)),
+            'entries_transaction_account_date_id')
+
+    def test_final_account_balance(self):
+        """Balances after a Transaction sum the newer Transactions."""
+        transaction = self.account.transaction_set.all()[100]
+        self.assertIndexScan(self.account.transaction_set.filter(
+            Q(date__gt=transaction.date) |
+            Q(date=transaction.date, id__gt=transaction.id)))
+
+    def test_reconcile(self):
+        """Reconciling finds the unreconciled Transactions before a date."""
+        self.assertIndexScan(
+            self.account.transaction_set.filter(
+                reconciled=False, date__lte=self.last_transaction.date),
+            'entries_transaction_account_reconciled_date')
+
+    def test_bank_matching(self):
+        """Statement lines are matched to Bank Spending Entry checks."""
+        check_numbers = BankSpendingEntry.objects.exclude(
+            check_number=None).values_list('check_number', flat=True)[:10]
+        bank_account = Account.objects.filter(bank=True)[0]
+        self.assertIndexScan(Transaction.objects.filter(
+            account=bank_account,
+            bankspendingentry__check_number__in=list(check_numbers)
+        ).select_related('bankspendingentry'))
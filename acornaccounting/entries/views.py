@@ -8,6 +8,7 @@ from django.shortcuts import render, get_object_or_404
 from django.utils import timezone
 
 from core.core import process_month_start_date_range_form
+from core.db.replicas import use_replica
 
 from .forms import (JournalEntryForm, BankSpendingForm, BankReceivingForm,
                     TransactionFormSet, TransferFormSet,
@@ -17,6 +18,7 @@ from .models import (Transaction, JournalEntry, BankSpendingEntry,
                      BankReceivingEntry)
 
 
+@use_replica
 def journal_ledger(request, template_name="entries/journal_ledger.html"):
     """Display a list of :class:`Journal Entries<.models.JournalEntry>`.
 
@@ -29,7 +31,9 @@ def journal_ledger(request, template_name="entries/journal_ledger.html"):
     """
     form, start_date, stop_date = process_month_start_date_range_form(request)
     journal_entries = JournalEntry.objects.filter(
-        date__lte=stop_date, date__gte=start_date).order_by('date')
+        date__lte=stop_date, date__gte=start_date).order_by(
+        'date').prefetch_related('transaction_set__account',
+                                 'transaction_set__event')
     return render(request, template_name, locals())
 
 
@@ -1,10 +1,9 @@
-from caching.base import CachingManager, CachingMixin
 from localflavor.us.models import USStateField
 from django.core.urlresolvers import reverse
 from django.db import models
 
 
-class BaseEvent(CachingMixin, models.Model):
+class BaseEvent(models.Model):
     """
     An abstract class for the commonalities of the :class:`Event` and
     :class:`HistoricalEvent` models.
@@ -51,8 +50,6 @@ class Event(BaseEvent):
     """Hold information about Events."""
     abbreviation = models.CharField(max_length=10)
 
-    objects = CachingManager()
-
     def get_absolute_url(self):
         """Return the URL of the Event's Details Page."""
         return reverse('events.views.show_event_detail',
@@ -119,5 +116,3 @@ class HistoricalEvent(BaseEvent):
     net_change = models.DecimalField(
         help_text="The Net Change of all Transactions related to the Event.",
         max_digits=19, decimal_places=4)
-
-    objects = CachingManager()
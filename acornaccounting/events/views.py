@@ -12,11 +12,15 @@ def show_event_detail(request, event_id,
     :param template_name: The template to use.
     :type template_name: string
     :returns: HTTP Response containing the :class:`~events.models.Event`
-            instance, and the :class:`Event's<events.models.Event>` Debit
-            Total, Credit Total and Net Change.
+            instance, it's ``transactions`` with their Entries, and the
+            :class:`Event's<events.models.Event>` Debit Total, Credit Total
+            and Net Change.
     :rtype: HttpResponse
     """
     event = get_object_or_404(Event, id=event_id)
+    transactions = event.transaction_set.select_related(
+        'account', 'journal_entry', 'bankspend_entry', 'bankreceive_entry',
+        'bankspendingentry', 'bankreceivingentry')
     debit_total, credit_total, net_change = event.transaction_set.get_totals(
         net_change=True)
     return render(request, template_name, locals())
@@ -1,11 +1,10 @@
 import calendar
 import datetime
 
-from caching.base import CachingManager, CachingMixin
 from django.db import models
 
 
-class FiscalYear(CachingMixin, models.Model):
+class FiscalYear(models.Model):
     """
     A model for storing data about the Company's Past and Present Fiscal Years.
 
@@ -53,8 +52,6 @@ class FiscalYear(CachingMixin, models.Model):
     # seemlessly by making them properties.
     date = models.DateField(editable=False, blank=True)
 
-    objects = CachingManager()
-
     class Meta:
         ordering = ('date',)
         get_latest_by = ('date',)
@@ -1,11 +1,15 @@
 import datetime
 
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
 
 from accounts.models import Account, HistoricalAccount
-from entries.models import Transaction, BankSpendingEntry, BankReceivingEntry
+from entries.models import (Transaction, JournalEntry, BankSpendingEntry,
+                            BankReceivingEntry)
 from events.models import Event, HistoricalEvent
+from receipts.models import Receipt
 from core.tests import (create_header, create_entry, create_account,
                         create_transaction, create_and_login_user)
 
@@ -711,6 +715,41 @@ class FiscalYearViewTests(TestCase):
             Transaction.objects.all(),
             [unreconciled_bank, unreconciled_expense, curr_trans, ret_trans])
 
+    def test_add_fiscal_year_with_previous_purge_receipts(self):
+        """
+        A ``POST`` to the ``add_fiscal_year`` view will delete the
+        ``Receipts`` of the purged ``JournalEntries`` and keep the
+        ``Receipts`` of the excluded ``JournalEntries``.
+        """
+        FiscalYear.objects.create(year=2012, end_month=12, period=12)
+        date = datetime.date(2012, 3, 20)
+        purged_entry = create_entry(date, 'purged entry')
+        create_transaction(purged_entry, self.expense_account, -20)
+        create_transaction(purged_entry, self.current_earnings, 20)
+        Receipt.objects.create(journal_entry=purged_entry,
+                               receipt_file='uploads/receipts/purged.pdf')
+        excluded_entry = create_entry(date, 'excluded entry')
+        create_transaction(excluded_entry, self.bank_account, 35)
+        create_transaction(excluded_entry, self.expense_account, -35)
+        excluded_receipt = Receipt.objects.create(
+            journal_entry=excluded_entry,
+            receipt_file='uploads/receipts/excluded.pdf')
+        self.client.post(reverse('fiscalyears.views.add_fiscal_year'),
+                         {'year': 2013,
+                          'end_month': 12,
+                          'period': 12,
+                          'form-TOTAL_FORMS': 2,
+                          'form-INITIAL_FORMS': 2,
+                          'form-MAX_NUM_FORMS': 2,
+                          'form-0-id': self.bank_account.id,
+                          'form-0-exclude': True,
+                          'form-1-id': self.expense_account.id,
+                          'form-1-exclude': False,
+                          'submit': 'Start New Year'})
+        self.assertSequenceEqual(Receipt.objects.all(), [excluded_receipt])
+        self.assertFalse(
+            JournalEntry.objects.filter(id=purged_entry.id).exists())
+
     def test_add_fiscal_year_with_previous_purge_bank_spending_entries(self):
         """
         A ``POST`` to the ``add_fiscal_year`` view with valid data and one
@@ -1202,3 +1241,116 @@ class FiscalYearViewTests(TestCase):
         self.assertEqual(BankReceivingEntry.objects.count(), 0)
         self.assertEqual(BankSpendingEntry.objects.count(), 1)
         self.assertEqual(Transaction.objects.count(), 4)
+
+
+class FiscalYearPurgeTests(TransactionTestCase):
+    """Test purging a previous year with the foreign keys enforced."""
+
+    def setUp(self):
+        """Create the Accounts & enforce SQLite's foreign key constraints."""
+        create_and_login_user(self)
+        asset_header = create_header('asset', cat_type=1)
+        self.bank_account = create_account('bank', asset_header, 0, 1, True)
+        self.bank_account.last_reconciled = datetime.date(2012, 11, 1)
+        self.bank_account.save()
+        self.expense_account = create_account(
+            'expense', create_header('expense', cat_type=6), 0, 6)
+        equity_header = create_header('Equity', cat_type=3)
+        create_account('Retained Earnings', equity_header, 0, 3)
+        create_account('Current Year Earnings', equity_header, 0, 3)
+        FiscalYear.objects.create(year=2012, end_month=12, period=12)
+        if connection.vendor == 'sqlite':
+            connection.cursor().execute('PRAGMA foreign_keys = ON')
+
+    def tearDown(self):
+        """Empty the committed tables, since they are only flushed before."""
+        if connection.vendor == 'sqlite':
+            connection.cursor().execute('PRAGMA foreign_keys = OFF')
+        call_command('flush', verbosity=0, interactive=False)
+
+    def _create_bank_entries(self, date, reconciled):
+        """Create a Bank Spending & Receiving Entry for the bank Account."""
+        spending = BankSpendingEntry.objects.create(
+            main_transaction=Transaction.objects.create(
+                account=self.bank_account, balance_delta=20,
+                reconciled=reconciled),
+            date=date, memo='spending', payee='payee', ach_payment=True)
+        Transaction.objects.create(account=self.expense_account,
+                                   balance_delta=-20, bankspend_entry=spending,
+                                   reconciled=reconciled)
+        receiving = BankReceivingEntry.objects.create(
+            main_transaction=Transaction.objects.create(
+                account=self.bank_account, balance_delta=-15,
+                reconciled=reconciled),
+            date=date, memo='receiving', payor='payor')
+        Transaction.objects.create(
+            account=self.expense_account, balance_delta=15,
+            bankreceive_entry=receiving, reconciled=reconciled)
+        return (spending, receiving)
+
+    def test_purge_deletes_referring_rows_first(self):
+        """
+        Receipts, Transactions & Bank Entries referring to purged rows are
+        deleted before the rows they refer to, so the purge succeeds with
+        foreign keys enforced.
+        """
+        date = datetime.date(2012, 3, 20)
+        journal_entry = create_entry(date, 'reconciled entry')
+        create_transaction(journal_entry, self.bank_account, 35)
+        create_transaction(journal_entry, self.expense_account, -35)
+        Transaction.objects.filter(journal_entry=journal_entry).update(
+            reconciled=True)
+        Receipt.objects.create(journal_entry=journal_entry,
+                               receipt_file='uploads/receipts/purged.pdf')
+        self._create_bank_entries(date, reconciled=True)
+        kept_spending, kept_receiving = self._create_bank_entries(
+            date, reconciled=False)
+
+        response = self.client.post(
+            reverse('fiscalyears.views.add_fiscal_year'),
+            {'year': 2013,
+             'end_month': 12,
+             'period': 12,
+             'form-TOTAL_FORMS': 1,
+             'form-INITIAL_FORMS': 1,
+             'form-MAX_NUM_FORMS': 1,
+             'form-0-id': self.bank_account.id,
+             'form-0-exclude': True,
+             'submit': 'Start New Year'})
+
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(
+            JournalEntry.objects.filter(memo='reconciled entry').exists())
+        self.assertFalse(Receipt.objects.exists())
+        self.assertSequenceEqual(BankSpendingEntry.objects.all(),
+                                 [kept_spending])
+        self.assertSequenceEqual(BankReceivingEntry.objects.all(),
+                                 [kept_receiving])
+        self.assertEqual(
+            set(Transaction.objects.filter(
+                account=self.bank_account).values_list('id', flat=True)),
+            set([kept_spending.main_transaction_id,
+                 kept_receiving.main_transaction_id]))
+
+    def test_purge_keeps_unrelated_transactions(self):
+        """Only the purged Bank Entries' main Transactions are deleted."""
+        self._create_bank_entries(datetime.date(2012, 3, 20), reconciled=True)
+        unrelated = Transaction.objects.create(
+            account=self.expense_account, balance_delta=10,
+            date=datetime.date(2012, 3, 20), reconciled=True)
+
+        self.client.post(
+            reverse('fiscalyears.views.add_fiscal_year'),
+            {'year': 2013,
+             'end_month': 12,
+             'period': 12,
+             'form-TOTAL_FORMS': 1,
+             'form-INITIAL_FORMS': 1,
+             'form-MAX_NUM_FORMS': 1,
+             'form-0-id': self.bank_account.id,
+             'submit': 'Start New Year'})
+
+        self.assertFalse(BankSpendingEntry.objects.exists())
+        self.assertSequenceEqual(
+            Transaction.objects.filter(account=self.bank_account), [])
+        self.assertTrue(Transaction.objects.filter(id=unrelated.id).exists())
@@ -5,14 +5,17 @@ from dateutil import rrule
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.core.urlresolvers import reverse
-from django.db.models import Sum
+from django.db.models import Q, Sum
 from django.http import HttpResponseRedirect
 from django.shortcuts import render
 
 from accounts.models import Account, HistoricalAccount
+from core.cache import bump_account_versions, bump_ledger_version
+from core.db.bulk import SQLITE_MAX_VARIABLES, bulk_delete
 from entries.models import (Transaction, JournalEntry, BankSpendingEntry,
                             BankReceivingEntry)
 from events.models import Event, HistoricalEvent
+from receipts.models import Receipt
 
 
 from .fiscalyears import get_start_of_current_fiscal_year
@@ -84,12 +87,7 @@ def add_fiscal_year(request, template_name="fiscalyears/year_add.html"):
             excluded_transactions = _get_excluded_transactions(
                 accounts_formset)
 
-            journals = [Journal.objects.filter(date__lte=end_of_previous_year)
-                        for Journal in (JournalEntry, BankReceivingEntry,
-                                        BankSpendingEntry)]
-            for entries in journals:
-                for entry in entries:
-                    _delete_entry_if_not_excluded(entry, excluded_transactions)
+            _purge_entries(end_of_previous_year, excluded_transactions)
             [_correct_account_balance(account, end_of_previous_year) for
              account in Account.objects.all()]
 
@@ -157,15 +155,14 @@ def _build_historical_account(account, month):
 
 def _get_excluded_transactions(accounts_formset):
     """
-    Process a FiscalYearAccountsFormSet and return a set of excluded
+    Process a FiscalYearAccountsFormSet and return a QuerySet of the excluded
     Transactions.
 
     """
     excluded_accounts = [form.instance for form in accounts_formset if
                          form.cleaned_data.get('exclude')]
-    excluded_transactions = frozenset(Transaction.objects.filter(
-        account__in=excluded_accounts, reconciled=False))
-    return excluded_transactions
+    return Transaction.objects.filter(account__in=excluded_accounts,
+                                      reconciled=False)
 
 
 def _get_last_day_of_month(month):
@@ -175,22 +172,57 @@ def _get_last_day_of_month(month):
     return last_day_of_month
 
 
-def _get_all_transactions(entry):
-    """Get all Transactions of the Entry, including a main_transaction."""
-    entry_transactions = list(entry.transaction_set.all())
-    if hasattr(entry, 'main_transaction'):
-        entry_transactions.append(entry.main_transaction)
-    return entry_transactions
+def _purge_entries(year_end, excluded_transactions):
+    """
+    Delete the Entries dated before the end of the year, along with their
+    Transactions and Receipts, unless any of their Transactions, including a
+    ``main_transaction``, are excluded.
+
+    Each table is purged with a single query instead of deleting the Entries
+    one by one, so the Transaction signals are skipped. The Account balances
+    are corrected afterwards and the versions of the purged Account months
+    are bumped here.
 
+    The deletes are ordered so no remaining row refers to a deleted one:
 
-def _delete_entry_if_not_excluded(entry, excluded_transactions):
-    """Delete an Entry if none of it's Transactions are excluded."""
-    entry_transactions = _get_all_transactions(entry)
-    entry_is_not_excluded = excluded_transactions.isdisjoint(
-        entry_transactions)
-    if entry_is_not_excluded:
-        [transaction.delete() for transaction in entry_transactions]
-        entry.delete()
+         1. Receipts, which refer to Journal Entries.
+         2. The Entries' Transactions, which refer to the Entries.
+         3. The Entries, Bank Entries referring to their
+            ``main_transaction``.
+         4. The ``main_transactions`` of the deleted Bank Entries, whose ids
+            are read before the Bank Entries are deleted. They are deleted
+            in batches, since SQLite limits the parameters of a query.
+
+    """
+    def not_excluded(entries, field_name):
+        """Remove the Entries with an excluded Transaction."""
+        return entries.filter(date__lte=year_end).exclude(
+            id__in=excluded_transactions.filter(
+                **{field_name + '__isnull': False}).values(field_name))
+
+    journals = not_excluded(JournalEntry.objects.all(), 'journal_entry')
+    spending = not_excluded(BankSpendingEntry.objects.exclude(
+        main_transaction__in=excluded_transactions), 'bankspend_entry')
+    receiving = not_excluded(BankReceivingEntry.objects.exclude(
+        main_transaction__in=excluded_transactions), 'bankreceive_entry')
+    entry_transactions = Transaction.objects.filter(
+        Q(journal_entry__in=journals) | Q(bankspend_entry__in=spending) |
+        Q(bankreceive_entry__in=receiving))
+    main_transactions = Transaction.objects.filter(
+        Q(id__in=spending.values('main_transaction')) |
+        Q(id__in=receiving.values('main_transaction')))
+    main_transaction_ids = list(main_transactions.values_list('id', flat=True))
+
+    bump_account_versions(
+        (entry_transactions | main_transactions).order_by().values_list(
+            'account', 'date').distinct())
+    for purged in (Receipt.objects.filter(journal_entry__in=journals),
+                   entry_transactions, spending, receiving, journals):
+        bulk_delete(purged)
+    for start in range(0, len(main_transaction_ids), SQLITE_MAX_VARIABLES):
+        bulk_delete(Transaction.objects.filter(id__in=main_transaction_ids[
+            start:start + SQLITE_MAX_VARIABLES]))
+    bump_ledger_version()
 
 
 def _correct_account_balance(account, historical_year_end):
@@ -3,9 +3,10 @@ import datetime
 from django.core.urlresolvers import reverse
 from django.test import TestCase
 
+from accounts.models import Account
 from core.forms import DateRangeForm
 from core.tests import (create_header, create_account, create_entry,
-                        create_transaction)
+                        create_transaction, use_local_memory_cache)
 from entries.models import Transaction
 from events.models import Event, HistoricalEvent
 
@@ -495,3 +496,41 @@ class TrialBalanceReportViewTests(TestCase):
         result = _get_account_details(self.asset_account, first_of_year, today)
 
         self.assertEqual(result, asset_info)
+
+
+class ReportCacheTests(TestCase):
+    """Test that the reports are cached until the ledger changes."""
+
+    def setUp(self):
+        """Use a real cache & create an Asset and Liability Account."""
+        use_local_memory_cache(self)
+        self.asset_account = create_account(
+            'Asset Account', create_header('Asset Header', cat_type=1), 0)
+        self.liability_account = create_account(
+            'Liability Account', create_header('Liability Header'), 0)
+        # Calculating the full numbers saves the Accounts
+        self.asset_account.get_full_number()
+        self.liability_account.get_full_number()
+        self.url = reverse('reports.views.trial_balance_report')
+
+    def test_trial_balance_served_from_cache(self):
+        """A repeated request should not recalculate the Account details."""
+        self.client.get(self.url)
+        # Queryset updates send no signals, so the ledger version is unchanged
+        Account.objects.filter(id=self.asset_account.id).update(name='Renamed')
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.context['accounts'][0]['name'],
+                         'Asset Account')
+
+    def test_trial_balance_rebuilt_after_new_entry(self):
+        """A new Transaction should invalidate the cached report."""
+        self.client.get(self.url)
+        entry = create_entry(datetime.date.today(), 'New Entry')
+        create_transaction(entry, self.asset_account, -20)
+        create_transaction(entry, self.liability_account, 20)
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.context['accounts'][0]['net_change'], -20)
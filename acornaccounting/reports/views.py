@@ -1,26 +1,51 @@
 import datetime
+from decimal import Decimal
 
+from django.db.models import Sum
 from django.shortcuts import render
 
 from accounts.models import Account, Header
+from core.cache import get_cached_report
 from core.core import process_year_start_date_range_form
+from core.db.replicas import use_replica
+from entries.models import Transaction
 from events.models import Event, HistoricalEvent
 
 
+@use_replica
 def events_report(request, template_name="reports/events.html"):
     """Display all :class:`Events<events.models.Event>`.
 
+    The Events are cached until the ledger changes.
+
     :param template_name: The template file to use to render the response.
     :type template_name: str
     :returns: HTTP Response with an ``events`` context variable.
     :rtype: HttpResponse
 
     """
-    events = Event.objects.all()
-    historical_events = HistoricalEvent.objects.all()
+    events, historical_events = get_cached_report(
+        'events', None, None, _get_events)
     return render(request, template_name, locals())
 
 
+def _get_events():
+    """Return lists of the current & historical Events.
+
+    Each current Event's ``net_change`` is summed in a single grouped query.
+
+    """
+    net_changes = dict(
+        Transaction.objects.filter(event__isnull=False).order_by()
+        .values('event').annotate(total=Sum('balance_delta'))
+        .values_list('event', 'total'))
+    events = list(Event.objects.all())
+    for event in events:
+        event.net_change = net_changes.get(event.id, Decimal(0))
+    return (events, list(HistoricalEvent.objects.all()))
+
+
+@use_replica
 def profit_loss_report(request, template_name="reports/profit_loss.html"):
     """
     Display the Profit or Loss for a time period calculated using all Income
@@ -42,6 +67,9 @@ def profit_loss_report(request, template_name="reports/profit_loss.html"):
     ``other_expense`` keys. These keys point to the root node for the
     respective :attr:~accounts.models.BaseAccountModel.type`.
 
+    The ``headers`` and Profit Totals are cached for each date range until the
+    ledger changes.
+
     These nodes have additional attributes appended to them, ``total``,
     ``accounts`` and ``descendants``. ``total`` represents the total Net Change
     for the node.  ``accounts`` and ``descendants`` are lists of child
@@ -55,13 +83,21 @@ def profit_loss_report(request, template_name="reports/profit_loss.html"):
 
     """
     form, start_date, stop_date = process_year_start_date_range_form(request)
+    headers, (gross_profit, operating_profit, net_profit) = get_cached_report(
+        'profit_loss', start_date, stop_date,
+        lambda: _get_profit_loss(start_date, stop_date))
+    return render(request, template_name, locals())
+
+
+def _get_profit_loss(start_date, stop_date):
+    """Return the ``headers`` dictionary & the Profit Totals."""
     headers_and_types = _get_profit_loss_header_keys_and_types()
+    net_changes = _get_net_changes(start_date, stop_date)
     headers = {
         header_key: _get_profit_loss_header_totals(
-            header_type, start_date, stop_date)
+            header_type, start_date, stop_date, net_changes)
         for (header_key, header_type) in headers_and_types}
-    gross_profit, operating_profit, net_profit = _get_profit_totals(headers)
-    return render(request, template_name, locals())
+    return headers, _get_profit_totals(headers)
 
 
 def _get_profit_loss_header_keys_and_types():
@@ -73,7 +109,17 @@ def _get_profit_loss_header_keys_and_types():
             ('other_expenses', 8))
 
 
-def _get_profit_loss_header_totals(header_type, start_date, stop_date):
+def _get_net_changes(start_date, stop_date):
+    """Return the net change of each Account's ``id`` in the time period."""
+    totals = Transaction.objects.filter(
+        date__lte=stop_date, date__gte=start_date).get_totals_by_account(
+        net_change=True)
+    return {account_id: net_change for (account_id, (_, _, net_change))
+            in totals.items()}
+
+
+def _get_profit_loss_header_totals(header_type, start_date, stop_date,
+                                   net_changes=None):
     """
     Return a root Header with the `descendants`, `accounts` and `total`
     attributes.
@@ -84,45 +130,53 @@ def _get_profit_loss_header_totals(header_type, start_date, stop_date):
     The `total` attribute should represent the net change of the Header or
     Account over the specified `start_date` and `stop_date`.
 
+    The tree is built from a single query for the Headers & one for the
+    Accounts. The `net_changes` of each Account's ``id`` may be passed in to
+    share them between the root Headers.
+
     """
+    if net_changes is None:
+        net_changes = _get_net_changes(start_date, stop_date)
     root_header = Header.objects.get(parent=None, type=header_type)
-    return _get_profit_loss_header(root_header, start_date, stop_date)
-
-
-def _get_profit_loss_header(header, start_date, stop_date):
+    child_headers = {}
+    for header in root_header.get_descendants():
+        child_headers.setdefault(header.parent_id, []).append(header)
+    header_accounts = {}
+    for account in Account.objects.filter(type=header_type):
+        header_accounts.setdefault(account.parent_id, []).append(account)
+    return _get_profit_loss_header(root_header, child_headers,
+                                   header_accounts, net_changes)
+
+
+def _get_profit_loss_header(header, child_headers, header_accounts,
+                            net_changes):
     """
     Return the `header` instance with additional attributes of accounts,
     descendants and total change for the time period.
 
     """
     header.accounts = [
-        _get_profit_loss_account(account, start_date, stop_date)
-        for account in header.account_set.all()
+        _get_profit_loss_account(account, net_changes)
+        for account in header_accounts.get(header.id, [])
     ]
+    descendants = [
+        _get_profit_loss_header(child, child_headers, header_accounts,
+                                net_changes)
+        for child in child_headers.get(header.id, [])]
     if header.level < 2:
-        header.descendants = [
-            _get_profit_loss_header(child, start_date, stop_date)
-            for child in header.get_children()]
-        header.total = (sum(account.total for account in header.accounts) +
-                        sum(child.total for child in header.descendants))
-    else:
-        descendants = header.get_descendants(include_self=True)
-        accounts = [_get_profit_loss_account(account, start_date, stop_date)
-                    for descendant in descendants
-                    for account in descendant.account_set.all()]
-        header.total = sum(account.total for account in accounts)
+        header.descendants = descendants
+    header.total = (sum(account.total for account in header.accounts) +
+                    sum(child.total for child in descendants))
     return header
 
 
-def _get_profit_loss_account(account, start_date, stop_date):
+def _get_profit_loss_account(account, net_changes):
     """
     Return the `account` instance with an additional `total` attribute,
     containing the net change for the time period.
 
     """
-    in_range_transactions = account.transaction_set.filter(
-        date__lte=stop_date, date__gte=start_date)
-    _, _, net_change = in_range_transactions.get_totals(net_change=True)
+    net_change = net_changes.get(account.id, Decimal(0))
     if account.flip_balance():
         net_change *= -1
     account.total = net_change
@@ -139,6 +193,7 @@ def _get_profit_totals(headers):
     return (gross_profit, operating_profit, net_profit)
 
 
+@use_replica
 def trial_balance_report(request, template_name="reports/trial_balance.html"):
     """
     Display the state and change of all :class:`Accounts
@@ -152,6 +207,8 @@ def trial_balance_report(request, template_name="reports/trial_balance.html"):
     The ``start_date`` and ``stop_date`` variables default to the first day of
     the year and the current date.
 
+    The ``accounts`` are cached for each date range until the ledger changes.
+
     The ``accounts`` variable is a list of dictionaries, each representing an
     :class:`~accounts.models.Account`. Each dictionary contains the
     :class:`Account's<accounts.models.Account>` number, name, balance at the
@@ -164,8 +221,9 @@ def trial_balance_report(request, template_name="reports/trial_balance.html"):
     :rtype: HttpResponse
     """
     form, start_date, stop_date = process_year_start_date_range_form(request)
-    accounts = [_get_account_details(x, start_date, stop_date) for x in
-                list(Account.objects.all().order_by('full_number'))]
+    accounts = get_cached_report(
+        'trial_balance', start_date, stop_date,
+        lambda: _get_trial_balance(start_date, stop_date))
 
     return render(request, template_name, {'start_date': start_date,
                                            'stop_date': stop_date,
@@ -173,6 +231,41 @@ def trial_balance_report(request, template_name="reports/trial_balance.html"):
                                            'form': form})
 
 
+def _get_trial_balance(start_date, stop_date):
+    """Return the details of every Account, ordered by their number.
+
+    The balances & totals of every :class:`~accounts.models.Account` are
+    summed in grouped queries, instead of running queries for each Account.
+
+    """
+    in_range_totals = Transaction.objects.filter(
+        date__gte=start_date, date__lte=stop_date).get_totals_by_account(
+        net_change=True)
+    totals_after_start = Transaction.objects.filter(
+        date__gte=start_date).get_totals_by_account(net_change=True)
+    totals_after_stop = Transaction.objects.filter(
+        date__gt=stop_date).get_totals_by_account(net_change=True)
+    no_totals = (Decimal(0), Decimal(0), Decimal(0))
+    one_day = datetime.timedelta(days=1)
+    accounts = []
+    for account in Account.objects.order_by('full_number'):
+        if account.name == "Current Year Earnings":
+            start_balance = account.get_balance_by_date(start_date - one_day)
+            end_balance = account.get_balance_by_date(stop_date)
+        else:
+            start_balance = (account.balance -
+                             totals_after_start.get(account.id, no_totals)[2])
+            end_balance = (account.balance -
+                           totals_after_stop.get(account.id, no_totals)[2])
+            if account.flip_balance():
+                start_balance *= -1
+                end_balance *= -1
+        accounts.append(_build_account_details(
+            account, start_balance, end_balance,
+            in_range_totals.get(account.id, no_totals)))
+    return accounts
+
+
 def _get_account_details(account, start_date, stop_date):
     """
     Return the Name, Number, URL, Starting/Ending Balances, Net Change and
@@ -194,9 +287,14 @@ def _get_account_details(account, start_date, stop_date):
 
     in_range_transactions = account.transaction_set.filter(
         date__gte=start_date, date__lte=stop_date)
-    debit_total, credit_total, net_change = in_range_transactions.get_totals(
-        net_change=True)
+    totals = in_range_transactions.get_totals(net_change=True)
+
+    return _build_account_details(account, start_balance, end_balance, totals)
+
 
+def _build_account_details(account, start_balance, end_balance, totals):
+    """Return the details of the Account, given it's balances & totals."""
+    debit_total, credit_total, net_change = totals
     return {'name': account.name,
             'number': account.get_full_number(),
             'beginning_balance': start_balance,
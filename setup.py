@@ -12,7 +12,6 @@ setup(
     long_description=open('README.rst').read(),
     install_requires=[
         "Django >= 1.4",
-        "django-cache-machine",
         "django-constance",
         "django-mptt",
         "django-parsley",